@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+コールドスタート（Lambdaのinitフェーズ）のベンチマーク
+新しいPythonプロセスでハンドラーモジュールをインポートし、`-X importtime` の出力から
+アプリケーションモジュールとLayerパッケージごとのインポート時間を集計する。
+結果を履歴ファイルに追記し、しきい値を超えて遅くなった場合は終了コード1で失敗する。
+
+使用例:
+    python benchmarks/bench_cold_start.py
+    python benchmarks/bench_cold_start.py --layer-dir lambda_layer/python --repeat 10
+    python benchmarks/bench_cold_start.py --record
+    python benchmarks/bench_cold_start.py --max-init-ms 1500 --max-regression-pct 20
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, NamedTuple, Optional
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+LAMBDA_DIR = os.path.join(ROOT, 'lambda')
+DEFAULT_HISTORY = os.path.join(ROOT, 'benchmarks', 'results', 'cold_start.jsonl')
+
+# インポート時間を個別に報告するアプリケーションモジュール
+APP_MODULES = ["lambda_function", "config", "utils", "custom_tools"]
+
+# initフェーズを模擬するためのLambda実行環境の環境変数
+LAMBDA_ENV = {
+    "AWS_LAMBDA_FUNCTION_NAME": "cold-start-benchmark",
+    "AWS_LAMBDA_FUNCTION_MEMORY_SIZE": "1024",
+    "AWS_REGION": "us-east-1",
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "LAMBDA_TASK_ROOT": LAMBDA_DIR,
+}
+
+_IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)$')
+
+
+class ImportRecord(NamedTuple):
+    name: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(stderr: str) -> List[ImportRecord]:
+    """`-X importtime` の出力を解析（ヘッダーやそれ以外の行は無視）"""
+    records = []
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            records.append(ImportRecord(name, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return records
+
+
+def summarize(records: List[ImportRecord], modules: List[str]) -> Dict[str, Dict[str, float]]:
+    """モジュールごとの累積時間とトップレベルパッケージごとの自己時間（ミリ秒）を集計"""
+    cumulative = {}
+    for record in records:
+        if record.name in modules and record.name not in cumulative:
+            cumulative[record.name] = record.cumulative_us / 1000
+
+    packages: Dict[str, float] = {}
+    for record in records:
+        package = record.name.split('.')[0]
+        packages[package] = packages.get(package, 0.0) + record.self_us / 1000
+
+    return {"modules": cumulative, "packages": packages}
+
+
+def run_init(module: str, python: str, layer_dir: Optional[str], cold_bytecode: bool) -> Dict[str, Any]:
+    """新しいプロセスでモジュールをインポートし、init時間とインポート記録を返す"""
+    env = {key: value for key, value in os.environ.items() if not key.startswith("PYTHON")}
+    env.update(LAMBDA_ENV)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (LAMBDA_DIR, layer_dir) if p)
+
+    code = (
+        "import json, time\n"
+        "start = time.perf_counter()\n"
+        f"import {module}\n"
+        "print(json.dumps({'init_ms': (time.perf_counter() - start) * 1000}))\n"
+    )
+
+    # Lambdaのファイルシステムは読み取り専用のため、コンパイル結果はキャッシュされない
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        if cold_bytecode:
+            # 既存のpycも使わず、毎回ソースからコンパイルさせる
+            env["PYTHONPYCACHEPREFIX"] = cache_dir
+        start = time.perf_counter()
+        proc = subprocess.run(
+            [python, "-X", "importtime", "-c", code],
+            env=env, cwd=LAMBDA_DIR, capture_output=True, text=True
+        )
+        process_ms = (time.perf_counter() - start) * 1000
+
+    if proc.returncode != 0:
+        raise RuntimeError(f"{module}のインポートに失敗しました:\n{proc.stderr[-2000:]}")
+
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["process_ms"] = process_ms
+    result["records"] = parse_importtime(proc.stderr)
+    return result
+
+
+def benchmark(
+    module: str,
+    repeat: int,
+    python: str = sys.executable,
+    layer_dir: Optional[str] = None,
+    cold_bytecode: bool = False,
+    modules: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """複数回計測し、各値の中央値をまとめた結果を返す"""
+    modules = modules or APP_MODULES
+    runs = [run_init(module, python, layer_dir, cold_bytecode) for _ in range(repeat)]
+    summaries = [summarize(run["records"], modules) for run in runs]
+
+    def median_of(section: str) -> Dict[str, float]:
+        names = {name for summary in summaries for name in summary[section]}
+        return {
+            name: round(statistics.median(s[section].get(name, 0.0) for s in summaries), 3)
+            for name in names
+        }
+
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_rev": _git_rev(),
+        "python": platform.python_version(),
+        "module": module,
+        "cold_bytecode": cold_bytecode,
+        "repeat": repeat,
+        "init_ms": round(statistics.median(run["init_ms"] for run in runs), 3),
+        "process_ms": round(statistics.median(run["process_ms"] for run in runs), 3),
+        "modules": median_of("modules"),
+        "packages": median_of("packages"),
+    }
+
+
+def check_regression(
+    result: Dict[str, Any],
+    baseline: Optional[Dict[str, Any]],
+    max_init_ms: Optional[float] = None,
+    max_regression_pct: Optional[float] = None
+) -> List[str]:
+    """しきい値を超えた項目のメッセージを返す（空なら合格）"""
+    failures = []
+    if max_init_ms is not None and result["init_ms"] > max_init_ms:
+        failures.append(f"init時間 {result['init_ms']:.1f}ms が上限 {max_init_ms:.1f}ms を超えました")
+
+    if baseline and max_regression_pct is not None:
+        limit = 1 + max_regression_pct / 100
+        if result["init_ms"] > baseline["init_ms"] * limit:
+            failures.append(
+                f"init時間 {result['init_ms']:.1f}ms がベースライン {baseline['init_ms']:.1f}ms から"
+                f"{max_regression_pct:g}%以上増加しました"
+            )
+        for name, elapsed in result["modules"].items():
+            previous = baseline.get("modules", {}).get(name)
+            if previous and elapsed > previous * limit:
+                failures.append(
+                    f"{name} のインポート時間 {elapsed:.1f}ms がベースライン {previous:.1f}ms から"
+                    f"{max_regression_pct:g}%以上増加しました"
+                )
+    return failures
+
+
+def load_baseline(path: str, module: str) -> Optional[Dict[str, Any]]:
+    """履歴ファイル（JSON Lines）またはJSONファイルから同じモジュールの最新の結果を読み込む"""
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    entries = [entry for entry in entries if entry.get("module") == module]
+    return entries[-1] if entries else None
+
+
+def append_history(path: str, result: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(result, ensure_ascii=False, sort_keys=True) + "\n")
+
+
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(result: Dict[str, Any], baseline: Optional[Dict[str, Any]], top: int) -> None:
+    print(f"モジュール: {result['module']}  Python {result['python']}  ({result['repeat']}回の中央値)")
+    print(f"init時間: {result['init_ms']:.1f}ms  プロセス全体: {result['process_ms']:.1f}ms")
+    if baseline:
+        print(f"ベースライン ({baseline.get('git_rev')}): init時間 {baseline['init_ms']:.1f}ms")
+
+    print(f"\n{'モジュール':<24}{'累積(ms)':>12}{'前回(ms)':>12}")
+    for name in APP_MODULES:
+        if name in result["modules"]:
+            previous = (baseline or {}).get("modules", {}).get(name)
+            previous_text = f"{previous:>12.1f}" if previous is not None else f"{'-':>12}"
+            print(f"{name:<24}{result['modules'][name]:>12.1f}{previous_text}")
+
+    print(f"\n{'パッケージ':<24}{'自己時間(ms)':>12}")
+    packages = sorted(result["packages"].items(), key=lambda item: item[1], reverse=True)
+    for name, elapsed in packages[:top]:
+        print(f"{name:<24}{elapsed:>12.1f}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="コールドスタート（initフェーズ）のベンチマーク")
+    parser.add_argument("--module", default="lambda_function", help="インポートするハンドラーモジュール")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--python", default=sys.executable, help="計測に使うPythonインタープリター")
+    parser.add_argument("--layer-dir", help="Layerのpythonディレクトリ（例: lambda_layer/python）")
+    parser.add_argument("--cold-bytecode", action="store_true", help="バイトコードキャッシュを使わずに計測")
+    parser.add_argument("--top", type=int, default=15, help="表示するパッケージ数")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="結果を追記する履歴ファイル（JSON Lines）")
+    parser.add_argument("--record", action="store_true", help="結果を履歴ファイルに追記")
+    parser.add_argument("--baseline", help="比較対象の結果ファイル（省略時は履歴の最新の結果）")
+    parser.add_argument("--max-init-ms", type=float, help="init時間の上限（ミリ秒）")
+    parser.add_argument("--max-regression-pct", type=float, help="ベースラインからの増加率の上限（%%）")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力")
+    args = parser.parse_args()
+
+    try:
+        result = benchmark(args.module, args.repeat, args.python, args.layer_dir, args.cold_bytecode)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    baseline = load_baseline(args.baseline or args.history, args.module)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2, sort_keys=True))
+    else:
+        print_report(result, baseline, args.top)
+
+    failures = check_regression(result, baseline, args.max_init_ms, args.max_regression_pct)
+    if args.record and not failures:
+        append_history(args.history, result)
+
+    for failure in failures:
+        print(f"失敗: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+ハンドラーのエンドツーエンドのレイテンシのベンチマーク
+ローカルの代替サーバー（fake_bedrock.py）に接続先を向けた実際のstrands・boto3で、Function URLの
+イベントをlambda_handlerに渡し、同時実行数ごとに次の値を計測する。
+
+- レイテンシのp50・p95・p99
+- ハンドラー側のオーバーヘッド（レイテンシからモデル呼び出しの時間を除いたもの、p50・p95・p99）
+- スループット（1秒あたりのリクエスト数）
+
+モデル呼び出しの時間はレスポンスのmetricsフィールド（model_calls_ms）から取得する。
+strands・boto3がインストールされた環境（uv sync、またはLayerのディレクトリを--layer-dirで指定）で実行する。
+
+使用例:
+    python benchmarks/bench_handler.py
+    python benchmarks/bench_handler.py --concurrency 1,8,32 --requests 200 --tool-turns 1
+    python benchmarks/bench_handler.py --throttle-rate 0.05 --env ENABLE_ASYNC_HANDLER=true --json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+LAMBDA_DIR = os.path.join(ROOT, 'lambda')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_bedrock import FakeBedrockServer, add_arguments, config_from_args  # noqa: E402
+
+DEFAULT_MODEL_ID = "us.amazon.nova-lite-v1:0"
+
+# 実際のリクエストに近いプロンプト（単純な質問、ツールが必要な質問、長めの説明の依頼）
+DEFAULT_PROMPTS = [
+    "こんにちは。自己紹介をしてください。",
+    "25 * 4 を計算してください。",
+    "現在の日時を教えてください。",
+    "「Hello World」のSHA256ハッシュ値を生成してください。",
+    "Lambda関数のコールドスタートを短くする方法を3つ説明してください。",
+]
+
+# 代替サーバーを使うLambda実行環境の環境変数（キャッシュはレイテンシを変えるため無効にする）
+BENCH_ENV = {
+    "AWS_REGION": "us-east-1",
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_ACCESS_KEY_ID": "fake",
+    "AWS_SECRET_ACCESS_KEY": "fake",
+    "AWS_LAMBDA_FUNCTION_NAME": "handler-benchmark",
+    "AWS_LAMBDA_FUNCTION_MEMORY_SIZE": "1024",
+    "ENABLE_RESPONSE_CACHE": "false",
+    "ENABLE_SEMANTIC_CACHE": "false",
+    "LOG_LEVEL": "WARNING",
+}
+
+
+class LambdaContext:
+    """Lambda実行コンテキストの代替（呼び出しごとの残り時間を返す）"""
+
+    def __init__(self, request_id: str, timeout_ms: int = 300000):
+        self.aws_request_id = request_id
+        self.function_name = BENCH_ENV["AWS_LAMBDA_FUNCTION_NAME"]
+        self.function_version = "$LATEST"
+        self.memory_limit_in_mb = BENCH_ENV["AWS_LAMBDA_FUNCTION_MEMORY_SIZE"]
+        self._deadline = time.monotonic() + timeout_ms / 1000
+
+    def get_remaining_time_in_millis(self) -> int:
+        return max(0, int((self._deadline - time.monotonic()) * 1000))
+
+
+def make_event(prompt: str, model_id: str = DEFAULT_MODEL_ID) -> Dict[str, Any]:
+    """Lambda Function URLのイベント（計測値をレスポンスに含める）"""
+    return {
+        "version": "2.0",
+        "rawPath": "/",
+        "headers": {"content-type": "application/json"},
+        "requestContext": {"http": {"method": "POST", "path": "/"}},
+        "body": json.dumps({"prompt": prompt, "model_config": {"model": model_id}, "metrics": True},
+                           ensure_ascii=False),
+        "isBase64Encoded": False,
+    }
+
+
+def percentile(values: Sequence[float], pct: float) -> Optional[float]:
+    """線形補間によるパーセンタイル（値がなければNone）"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * pct / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def _distribution(values: Sequence[float]) -> Dict[str, Optional[float]]:
+    return {
+        name: round(value, 3) if value is not None else None
+        for name, value in (("p50", percentile(values, 50)), ("p95", percentile(values, 95)),
+                            ("p99", percentile(values, 99)))
+    }
+
+
+def sample_from_result(result: Dict[str, Any], latency_ms: float) -> Dict[str, Any]:
+    """ハンドラーの戻り値から1リクエストの計測値を取り出す"""
+    try:
+        body = json.loads(result.get("body") or "{}")
+    except (TypeError, ValueError):
+        body = {}
+    status = body.get("status", "completed") if result.get("statusCode") == 200 else "error"
+    metrics = body.get("metrics") or {}
+    model_ms = sum(metrics.get("model_calls_ms") or [])
+    return {
+        "latency_ms": latency_ms,
+        "model_ms": model_ms,
+        "overhead_ms": max(0.0, latency_ms - model_ms),
+        "status": status,
+        "tool_calls": len(metrics.get("tool_calls") or []),
+    }
+
+
+def summarize_level(samples: List[Dict[str, Any]], elapsed_s: float, concurrency: int) -> Dict[str, Any]:
+    """同時実行数ごとの集計（失敗したリクエストはレイテンシの集計から除く）"""
+    ok = [sample for sample in samples if sample["status"] != "error"]
+    statuses: Dict[str, int] = {}
+    for sample in samples:
+        statuses[sample["status"]] = statuses.get(sample["status"], 0) + 1
+    return {
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "statuses": statuses,
+        "elapsed_s": round(elapsed_s, 3),
+        "throughput_rps": round(len(ok) / elapsed_s, 3) if elapsed_s > 0 else None,
+        "latency_ms": _distribution([sample["latency_ms"] for sample in ok]),
+        "overhead_ms": _distribution([sample["overhead_ms"] for sample in ok]),
+        "model_ms": _distribution([sample["model_ms"] for sample in ok]),
+    }
+
+
+def run_level(
+    handler: Callable[[Dict[str, Any], Any], Dict[str, Any]],
+    concurrency: int,
+    requests: int,
+    prompts: Sequence[str],
+    model_id: str = DEFAULT_MODEL_ID
+) -> Dict[str, Any]:
+    """concurrency本のスレッドからrequests件のリクエストを送り、集計を返す"""
+    def invoke(index: int) -> Dict[str, Any]:
+        event = make_event(prompts[index % len(prompts)], model_id)
+        start = time.perf_counter()
+        try:
+            result = handler(event, LambdaContext(f"bench-{concurrency}-{index}"))
+        except Exception:
+            result = {"statusCode": 500}
+        return sample_from_result(result, (time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(invoke, range(requests)))
+    return summarize_level(samples, time.perf_counter() - start, concurrency)
+
+
+def load_handler(endpoint_url: str, layer_dir: Optional[str] = None,
+                 env: Optional[Dict[str, str]] = None) -> Callable[..., Any]:
+    """接続先を代替サーバーに向けてハンドラーモジュールをインポート"""
+    os.environ.update(BENCH_ENV)
+    os.environ.update(env or {})
+    os.environ["AWS_ENDPOINT_URL_BEDROCK_RUNTIME"] = endpoint_url
+    for path in (layer_dir, LAMBDA_DIR):
+        if path and path not in sys.path:
+            sys.path.insert(0, path)
+    try:
+        import lambda_function
+    except ImportError as e:
+        raise RuntimeError(
+            f"ハンドラーのインポートに失敗しました（strands・boto3が必要です）: {e}"
+        ) from e
+    return lambda_function.lambda_handler
+
+
+def print_report(result: Dict[str, Any]) -> None:
+    server = result["server"]
+    print(f"Python {result['python']}  モデル: {result['model_id']}  代替サーバー: {json.dumps(result['fake_bedrock'])}")
+    print(f"\n{'同時実行':>8}{'件数':>8}{'rps':>10}"
+          f"{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}"
+          f"{'OH p50':>10}{'OH p95':>10}{'OH p99':>10}  状態")
+
+    def cell(value: Optional[float]) -> str:
+        return f"{value:>10.1f}" if value is not None else f"{'-':>10}"
+
+    for level in result["levels"]:
+        latency, overhead = level["latency_ms"], level["overhead_ms"]
+        print(
+            f"{level['concurrency']:>8}{level['requests']:>8}{cell(level['throughput_rps'])}"
+            f"{cell(latency['p50'])}{cell(latency['p95'])}{cell(latency['p99'])}"
+            f"{cell(overhead['p50'])}{cell(overhead['p95'])}{cell(overhead['p99'])}  {level['statuses']}"
+        )
+    print("\nOH: レイテンシからモデル呼び出しの時間を除いたハンドラー側のオーバーヘッド")
+    print(f"代替サーバーの集計: {server}")
+
+
+def _parse_env(values: List[str]) -> Dict[str, str]:
+    env = {}
+    for value in values:
+        key, sep, item = value.partition("=")
+        if not sep:
+            raise argparse.ArgumentTypeError(f"KEY=VALUEの形式で指定してください: {value}")
+        env[key] = item
+    return env
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="ハンドラーのエンドツーエンドのレイテンシのベンチマーク")
+    parser.add_argument("--concurrency", default="1,4,16", help="同時実行数（カンマ区切り）")
+    parser.add_argument("--requests", type=int, default=50, help="同時実行数ごとのリクエスト数")
+    parser.add_argument("--warmup", type=int, default=3, help="計測前の呼び出し回数（Agentと接続の準備）")
+    parser.add_argument("--model-id", default=DEFAULT_MODEL_ID)
+    parser.add_argument("--prompts", help="プロンプトのファイル（1行に1つ）")
+    parser.add_argument("--layer-dir", help="Layerのpythonディレクトリ（例: lambda_layer/python）")
+    parser.add_argument("--env", action="append", default=[], help="ハンドラーの環境変数（KEY=VALUE、複数指定可）")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    levels = [int(value) for value in args.concurrency.split(",") if value.strip()]
+    prompts = DEFAULT_PROMPTS
+    if args.prompts:
+        with open(args.prompts, encoding="utf-8") as f:
+            prompts = [line.strip() for line in f if line.strip()]
+
+    fake_config = config_from_args(args)
+    with FakeBedrockServer(fake_config) as server:
+        try:
+            handler = load_handler(server.url, args.layer_dir, _parse_env(args.env))
+        except (RuntimeError, argparse.ArgumentTypeError) as e:
+            print(e, file=sys.stderr)
+            return 2
+
+        for index in range(args.warmup):
+            handler(make_event(prompts[index % len(prompts)], args.model_id), LambdaContext(f"warmup-{index}"))
+
+        result = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "model_id": args.model_id,
+            "fake_bedrock": {key: value for key, value in vars(fake_config).items() if value is not None},
+            "levels": [run_level(handler, level, args.requests, prompts, args.model_id) for level in levels],
+        }
+        result["server"] = server.stats()
+
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2, sort_keys=True))
+    else:
+        print_report(result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+text_analyzerのベンチマーク
+以前の実装（文字種別ごとに7回走査）と1パス実装の処理時間を比較する
+
+使用例:
+    python benchmarks/bench_text_analyzer.py
+    python benchmarks/bench_text_analyzer.py --size-mb 8 --repeat 3
+"""
+import argparse
+import os
+import sys
+import time
+from unittest.mock import Mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'tests'))
+
+try:
+    import strands  # noqa: F401
+except ImportError:
+    # ベンチマーク対象は@toolを付けていない関数のみなので、strandsがなくても実行できるようにする
+    sys.modules['strands'] = Mock()
+
+from custom_tools import TextStats, analyze_text_chunks
+from test_custom_tools import reference_text_stats
+
+SAMPLE = "Strands Agentはツールを使うAIエージェントです。Hello World 123\nカタカナ、ひらがな、漢字。\t"
+
+
+def _time(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size-mb", type=float, default=2.0, help="テキストサイズ（MB、UTF-8換算の目安）")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--chunk-kb", type=int, default=256, help="チャンク処理時のチャンクサイズ（KB）")
+    args = parser.parse_args()
+
+    copies = max(1, int(args.size_mb * 1024 * 1024 / len(SAMPLE.encode("utf-8"))))
+    text = SAMPLE * copies
+    chunk_size = args.chunk_kb * 1024
+
+    print(f"テキスト: {len(text):,}文字 ({len(text.encode('utf-8')) / 1024 / 1024:.1f} MB)")
+
+    legacy_time, legacy = _time(lambda: reference_text_stats(text), args.repeat)
+    single_time, single = _time(lambda: TextStats().update(text).to_dict(), args.repeat)
+    chunked_time, chunked = _time(
+        lambda: analyze_text_chunks(text[i:i + chunk_size] for i in range(0, len(text), chunk_size)),
+        args.repeat
+    )
+
+    assert legacy == single == chunked, "集計結果が一致しません"
+
+    print(f"{'実装':<20}{'時間(秒)':>12}{'倍率':>10}")
+    for name, elapsed in (("以前の実装", legacy_time), ("1パス", single_time), ("1パス（チャンク）", chunked_time)):
+        print(f"{name:<20}{elapsed:>12.4f}{legacy_time / elapsed:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
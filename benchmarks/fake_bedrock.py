@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+ローカルで動くBedrock Converse / ConverseStream APIの代替サーバー
+strandsのBedrockModel（boto3のbedrock-runtimeクライアント）の接続先をこのサーバーに向け、
+AWSを使わずにハンドラー全体（Agent、ツールの実行、イベントの変換）の処理時間を計測する。
+
+応答の速さ（最初のトークンまでの時間、1秒あたりの出力トークン数）、ツール呼び出しのターン数、
+スロットリングの発生率を設定できる。boto3はAWS_ENDPOINT_URL_BEDROCK_RUNTIMEで接続先を切り替えられる。
+
+使用例:
+    python benchmarks/fake_bedrock.py --port 8900 --tokens-per-second 80 --tool-turns 1
+    AWS_ENDPOINT_URL_BEDROCK_RUNTIME=http://127.0.0.1:8900 AWS_ACCESS_KEY_ID=fake AWS_SECRET_ACCESS_KEY=fake \\
+        python tests/test_lambda.py --real
+"""
+import argparse
+import json
+import random
+import re
+import struct
+import threading
+import time
+import uuid
+import zlib
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import unquote
+
+_PATH = re.compile(r'^/model/(?P<model_id>[^/]+)/(?P<operation>converse|converse-stream)$')
+
+# ツールごとの呼び出し時の入力（指定がないツールは空の入力で呼び出す）
+DEFAULT_TOOL_INPUTS = {
+    "calculator": {"expression": "25 * 4"},
+    "current_time": {"timezone": "Asia/Tokyo"},
+    "generate_hash": {"text": "Hello World", "algorithm": "sha256"},
+    "text_analyzer": {"text": "ベンチマーク用のテキストです。"},
+}
+
+
+@dataclass
+class FakeBedrockConfig:
+    """代替サーバーの応答の設定"""
+
+    first_token_ms: float = 200.0  # リクエストを受けてから最初のトークンまでの時間
+    tokens_per_second: float = 50.0  # 出力トークンの生成速度（0の場合は待たない）
+    output_tokens: int = 40  # テキストの応答のトークン数
+    tool_turns: int = 0  # テキストで応答する前にツールを呼び出すターン数
+    tool_name: str = "calculator"  # 呼び出すツール（リクエストに含まれない場合は最初のツール）
+    tool_input: Optional[Dict[str, Any]] = None
+    throttle_rate: float = 0.0  # ThrottlingExceptionを返す割合
+    seed: Optional[int] = None
+
+
+@dataclass
+class FakeBedrockStats:
+    requests: int = 0
+    streamed: int = 0
+    throttled: int = 0
+    tool_uses: int = 0
+    simulated_ms: float = 0.0
+    models: Dict[str, int] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "streamed": self.streamed,
+            "throttled": self.throttled,
+            "tool_uses": self.tool_uses,
+            "simulated_ms": round(self.simulated_ms, 3),
+            "models": dict(self.models),
+        }
+
+
+def encode_event(event_type: str, payload: Dict[str, Any]) -> bytes:
+    """ConverseStreamのイベントをAWSイベントストリーム形式の1メッセージにエンコード
+
+    形式: 全体の長さ(4) ヘッダーの長さ(4) プレリュードのCRC32(4) ヘッダー ペイロード メッセージのCRC32(4)
+    """
+    headers = b""
+    for name, value in ((":event-type", event_type), (":content-type", "application/json"), (":message-type", "event")):
+        name_bytes, value_bytes = name.encode("utf-8"), value.encode("utf-8")
+        # 値の型7は文字列
+        headers += bytes([len(name_bytes)]) + name_bytes + b"\x07" + struct.pack(">H", len(value_bytes)) + value_bytes
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    prelude = struct.pack(">II", 12 + len(headers) + len(body) + 4, len(headers))
+    message = prelude + struct.pack(">I", zlib.crc32(prelude)) + headers + body
+    return message + struct.pack(">I", zlib.crc32(message))
+
+
+def _tool_turns_since_prompt(messages: List[Dict[str, Any]]) -> int:
+    """最後のユーザーの発話（テキスト）以降にツールの結果を返したターン数"""
+    turns = 0
+    for message in reversed(messages):
+        if message.get("role") != "user":
+            continue
+        if any("toolResult" in block for block in message.get("content", [])):
+            turns += 1
+        else:
+            break
+    return turns
+
+
+def plan_reply(request: Dict[str, Any], config: FakeBedrockConfig) -> Tuple[str, Any]:
+    """リクエストに対する応答を決める（("tool_use", toolUseブロック) または ("text", テキスト)）"""
+    tools = [
+        tool["toolSpec"]["name"] for tool in (request.get("toolConfig") or {}).get("tools", []) if "toolSpec" in tool
+    ]
+    if tools and _tool_turns_since_prompt(request.get("messages", [])) < config.tool_turns:
+        name = config.tool_name if config.tool_name in tools else tools[0]
+        tool_input = config.tool_input if config.tool_input is not None else DEFAULT_TOOL_INPUTS.get(name, {})
+        return "tool_use", {"toolUseId": f"tooluse_{uuid.uuid4().hex[:22]}", "name": name, "input": tool_input}
+    return "text", " ".join(f"token{index}" for index in range(config.output_tokens))
+
+
+def _input_tokens(request: Dict[str, Any]) -> int:
+    text = json.dumps([request.get("system"), request.get("messages"), request.get("toolConfig")], ensure_ascii=False)
+    return max(1, len(text) // 4)
+
+
+class FakeBedrockServer:
+    """代替サーバーを別スレッドで起動する（with文で起動・停止）"""
+
+    def __init__(self, config: Optional[FakeBedrockConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or FakeBedrockConfig()
+        self._stats = FakeBedrockStats()
+        self._lock = threading.Lock()
+        self._random = random.Random(self.config.seed)
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeBedrockServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-bedrock", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeBedrockServer":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return self._stats.to_dict()
+
+    def _record(self, model_id: str, streamed: bool, throttled: bool = False, tool_use: bool = False) -> None:
+        with self._lock:
+            self._stats.requests += 1
+            self._stats.streamed += int(streamed)
+            self._stats.throttled += int(throttled)
+            self._stats.tool_uses += int(tool_use)
+            self._stats.models[model_id] = self._stats.models.get(model_id, 0) + 1
+
+    def _add_simulated(self, duration_ms: float) -> None:
+        with self._lock:
+            self._stats.simulated_ms += duration_ms
+
+    def _throttle(self) -> bool:
+        with self._lock:
+            return self._random.random() < self.config.throttle_rate
+
+    def _handler_class(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # 共有の接続プールが接続を再利用できるようにキープアライブで応答する
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+            def do_POST(self) -> None:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                match = _PATH.match(self.path.split("?")[0])
+                if not match:
+                    self._send_json(404, {"message": f"Unknown operation: {self.path}"},
+                                    error_type="UnknownOperationException")
+                    return
+                model_id = unquote(match.group("model_id"))
+                streamed = match.group("operation") == "converse-stream"
+                if server._throttle():
+                    server._record(model_id, streamed, throttled=True)
+                    self._send_json(429, {"message": "Too many requests, please wait before trying again."},
+                                    error_type="ThrottlingException")
+                    return
+
+                started = time.perf_counter()
+                kind, reply = plan_reply(request, server.config)
+                server._record(model_id, streamed, tool_use=kind == "tool_use")
+                if streamed:
+                    self._stream(request, kind, reply, started)
+                else:
+                    self._converse(request, kind, reply, started)
+
+            def _send_json(self, status: int, payload: Dict[str, Any], error_type: Optional[str] = None) -> None:
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                if error_type:
+                    self.send_header("x-amzn-ErrorType", error_type)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _write_chunk(self, data: bytes) -> None:
+                self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def _usage(self, request: Dict[str, Any], output_tokens: int, started: float) -> Dict[str, Any]:
+                """応答の最後に返すトークン数と所要時間（応答を書き終える前にサーバーの集計に加える）"""
+                input_tokens = _input_tokens(request)
+                server._add_simulated((time.perf_counter() - started) * 1000)
+                return {
+                    "usage": {
+                        "inputTokens": input_tokens,
+                        "outputTokens": output_tokens,
+                        "totalTokens": input_tokens + output_tokens,
+                    },
+                    "metrics": {"latencyMs": int((time.perf_counter() - started) * 1000)},
+                }
+
+            def _converse(self, request: Dict[str, Any], kind: str, reply: Any, started: float) -> None:
+                config = server.config
+                if kind == "tool_use":
+                    content, output_tokens, stop_reason = [{"toolUse": reply}], 20, "tool_use"
+                else:
+                    content, output_tokens, stop_reason = [{"text": reply}], config.output_tokens, "end_turn"
+                delay = config.first_token_ms / 1000
+                if config.tokens_per_second > 0:
+                    delay += output_tokens / config.tokens_per_second
+                time.sleep(delay)
+                self._send_json(200, {
+                    "output": {"message": {"role": "assistant", "content": content}},
+                    "stopReason": stop_reason,
+                    **self._usage(request, output_tokens, started),
+                })
+
+            def _stream(self, request: Dict[str, Any], kind: str, reply: Any, started: float) -> None:
+                config = server.config
+                self.send_response(200)
+                self.send_header("Content-Type", "application/vnd.amazon.eventstream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                time.sleep(config.first_token_ms / 1000)
+                self._write_chunk(encode_event("messageStart", {"role": "assistant"}))
+
+                if kind == "tool_use":
+                    output_tokens, stop_reason = 20, "tool_use"
+                    self._write_chunk(encode_event("contentBlockStart", {
+                        "contentBlockIndex": 0,
+                        "start": {"toolUse": {"toolUseId": reply["toolUseId"], "name": reply["name"]}},
+                    }))
+                    self._write_chunk(encode_event("contentBlockDelta", {
+                        "contentBlockIndex": 0,
+                        "delta": {"toolUse": {"input": json.dumps(reply["input"], ensure_ascii=False)}},
+                    }))
+                else:
+                    tokens = reply.split(" ")
+                    output_tokens, stop_reason = len(tokens), "end_turn"
+                    for index, token in enumerate(tokens):
+                        if index and config.tokens_per_second > 0:
+                            time.sleep(1 / config.tokens_per_second)
+                        text = token if index == 0 else f" {token}"
+                        self._write_chunk(encode_event("contentBlockDelta", {
+                            "contentBlockIndex": 0, "delta": {"text": text}
+                        }))
+
+                self._write_chunk(encode_event("contentBlockStop", {"contentBlockIndex": 0}))
+                self._write_chunk(encode_event("messageStop", {"stopReason": stop_reason}))
+                self._write_chunk(encode_event("metadata", self._usage(request, output_tokens, started)))
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """応答の設定のコマンドライン引数（ベンチマークと共用）"""
+    defaults = FakeBedrockConfig()
+    parser.add_argument("--first-token-ms", type=float, default=defaults.first_token_ms,
+                        help="最初のトークンまでの時間（ミリ秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=defaults.tokens_per_second,
+                        help="出力トークンの生成速度（0で待たない）")
+    parser.add_argument("--output-tokens", type=int, default=defaults.output_tokens, help="テキストの応答のトークン数")
+    parser.add_argument("--tool-turns", type=int, default=defaults.tool_turns, help="応答の前にツールを呼び出すターン数")
+    parser.add_argument("--tool-name", default=defaults.tool_name, help="呼び出すツール")
+    parser.add_argument("--throttle-rate", type=float, default=defaults.throttle_rate,
+                        help="ThrottlingExceptionを返す割合（0〜1）")
+    parser.add_argument("--seed", type=int, help="スロットリングの乱数のシード")
+
+
+def config_from_args(args: argparse.Namespace) -> FakeBedrockConfig:
+    return FakeBedrockConfig(
+        first_token_ms=args.first_token_ms,
+        tokens_per_second=args.tokens_per_second,
+        output_tokens=args.output_tokens,
+        tool_turns=args.tool_turns,
+        tool_name=args.tool_name,
+        throttle_rate=args.throttle_rate,
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="ローカルで動くBedrock Converse / ConverseStream APIの代替サーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = FakeBedrockServer(config_from_args(args), args.host, args.port)
+    print(f"代替サーバーを起動しました: {server.url}")
+    print(f"  export AWS_ENDPOINT_URL_BEDROCK_RUNTIME={server.url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(server.stats(), ensure_ascii=False))
+        server._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
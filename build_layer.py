@@ -1,70 +1,302 @@
 #!/usr/bin/env python3
 """
 依存関係を含むLambda Layerをビルド
+
+--optimize を指定すると、対象バージョンのバイトコード（unchecked-hash形式のpyc）を
+事前にコンパイルし、型スタブ・ドキュメント・ロケールなど実行時に使わないファイルを削除する。
+Lambdaのファイルシステムは読み取り専用でpycを書き込めないため、事前コンパイルしないと
+コールドスタートのたびにソースからコンパイルされる。
 """
+import argparse
+import fnmatch
+import json
 import os
 import shutil
 import subprocess
 import sys
 
 
-def build_layer():
+LAYER_DIR = "lambda_layer"
+# ビルドしたPythonバージョンを記録するファイル（CDKのシンセサイズ時にランタイムと照合する）
+LAYER_METADATA = "layer-metadata.json"
+
+# 実行時に使わないファイル（--optimize時に削除）
+STRIP_FILE_PATTERNS = ["*.pyi", "*.pyx", "*.pxd", "*.c", "*.h", "*.cpp"]
+# Pythonパッケージ（__init__.pyを含む）でない場合のみ削除するディレクトリ
+STRIP_DATA_DIRS = ["docs", "doc", "examples", "locale", "locales"]
+# インポートトレースに現れなくても削除しないトップレベルパッケージ（実行時に遅延インポートされるもの）
+DEFAULT_KEEP = ["boto3", "botocore", "s3transfer", "certifi", "urllib3", "pip", "setuptools"]
+# ツールの実行時（http_request・use_aws・calculatorなどの呼び出し時）に初めてインポートされるパッケージ
+# （トレースはツールを読み込むだけで実行しないため、ここで保護する）
+TOOL_RUNTIME_KEEP = [
+    "strands_tools", "requests", "charset_normalizer", "chardet", "idna", "aws_requests_auth", "jwt",
+    "markdownify", "bs4", "soupsieve", "rich", "pygments", "markdown_it", "mdurl", "prompt_toolkit",
+    "wcwidth", "sympy", "mpmath", "dateutil", "jmespath", "six", "tzdata",
+]
+
+# インポートトレース: ハンドラーと全ツールを読み込み、使用したトップレベルモジュールを出力する
+TRACE_SCRIPT = """
+import json, sys
+import lambda_function
+lambda_function._lazy_imports()
+lambda_function._build_tools()
+print(json.dumps(sorted({name.split('.')[0] for name in sys.modules})))
+"""
+
+
+def _layer_size(path):
+    total_size = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for f in filenames:
+            total_size += os.path.getsize(os.path.join(dirpath, f))
+    return total_size
+
+
+def _find_python(python_version):
+    """対象バージョンのPythonインタープリターを探す（pycのマジックナンバーを合わせるため）"""
+    if f"{sys.version_info.major}.{sys.version_info.minor}" == python_version:
+        return sys.executable
+    found = shutil.which(f"python{python_version}")
+    if found:
+        return found
+    try:
+        return subprocess.run(
+            ["uv", "python", "find", python_version], capture_output=True, text=True, check=True
+        ).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def strip_unused_files(python_dir):
+    """型スタブ・ソース・ドキュメント・ロケールなど実行時に使わないファイルを削除"""
+    removed = 0
+    for root, dirs, files in os.walk(python_dir):
+        if root.endswith(".dist-info"):
+            continue
+        for dir_name in list(dirs):
+            path = os.path.join(root, dir_name)
+            if dir_name in STRIP_DATA_DIRS and not os.path.exists(os.path.join(path, "__init__.py")):
+                shutil.rmtree(path)
+                dirs.remove(dir_name)
+                removed += 1
+        for file in files:
+            if any(fnmatch.fnmatch(file, pattern) for pattern in STRIP_FILE_PATTERNS):
+                os.remove(os.path.join(root, file))
+                removed += 1
+    return removed
+
+
+def trace_imports(python, python_dir):
+    """ハンドラーとツールを実際にインポートし、使用されたトップレベルモジュール名を返す"""
+    env = {key: value for key, value in os.environ.items() if not key.startswith("PYTHON")}
+    lambda_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lambda")
+    env["PYTHONPATH"] = os.pathsep.join([lambda_dir, os.path.abspath(python_dir)])
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    proc = subprocess.run([python, "-c", TRACE_SCRIPT], env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"インポートトレースに失敗しました:\n{proc.stderr[-2000:]}")
+    return set(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+
+def _top_level_name(entry):
+    # six.py, _cffi_backend.cpython-311-aarch64-linux-gnu.so, numpy.libs などはすべて先頭の名前で判定
+    return entry.split(".")[0]
+
+
+def prune_unused_packages(python_dir, imported, keep):
+    """インポートトレースに現れないトップレベルパッケージと、そのdist-infoを削除"""
+    removed = []
+    for entry in sorted(os.listdir(python_dir)):
+        path = os.path.join(python_dir, entry)
+        if entry.endswith((".dist-info", ".egg-info", ".pth")) or entry == "__pycache__":
+            continue
+        name = _top_level_name(entry)
+        if name in imported or name in keep:
+            continue
+        if entry == "bin" or os.path.isdir(path) or entry.endswith((".py", ".so", ".pyd")):
+            shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+            removed.append(entry)
+
+    # 含まれるパッケージがすべて削除されたディストリビューションのメタデータを削除
+    for entry in os.listdir(python_dir):
+        record = os.path.join(python_dir, entry, "RECORD")
+        if not entry.endswith(".dist-info") or not os.path.exists(record):
+            continue
+        with open(record, encoding="utf-8") as f:
+            tops = {line.split("/")[0].split(",")[0] for line in f if line.strip()}
+        tops = {t for t in tops if not t.endswith(".dist-info") and not t.startswith("..")}
+        if tops and not any(os.path.exists(os.path.join(python_dir, t)) for t in tops):
+            shutil.rmtree(os.path.join(python_dir, entry))
+    return removed
+
+
+def compile_bytecode(python, python_dir, optimize_levels):
+    """対象バージョンのインタープリターでunchecked-hash形式のpycを事前コンパイル
+
+    unchecked-hash形式はソースのタイムスタンプやハッシュを検証しないため、
+    インポート時のstat・ハッシュ計算を省略できる（Layerは不変なので安全）。
+    """
+    command = [python, "-m", "compileall", "-q", "-j", "0", "--invalidation-mode", "unchecked-hash"]
+    for level in optimize_levels:
+        command += ["-o", str(level)]
+    # Python 2専用の構文を含むファイルなどはコンパイルできないため、失敗しても続行する
+    if subprocess.call(command + [python_dir]) != 0:
+        print("警告: 一部のファイルをコンパイルできませんでした（該当ファイルは実行時にコンパイルされます）")
+
+
+def measure_import_time(python, python_dir, repeat):
+    """bench_cold_startでハンドラーのインポート時間（init時間）を計測"""
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks"))
+    from bench_cold_start import benchmark
+    try:
+        return benchmark("lambda_function", repeat, python=python, layer_dir=os.path.abspath(python_dir))
+    except RuntimeError as e:
+        print(f"警告: インポート時間を計測できませんでした（ビルド環境と対象のアーキテクチャが異なる場合など）\n{e}")
+        return None
+
+
+def build_layer(
+    python_version="3.11",
+    layer_dir=LAYER_DIR,
+    extra_packages=(),
+    optimize=False,
+    prune_unused=False,
+    keep=(),
+    optimize_levels=(0,),
+    report=False,
+    repeat=5
+):
     """依存関係を含むLambda Layerをビルド"""
     print("Lambda Layerをビルド中...")
-    
+
     # ディレクトリ構造を作成
-    layer_dir = "lambda_layer"
     python_dir = os.path.join(layer_dir, "python")
-    
+
     # 既存のレイヤーディレクトリをクリーンアップ
     if os.path.exists(layer_dir):
         shutil.rmtree(layer_dir)
-    
+
     os.makedirs(python_dir)
-    
+
     # pyproject.tomlから依存関係をインストール
     print("uvを使用して依存関係をインストール中...")
-    
+
     # pyproject.tomlから依存関係を読み取って直接インストール
     subprocess.check_call([
         "uv", "pip", "install",
-        "strands-agents>=0.1.7",
-        "strands-agents-tools>=0.1.5",
+        "strands-agents>=1.13.0",
+        "strands-agents-tools>=0.2.0",
+        "orjson>=3.8",
+        *extra_packages,
         "--target", python_dir,
         "--python-platform", "aarch64-unknown-linux-gnu",
-        "--python-version", "3.11"
+        "--python-version", python_version
     ])
-    
+
     # レイヤーサイズを削減するため不要なファイルを削除
     print("不要なファイルをクリーンアップ中...")
     for root, dirs, files in os.walk(python_dir):
         # __pycache__ディレクトリを削除
         if "__pycache__" in dirs:
             shutil.rmtree(os.path.join(root, "__pycache__"))
-        
+
         # .pycファイルを削除
         for file in files:
             if file.endswith(".pyc") or file.endswith(".pyo"):
                 os.remove(os.path.join(root, file))
-        
+
         # テストディレクトリを削除
         for dir_name in ["tests", "test", "__tests__", "testing"]:
             if dir_name in dirs:
                 shutil.rmtree(os.path.join(root, dir_name))
-    
+
+    results = {"before": {"size": _layer_size(layer_dir)}}
+    python = _find_python(python_version) if (optimize or prune_unused or report) else None
+    if (optimize or prune_unused or report) and python is None:
+        print(f"エラー: Python {python_version} が見つかりません（uv python install {python_version} でインストールできます）")
+        sys.exit(1)
+
+    if report:
+        results["before"]["import"] = measure_import_time(python, python_dir, repeat)
+
+    if prune_unused:
+        print("インポートトレースで使用されていないパッケージを削除中...")
+        try:
+            imported = trace_imports(python, python_dir)
+        except RuntimeError as e:
+            print(f"警告: インポートトレースに失敗したため、パッケージの削除をスキップします"
+                  f"（ビルド環境と対象のアーキテクチャが異なる場合など）\n{e}")
+        else:
+            removed = prune_unused_packages(
+                python_dir, imported, set(DEFAULT_KEEP) | set(TOOL_RUNTIME_KEEP) | set(keep)
+            )
+            print(f"削除したパッケージ: {', '.join(removed) if removed else 'なし'}")
+
+    if optimize:
+        print("実行時に使わないファイルを削除中...")
+        print(f"削除したファイル・ディレクトリ: {strip_unused_files(python_dir)}")
+        print(f"Python {python_version} のバイトコードを事前コンパイル中...")
+        compile_bytecode(python, python_dir, optimize_levels)
+
+    with open(os.path.join(layer_dir, LAYER_METADATA), "w", encoding="utf-8") as f:
+        json.dump({"python_version": python_version, "platform": "aarch64-unknown-linux-gnu"}, f)
+
     print(f"Lambda Layerが{layer_dir}/に正常にビルドされました")
-    
+
     # レイヤーサイズを確認
-    total_size = 0
-    for dirpath, dirnames, filenames in os.walk(layer_dir):
-        for f in filenames:
-            fp = os.path.join(dirpath, f)
-            total_size += os.path.getsize(fp)
-    
+    total_size = _layer_size(layer_dir)
+    results["after"] = {"size": total_size}
+
     print(f"レイヤーサイズ: {total_size / 1024 / 1024:.2f} MB")
     if total_size > 250 * 1024 * 1024:  # 250 MB制限
-        print("警告: レイヤーサイズがLambdaの250MB制限を超えています！")
+        print("警告: レイヤーサイズがLambdaの250MB制限を超えています！（コンテナイメージ形式では制限は10GB）")
+
+    if report:
+        results["after"]["import"] = measure_import_time(python, python_dir, repeat)
+        print_report(results)
+    return results
+
+
+def print_report(results):
+    before, after = results["before"], results["after"]
+    print("\n最適化レポート")
+    print(f"  レイヤーサイズ: {before['size'] / 1024 / 1024:.2f} MB → {after['size'] / 1024 / 1024:.2f} MB")
+    if before.get("import") and after.get("import"):
+        before_ms, after_ms = before["import"]["init_ms"], after["import"]["init_ms"]
+        print(f"  インポート時間（init、中央値）: {before_ms:.1f} ms → {after_ms:.1f} ms")
+        packages = sorted(after["import"]["packages"].items(), key=lambda item: item[1], reverse=True)
+        for name, elapsed in packages[:10]:
+            previous = before["import"]["packages"].get(name, 0.0)
+            print(f"    {name:<24}{previous:>10.1f} ms → {elapsed:>8.1f} ms")
 
 
 if __name__ == "__main__":
-    build_layer()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="依存関係を含むLambda Layerをビルド")
+    parser.add_argument("--python-version", default="3.11",
+                        help="対象のPythonバージョン（SnapStartを使う場合は3.12）")
+    parser.add_argument("--layer-dir", default=LAYER_DIR, help="出力先ディレクトリ（python/配下にインストール）")
+    parser.add_argument("--extra-package", action="append", default=[],
+                        help="追加でインストールするパッケージ（追加ツール用、複数指定可）")
+    parser.add_argument("--optimize", action="store_true",
+                        help="バイトコードの事前コンパイルと不要ファイルの削除を行う")
+    parser.add_argument("--optimize-level", type=int, action="append", choices=[0, 1, 2],
+                        help="コンパイルする最適化レベル（複数指定可、デフォルト: 0）")
+    parser.add_argument("--prune-unused", action="store_true",
+                        help="インポートトレースに現れないトップレベルパッケージを削除")
+    parser.add_argument("--keep", action="append", default=[],
+                        help="--prune-unusedで削除しないパッケージ（複数指定可）")
+    parser.add_argument("--report", action="store_true",
+                        help="最適化前後のレイヤーサイズとインポート時間を計測して表示")
+    parser.add_argument("--repeat", type=int, default=5, help="インポート時間の計測回数")
+    args = parser.parse_args()
+    build_layer(
+        python_version=args.python_version,
+        layer_dir=args.layer_dir,
+        extra_packages=args.extra_package,
+        optimize=args.optimize,
+        prune_unused=args.prune_unused,
+        keep=args.keep,
+        optimize_levels=args.optimize_level or [0],
+        report=args.report,
+        repeat=args.repeat
+    )
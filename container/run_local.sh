@@ -0,0 +1,82 @@
+#!/bin/bash
+# コンテナイメージをローカルでビルド・実行し、Lambda Runtime Interface Emulator（RIE）経由で呼び出す
+#
+# 使用方法:
+#   container/run_local.sh build                 # イメージをビルド
+#   container/run_local.sh run                   # RIE付きでコンテナを起動（ポート9000）
+#   container/run_local.sh invoke "プロンプト"     # 起動中のコンテナを呼び出す
+#   container/run_local.sh bench [回数]           # コンテナを毎回起動し直してコールドスタートを計測
+#
+# Lambdaのベースイメージには RIE が含まれているため追加のインストールは不要。
+# Bedrockを呼び出す場合はAWS認証情報（AWS_ACCESS_KEY_ID など）を環境変数で渡す。
+
+set -euo pipefail
+
+IMAGE="${IMAGE:-strands-agent-lambda}"
+PORT="${PORT:-9000}"
+CONTAINER="${CONTAINER:-strands-agent-lambda-local}"
+INVOKE_URL="http://localhost:${PORT}/2015-03-31/functions/function/invocations"
+ROOT="$(cd "$(dirname "$0")/.." && pwd)"
+
+env_args() {
+    for name in AWS_ACCESS_KEY_ID AWS_SECRET_ACCESS_KEY AWS_SESSION_TOKEN AWS_REGION DEFAULT_MODEL_ID EAGER_INIT; do
+        if [ -n "${!name:-}" ]; then
+            echo "-e $name"
+        fi
+    done
+}
+
+start_container() {
+    docker rm -f "$CONTAINER" >/dev/null 2>&1 || true
+    # shellcheck disable=SC2046
+    docker run -d --rm --name "$CONTAINER" --platform linux/arm64 -p "${PORT}:8080" $(env_args) "$IMAGE" >/dev/null
+    # RIEが接続を受け付けるまで待つ
+    for _ in $(seq 1 100); do
+        if curl -s -o /dev/null "http://localhost:${PORT}/"; then
+            return 0
+        fi
+        sleep 0.05
+    done
+    echo "コンテナの起動を確認できませんでした" >&2
+    return 1
+}
+
+invoke() {
+    local prompt="$1"
+    local body
+    body=$(python3 -c 'import json, sys; print(json.dumps({"body": json.dumps({"prompt": sys.argv[1]})}))' "$prompt")
+    curl -s -XPOST "$INVOKE_URL" -d "$body"
+}
+
+case "${1:-}" in
+    build)
+        docker build --platform linux/arm64 -f "$ROOT/container/Dockerfile" -t "$IMAGE" "$ROOT"
+        docker image ls "$IMAGE"
+        ;;
+    run)
+        start_container
+        echo "起動しました: $INVOKE_URL（停止: docker rm -f $CONTAINER）"
+        ;;
+    invoke)
+        invoke "${2:-現在の日時を教えてください}"
+        echo
+        ;;
+    bench)
+        count="${2:-5}"
+        echo "回数,起動(秒),初回呼び出し(秒),2回目(秒)"
+        for i in $(seq 1 "$count"); do
+            start=$(date +%s.%N)
+            start_container
+            started=$(date +%s.%N)
+            # 空のプロンプトは検証エラーで即座に返るため、Bedrockなしでinitとハンドラーの時間を計測できる
+            first=$(curl -s -o /dev/null -w '%{time_total}' -XPOST "$INVOKE_URL" -d '{"body": "{\"prompt\": \"\"}"}')
+            second=$(curl -s -o /dev/null -w '%{time_total}' -XPOST "$INVOKE_URL" -d '{"body": "{\"prompt\": \"\"}"}')
+            echo "$i,$(echo "$started - $start" | bc),$first,$second"
+            docker rm -f "$CONTAINER" >/dev/null
+        done
+        ;;
+    *)
+        sed -n '2,12p' "$0"
+        exit 1
+        ;;
+esac
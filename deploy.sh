@@ -21,6 +21,7 @@ STACK_TYPE=${CDK_STACK_TYPE:-"standard"}  # standard, migration, secure
 ENVIRONMENT=${ENVIRONMENT:-"dev"}
 DRY_RUN=false
 FORCE_DEPLOY=false
+ENABLE_SNAPSTART=false
 
 # カラーコード
 RED='\033[0;31m'
@@ -81,6 +82,10 @@ while [[ $# -gt 0 ]]; do
             ENVIRONMENT="$2"
             shift 2
             ;;
+        --snapstart)
+            ENABLE_SNAPSTART=true
+            shift
+            ;;
         --dry-run)
             DRY_RUN=true
             shift
@@ -107,6 +112,7 @@ while [[ $# -gt 0 ]]; do
             echo "  -M, --model <model_id>   BedrockモデルID（デフォルト: us.amazon.nova-pro-v1:0）"
             echo "  -s, --stack-type <type>  スタックタイプ (standard/migration/secure, デフォルト: standard)"
             echo "  -e, --environment <env>  環境 (デフォルト: dev)"
+            echo "  --snapstart              SnapStartを有効化（Python 3.12ランタイム、Layerも3.12向けにビルド）"
             echo "  --dry-run                実際のデプロイを行わずにシンセサイズのみ実行"
             echo "  --force                  確認プロンプトをスキップ"
             echo "  -v, --version            バージョン情報を表示"
@@ -223,7 +229,12 @@ uv pip install aws-cdk-lib constructs --quiet
 # Lambda Layerの構築
 echo ""
 print_info "Lambda Layerを構築中..."
-if python build_layer.py; then
+# SnapStartはPython 3.12ランタイムを使うため、Layerのネイティブ拡張も3.12向けにビルドする
+LAYER_PYTHON_VERSION="3.11"
+if [ "$ENABLE_SNAPSTART" = true ]; then
+    LAYER_PYTHON_VERSION="3.12"
+fi
+if python build_layer.py --python-version "$LAYER_PYTHON_VERSION"; then
     print_success "Lambda Layerの構築が完了しました"
 else
     print_error "Lambda Layerの構築に失敗しました"
@@ -268,6 +279,9 @@ fi
 if [ ! -z "$MODEL_ID" ]; then
     CDK_CONTEXT="$CDK_CONTEXT -c default_model_id=$MODEL_ID"
 fi
+if [ "$ENABLE_SNAPSTART" = true ]; then
+    CDK_CONTEXT="$CDK_CONTEXT -c enable_snapstart=true"
+fi
 
 # スタック名の設定
 STACK_NAME="StrandsAgentStack"
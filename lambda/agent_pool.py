@@ -0,0 +1,160 @@
+"""
+ウォームコンテナ間でAgentを再利用するためのプール
+"""
+import json
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+PoolKey = Tuple[str, str, Tuple[str, ...]]
+
+
+def tool_name(tool: Any) -> str:
+    """ツールオブジェクトから識別用の名前を取得"""
+    name = getattr(tool, "__name__", None) or getattr(tool, "tool_name", None)
+    return str(name) if name else repr(tool)
+
+
+def make_pool_key(model_config: Dict[str, Any], tools: Sequence[Any]) -> PoolKey:
+    """(モデルID, 正規化したmodel_config, 有効なツール集合) からプールのキーを生成"""
+    model_id = str(model_config.get("model", ""))
+    normalized_config = json.dumps(model_config, sort_keys=True, ensure_ascii=False, default=str)
+    tool_names = tuple(sorted(tool_name(t) for t in tools))
+    return model_id, normalized_config, tool_names
+
+
+def reset_agent(agent: Any) -> None:
+    """次のリクエストに持ち越さないよう会話状態をリセット"""
+    messages = getattr(agent, "messages", None)
+    if messages is not None:
+        messages.clear()
+
+    # 累積メトリクスもリクエスト単位に戻す
+    metrics = getattr(agent, "event_loop_metrics", None)
+    if metrics is not None:
+        try:
+            agent.event_loop_metrics = type(metrics)()
+        except Exception:
+            pass
+
+    # agent.stateは呼び出し元ごとのキーバリューのため空の状態に作り直す
+    state = getattr(agent, "state", None)
+    if state is not None:
+        agent.state = type(state)()
+
+    # 会話マネージャーの削除済みメッセージ数や要約を初期状態に戻す
+    conversation_manager = getattr(agent, "conversation_manager", None)
+    if conversation_manager is not None and hasattr(conversation_manager, "restore_from_session"):
+        conversation_manager.restore_from_session({
+            "__name__": type(conversation_manager).__name__,
+            "removed_message_count": 0
+        })
+
+
+class AgentPool:
+    """キーごとにアイドル状態のAgentを保持するLRUプール
+
+    同じキーのAgentは同時に1リクエストでのみ使用されるよう、
+    acquire()で貸し出し、終了時に会話状態をリセットして返却する。
+    """
+
+    def __init__(self, max_size: int = 8):
+        self.max_size = max_size
+        self._idle: "OrderedDict[PoolKey, List[Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._discarded: set = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    @contextmanager
+    def acquire(self, key: PoolKey, factory: Callable[[], Any]) -> Iterator[Any]:
+        """キーに対応するAgentを貸し出す（なければfactoryで生成）"""
+        agent = self._checkout(key)
+        if agent is None:
+            agent = factory()
+
+        try:
+            yield agent
+        finally:
+            self._checkin(key, agent)
+
+    def _checkout(self, key: PoolKey) -> Any:
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            agents = self._idle.get(key)
+            if agents:
+                self._idle.move_to_end(key)
+                self.hits += 1
+                return agents.pop()
+            self.misses += 1
+            return None
+
+    def discard(self, agent: Any) -> None:
+        """貸し出し中のAgentを返却時に破棄するよう印を付ける（処理が中断された場合など）"""
+        with self._lock:
+            self._discarded.add(id(agent))
+
+    def _checkin(self, key: PoolKey, agent: Any) -> None:
+        with self._lock:
+            if id(agent) in self._discarded:
+                self._discarded.discard(id(agent))
+                return
+
+        if not self.enabled:
+            return
+
+        try:
+            reset_agent(agent)
+        except Exception as e:
+            # リセットできないAgentは再利用しない
+            logger.warning(f"Agentのリセットに失敗したため破棄します: {str(e)}")
+            return
+
+        with self._lock:
+            self._idle.setdefault(key, []).append(agent)
+            self._idle.move_to_end(key)
+            self._evict_locked()
+
+    def _evict_locked(self) -> None:
+        """最も長く使われていないキーから順に上限まで削除"""
+        total = sum(len(agents) for agents in self._idle.values())
+        while total > self.max_size and self._idle:
+            oldest_key, agents = next(iter(self._idle.items()))
+            agents.pop(0)
+            total -= 1
+            self.evictions += 1
+            if not agents:
+                del self._idle[oldest_key]
+
+    def agents(self) -> List[Any]:
+        """アイドル状態のAgentの一覧（SnapStart復元後の接続の張り直しなどに使用）"""
+        with self._lock:
+            return [agent for agents in self._idle.values() for agent in agents]
+
+    def clear(self) -> None:
+        """プールを空にする"""
+        with self._lock:
+            self._idle.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """プールの利用状況を返す"""
+        with self._lock:
+            size = sum(len(agents) for agents in self._idle.values())
+            return {
+                "size": size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
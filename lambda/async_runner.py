@@ -0,0 +1,101 @@
+"""
+エージェントの非同期実行
+
+同期のAgent呼び出し（agent(prompt)）は呼び出しごとにスレッドとイベントループを作成し、
+締め切りを過ぎても実行中の処理を止められない。AsyncRunnerはウォームコンテナ間で共有する
+1つのイベントループでAgentのstream_asyncを実行する。バッチの各項目や1ターン内の複数のツール呼び出しの
+待ち時間は同じループ上で重なり、締め切りを過ぎた呼び出しはタスクの取り消しで中断する。
+
+strandsは同期関数のツール（http_request、use_awsなど）をループのデフォルトのExecutorで
+asyncio.to_threadとして待つため、Lambdaの少ないvCPU数から決まる既定のスレッド数ではなく、
+I/O待ちに合わせたスレッド数のExecutorを設定する。
+"""
+import asyncio
+import concurrent.futures
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from deadline import Deadline
+
+
+logger = logging.getLogger(__name__)
+
+
+async def stream_agent_result(agent: Any, prompt: Any, invocation_state: Dict[str, Any]) -> Any:
+    """stream_asyncのイベントを最後まで読み、AgentResultを返す
+
+    イベントはAgentのcallback_handlerにも渡されるため、ここでは最終結果のみ取り出す。
+    """
+    result = None
+    async for event in agent.stream_async(prompt, invocation_state=invocation_state):
+        if isinstance(event, dict) and "result" in event:
+            result = event["result"]
+    return result
+
+
+class AsyncRunner:
+    """バックグラウンドのスレッドで動くイベントループにコルーチンを投入する"""
+
+    def __init__(self, max_tool_threads: int = 32):
+        self.max_tool_threads = max_tool_threads
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self.running = 0
+        self.completed = 0
+        self.cancelled = 0
+
+    @property
+    def started(self) -> bool:
+        return self._loop is not None
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_tool_threads, thread_name_prefix="async-tool"
+                ))
+                threading.Thread(target=loop.run_forever, name="agent-loop", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def submit(self, coroutine: Awaitable[Any]) -> concurrent.futures.Future:
+        """コルーチンをループで実行し、別スレッドから待てるFutureを返す"""
+        future = asyncio.run_coroutine_threadsafe(coroutine, self._ensure_loop())
+        with self._lock:
+            self.running += 1
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future: concurrent.futures.Future) -> None:
+        with self._lock:
+            self.running -= 1
+
+    def run(self, factory: Callable[[], Awaitable[Any]], deadline: Deadline) -> Tuple[bool, Any]:
+        """締め切りまでコルーチンを実行し、(完了したか, 結果) を返す（run_with_deadlineの非同期版）
+
+        締め切りを過ぎた場合はタスクを取り消す。コルーチン内の例外はそのまま送出する。
+        """
+        future = self.submit(factory())
+        try:
+            result = future.result(timeout=deadline.remaining())
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            with self._lock:
+                self.cancelled += 1
+            return False, None
+        with self._lock:
+            self.completed += 1
+        return True, result
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"running": self.running, "completed": self.completed, "cancelled": self.cancelled}
+
+    def close(self) -> None:
+        """ループを停止する（テスト・プロセス終了時）"""
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
@@ -1,7 +1,9 @@
 """
 アプリケーション設定の一元管理
 """
+import json
 import os
+import re
 from typing import Optional, Dict, Any
 from dataclasses import dataclass, field
 
@@ -27,6 +29,19 @@ HTTPリクエストの実行、数式の計算、現在の日時情報の取得
     ALLOWED_HASH_ALGORITHMS: list = field(default_factory=lambda: ["sha256", "sha512", "sha3_256", "sha3_512"])
     SECURE_HASH_ALGORITHMS: list = field(default_factory=lambda: ["sha256", "sha512", "sha3_256", "sha3_512"])
     
+    # 検出・マスク用のルール（名前: 正規表現）。1つの正規表現に結合して1回の走査で判定する
+    # 環境変数ではJSONオブジェクトを指定し、既定のルールに追加・上書きする
+    DANGEROUS_CONTENT_RULES: dict = field(default_factory=lambda: {
+        "script_tag": r'<script[^>]*>.*?</script>',  # スクリプトタグ
+        "javascript_protocol": r'javascript:',  # JavaScriptプロトコル
+        "html_data_uri": r'data:text/html',  # データURI
+    })
+    REDACTION_RULES: dict = field(default_factory=lambda: {
+        "aws_arn": r'arn:aws:[^:]+:[^:]+:[^:]+:[^/\s]+',  # AWS ARN
+        "aws_access_key": r'AKIA[0-9A-Z]{16}',  # AWS Access Key
+        "aws_secret_key": r'[0-9a-zA-Z/+=]{40}',  # AWS Secret Key
+    })
+    
     # ツール設定
     ENABLE_CUSTOM_TOOLS: bool = True
     ENABLE_AWS_TOOLS: bool = True   # strands-agents-toolsのuse_awsを使用
@@ -38,6 +53,115 @@ HTTPリクエストの実行、数式の計算、現在の日時情報の取得
     ENABLE_JSON_FORMATTER: bool = True
     ENABLE_TEXT_ANALYZER: bool = True
     
+    # ハッシュ生成ツール設定
+    HASH_CHUNK_SIZE: int = 1048576  # 1MB単位で読み込み
+    HASH_FILE_ALLOWED_DIRS: list = field(default_factory=lambda: ["/tmp"])
+    # ハッシュ生成で読み込めるS3の場所（bucket または bucket/prefix、空の場合はS3を読み込まない）
+    HASH_S3_ALLOWED_PREFIXES: list = field(default_factory=list)
+    
+    # Agentプール設定（ウォームコンテナでのAgent再利用）
+    ENABLE_AGENT_POOL: bool = True
+    AGENT_POOL_MAX_SIZE: int = 8
+    
+    # バッチ処理設定
+    MAX_BATCH_SIZE: int = 50
+    BATCH_MAX_CONCURRENCY: int = 4
+    DEADLINE_SAFETY_MARGIN_MS: int = 5000  # Lambdaのタイムアウト前に応答を返すための余裕
+    
+    # JSON設定
+    JSON_BACKEND: str = "auto"  # auto（orjsonがあれば使用）, orjson, json
+    JSON_COMPACT_RESPONSES: bool = False  # レスポンスボディを空白なしのJSONで返す
+    JSON_STREAMING_THRESHOLD: int = 262144  # これより大きいJSONはチャンク単位で整形
+    
+    # 応答キャッシュ設定（同一プロンプトの応答を再利用）
+    ENABLE_RESPONSE_CACHE: bool = False
+    RESPONSE_CACHE_TTL: int = 3600  # 秒
+    RESPONSE_CACHE_MAX_ENTRIES: int = 256  # ウォームコンテナごとのメモリ層の上限
+    RESPONSE_CACHE_BACKEND: str = "none"  # 共有層: none, dynamodb, s3, local
+    RESPONSE_CACHE_TABLE: str = ""
+    RESPONSE_CACHE_BUCKET: str = ""
+    RESPONSE_CACHE_PREFIX: str = "response-cache/"
+    RESPONSE_CACHE_LOCAL_DIR: str = "/tmp/response-cache"
+    # 使用した場合は応答を保存しないツール（結果が呼び出しごとに変わるもの）
+    RESPONSE_CACHE_BYPASS_TOOLS: list = field(default_factory=lambda: ["current_time", "http_request", "use_aws"])
+    
+    # セマンティックキャッシュ設定（言い換えられたプロンプトの応答を再利用）
+    ENABLE_SEMANTIC_CACHE: bool = False
+    SEMANTIC_CACHE_THRESHOLD: float = 0.92  # コサイン類似度のしきい値
+    SEMANTIC_CACHE_EMBEDDER: str = "bedrock"  # bedrock, hashing（テスト・ローカル実行用）
+    SEMANTIC_CACHE_EMBEDDING_MODEL: str = "amazon.titan-embed-text-v2:0"
+    SEMANTIC_CACHE_DIMENSIONS: int = 256
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 10000
+    SEMANTIC_CACHE_INDEX_URI: str = ""  # s3://bucket/key またはローカルパス（空の場合は保存しない）
+    SEMANTIC_CACHE_SAVE_EVERY: int = 10  # この件数を追加するごとにインデックスを保存
+    SEMANTIC_CACHE_FLUSH_TIMEOUT: float = 5.0  # ハンドラーの終了前にインデックスの保存を待つ最大秒数
+    
+    # ツール結果のメモ化設定（同じ入力に対して常に同じ結果を返すツールのみ）
+    ENABLE_TOOL_MEMOIZATION: bool = False
+    MEMOIZED_TOOLS: list = field(default_factory=lambda: ["generate_hash", "json_formatter", "text_analyzer", "calculator"])
+    TOOL_MEMO_MAX_BYTES: int = 8388608  # 8MB（保存した結果のJSONのバイト数の合計）
+    
+    # ツールの並行実行設定（1ターン内の複数のツール呼び出しを並行に実行）
+    ENABLE_CONCURRENT_TOOLS: bool = False
+    TOOL_MAX_CONCURRENCY: int = 4
+    TOOL_TIMEOUTS: dict = field(default_factory=dict)  # ツール名: タイムアウト秒数（未指定はDEFAULT_TIMEOUT）
+    
+    # 接続プール設定（ウォームコンテナ間でBedrock・http_requestの接続を再利用）
+    ENABLE_CONNECTION_POOL: bool = True
+    CONNECTION_POOL_MAX_CONNECTIONS: int = 50  # Bedrockクライアントの接続数の上限（バッチの並行数以上）
+    CONNECTION_HTTP_POOL_SIZE: int = 10  # http_requestのドメインごとの接続数の上限
+    CONNECTION_TCP_KEEPALIVE: bool = True
+    CONNECTION_IDLE_RESET_SECONDS: int = 300  # これより長くアイドルだった場合は接続を張り直す（0で無効）
+    
+    # 計測設定（フェーズごとの所要時間、トークン使用量、コールドスタート）
+    ENABLE_EMF_METRICS: bool = False  # CloudWatch Embedded Metric Formatでstdoutに出力
+    METRICS_NAMESPACE: str = "StrandsAgent"
+    RESPONSE_METRICS: bool = False  # 全てのレスポンスにmetricsフィールドを含める（リクエストの"metrics": trueでも可）
+    
+    # セッション設定（session_idごとに会話履歴を保持する複数ターンの会話）
+    SESSION_STORE_BACKEND: str = "none"  # none（無効）, dynamodb, local, memory（テスト・ローカル実行用）
+    SESSION_TABLE: str = ""
+    SESSION_LOCAL_DIR: str = "/tmp/sessions"
+    SESSION_TTL: int = 86400  # 最後の更新からの秒数
+    SESSION_CACHE_MAX_ENTRIES: int = 128  # ウォームコンテナごとの読み込みキャッシュの上限
+    SESSION_MAX_MESSAGES: int = 20  # これを超えたら古いターンを要約に置き換える
+    SESSION_MAX_TOKENS: int = 4000  # 履歴の推定トークン数の上限
+    SESSION_SUMMARIZER: str = "bedrock"  # bedrock, truncate（テスト・ローカル実行用）
+    SESSION_SUMMARY_MODEL: str = "us.amazon.nova-micro-v1:0"
+    
+    # プロンプトキャッシュ設定（システムプロンプトとツール定義にキャッシュポイントを付ける）
+    # キャッシュポイントの前がモデルの最小トークン数に満たない場合はキャッシュされない（同梱のシステムプロンプトは短い）
+    ENABLE_PROMPT_CACHE: bool = False
+    # キャッシュポイントに対応するモデル（モデルIDに含まれる文字列）
+    PROMPT_CACHE_MODELS: list = field(default_factory=lambda: [
+        "anthropic.claude-3-5-haiku", "anthropic.claude-3-7-sonnet", "anthropic.claude-sonnet-4",
+        "anthropic.claude-opus-4", "anthropic.claude-haiku-4",
+        "amazon.nova-micro", "amazon.nova-lite", "amazon.nova-pro", "amazon.nova-premier",
+    ])
+    # ツール定義のキャッシュポイントにも対応するモデル（Novaはシステムプロンプトのみ）
+    PROMPT_CACHE_TOOL_MODELS: list = field(default_factory=lambda: [
+        "anthropic.claude-3-5-haiku", "anthropic.claude-3-7-sonnet", "anthropic.claude-sonnet-4",
+        "anthropic.claude-opus-4", "anthropic.claude-haiku-4",
+    ])
+    
+    # モデルのルーティング設定（model_configでモデルを指定していないリクエストのみ）
+    ENABLE_MODEL_ROUTER: bool = False
+    # 安価なモデルから順に並べたティア（0: 単純、1: ツールが必要、2: 複雑なプロンプト）
+    MODEL_ROUTER_TIERS: list = field(default_factory=lambda: [
+        "us.amazon.nova-micro-v1:0", "us.amazon.nova-lite-v1:0", "us.amazon.nova-pro-v1:0"
+    ])
+    MODEL_ROUTER_CLASSIFIER: str = "heuristic"  # heuristic（長さとキーワード）, bedrock（小さなモデルで判定）
+    MODEL_ROUTER_CLASSIFIER_MODEL: str = "us.amazon.nova-micro-v1:0"
+    MODEL_ROUTER_COOLDOWN_SECONDS: int = 30  # スロットリングされたモデルをチェーンの後ろに回す秒数
+    MODEL_ROUTER_MAX_ERROR_RATE: float = 0.5  # これを超えたモデルをチェーンの後ろに回す
+    
+    # 非同期実行設定（Agentのstream_asyncを共有のイベントループで実行）
+    ENABLE_ASYNC_HANDLER: bool = False
+    ASYNC_MAX_TOOL_THREADS: int = 32  # イベントループで同期関数のツールを実行するスレッド数
+    
+    # 初期化設定
+    EAGER_INIT: bool = False  # initフェーズでstrands・ツール・Bedrockクライアントを初期化
+    
     # ロギング設定
     LOG_LEVEL: str = "INFO"
     LOG_FORMAT: str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -73,6 +197,12 @@ HTTPリクエストの実行、数式の計算、現在の日時情報の取得
                         elif current_type == list:
                             # カンマ区切りのリストとして解析
                             setattr(config, key, [item.strip() for item in env_value.split(",")])
+                        elif current_type == dict:
+                            # JSONオブジェクトとして解析し、既定値にマージ
+                            overrides = json.loads(env_value)
+                            if not isinstance(overrides, dict):
+                                raise ValueError(f"{key} must be a JSON object")
+                            setattr(config, key, {**current_value, **overrides})
                         else:
                             setattr(config, key, env_value)
                     except ValueError:
@@ -95,8 +225,100 @@ HTTPリクエストの実行、数式の計算、現在の日時情報の取得
         if self.LAMBDA_TIMEOUT < 1 or self.LAMBDA_TIMEOUT > 15:
             raise ValueError("LAMBDA_TIMEOUT must be between 1 and 15 minutes")
         
+        if self.HASH_CHUNK_SIZE <= 0:
+            raise ValueError("HASH_CHUNK_SIZE must be positive")
+        
+        if self.MAX_BATCH_SIZE <= 0:
+            raise ValueError("MAX_BATCH_SIZE must be positive")
+        
+        if self.BATCH_MAX_CONCURRENCY <= 0:
+            raise ValueError("BATCH_MAX_CONCURRENCY must be positive")
+        
+        if self.AGENT_POOL_MAX_SIZE < 0:
+            raise ValueError("AGENT_POOL_MAX_SIZE must be non-negative")
+        
+        if self.JSON_BACKEND not in ("auto", "orjson", "json"):
+            raise ValueError("JSON_BACKEND must be one of auto, orjson, json")
+        
+        if self.RESPONSE_CACHE_TTL <= 0:
+            raise ValueError("RESPONSE_CACHE_TTL must be positive")
+        
+        if self.RESPONSE_CACHE_BACKEND not in ("none", "dynamodb", "s3", "local"):
+            raise ValueError("RESPONSE_CACHE_BACKEND must be one of none, dynamodb, s3, local")
+        
+        if not 0 < self.SEMANTIC_CACHE_THRESHOLD <= 1:
+            raise ValueError("SEMANTIC_CACHE_THRESHOLD must be between 0 and 1")
+        
+        if self.SEMANTIC_CACHE_EMBEDDER not in ("bedrock", "hashing"):
+            raise ValueError("SEMANTIC_CACHE_EMBEDDER must be one of bedrock, hashing")
+        
+        if self.SEMANTIC_CACHE_FLUSH_TIMEOUT < 0:
+            raise ValueError("SEMANTIC_CACHE_FLUSH_TIMEOUT must not be negative")
+        
+        memoizable_tools = ("generate_hash", "json_formatter", "text_analyzer", "calculator")
+        for tool_name in self.MEMOIZED_TOOLS:
+            if tool_name not in memoizable_tools:
+                raise ValueError(f"MEMOIZED_TOOLS must be a subset of {', '.join(memoizable_tools)}: {tool_name}")
+        
+        if self.TOOL_MEMO_MAX_BYTES <= 0:
+            raise ValueError("TOOL_MEMO_MAX_BYTES must be positive")
+        
+        if self.TOOL_MAX_CONCURRENCY <= 0:
+            raise ValueError("TOOL_MAX_CONCURRENCY must be positive")
+        
+        for tool_name, timeout in self.TOOL_TIMEOUTS.items():
+            if not isinstance(timeout, (int, float)) or timeout <= 0:
+                raise ValueError(f"TOOL_TIMEOUTS.{tool_name} must be a positive number")
+        
+        if self.CONNECTION_POOL_MAX_CONNECTIONS <= 0:
+            raise ValueError("CONNECTION_POOL_MAX_CONNECTIONS must be positive")
+        
+        if self.CONNECTION_HTTP_POOL_SIZE <= 0:
+            raise ValueError("CONNECTION_HTTP_POOL_SIZE must be positive")
+        
+        if self.CONNECTION_IDLE_RESET_SECONDS < 0:
+            raise ValueError("CONNECTION_IDLE_RESET_SECONDS must be non-negative")
+        
+        if not self.METRICS_NAMESPACE:
+            raise ValueError("METRICS_NAMESPACE cannot be empty")
+        
+        if self.SESSION_STORE_BACKEND not in ("none", "dynamodb", "local", "memory"):
+            raise ValueError("SESSION_STORE_BACKEND must be one of none, dynamodb, local, memory")
+        
+        if self.SESSION_STORE_BACKEND == "dynamodb" and not self.SESSION_TABLE:
+            raise ValueError("SESSION_TABLE is required when SESSION_STORE_BACKEND is dynamodb")
+        
+        for key in ("SESSION_TTL", "SESSION_MAX_MESSAGES", "SESSION_MAX_TOKENS"):
+            if getattr(self, key) <= 0:
+                raise ValueError(f"{key} must be positive")
+        
+        if self.SESSION_SUMMARIZER not in ("bedrock", "truncate"):
+            raise ValueError("SESSION_SUMMARIZER must be one of bedrock, truncate")
+        
+        if self.ENABLE_MODEL_ROUTER and not self.MODEL_ROUTER_TIERS:
+            raise ValueError("MODEL_ROUTER_TIERS cannot be empty when ENABLE_MODEL_ROUTER is true")
+        
+        if self.MODEL_ROUTER_CLASSIFIER not in ("heuristic", "bedrock"):
+            raise ValueError("MODEL_ROUTER_CLASSIFIER must be one of heuristic, bedrock")
+        
+        if self.MODEL_ROUTER_COOLDOWN_SECONDS < 0:
+            raise ValueError("MODEL_ROUTER_COOLDOWN_SECONDS must be non-negative")
+        
+        if not 0 < self.MODEL_ROUTER_MAX_ERROR_RATE <= 1:
+            raise ValueError("MODEL_ROUTER_MAX_ERROR_RATE must be between 0 and 1")
+        
+        if self.ASYNC_MAX_TOOL_THREADS <= 0:
+            raise ValueError("ASYNC_MAX_TOOL_THREADS must be positive")
+        
         if not self.DEFAULT_MODEL_ID:
             raise ValueError("DEFAULT_MODEL_ID cannot be empty")
+        
+        for rules_name in ("DANGEROUS_CONTENT_RULES", "REDACTION_RULES"):
+            for rule_name, pattern in getattr(self, rules_name).items():
+                try:
+                    re.compile(pattern)
+                except (re.error, TypeError) as e:
+                    raise ValueError(f"{rules_name}.{rule_name} is not a valid regular expression: {e}")
     
     def to_dict(self) -> Dict[str, Any]:
         """設定を辞書形式で返す"""
@@ -0,0 +1,261 @@
+"""
+ウォームコンテナ間で共有するHTTP接続プール
+
+Agentを構築し直してもBedrockへのTLS接続を使い回せるよう、bedrock-runtimeクライアントを
+（リージョン, エンドポイント, クライアント設定）ごとにモジュールレベルで1つだけ保持し、構築したAgentの
+モデルに割り当てる（既定と異なる認証情報のクライアントはそのまま使う）。クライアントは接続プールの上限を引き上げ、TCPキープアライブを有効にする。
+http_requestツールがドメインごとにキャッシュするrequestsのセッションにも同じソケット設定を適用する。
+
+NATゲートウェイやロードバランサーはアイドル状態の接続を通知なしに切断するため、
+一定時間呼び出しがなかった場合は次の呼び出しの前に接続プールを破棄し、
+切断済みの接続への送信とそのリトライを避ける。接続の新規作成数と再利用数を集計する。
+"""
+import logging
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import priming
+
+
+logger = logging.getLogger(__name__)
+
+# アイドル状態の接続にキープアライブを送り始めるまでの秒数・送信間隔・切断とみなす回数
+KEEPALIVE_IDLE = 60
+KEEPALIVE_INTERVAL = 15
+KEEPALIVE_COUNT = 4
+
+# 共有クライアントを分けるbotocoreの設定（モデルごとにタイムアウトやリトライが異なる場合）
+CLIENT_CONFIG_KEYS = (
+    "read_timeout", "connect_timeout", "retries", "user_agent", "user_agent_extra", "user_agent_appid",
+    "signature_version", "proxies", "parameter_validation", "inject_host_prefix",
+)
+
+
+def keepalive_socket_options() -> List[Tuple[int, int, int]]:
+    """TCPキープアライブを有効にするソケットオプション（プラットフォームにあるもののみ）"""
+    options = [
+        (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),  # urllib3の既定
+        (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+    ]
+    for name, value in (
+        ("TCP_KEEPIDLE", KEEPALIVE_IDLE),
+        ("TCP_KEEPINTVL", KEEPALIVE_INTERVAL),
+        ("TCP_KEEPCNT", KEEPALIVE_COUNT),
+    ):
+        if hasattr(socket, name):
+            options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    return options
+
+
+def pool_counts(manager: Any) -> Tuple[int, int]:
+    """urllib3のPoolManagerが保持する接続プールの (新規接続数, リクエスト数) の合計"""
+    pools = getattr(manager, "pools", None)
+    if pools is None:
+        return 0, 0
+    connections = requests = 0
+    for key in list(pools.keys()):
+        try:
+            pool = pools[key]
+        except KeyError:
+            continue
+        connections += getattr(pool, "num_connections", 0)
+        requests += getattr(pool, "num_requests", 0)
+    return connections, requests
+
+
+def client_config_key(config: Any) -> Tuple[Tuple[str, str], ...]:
+    """共有クライアントのキーに含めるbotocoreの設定（設定がなければ空）"""
+    if config is None:
+        return ()
+    return tuple((name, repr(getattr(config, name, None))) for name in CLIENT_CONFIG_KEYS)
+
+
+def _client_manager(client: Any) -> Any:
+    """botocoreクライアントのPoolManager"""
+    http_session = getattr(getattr(client, "_endpoint", None), "http_session", None)
+    return getattr(http_session, "_manager", None)
+
+
+def _session_managers(session: Any) -> List[Any]:
+    """requestsのセッションにマウントされたアダプターのPoolManager"""
+    adapters = getattr(session, "adapters", None) or {}
+    managers = [getattr(adapter, "poolmanager", None) for adapter in adapters.values()]
+    # http://とhttps://は同じアダプターを共有する
+    unique = {id(manager): manager for manager in managers if manager is not None}
+    return list(unique.values())
+
+
+class ConnectionManager:
+    """Bedrockクライアントとhttp_requestのセッションの接続プールを管理する"""
+
+    def __init__(
+        self,
+        max_pool_connections: int = 50,
+        http_pool_size: int = 10,
+        tcp_keepalive: bool = True,
+        idle_reset_seconds: float = 300,
+        enabled: bool = True,
+        session_factory: Optional[Callable[[], Any]] = None
+    ):
+        self.max_pool_connections = max_pool_connections
+        self.http_pool_size = http_pool_size
+        self.tcp_keepalive = tcp_keepalive
+        self.idle_reset_seconds = idle_reset_seconds
+        self.enabled = enabled
+        self._session_factory = session_factory
+        self._session: Any = None
+        self._clients: Dict[Tuple[str, str, Tuple[Tuple[str, str], ...]], Any] = {}
+        self._http_module: Any = None
+        self._lock = threading.Lock()
+        self._last_used: Optional[float] = None
+        # 破棄した接続プールの集計（破棄後も累計を保つ）
+        self._retired = {"bedrock": [0, 0], "http": [0, 0]}
+        self.idle_resets = 0
+
+    def _boto_session(self) -> Any:
+        if self._session is None:
+            if self._session_factory is not None:
+                self._session = self._session_factory()
+            else:
+                import boto3
+                self._session = boto3.Session()
+        return self._session
+
+    def _client_config(self, base: Any) -> Any:
+        """既存クライアントの設定（ユーザーエージェント・タイムアウト等）に接続プールの設定を重ねる"""
+        from botocore.config import Config
+        pool_config = Config(max_pool_connections=self.max_pool_connections, tcp_keepalive=self.tcp_keepalive)
+        return base.merge(pool_config) if base is not None else pool_config
+
+    def bedrock_client(self, region: str, endpoint_url: Optional[str] = None, base_config: Any = None) -> Any:
+        """リージョン・エンドポイント・クライアント設定ごとに共有するbedrock-runtimeクライアント"""
+        key = (region, endpoint_url or "", client_config_key(base_config))
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = self._boto_session().client(
+                    "bedrock-runtime",
+                    region_name=region,
+                    endpoint_url=endpoint_url,
+                    config=self._client_config(base_config)
+                )
+                self._clients[key] = client
+                logger.info(f"共有のBedrockクライアントを作成しました: {region}")
+            return client
+
+    def _uses_session_credentials(self, client: Any) -> bool:
+        """クライアントの認証情報が共有クライアントを作るセッションと同じか（アクセスキーで比較）"""
+        signer = getattr(client, "_request_signer", None)
+        client_key = getattr(getattr(signer, "_credentials", None), "access_key", None)
+        session_key = getattr(self._boto_session().get_credentials(), "access_key", None)
+        return client_key == session_key
+
+    def attach(self, model: Any) -> bool:
+        """モデルのBedrockクライアントを共有クライアントに置き換える（置き換えた場合True）"""
+        client = getattr(model, "client", None)
+        meta = getattr(client, "meta", None)
+        if not self.enabled or meta is None:
+            return False
+        if getattr(getattr(meta, "service_model", None), "service_name", None) != "bedrock-runtime":
+            return False
+        if client in self._clients.values():
+            return False
+        # 既定以外のboto3セッション（別のプロファイルや認証情報）で作られたクライアントは置き換えない
+        if not self._uses_session_credentials(client):
+            logger.info("既定と異なる認証情報のBedrockクライアントのため共有クライアントに置き換えません")
+            return False
+        model.client = self.bedrock_client(meta.region_name, meta.endpoint_url, getattr(meta, "config", None))
+        return True
+
+    def configure_http_sessions(self, http_module: Any) -> bool:
+        """http_requestツールが作成するセッションにキープアライブのソケット設定を適用する
+
+        ツールはドメインごとにセッションをSESSION_CACHEへ保持するため、作成関数を包んで
+        新しいセッションの接続プールにソケットオプションと既定のプールサイズを設定する。
+        """
+        if not self.enabled or not isinstance(getattr(http_module, "SESSION_CACHE", None), dict):
+            return False
+        create_session = getattr(http_module, "create_session", None)
+        if not callable(create_session) or getattr(create_session, "_pooled", False):
+            self._http_module = http_module
+            return False
+
+        def pooled_create_session(session_config: Dict[str, Any]) -> Any:
+            session = create_session({"pool_size": self.http_pool_size, **(session_config or {})})
+            if self.tcp_keepalive:
+                for manager in _session_managers(session):
+                    # 接続プールは最初のリクエストで作成されるため、作成時の引数に加える
+                    manager.connection_pool_kw["socket_options"] = keepalive_socket_options()
+            return session
+
+        pooled_create_session._pooled = True
+        http_module.create_session = pooled_create_session
+        self._http_module = http_module
+        return True
+
+    def _http_sessions(self) -> List[Any]:
+        cache = getattr(self._http_module, "SESSION_CACHE", None) or {}
+        return list(cache.values())
+
+    def clients(self) -> List[Any]:
+        with self._lock:
+            return list(self._clients.values())
+
+    def _counts(self) -> Dict[str, Tuple[int, int]]:
+        bedrock = [pool_counts(_client_manager(client)) for client in self.clients()]
+        http = [pool_counts(manager) for session in self._http_sessions() for manager in _session_managers(session)]
+        return {
+            "bedrock": tuple(map(sum, zip(self._retired["bedrock"], *bedrock))),
+            "http": tuple(map(sum, zip(self._retired["http"], *http))),
+        }
+
+    def reset(self) -> int:
+        """全ての接続プールを破棄し、次のリクエストで再接続させる（破棄したプール数を返す）"""
+        counts = self._counts()
+        count = priming.reset_connections(self.clients())
+        for session in self._http_sessions():
+            close = getattr(session, "close", None)
+            if callable(close):
+                close()
+                count += 1
+        # 破棄した接続プールの集計は累計に移す
+        self._retired = {name: list(value) for name, value in counts.items()}
+        return count
+
+    def check_idle(self, now: Optional[float] = None) -> bool:
+        """アイドル時間が上限を超えていれば接続プールを破棄する（呼び出しの開始時に使用）
+
+        呼び出し時刻を記録し、破棄した場合はTrueを返す。
+        """
+        now = time.monotonic() if now is None else now
+        idle = None if self._last_used is None else now - self._last_used
+        self._last_used = now
+        if not self.enabled or self.idle_reset_seconds <= 0 or idle is None or idle <= self.idle_reset_seconds:
+            return False
+        count = self.reset()
+        self.idle_resets += 1
+        logger.info(f"{idle:.0f}秒間アイドル状態だったため接続プールを破棄しました（{count}件）")
+        return True
+
+    def mark_used(self, now: Optional[float] = None) -> None:
+        """呼び出しの終了時刻を記録（アイドル時間は最後の呼び出しの終了から数える）"""
+        self._last_used = time.monotonic() if now is None else now
+
+    def stats(self) -> Dict[str, Any]:
+        """接続の新規作成数・リクエスト数・再利用数（Bedrockとhttp_requestの別）"""
+        stats: Dict[str, Any] = {}
+        for name, (connections, requests) in self._counts().items():
+            reused = max(0, requests - connections)
+            stats[name] = {
+                "connections": connections,
+                "requests": requests,
+                "reused": reused,
+                "reuse_rate": round(reused / requests, 3) if requests else 0.0,
+            }
+        stats["clients"] = len(self.clients())
+        stats["http_sessions"] = len(self._http_sessions())
+        stats["idle_resets"] = self.idle_resets
+        return stats
+
@@ -2,44 +2,186 @@
 カスタムツールの実装例
 strands-agents-toolsに含まれない独自機能の実装方法
 """
-import json
+import os
+import base64
 import hashlib
-from typing import Dict, Any, Union
+import functools
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
 from strands import tool
 
+import json_backend
+from config import config
+
+
+HASH_ALGORITHMS = ["md5", "sha1", "sha256", "sha512"]
+HASH_SOURCES = ["text", "base64", "file", "s3"]
+
+# 複数アルゴリズムの計算に使うスレッドプール（hashlibは大きなデータの更新中にGILを解放する）
+_hash_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_hash_executor() -> ThreadPoolExecutor:
+    global _hash_executor
+    if _hash_executor is None:
+        _hash_executor = ThreadPoolExecutor(max_workers=len(HASH_ALGORITHMS), thread_name_prefix="hash")
+    return _hash_executor
+
+
+def _iter_text_chunks(text: str, chunk_size: int) -> Iterator[bytes]:
+    """テキストを少しずつUTF-8にエンコードして返す"""
+    for i in range(0, len(text), chunk_size):
+        yield text[i:i + chunk_size].encode()
+
+
+def _iter_base64_chunks(data: str, chunk_size: int) -> Iterator[bytes]:
+    """base64文字列を4文字単位の境界でチャンクごとにデコード"""
+    data = "".join(data.split())
+    step = max(4, chunk_size // 3 * 4)
+    for i in range(0, len(data), step):
+        yield base64.b64decode(data[i:i + step], validate=True)
+
+
+def _iter_file_chunks(path: str, chunk_size: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+def _resolve_s3_uri(uri: str) -> Tuple[str, str]:
+    """許可されたバケット・プレフィックス配下のオブジェクトのみを対象にし、(bucket, key) を返す"""
+    if not uri.startswith("s3://"):
+        raise ValueError(f"無効なS3 URI: {uri}")
+    bucket, _, key = uri[len("s3://"):].partition("/")
+    if not bucket or not key:
+        raise ValueError(f"無効なS3 URI: {uri}")
+    for allowed in config.HASH_S3_ALLOWED_PREFIXES:
+        allowed_bucket, _, prefix = allowed.strip().partition("/")
+        if allowed_bucket and allowed_bucket == bucket and key.startswith(prefix):
+            return bucket, key
+    raise PermissionError(f"許可されていないS3の場所です: {uri}")
+
+
+def _iter_s3_chunks(uri: str, chunk_size: int) -> Iterator[bytes]:
+    """s3://bucket/key のオブジェクトをストリーミングで読み込む"""
+    bucket, key = _resolve_s3_uri(uri)
+    import boto3
+    body = boto3.client("s3").get_object(Bucket=bucket, Key=key)["Body"]
+    try:
+        yield from body.iter_chunks(chunk_size=chunk_size)
+    finally:
+        body.close()
+
+
+def _resolve_local_path(path: str) -> str:
+    """許可されたディレクトリ配下のファイルのみを対象にする"""
+    real_path = os.path.realpath(path)
+    allowed_dirs = [os.path.realpath(d) for d in config.HASH_FILE_ALLOWED_DIRS]
+    if not any(os.path.commonpath([real_path, d]) == d for d in allowed_dirs):
+        raise PermissionError(f"許可されていないパスです: {path}")
+    return real_path
+
+
+def hash_chunks(chunks: Iterable[bytes], algorithms: List[str]) -> Tuple[Dict[str, str], int]:
+    """チャンクを1回だけ読み、複数のアルゴリズムのハッシュ値を同時に計算
+
+    Returns:
+        (アルゴリズム名→16進ハッシュ値, 総バイト数)
+    """
+    hashers = [hashlib.new(algorithm) for algorithm in algorithms]
+    executor = _get_hash_executor() if len(hashers) > 1 else None
+    total = 0
+
+    for chunk in chunks:
+        total += len(chunk)
+        if executor is not None:
+            list(executor.map(lambda h: h.update(chunk), hashers))
+        else:
+            hashers[0].update(chunk)
+
+    return {a: h.hexdigest() for a, h in zip(algorithms, hashers)}, total
+
 
 @tool
-def generate_hash(text: str, algorithm: str = "sha256") -> Dict[str, Union[str, int]]:
+def generate_hash(
+    text: str,
+    algorithm: str = "sha256",
+    source: str = "text",
+    algorithms: Optional[List[str]] = None
+) -> Dict[str, Any]:
     """
-    テキストのハッシュ値を生成します。
+    テキストやファイル、S3オブジェクト、base64データのハッシュ値を生成します。
+    データは一定サイズのチャンクごとに読み込むため、大きなデータでもメモリ使用量は一定です。
     
     Args:
-        text: ハッシュ化するテキスト
+        text: ハッシュ化する対象（sourceに応じてテキスト、base64文字列、ファイルパス、s3://bucket/key）
         algorithm: 使用するアルゴリズム（md5, sha1, sha256, sha512）
+        source: 入力の種類（text, base64, file, s3）
+        algorithms: 複数のアルゴリズムを1回の読み込みで計算する場合に指定
         
     Returns:
         ハッシュ値とアルゴリズムを含む辞書
     """
     try:
-        if algorithm not in ["md5", "sha1", "sha256", "sha512"]:
-            return {"error": f"サポートされていないアルゴリズム: {algorithm}"}
+        requested = list(dict.fromkeys(algorithms or [algorithm]))
+        for name in requested:
+            if name not in HASH_ALGORITHMS:
+                return {"error": f"サポートされていないアルゴリズム: {name}"}
+        
+        if source not in HASH_SOURCES:
+            return {"error": f"サポートされていない入力の種類: {source}"}
         
-        hash_func = getattr(hashlib, algorithm)
-        hash_value = hash_func(text.encode()).hexdigest()
+        chunk_size = config.HASH_CHUNK_SIZE
+        if source == "file":
+            path = _resolve_local_path(text)
+            if len(requested) == 1:
+                with open(path, "rb") as f:
+                    digest = hashlib.file_digest(f, requested[0])
+                hashes, length = {requested[0]: digest.hexdigest()}, os.path.getsize(path)
+            else:
+                hashes, length = hash_chunks(_iter_file_chunks(path, chunk_size), requested)
+        elif source == "s3":
+            hashes, length = hash_chunks(_iter_s3_chunks(text, chunk_size), requested)
+        elif source == "base64":
+            hashes, length = hash_chunks(_iter_base64_chunks(text, chunk_size), requested)
+        else:
+            hashes, _ = hash_chunks(_iter_text_chunks(text, chunk_size), requested)
+            length = len(text)
         
+        if algorithms is None:
+            return {
+                "algorithm": algorithm,
+                "hash": hashes[algorithm],
+                "original_length": length
+            }
         return {
-            "algorithm": algorithm,
-            "hash": hash_value,
-            "original_length": len(text)
+            "hashes": hashes,
+            "original_length": length
         }
     except Exception as e:
         return {"error": f"ハッシュ生成エラー: {str(e)}"}
 
 
+def _join_limited(chunks: Iterable[str], limit: int) -> str:
+    """チャンクを上限の文字数まで結合し、超えた分は省略する"""
+    parts = []
+    size = 0
+    for chunk in chunks:
+        if size + len(chunk) > limit:
+            parts.append(chunk[:limit - size])
+            parts.append(f"\n...（出力が{limit}文字を超えたため以降を省略しました）")
+            break
+        parts.append(chunk)
+        size += len(chunk)
+    return "".join(parts)
+
+
 @tool
 def json_formatter(json_string: str, indent: int = 2) -> str:
     """
     JSON文字列を整形します。
+    大きなJSONはトップレベルの要素ごとに整形し、出力が上限を超えた時点で打ち切ります。
     
     Args:
         json_string: 整形するJSON文字列
@@ -49,14 +191,89 @@ def json_formatter(json_string: str, indent: int = 2) -> str:
         整形されたJSON文字列
     """
     try:
-        data = json.loads(json_string)
-        return json.dumps(data, indent=indent, ensure_ascii=False, sort_keys=True)
-    except json.JSONDecodeError as e:
+        if len(json_string) <= config.JSON_STREAMING_THRESHOLD:
+            return json_backend.pretty(json_string, indent=indent, sort_keys=True)
+        return _join_limited(
+            json_backend.iter_pretty(json_string, indent=indent, sort_keys=True),
+            config.MAX_RESPONSE_SIZE
+        )
+    except json_backend.JSONDecodeError as e:
         return f"JSON解析エラー: {str(e)}"
     except Exception as e:
         return f"エラー: {str(e)}"
 
 
+# 文字種別の判定結果（大文字, 小文字, 数字, 空白, ひらがな, カタカナ, 漢字）
+CHAR_CLASS_NAMES = ("大文字", "小文字", "数字", "空白文字", "ひらがな", "カタカナ", "漢字")
+
+
+@functools.lru_cache(maxsize=65536)
+def _char_classes(c: str) -> Tuple[bool, ...]:
+    """1文字の文字種別を判定（コードポイントごとに1度だけ計算）"""
+    return (
+        c.isupper(),
+        c.islower(),
+        c.isdigit(),
+        c.isspace(),
+        '\u3040' <= c <= '\u309f',
+        '\u30a0' <= c <= '\u30ff',
+        '\u4e00' <= c <= '\u9fff',
+    )
+
+
+class TextStats:
+    """テキストの統計情報をチャンク単位で1パスで集計する
+
+    文字の出現回数をCounterでまとめて数え、文字種別は異なる文字ごとに1回だけ判定する。
+    チャンク境界をまたぐ単語は1語として数える。
+    """
+
+    def __init__(self) -> None:
+        self.char_count = 0
+        self.newline_count = 0
+        self.word_count = 0
+        self._char_counts: Counter = Counter()
+        self._ends_in_word = False
+
+    def update(self, chunk: str) -> "TextStats":
+        if not chunk:
+            return self
+
+        self.char_count += len(chunk)
+        self.newline_count += chunk.count('\n')
+        self._char_counts.update(chunk)
+
+        words = len(chunk.split())
+        if self._ends_in_word and not chunk[0].isspace() and words:
+            words -= 1  # 前のチャンクから続く単語
+        self.word_count += words
+        self._ends_in_word = not chunk[-1].isspace()
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        class_counts = [0] * len(CHAR_CLASS_NAMES)
+        for c, count in self._char_counts.items():
+            for i, matched in enumerate(_char_classes(c)):
+                if matched:
+                    class_counts[i] += count
+
+        return {
+            "総文字数": self.char_count,
+            "単語数": self.word_count,
+            "行数": self.newline_count + 1 if self.char_count else 0,
+            "文字種別": dict(zip(CHAR_CLASS_NAMES, class_counts)),
+            "平均単語長": round(self.char_count / self.word_count, 2) if self.word_count > 0 else 0
+        }
+
+
+def analyze_text_chunks(chunks: Iterable[str]) -> Dict[str, Any]:
+    """チャンクに分割されたテキスト（大きなファイルなど）の統計情報を集計"""
+    stats = TextStats()
+    for chunk in chunks:
+        stats.update(chunk)
+    return stats.to_dict()
+
+
 @tool
 def text_analyzer(text: str) -> Dict[str, Any]:
     """
@@ -69,46 +286,17 @@ def text_analyzer(text: str) -> Dict[str, Any]:
         文字数、単語数、行数などの統計情報
     """
     try:
-        # 基本統計
-        char_count = len(text)
-        line_count = text.count('\n') + 1 if text else 0
-        word_count = len(text.split())
-        
-        # 文字種別カウント
-        uppercase_count = sum(1 for c in text if c.isupper())
-        lowercase_count = sum(1 for c in text if c.islower())
-        digit_count = sum(1 for c in text if c.isdigit())
-        space_count = sum(1 for c in text if c.isspace())
-        
-        # 日本語文字カウント
-        hiragana_count = sum(1 for c in text if '\u3040' <= c <= '\u309f')
-        katakana_count = sum(1 for c in text if '\u30a0' <= c <= '\u30ff')
-        kanji_count = sum(1 for c in text if '\u4e00' <= c <= '\u9fff')
-        
-        return {
-            "総文字数": char_count,
-            "単語数": word_count,
-            "行数": line_count,
-            "文字種別": {
-                "大文字": uppercase_count,
-                "小文字": lowercase_count,
-                "数字": digit_count,
-                "空白文字": space_count,
-                "ひらがな": hiragana_count,
-                "カタカナ": katakana_count,
-                "漢字": kanji_count
-            },
-            "平均単語長": round(char_count / word_count, 2) if word_count > 0 else 0
-        }
+        return TextStats().update(text).to_dict()
     except Exception as e:
         return {"error": f"テキスト分析エラー: {str(e)}"}
 
 
-
-
 # カスタムツールをエクスポート
 __all__ = [
     'generate_hash',
     'json_formatter', 
-    'text_analyzer'
+    'text_analyzer',
+    'analyze_text_chunks',
+    'hash_chunks',
+    'TextStats'
 ]
\ No newline at end of file
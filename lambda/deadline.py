@@ -0,0 +1,199 @@
+"""
+Lambdaの残り実行時間に基づく締め切り管理
+"""
+import logging
+import math
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# 締め切りに合わせて入力のtimeoutを調整するツール
+TIMEOUT_AWARE_TOOLS = ("http_request",)
+# 締め切りに合わせてAWS SDKクライアントのタイムアウトを調整するツール（入力にtimeoutがないため、
+# install_aws_client_timeoutsで置き換えたクライアントの生成時に締め切りを参照する）
+AWS_CLIENT_TOOLS = ("use_aws",)
+
+# 実行中のツール呼び出しの締め切り（asyncio.to_threadはコンテキストを引き継ぐため、ツールのスレッドから参照できる）
+_tool_deadline: ContextVar[Optional["Deadline"]] = ContextVar("tool_deadline", default=None)
+
+
+class Deadline:
+    """リクエスト単位の締め切り（Noneは無制限）"""
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.expires_at = None if seconds is None else time.monotonic() + max(seconds, 0)
+
+    @classmethod
+    def from_context(cls, context: Any, safety_margin_ms: int = 0) -> "Deadline":
+        """Lambdaコンテキストの残り時間から安全マージンを引いた締め切りを生成"""
+        if context is None or not hasattr(context, "get_remaining_time_in_millis"):
+            return cls(None)
+        try:
+            remaining_ms = float(context.get_remaining_time_in_millis())
+        except (TypeError, ValueError):
+            return cls(None)
+        return cls((remaining_ms - safety_margin_ms) / 1000)
+
+    def remaining(self) -> Optional[float]:
+        """残り秒数（無制限ならNone）"""
+        if self.expires_at is None:
+            return None
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def clamp(self, timeout: float) -> float:
+        """タイムアウト値を締め切りまでの残り時間以内に収める"""
+        remaining = self.remaining()
+        return timeout if remaining is None else min(timeout, remaining)
+
+
+def stop_event_loop(invocation_state: Dict[str, Any]) -> None:
+    """現在のサイクルの後にstrandsのイベントループを終了させる（次のモデル呼び出しを行わない）"""
+    invocation_state.setdefault("request_state", {})["stop_event_loop"] = True
+
+
+class DeadlineHook:
+    """モデル・ツール呼び出しに締め切りを伝搬するフックプロバイダー
+
+    invocation_state["deadline"]を参照し、締め切り後のツール呼び出しを取り消し、
+    HTTPリクエストのtimeoutを残り時間以内に制限する。締め切りを過ぎた時点でイベントループの停止を要求するため、
+    ハンドラーが応答を返した後にバックグラウンドのスレッドで新たなBedrockの呼び出しやツールの実行が始まることはない
+    （締め切りの時点で実行中のモデル呼び出しは、Agent.cancelがないstrandsでは完了まで続く）。
+    """
+
+    def __init__(self, default_tool_timeout: float = 30):
+        self.default_tool_timeout = default_tool_timeout
+
+    def register_hooks(self, registry: Any, **kwargs: Any) -> None:
+        from strands.hooks import BeforeModelCallEvent, BeforeToolCallEvent
+        registry.add_callback(BeforeModelCallEvent, self.before_model_call)
+        registry.add_callback(BeforeToolCallEvent, self.before_tool_call)
+
+    def before_model_call(self, event: Any) -> None:
+        # 古いstrandsのBeforeModelCallEventにはinvocation_state・cancelがない
+        invocation_state = getattr(event, "invocation_state", None)
+        deadline = (invocation_state or {}).get("deadline")
+        if deadline is None or not deadline.expired:
+            return
+        logger.warning("締め切りを過ぎたためモデル呼び出しを取り消します")
+        stop_event_loop(invocation_state)
+        if hasattr(event, "cancel"):
+            event.cancel = "締め切りを過ぎたためモデル呼び出しを中止しました"
+
+    def _tool_timeout(self, value: Any) -> float:
+        """モデルが指定したtimeoutを秒数に変換（数値でない・NaN・0以下の場合は既定値）"""
+        if isinstance(value, bool):
+            return float(self.default_tool_timeout)
+        try:
+            timeout = float(value)
+        except (TypeError, ValueError, OverflowError):
+            return float(self.default_tool_timeout)
+        if not math.isfinite(timeout) or timeout <= 0:
+            return float(self.default_tool_timeout)
+        return timeout
+
+    def before_tool_call(self, event: Any) -> None:
+        invocation_state = event.invocation_state if event.invocation_state is not None else {}
+        deadline = invocation_state.get("deadline")
+        tool_use = event.tool_use
+        name = tool_use.get("name")
+
+        if deadline is not None and deadline.expired:
+            logger.warning(f"締め切りを過ぎたためツール呼び出しを取り消します: {name}")
+            event.cancel_tool = "締め切りを過ぎたためツール呼び出しを中止しました"
+            # ツールの結果を受け取った後のモデル呼び出しも行わない
+            stop_event_loop(invocation_state)
+            return
+
+        if name in AWS_CLIENT_TOOLS:
+            _tool_deadline.set(deadline)
+
+        if name in TIMEOUT_AWARE_TOOLS:
+            tool_input = tool_use.setdefault("input", {})
+            timeout = self._tool_timeout(tool_input.get("timeout"))
+            if deadline is not None:
+                timeout = deadline.clamp(timeout)
+            tool_input["timeout"] = timeout
+
+
+def aws_client_timeouts(deadline: Optional[Deadline], default_timeout: float = 30) -> Optional[Dict[str, Any]]:
+    """締め切りまでの残り時間に収まるbotocoreのConfigの引数（締め切りがなければNone）
+
+    再試行するとタイムアウトが試行回数倍になるため、締め切りがある場合は再試行しない。
+    """
+    remaining = deadline.remaining() if deadline is not None else None
+    if remaining is None:
+        return None
+    timeout = max(min(float(default_timeout), remaining), 0.1)
+    return {
+        "connect_timeout": min(timeout, 5.0),
+        "read_timeout": timeout,
+        "retries": {"total_max_attempts": 1},
+    }
+
+
+def install_aws_client_timeouts(use_aws_module: Any, default_timeout: float = 30) -> bool:
+    """use_awsのクライアント生成を、ツール呼び出しの締め切りに合わせたタイムアウトを設定するものに置き換える
+
+    use_awsはget_boto3_client(service_name, region_name, profile_name)でクライアントを生成する。
+    この関数がない版のstrands-agents-toolsでは置き換えず、use_awsには締め切りが伝わらない（Falseを返す）。
+    """
+    original = getattr(use_aws_module, "get_boto3_client", None)
+    if not callable(original):
+        logger.warning("use_awsのクライアント生成を置き換えられないため、use_awsに締め切りを適用しません")
+        return False
+    if getattr(original, "deadline_aware", False) is True:
+        return True
+
+    def get_boto3_client(service_name: str, region_name: str, profile_name: Optional[str] = None) -> Any:
+        settings = aws_client_timeouts(_tool_deadline.get(), default_timeout)
+        if settings is None:
+            return original(service_name, region_name, profile_name)
+        import boto3
+        from botocore.config import Config
+        session = boto3.Session(profile_name=profile_name)
+        config = Config(user_agent_extra="strands-agents-use-aws", **settings)
+        return session.client(service_name=service_name, region_name=region_name, config=config)
+
+    get_boto3_client.deadline_aware = True
+    use_aws_module.get_boto3_client = get_boto3_client
+    return True
+
+
+def run_with_deadline(func: Callable[[], Any], deadline: Deadline) -> Tuple[bool, Any]:
+    """締め切りまで関数を実行し、(完了したか, 結果) を返す
+
+    締め切りを過ぎた場合、関数はバックグラウンドのスレッドで実行され続けるため、
+    呼び出し側で取り消し処理を行う（Agentの呼び出しはDeadlineHookが次のモデル・ツール呼び出しの前に停止する）。
+    関数内の例外はそのまま送出する。
+    """
+    timeout = deadline.remaining()
+    if timeout is None:
+        return True, func()
+
+    outcome = {}
+    finished = threading.Event()
+
+    def target():
+        try:
+            outcome["result"] = func()
+        except BaseException as e:
+            outcome["error"] = e
+        finally:
+            finished.set()
+
+    threading.Thread(target=target, name="agent-invocation", daemon=True).start()
+    if not finished.wait(timeout):
+        return False, None
+
+    if "error" in outcome:
+        raise outcome["error"]
+    return True, outcome.get("result")
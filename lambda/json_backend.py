@@ -0,0 +1,146 @@
+"""
+JSONのエンコード・デコードを行うバックエンド
+
+orjsonがインストールされていれば高速なorjsonを使い、なければ標準ライブラリのjsonに
+フォールバックする。整形出力は標準ライブラリ（ensure_ascii=False）とバイト単位で
+同一になるよう、一致を保証できない入力では標準ライブラリで処理する。
+"""
+import json
+import re
+from typing import Any, Callable, Iterator, Optional, Tuple, Union
+
+from config import config
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+JSONDecodeError = json.JSONDecodeError
+
+# orjsonは 1e-05 や 1e+16 を 0.00001 / 1e16 と出力するため、該当する出力は標準ライブラリで作り直す
+_UNSAFE_FLOAT = re.compile(r'[0-9][eE]|0\.0000')
+# orjsonは64ビットに収まらない整数を浮動小数点数として読み込む
+_LONG_INT = re.compile(r'[0-9]{19}')
+# orjsonのインデントは2スペース固定のため、行頭の2スペース単位を指定の幅に置き換える
+_LEADING_INDENT = re.compile(r'^(?:  )+', re.MULTILINE)
+
+
+def backend_name() -> str:
+    """現在使用しているバックエンド名（orjson または json）"""
+    return "orjson" if _use_orjson() else "json"
+
+
+def _use_orjson() -> bool:
+    return orjson is not None and config.JSON_BACKEND != "json"
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """JSONをデコード（エラー時は標準ライブラリと同じJSONDecodeErrorを送出）"""
+    return _loads(data)[0]
+
+
+def _loads(data: Union[str, bytes]) -> Tuple[Any, bool]:
+    """JSONをデコードし、(値, orjsonの出力が標準ライブラリと一致しうるか) を返す"""
+    if _use_orjson():
+        try:
+            value = orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # NaNや巨大な数値など標準ライブラリのみが受け付ける入力、
+            # またはエラーメッセージを標準ライブラリと揃えるために読み直す
+            pass
+        else:
+            text = data if isinstance(data, str) else data.decode("utf-8", "replace")
+            if not _LONG_INT.search(text):
+                return value, True
+    return json.loads(data), False
+
+
+def dumps(
+    obj: Any,
+    *,
+    indent: Optional[int] = None,
+    sort_keys: bool = False,
+    compact: bool = False,
+    default: Optional[Callable[[Any], Any]] = None
+) -> str:
+    """JSONにエンコード
+
+    既定では標準ライブラリの json.dumps(obj, ensure_ascii=False) と同じ出力を返す。
+    compact=Trueでは区切り文字の空白を省いた出力になり、orjsonを利用できる。
+    """
+    if compact and indent is None and _use_orjson():
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if default is not None:
+            # datetimeなどもdefaultに渡し、標準ライブラリと同じ文字列表現にする
+            option |= orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        try:
+            return orjson.dumps(obj, default=default, option=option).decode("utf-8")
+        except orjson.JSONEncodeError:
+            pass  # 64ビットを超える整数など
+
+    return json.dumps(
+        obj,
+        indent=indent,
+        ensure_ascii=False,
+        sort_keys=sort_keys,
+        separators=(",", ":") if compact else None,
+        default=default
+    )
+
+
+def _reindent(text: str, indent: int) -> str:
+    if indent == 2:
+        return text
+    pad = " " * indent
+    return _LEADING_INDENT.sub(lambda m: pad * (len(m.group(0)) // 2), text)
+
+
+def _pretty_value(value: Any, indent: Any, sort_keys: bool, fast: bool) -> str:
+    if fast and type(indent) is int:
+        option = orjson.OPT_INDENT_2 | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        text = orjson.dumps(value, option=option).decode("utf-8")
+        if not _UNSAFE_FLOAT.search(text):
+            return _reindent(text, indent)
+    return json.dumps(value, indent=indent, ensure_ascii=False, sort_keys=sort_keys)
+
+
+def pretty(text: Union[str, bytes], indent: Any = 2, sort_keys: bool = False) -> str:
+    """JSON文字列を整形
+
+    json.dumps(json.loads(text), indent=indent, ensure_ascii=False, sort_keys=sort_keys)
+    と同じ出力を返す。
+    """
+    value, fast = _loads(text)
+    return _pretty_value(value, indent, sort_keys, fast)
+
+
+def iter_pretty(text: Union[str, bytes], indent: Any = 2, sort_keys: bool = False) -> Iterator[str]:
+    """JSON文字列を整形し、トップレベルの要素ごとにチャンクとして生成
+
+    結合した結果はpretty()と同一。出力全体を一度に組み立てないため、
+    大きなドキュメントを途中で打ち切る場合も打ち切った以降の整形は行わない。
+    """
+    value, fast = _loads(text)
+    if not isinstance(value, (dict, list)) or not value or type(indent) is not int:
+        yield _pretty_value(value, indent, sort_keys, fast)
+        return
+
+    newline = "\n" + " " * indent
+    if isinstance(value, dict):
+        items = sorted(value.items()) if sort_keys else value.items()
+        opening, closing = "{", "}"
+    else:
+        items = ((None, item) for item in value)
+        opening, closing = "[", "]"
+
+    yield opening
+    separator = newline
+    for key, item in items:
+        prefix = separator if key is None else f"{separator}{json.dumps(key, ensure_ascii=False)}: "
+        yield prefix + _pretty_value(item, indent, sort_keys, fast).replace("\n", newline)
+        separator = "," + newline
+    yield "\n" + closing
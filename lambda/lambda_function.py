@@ -4,10 +4,14 @@ Strands Agentを使用してAIアシスタント機能を提供
 """
 import json
 import logging
-from typing import Dict, Any
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, Iterator, List, Optional
 # 遅延インポートを使用してコールドスタートを最適化
 Agent = None
 BedrockModel = None
+NullConversationManager = None
 http_request = None
 calculator = None
 current_time = None
@@ -15,17 +19,45 @@ use_aws = None
 
 def _lazy_imports():
     """必要になったときにのみモジュールをインポート"""
-    global Agent, BedrockModel, http_request, calculator, current_time, use_aws
+    global Agent, BedrockModel, NullConversationManager, http_request, calculator, current_time, use_aws
     if Agent is None:
         from strands import Agent
+    if BedrockModel is None:
         from strands.models import BedrockModel
+    if NullConversationManager is None:
+        from strands.agent.conversation_manager import NullConversationManager
     if http_request is None or calculator is None or current_time is None or use_aws is None:
         from strands_tools import http_request, calculator, current_time, use_aws
+        # http_requestが作成するセッションにキープアライブの設定を適用
+        connection_manager.configure_http_sessions(http_request)
+        # use_awsのAWS SDKクライアントのタイムアウトを締め切りに合わせる
+        install_aws_client_timeouts(use_aws, DEFAULT_TIMEOUT)
 
 # ローカルインポート
 from config import config
-from utils import capture_stdout, validate_prompt, get_model_info, sanitize_error_message, format_response
+import json_backend
+from utils import validate_prompt, get_model_info, sanitize_error_message, format_response
 from custom_tools import generate_hash, json_formatter, text_analyzer
+from agent_pool import AgentPool, make_pool_key, tool_name
+from streaming import EventCollector
+from deadline import Deadline, DeadlineHook, install_aws_client_timeouts, run_with_deadline, stop_event_loop
+from response_cache import MemoryTier, ResponseCache, create_shared_tier, make_cache_key, make_scope_key
+from semantic_cache import SemanticCache, create_embedder, create_index_store
+from tool_memo import STATS_KEY, ToolMemoHook, ToolResultCache, new_request_stats
+from tool_executor import create_tool_executor
+from connections import ConnectionManager
+from telemetry import (
+    METRICS_KEY, RequestMetrics, TelemetryHook, emf_document, emit, function_name, mark_cold_start, measure,
+    take_cold_start, usage_from_result
+)
+from session_store import (
+    CompactionPolicy, SessionConflictError, SessionManager, create_session_store, create_summarizer,
+    validate_session_id
+)
+from prompt_cache import cache_settings, stable_tool_order
+from model_router import ModelRouter, create_classifier, error_name
+from async_runner import AsyncRunner, stream_agent_result
+import priming
 
 # ロガーの設定
 logger = logging.getLogger()
@@ -37,6 +69,554 @@ DEFAULT_TIMEOUT = config.DEFAULT_TIMEOUT
 MAX_PROMPT_LENGTH = config.MAX_PROMPT_LENGTH
 DEFAULT_MODEL_ID = config.DEFAULT_MODEL_ID
 
+# ウォームコンテナ間で共有する接続プール（Bedrockクライアント、http_requestのセッション）
+connection_manager = ConnectionManager(
+    max_pool_connections=config.CONNECTION_POOL_MAX_CONNECTIONS,
+    http_pool_size=config.CONNECTION_HTTP_POOL_SIZE,
+    tcp_keepalive=config.CONNECTION_TCP_KEEPALIVE,
+    idle_reset_seconds=config.CONNECTION_IDLE_RESET_SECONDS,
+    enabled=config.ENABLE_CONNECTION_POOL
+)
+
+# Agentのstream_asyncを実行するイベントループ（ENABLE_ASYNC_HANDLERの場合、最初の呼び出しで起動）
+async_runner = AsyncRunner(max_tool_threads=config.ASYNC_MAX_TOOL_THREADS)
+
+# ウォームコンテナ間で共有するAgentプール
+agent_pool = AgentPool(max_size=config.AGENT_POOL_MAX_SIZE if config.ENABLE_AGENT_POOL else 0)
+
+# 決定的なツールの結果をリクエストをまたいで再利用するキャッシュ
+tool_memo_cache = ToolResultCache(max_bytes=config.TOOL_MEMO_MAX_BYTES)
+
+
+def _build_hooks() -> list:
+    """Agentに登録するフック（締め切りの伝搬、所要時間の計測、ツール結果のメモ化）"""
+    hooks = [DeadlineHook(default_tool_timeout=DEFAULT_TIMEOUT), TelemetryHook()]
+    if config.ENABLE_TOOL_MEMOIZATION:
+        hooks.append(ToolMemoHook(tool_memo_cache, config.MEMOIZED_TOOLS))
+    return hooks
+
+
+def _build_executor_config() -> Dict[str, Any]:
+    """1ターン内のツール呼び出しを並行実行するExecutorの設定（無効時はstrandsの既定）"""
+    if not config.ENABLE_CONCURRENT_TOOLS:
+        return {}
+    return {
+        'tool_executor': create_tool_executor(
+            max_concurrency=config.TOOL_MAX_CONCURRENCY,
+            default_timeout=DEFAULT_TIMEOUT,
+            timeouts=config.TOOL_TIMEOUTS
+        )
+    }
+
+
+def _create_response_cache() -> ResponseCache:
+    """設定に基づいて応答キャッシュを構築（共有層の設定が不正な場合はメモリ層のみ）"""
+    shared = None
+    if config.ENABLE_RESPONSE_CACHE:
+        try:
+            shared = create_shared_tier(
+                config.RESPONSE_CACHE_BACKEND,
+                table_name=config.RESPONSE_CACHE_TABLE,
+                bucket=config.RESPONSE_CACHE_BUCKET,
+                prefix=config.RESPONSE_CACHE_PREFIX,
+                local_dir=config.RESPONSE_CACHE_LOCAL_DIR
+            )
+        except ValueError as e:
+            logger.warning(f"共有キャッシュを無効化します: {str(e)}")
+    return ResponseCache(
+        memory=MemoryTier(config.RESPONSE_CACHE_MAX_ENTRIES),
+        shared=shared,
+        ttl=config.RESPONSE_CACHE_TTL,
+        bypass_tools=config.RESPONSE_CACHE_BYPASS_TOOLS,
+        enabled=config.ENABLE_RESPONSE_CACHE
+    )
+
+
+# ウォームコンテナ間で共有する応答キャッシュ
+response_cache = _create_response_cache()
+
+
+def _create_semantic_cache() -> SemanticCache:
+    """設定に基づいてセマンティックキャッシュを構築（保存済みのインデックスがあれば読み込む）"""
+    embedder = create_embedder(
+        config.SEMANTIC_CACHE_EMBEDDER,
+        dimensions=config.SEMANTIC_CACHE_DIMENSIONS,
+        model_id=config.SEMANTIC_CACHE_EMBEDDING_MODEL
+    )
+    store = None
+    if config.ENABLE_SEMANTIC_CACHE:
+        try:
+            store = create_index_store(config.SEMANTIC_CACHE_INDEX_URI)
+        except ValueError as e:
+            logger.warning(f"セマンティックキャッシュのインデックスを保存しません: {str(e)}")
+    return SemanticCache.from_store(
+        embedder,
+        store,
+        threshold=config.SEMANTIC_CACHE_THRESHOLD,
+        ttl=config.RESPONSE_CACHE_TTL,
+        max_entries=config.SEMANTIC_CACHE_MAX_ENTRIES,
+        bypass_tools=config.RESPONSE_CACHE_BYPASS_TOOLS,
+        save_every=config.SEMANTIC_CACHE_SAVE_EVERY,
+        enabled=config.ENABLE_SEMANTIC_CACHE
+    )
+
+
+# 言い換えられたプロンプト用のセマンティックキャッシュ（initフェーズでインデックスをメモリマップ）
+semantic_cache = _create_semantic_cache()
+
+
+def _create_session_manager() -> SessionManager:
+    """設定からセッションの管理を生成（ストアを作れない場合はセッションなしで動作）"""
+    store = None
+    try:
+        store = create_session_store(
+            config.SESSION_STORE_BACKEND,
+            table_name=config.SESSION_TABLE,
+            local_dir=config.SESSION_LOCAL_DIR
+        )
+    except ValueError as e:
+        logger.warning(f"セッションストアを無効化します: {str(e)}")
+    return SessionManager(
+        store,
+        policy=CompactionPolicy(config.SESSION_MAX_MESSAGES, config.SESSION_MAX_TOKENS),
+        summarizer=create_summarizer(config.SESSION_SUMMARIZER, config.SESSION_SUMMARY_MODEL),
+        cache=MemoryTier(config.SESSION_CACHE_MAX_ENTRIES),
+        ttl=config.SESSION_TTL
+    )
+
+
+session_manager = _create_session_manager()
+
+# プロンプトの分類によるモデルの選択（モデルごとの統計はウォームコンテナ間で共有）
+model_router = ModelRouter(
+    config.MODEL_ROUTER_TIERS,
+    classifier=create_classifier(config.MODEL_ROUTER_CLASSIFIER, config.MODEL_ROUTER_CLASSIFIER_MODEL),
+    enabled=config.ENABLE_MODEL_ROUTER,
+    cooldown_seconds=config.MODEL_ROUTER_COOLDOWN_SECONDS,
+    max_error_rate=config.MODEL_ROUTER_MAX_ERROR_RATE
+)
+
+
+def _build_tools() -> list:
+    """設定に基づいてツールリストを動的に構築"""
+    # 基本ツール（strands-agents-tools）
+    tools = [
+        http_request,
+        calculator,
+        current_time,
+    ]
+    
+    # カスタムツールを設定に基づいて追加
+    if config.ENABLE_CUSTOM_TOOLS:
+        custom_tools = []
+        
+        if config.ENABLE_HASH_GENERATOR:
+            custom_tools.append(generate_hash)
+        if config.ENABLE_JSON_FORMATTER:
+            custom_tools.append(json_formatter)
+        if config.ENABLE_TEXT_ANALYZER:
+            custom_tools.append(text_analyzer)
+        
+        tools.extend(custom_tools)
+        logger.info(f"有効なカスタムツール: {[tool_name(t) for t in custom_tools]}")
+    
+    # AWSツール（strands-agents-toolsに含まれる）
+    if config.ENABLE_AWS_TOOLS:
+        tools.append(use_aws)
+        logger.info("AWSツール(use_aws)を有効化")
+    
+    # if config.ENABLE_NOVA_REELS:
+    #     from nova_tools import nova_reels
+    #     tools.append(nova_reels)
+    #     logger.info("Nova Reelsツールを有効化")
+    
+    # MCP Server統合（将来実装）
+    # if config.ENABLE_MCP_SERVER:
+    #     from mcp_integration import load_mcp_tools
+    #     mcp_tools = load_mcp_tools()
+    #     tools.extend(mcp_tools)
+    #     logger.info(f"MCPツールを{len(mcp_tools)}個ロード")
+    
+    # ツール定義の順序を固定し、プロンプトキャッシュのプレフィックスをリクエスト間で一致させる
+    return stable_tool_order(tools)
+
+
+def resolve_model_config(body: Dict[str, Any]) -> Dict[str, Any]:
+    """リクエストボディからモデル設定を抽出（未指定ならデフォルトモデルを使用）"""
+    # オプション: イベントからモデル設定を抽出
+    model_config = body.get('model_config', {})
+    
+    # デフォルトモデルIDが環境変数で指定されている場合は使用
+    if DEFAULT_MODEL_ID and 'model' not in model_config:
+        model_config['model'] = DEFAULT_MODEL_ID
+    
+    return model_config
+
+
+@contextmanager
+def acquire_agent(
+    model_config: Dict[str, Any],
+    shared_model: Any = None,
+    metrics: Optional[RequestMetrics] = None
+) -> Iterator[Any]:
+    """プールからAgentを借りる（ウォームコンテナではAgentとBedrockクライアントを再利用）
+    
+    shared_modelを指定すると、新しく構築するAgentはそのモデルインスタンスを共有する。
+    metricsを指定すると、Agentを構築した場合の所要時間をagent_buildフェーズとして記録する。
+    """
+    _lazy_imports()
+    tools = _build_tools()
+    pool_key = make_pool_key(model_config, tools)
+    
+    def build_agent():
+        with measure(metrics, 'agent_build'):
+            logger.info("新しいAgentを構築します")
+            agent_config = dict(model_config)  # カスタムモデル設定を許可
+            if shared_model is not None:
+                agent_config['model'] = shared_model
+            elif config.ENABLE_PROMPT_CACHE:
+                # 対応するモデルではシステムプロンプトとツール定義をキャッシュする
+                settings = cache_settings(
+                    agent_config.get('model'), config.PROMPT_CACHE_MODELS, config.PROMPT_CACHE_TOOL_MODELS
+                )
+                if settings:
+                    agent_config['model'] = BedrockModel(model_id=agent_config['model'], **settings)
+            agent = Agent(
+                system_prompt=ASSISTANT_SYSTEM_PROMPT,
+                tools=tools,
+                callback_handler=None,  # イベントはリクエストごとのEventCollectorで受け取る
+                hooks=_build_hooks(),
+                **_build_executor_config(),
+                **agent_config
+            )
+            # Agentごとのクライアントではなく、接続を保持している共有クライアントを使う
+            connection_manager.attach(getattr(agent, 'model', None))
+            return agent
+    
+    with agent_pool.acquire(pool_key, build_agent) as agent:
+        yield agent
+
+
+def _run_agent(
+    prompt: str,
+    model_config: Dict[str, Any],
+    deadline: Optional[Deadline] = None,
+    use_cache: bool = True,
+    shared_model: Any = None,
+    metrics: Optional[RequestMetrics] = None,
+    session_id: Optional[str] = None,
+    routed: bool = False
+) -> Dict[str, Any]:
+    """プロンプトを処理してレスポンスデータを返す
+    
+    応答キャッシュ（完全一致）、セマンティックキャッシュ（類似プロンプト）の順に参照し、
+    どちらにもなければAgentを呼び出して結果を保存する。metricsには各フェーズの所要時間を記録する。
+    session_idを指定した場合は会話履歴に続けて処理し、応答は履歴に依存するためキャッシュを使わない。
+    routedの場合はプロンプトに応じてモデルを選ぶ（選んだモデルはshared_modelより優先する）。
+    """
+    if session_id is not None:
+        return _run_session_turn(prompt, model_config, session_id, deadline, metrics, routed)
+    
+    cache_key = scope = vector = None
+    if use_cache and (response_cache.enabled or semantic_cache.enabled):
+        with measure(metrics, 'cache_lookup'):
+            tools = _build_tools()
+            if response_cache.enabled:
+                cache_key = make_cache_key(prompt, model_config, ASSISTANT_SYSTEM_PROMPT, tools)
+                cached, tier = response_cache.get(cache_key)
+                if cached is not None:
+                    logger.info(f"応答キャッシュにヒットしました（{tier}）: {response_cache.stats()}")
+                    return {**cached, 'prompt': prompt, 'cached': True}
+        
+            if semantic_cache.enabled:
+                scope = make_scope_key(model_config, ASSISTANT_SYSTEM_PROMPT, tools)
+                try:
+                    vector = semantic_cache.embed(prompt)
+                except Exception as e:
+                    # 埋め込みに失敗してもキャッシュなしで処理を続ける
+                    logger.warning(f"プロンプトの埋め込みに失敗しました: {type(e).__name__}: {str(e)}")
+                else:
+                    cached, similarity = semantic_cache.lookup(vector, scope)
+                    if cached is not None:
+                        logger.info(f"セマンティックキャッシュにヒットしました（類似度 {similarity:.3f}）: {semantic_cache.stats()}")
+                        if cache_key is not None:
+                            response_cache.put(cache_key, cached)
+                        return {**cached, 'prompt': prompt, 'cached': True, 'cache_similarity': round(similarity, 4)}
+    
+    def invoke(attempt_config: Dict[str, Any]) -> Dict[str, Any]:
+        with acquire_agent(attempt_config, shared_model=None if routed else shared_model, metrics=metrics) as agent:
+            return _invoke_agent(agent, prompt, attempt_config, deadline, metrics)
+    
+    response_data = _invoke_with_routing(prompt, model_config, deadline, routed, invoke)
+    
+    with measure(metrics, 'cache_store'):
+        if cache_key is not None:
+            response_cache.put(cache_key, response_data)
+            logger.info(f"応答キャッシュの利用状況: {response_cache.stats()}")
+        if vector is not None:
+            semantic_cache.add(vector, scope, response_data)
+            logger.info(f"セマンティックキャッシュの利用状況: {semantic_cache.stats()}")
+    if cache_key is not None or vector is not None:
+        response_data['cached'] = False
+    return response_data
+
+
+@contextmanager
+def _session_conversation(agent: Any) -> Iterator[None]:
+    """セッションのターンの間はAgentの会話管理（スライディングウィンドウ）を無効にする
+
+    履歴の圧縮はSessionManagerが行う。実行中に履歴が削られると今回のターンを切り出せず、
+    先頭に置いた要約も失われるため、NullConversationManagerに差し替えて返却時に戻す。
+    """
+    original = getattr(agent, 'conversation_manager', None)
+    agent.conversation_manager = NullConversationManager()
+    try:
+        yield
+    finally:
+        agent.conversation_manager = original
+
+
+def _run_session_turn(
+    prompt: str,
+    model_config: Dict[str, Any],
+    session_id: str,
+    deadline: Optional[Deadline] = None,
+    metrics: Optional[RequestMetrics] = None,
+    routed: bool = False
+) -> Dict[str, Any]:
+    """セッションの会話履歴をAgentに渡してプロンプトを処理し、今回のターンを履歴に追加する
+    
+    締め切りを過ぎた場合は不完全なターンを履歴に残さないよう保存しない。
+    """
+    with measure(metrics, 'session_load'):
+        state = session_manager.load(session_id)
+        history = session_manager.history(state)
+    
+    new_messages = []
+    history_intact = [True]
+    
+    def invoke(attempt_config: Dict[str, Any]) -> Dict[str, Any]:
+        with acquire_agent(attempt_config, metrics=metrics) as agent, _session_conversation(agent):
+            agent.messages.extend(history)
+            start = len(agent.messages)
+            response_data = _invoke_agent(agent, prompt, attempt_config, deadline, metrics)
+            # プールへの返却時に履歴が消去されるため、今回のターンのメッセージを取り出しておく
+            history_intact[0] = agent.messages[:start] == history
+            new_messages[:] = agent.messages[start:]
+            return response_data
+    
+    response_data = _invoke_with_routing(prompt, model_config, deadline, routed, invoke)
+    
+    if response_data['status'] == 'completed' and not history_intact[0]:
+        # 履歴が書き換えられた場合は今回のターンを正しく切り出せないため保存しない
+        logger.warning(f"Agentの実行中に会話履歴が変更されたため、セッションに保存しません: {session_id}")
+    elif response_data['status'] == 'completed':
+        with measure(metrics, 'session_save'):
+            state = session_manager.append(session_id, state, new_messages)
+        logger.info(f"セッションの利用状況: {session_manager.stats()}")
+    
+    response_data['session_id'] = session_id
+    response_data['session'] = {
+        'turns': state.turns,
+        'messages': len(state.messages),
+        'summarized_messages': state.summarized_messages
+    }
+    return response_data
+
+
+def _invoke_with_routing(
+    prompt: str,
+    model_config: Dict[str, Any],
+    deadline: Optional[Deadline],
+    routed: bool,
+    invoke: Callable[[Dict[str, Any]], Dict[str, Any]]
+) -> Dict[str, Any]:
+    """routedの場合はプロンプトに応じてモデルを選んでinvokeを呼び出す
+    
+    スロットリングやモデルのタイムアウトで失敗した場合は、フォールバックチェーンの次のモデルで処理し直す。
+    各モデルの所要時間と失敗はルーターに記録し、以降のモデルの選択に使う。
+    """
+    if not routed:
+        return invoke(model_config)
+    
+    deadline = deadline or Deadline()
+    route = model_router.route(prompt, deadline.remaining())
+    logger.info(f"モデルを選択しました（ティア{route.tier}、{', '.join(route.reasons)}）: {route.chain}")
+    attempts = []
+    for model_id in route.chain:
+        attempts.append(model_id)
+        started = time.perf_counter()
+        try:
+            response_data = invoke({**model_config, 'model': model_id})
+        except Exception as e:
+            error = error_name(e)
+            if error is None:
+                raise
+            model_router.record(model_id, (time.perf_counter() - started) * 1000, error)
+            if model_id == route.chain[-1] or deadline.expired:
+                raise
+            logger.warning(f"{model_id}の呼び出しに失敗したため次のモデルで処理します: {error}")
+            continue
+        timed_out = response_data.get('status') == 'timeout'
+        model_router.record(model_id, (time.perf_counter() - started) * 1000, 'timeout' if timed_out else None)
+        response_data['routing'] = route.to_dict(attempts)
+        logger.info(f"モデルの利用状況: {model_router.stats()}")
+        return response_data
+
+
+def new_invocation_state(deadline: Deadline, metrics: Optional[RequestMetrics] = None) -> Dict[str, Any]:
+    """フック（締め切り・メモ化・計測）と共有するリクエスト単位のinvocation_state"""
+    # ネストした辞書はフックと共有されるため、リクエスト単位のメモ化の集計に使う
+    return {'deadline': deadline, STATS_KEY: new_request_stats(), METRICS_KEY: metrics}
+
+
+def _invoke_agent(
+    agent: Any,
+    prompt: str,
+    model_config: Dict[str, Any],
+    deadline: Optional[Deadline] = None,
+    metrics: Optional[RequestMetrics] = None
+) -> Dict[str, Any]:
+    """エージェントでプロンプトを処理してレスポンスデータを返す
+    
+    締め切りを過ぎた場合は処理を取り消し、それまでに得られた部分的な応答を返す。
+    モデル呼び出し（ターン）とツール呼び出しの所要時間はフックでmetricsに記録する。
+    ENABLE_ASYNC_HANDLERの場合は共有のイベントループでstream_asyncを実行し、締め切りでタスクを取り消す。
+    """
+    deadline = deadline or Deadline()
+    # 使用されるモデル情報をログに出力
+    used_model = get_model_info(agent, model_config, DEFAULT_MODEL_ID)
+    logger.info(f"使用モデル: {used_model}")
+    
+    # プロンプトを処理
+    logger.info(f"プロンプトを処理中: {prompt[:100]}...")  # 最初の100文字をログ出力
+    
+    # コールバックでテキスト差分・推論・ツールイベントを収集
+    collector = EventCollector()
+    previous_handler = getattr(agent, 'callback_handler', None)
+    agent.callback_handler = collector
+    invocation_state = new_invocation_state(deadline, metrics)
+    with measure(metrics, 'agent_invoke'):
+        if config.ENABLE_ASYNC_HANDLER:
+            completed, response = async_runner.run(
+                lambda: stream_agent_result(agent, prompt, invocation_state),
+                deadline
+            )
+        else:
+            completed, response = run_with_deadline(
+                lambda: agent(prompt, invocation_state=invocation_state),
+                deadline
+            )
+    
+    if completed and metrics is not None:
+        metrics.add_usage(usage_from_result(response))
+    
+    if completed:
+        agent.callback_handler = previous_handler
+        # 最終的な応答の構築（ストリーミングされたテキストがなければ最終結果を使用）
+        complete_response = collector.text.strip() or str(response)
+        logger.info("プロンプト処理完了")
+    else:
+        # 実行中の処理を取り消し、状態が不定なAgentはプールに戻さない
+        logger.warning("締め切りを過ぎたため処理を中断し、部分的な応答を返します")
+        # バックグラウンドで続くイベントループは次のモデル・ツール呼び出しの前にDeadlineHookが停止する
+        stop_event_loop(invocation_state)
+        if hasattr(agent, 'cancel'):
+            agent.cancel()
+        agent_pool.discard(agent)
+        complete_response = collector.text.strip()
+    
+    logger.info(f"完全な応答: {complete_response}")
+    
+    # レスポンスをフォーマット
+    response_data = {
+        'response': complete_response,
+        'prompt': prompt,
+        'status': 'completed' if completed else 'timeout'
+    }
+    
+    # 推論とツール呼び出しは構造化フィールドとして返す
+    if collector.reasoning:
+        response_data['reasoning'] = collector.reasoning
+    if collector.tool_calls:
+        response_data['tool_calls'] = collector.tool_calls
+    
+    if config.ENABLE_TOOL_MEMOIZATION:
+        response_data['tool_memo'] = dict(invocation_state[STATS_KEY])
+    
+    # 使用したモデル情報を含める
+    if used_model:
+        response_data['model_used'] = used_model
+    
+    return response_data
+
+
+def _run_batch(
+    prompts: List[Any],
+    model_config: Dict[str, Any],
+    deadline: Deadline,
+    use_cache: bool = True,
+    metrics: Optional[RequestMetrics] = None,
+    include_metrics: bool = False,
+    routed: bool = False
+) -> Dict[str, Any]:
+    """複数のプロンプトをスレッドプールで並行処理し、項目ごとの結果を返す
+    
+    metricsは全項目で共有し、フェーズの所要時間とトークン使用量は項目の合計になる。
+    routedの場合は項目ごとにモデルを選ぶ。
+    """
+    # 最初のAgentのモデル（Bedrockクライアント）を全項目で共有する
+    shared_model = None
+    if not routed:
+        with acquire_agent(model_config, metrics=metrics) as lead_agent:
+            shared_model = getattr(lead_agent, 'model', None)
+    
+    def run_item(prompt: Any) -> Dict[str, Any]:
+        with measure(metrics, 'validate'):
+            is_valid, error_msg = validate_prompt(prompt, MAX_PROMPT_LENGTH)
+        if not is_valid:
+            return {'success': False, 'error': error_msg}
+        return {
+            'success': True,
+            **_run_agent(prompt, model_config, deadline, use_cache, shared_model, metrics, routed=routed)
+        }
+    
+    max_workers = max(1, min(config.BATCH_MAX_CONCURRENCY, len(prompts)))
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='batch')
+    try:
+        futures = [executor.submit(run_item, prompt) for prompt in prompts]
+        # 間に合わない項目はタイムアウトとして返す
+        wait(futures, timeout=deadline.remaining())
+    finally:
+        # 締め切りを過ぎた未着手の項目は取り消す（実行中のスレッドは待たない）
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    results = []
+    for index, future in enumerate(futures):
+        if not future.done() or future.cancelled():
+            item = {'success': False, 'error': 'タイムアウト'}
+        elif future.exception() is not None:
+            e = future.exception()
+            logger.error(f"バッチ項目{index}のエラー: {type(e).__name__}: {str(e)}")
+            item = {'success': False, 'error': sanitize_error_message(e)}
+        else:
+            item = future.result()
+        results.append({'index': index, **item})
+    
+    succeeded = sum(1 for item in results if item['success'])
+    logger.info(f"バッチ処理完了: {succeeded}/{len(results)}件成功")
+    
+    data = {
+        'results': results,
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded
+    }
+    if include_metrics and metrics is not None:
+        data['metrics'] = metrics.to_dict()
+    with measure(metrics, 'serialize'):
+        return format_response(success=succeeded == len(results), data=data, status_code=200)
+
+
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Strands Agents SDKを使用してリクエストを処理するAWS Lambdaハンドラー関数
@@ -51,21 +631,82 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     # 遅延インポートを実行
     _lazy_imports()
     
+    # Lambdaのタイムアウト前に応答を返せるよう締め切りを設定
+    deadline = Deadline.from_context(context, config.DEADLINE_SAFETY_MARGIN_MS)
+    
+    # リクエスト単位の計測（レスポンスのmetricsフィールドとEMFで出力）
+    metrics = RequestMetrics(cold_start=take_cold_start())
+    model_id = None
+    
+    # 長くアイドルだった場合は切断されている可能性のある接続を張り直す
+    connection_manager.check_idle()
+    
     try:
-        # リクエストペイロードをログ出力
-        logger.info(f"受信したイベント: {json.dumps(event, ensure_ascii=False)}")
+        # リクエストペイロードをログ出力（INFOが無効な場合はシリアライズしない）
+        log_payloads = logger.isEnabledFor(logging.INFO)
+        if log_payloads:
+            logger.info(f"受信したイベント: {json_backend.dumps(event, compact=True, default=str)}")
         
         # イベントからプロンプトを抽出
-        body = event.get('body', '{}')
-        if isinstance(body, str):
-            body = json.loads(body)
+        with metrics.phase('parse'):
+            body = event.get('body', '{}')
+            if isinstance(body, str):
+                body = json_backend.loads(body)
+        
+        if log_payloads:
+            logger.info(f"リクエストボディ: {json_backend.dumps(body, compact=True, default=str)}")
         
-        logger.info(f"リクエストボディ: {json.dumps(body, ensure_ascii=False)}")
+        # リクエスト単位でキャッシュを無効化できる: {"cache": false}
+        use_cache = body.get('cache', True) is not False
+        # 計測値をレスポンスに含める: {"metrics": true}
+        include_metrics = config.RESPONSE_METRICS or body.get('metrics') is True
+        # モデルを指定していないリクエストはプロンプトに応じてモデルを選ぶ
+        routed = model_router.enabled and 'model' not in (body.get('model_config') or {})
+        
+        # バッチリクエスト: {"prompts": [...]}
+        prompts = body.get('prompts', event.get('prompts'))
+        
+        # 複数ターンの会話: {"session_id": "..."}
+        session_id = body.get('session_id', event.get('session_id'))
+        if session_id is not None:
+            if not session_manager.enabled:
+                is_valid, error_msg = False, 'セッションが有効化されていません（SESSION_STORE_BACKEND）'
+            elif prompts is not None:
+                is_valid, error_msg = False, 'session_idはバッチリクエストでは指定できません'
+            else:
+                is_valid, error_msg = validate_session_id(session_id)
+            if not is_valid:
+                return format_response(
+                    success=False,
+                    error=error_msg,
+                    data={'message': 'セッションの検証に失敗しました'},
+                    status_code=400
+                )
+        
+        if prompts is not None:
+            if not isinstance(prompts, list) or not prompts:
+                return format_response(
+                    success=False,
+                    error='promptsは空でないリストである必要があります',
+                    data={'message': 'バッチリクエストの検証に失敗しました'},
+                    status_code=400
+                )
+            if len(prompts) > config.MAX_BATCH_SIZE:
+                return format_response(
+                    success=False,
+                    error=f'promptsが多すぎます（最大{config.MAX_BATCH_SIZE}件）',
+                    data={'message': 'バッチリクエストの検証に失敗しました'},
+                    status_code=400
+                )
+            model_config = resolve_model_config(body)
+            model_id = model_config.get('model')
+            return _run_batch(prompts, model_config, deadline, use_cache, metrics, include_metrics, routed)
         
         prompt = body.get('prompt', event.get('prompt', ''))
         
         # プロンプトのバリデーション
-        is_valid, error_msg = validate_prompt(prompt, MAX_PROMPT_LENGTH)
+        with metrics.phase('validate'):
+            is_valid, error_msg = validate_prompt(prompt, MAX_PROMPT_LENGTH)
         if not is_valid:
             return format_response(
                 success=False,
@@ -74,103 +715,20 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 status_code=400
             )
         
-        # オプション: イベントからモデル設定を抽出
-        model_config = body.get('model_config', {})
-        
-        # 利用可能なツールを持つエージェントを作成
-        # デフォルトモデルIDが環境変数で指定されている場合は使用
-        if DEFAULT_MODEL_ID and 'model' not in model_config:
-            model_config['model'] = DEFAULT_MODEL_ID
-        
-        # ツールリストを動的に構築
-        # 基本ツール（strands-agents-tools）
-        tools = [
-            http_request,
-            calculator,
-            current_time,
-        ]
-        
-        # カスタムツールを設定に基づいて追加
-        if config.ENABLE_CUSTOM_TOOLS:
-            custom_tools = []
-            
-            if config.ENABLE_HASH_GENERATOR:
-                custom_tools.append(generate_hash)
-            if config.ENABLE_JSON_FORMATTER:
-                custom_tools.append(json_formatter)
-            if config.ENABLE_TEXT_ANALYZER:
-                custom_tools.append(text_analyzer)
-            
-            tools.extend(custom_tools)
-            logger.info(f"有効なカスタムツール: {[t.__name__ for t in custom_tools]}")
-        
-        # AWSツール（strands-agents-toolsに含まれる）
-        if config.ENABLE_AWS_TOOLS:
-            tools.append(use_aws)
-            logger.info("AWSツール(use_aws)を有効化")
-        
-        # if config.ENABLE_NOVA_REELS:
-        #     from nova_tools import nova_reels
-        #     tools.append(nova_reels)
-        #     logger.info("Nova Reelsツールを有効化")
-        
-        # MCP Server統合（将来実装）
-        # if config.ENABLE_MCP_SERVER:
-        #     from mcp_integration import load_mcp_tools
-        #     mcp_tools = load_mcp_tools()
-        #     tools.extend(mcp_tools)
-        #     logger.info(f"MCPツールを{len(mcp_tools)}個ロード")
-            
-        agent = Agent(
-            system_prompt=ASSISTANT_SYSTEM_PROMPT,
-            tools=tools,
-            **model_config  # カスタムモデル設定を許可
-        )
-        
-        # 使用されるモデル情報をログに出力
-        used_model = get_model_info(agent, model_config, DEFAULT_MODEL_ID)
-        logger.info(f"使用モデル: {used_model}")
-        
-        # プロンプトを処理
-        logger.info(f"プロンプトを処理中: {prompt[:100]}...")  # 最初の100文字をログ出力
-        
-        # 標準出力をキャプチャして全ての応答を収集
-        with capture_stdout() as captured:
-            response = agent(prompt)
-            captured_text = captured.getvalue()
-        
-        # 最終的な応答の構築
-        final_response = str(response)
-        complete_response = captured_text.strip()
-        
-        if complete_response and final_response not in complete_response:
-            complete_response = f"{complete_response}\n\n{final_response}" if complete_response else final_response
-        elif not complete_response:
-            complete_response = final_response
-            
-        if captured_text:
-            logger.info(f"エージェントの出力:\n{captured_text}")
-        
-        logger.info(f"完全な応答: {complete_response}")
-        logger.info("プロンプト処理完了")
-        
-        # レスポンスをフォーマット
-        response_data = {
-            'response': complete_response,
-            'prompt': prompt
-        }
-        
-        # 使用したモデル情報を含める
-        if used_model:
-            response_data['model_used'] = used_model
+        model_config = resolve_model_config(body)
+        model_id = model_config.get('model')
         
-        return format_response(
-            success=True,
-            data=response_data,
-            status_code=200
+        response_data = _run_agent(
+            prompt, model_config, deadline, use_cache, metrics=metrics, session_id=session_id, routed=routed
         )
+        model_id = response_data.get('model_used', model_id)
+        if include_metrics:
+            # シリアライズの所要時間はEMFでのみ出力する
+            response_data['metrics'] = metrics.to_dict()
+        with metrics.phase('serialize'):
+            return format_response(success=True, data=response_data, status_code=200)
         
-    except json.JSONDecodeError as e:
+    except json_backend.JSONDecodeError as e:
         logger.error(f"JSONDecodeError: {str(e)}")
         return format_response(
             success=False,
@@ -178,6 +736,14 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             data={'message': f'リクエストボディの解析に失敗しました: {str(e)}'},
             status_code=400
         )
+    except SessionConflictError as e:
+        logger.warning(f"SessionConflictError: {str(e)}")
+        return format_response(
+            success=False,
+            error='セッションの競合',
+            data={'message': '同じセッションへの同時リクエストが多すぎるため、会話履歴を保存できませんでした'},
+            status_code=409
+        )
     except Exception as e:
         logger.error(f"Error: {type(e).__name__}: {str(e)}")
         error_message = sanitize_error_message(e)
@@ -190,6 +756,68 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             },
             status_code=500
         )
+    finally:
+        # 実行環境が凍結される前にセマンティックキャッシュの保存を終える（締め切りの残り時間まで）
+        semantic_cache.flush(deadline.clamp(config.SEMANTIC_CACHE_FLUSH_TIMEOUT))
+        connection_manager.mark_used()
+        if connection_manager.enabled and logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"接続の利用状況: {connection_manager.stats()}")
+        _emit_metrics(metrics, model_id, context)
+
+
+def _emit_metrics(metrics: RequestMetrics, model_id: Optional[str], context: Any) -> None:
+    """計測値をCloudWatch Embedded Metric Formatでstdoutに出力（失敗しても応答には影響させない）"""
+    if not config.ENABLE_EMF_METRICS:
+        return
+    dimensions = {'FunctionName': function_name()}
+    if model_id:
+        dimensions['ModelId'] = str(model_id)
+    properties = {'RequestId': getattr(context, 'aws_request_id', None)}
+    try:
+        emit(emf_document(metrics, config.METRICS_NAMESPACE, dimensions, properties))
+    except Exception as e:
+        logger.warning(f"メトリクスの出力に失敗しました: {type(e).__name__}: {str(e)}")
+
+
+def prime() -> Dict[str, float]:
+    """strands・ツール・Bedrockクライアントを初期化し、既定モデルのAgentをプールに用意する
+    
+    initフェーズ（またはSnapStartのスナップショット前）に呼び出し、最初のリクエストで
+    同じモデル設定のAgentを再利用できるようにする。ステップごとの所要時間を返す。
+    """
+    def build_default_agent():
+        with acquire_agent(resolve_model_config({})):
+            pass
+    
+    steps = [
+        ("imports", _lazy_imports),
+        ("validation_rules", lambda: validate_prompt("priming", MAX_PROMPT_LENGTH)),
+    ]
+    if agent_pool.enabled:
+        steps.append(("agent", build_default_agent))
+    return priming.run_steps(steps)
+
+
+def restore() -> None:
+    """SnapStartの復元後処理（乱数の再シードとBedrockクライアントの再接続）"""
+    priming.reseed_random()
+    # 復元後の最初の呼び出しをコールドスタートとして計測する
+    mark_cold_start()
+    shared = connection_manager.clients()
+    clients = [getattr(getattr(agent, 'model', None), 'client', None) for agent in agent_pool.agents()]
+    # 共有クライアントはconnection_managerでまとめて張り直す
+    count = priming.reset_connections([client for client in clients if client not in shared])
+    count += connection_manager.reset()
+    logger.info(f"スナップショットから復元しました（再接続したクライアント: {count}）")
+
+
+# initフェーズでの事前初期化（SnapStartではスナップショットの直前に実行）
+if priming.is_snapstart():
+    if not priming.register_snapstart_hooks(prime, restore):
+        prime()
+elif config.EAGER_INIT:
+    prime()
+
 
 # ローカルテスト用
 if __name__ == "__main__":
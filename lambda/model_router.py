@@ -0,0 +1,251 @@
+"""
+コストとレイテンシを考慮したモデルのルーティング
+
+model_configでモデルを指定していないリクエストは、プロンプトを分類して安価なモデルから順に並べた
+ティアの1つを選ぶ。短く単純なプロンプトは最も安価なモデル、ツールが必要そうなプロンプトは中位、
+長い・複雑なプロンプトは最上位のモデルで処理する。スロットリングやタイムアウトで失敗した場合は
+フォールバックチェーンの次のモデルで処理し直す。
+
+モデルごとのレイテンシとエラー率はウォームコンテナ内に保持し、直近にスロットリングされたモデルや
+エラー率の高いモデル、締め切りまでに応答が間に合いそうにないモデルはチェーンの後ろに回す。
+"""
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# フォールバックの対象とする例外（strandsの例外とbotocoreのエラーコード・例外名）
+FALLBACK_ERRORS = {
+    "ModelThrottledException",
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+    "ModelTimeoutException",
+    "ReadTimeoutError",
+    "ConnectTimeoutError",
+    "EndpointConnectionError",
+}
+THROTTLING_ERRORS = {"ModelThrottledException", "ThrottlingException", "TooManyRequestsException"}
+
+# ツールが必要そうなプロンプト（URL、計算、日時、ハッシュ、JSON、AWSの操作）
+_TOOL_HINTS = re.compile(
+    r'https?://|\d\s*[-+*/^%]\s*\d|計算|平方根|何時|日時|今日|現在|時刻|ハッシュ|sha\d|md5|json|'
+    r'文字数|単語数|s3|dynamodb|lambda|ec2|aws|'
+    r'\b(?:calculate|compute|time|date|today|hash|fetch|request|count)\b',
+    re.IGNORECASE
+)
+# 推論や長い出力が必要そうなプロンプト
+_COMPLEX_HINTS = re.compile(
+    r'分析|比較|設計|理由|説明して|詳しく|要約|レビュー|コード|実装|手順|計画|'
+    r'\b(?:analy[sz]e|compare|design|explain|why|review|implement|step by step|plan|summari[sz]e)\b',
+    re.IGNORECASE
+)
+
+
+def error_name(error: BaseException) -> Optional[str]:
+    """フォールバックの対象となる例外の名前（原因の例外も辿る、対象外はNone）"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        code = (getattr(error, "response", None) or {}).get("Error", {}).get("Code")
+        for name in (type(error).__name__, code):
+            if name in FALLBACK_ERRORS:
+                return name
+        error = error.__cause__ or error.__context__
+    return None
+
+
+@dataclass
+class Route:
+    """ルーティングの結果（試す順のモデルIDと、選んだティア・理由）"""
+
+    tier: int
+    reasons: List[str]
+    chain: List[str]
+
+    def to_dict(self, attempts: Sequence[str]) -> Dict[str, Any]:
+        return {
+            "tier": self.tier,
+            "reasons": list(self.reasons),
+            "attempts": list(attempts),
+            "fallback": len(attempts) > 1,
+        }
+
+
+class HeuristicClassifier:
+    """プロンプトの長さとキーワードでティアを決める（0: 単純、1: ツールが必要、2: 複雑）"""
+
+    name = "heuristic"
+
+    def __init__(self, short_chars: int = 200, long_chars: int = 2000):
+        self.short_chars = short_chars
+        self.long_chars = long_chars
+
+    def classify(self, prompt: str) -> Tuple[int, List[str]]:
+        tier, reasons = 0, []
+        if _TOOL_HINTS.search(prompt):
+            tier, reasons = 1, ["tools"]
+        if len(prompt) > self.short_chars:
+            tier = max(tier, 1)
+            reasons.append("medium")
+        if len(prompt) > self.long_chars:
+            tier = 2
+            reasons.append("long")
+        if _COMPLEX_HINTS.search(prompt):
+            tier = 2
+            reasons.append("complex")
+        return tier, reasons or ["simple"]
+
+
+class BedrockClassifier:
+    """小さなモデルでティアを判定する（失敗した場合は長さとキーワードで判定）"""
+
+    name = "bedrock"
+
+    SYSTEM_PROMPT = (
+        "ユーザーのリクエストの難しさを判定します。0: 短い雑談や単純な質問、1: 計算・日時・Web・AWSなどの"
+        "ツールが必要、2: 分析・比較・設計・コードなど高度な推論が必要。数字1文字だけを出力してください。"
+    )
+
+    def __init__(self, model_id: str = "us.amazon.nova-micro-v1:0", client: Any = None, fallback: Any = None):
+        self.model_id = model_id
+        self._client = client
+        self.fallback = fallback or HeuristicClassifier()
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            import boto3
+            self._client = boto3.client("bedrock-runtime")
+        return self._client
+
+    def classify(self, prompt: str) -> Tuple[int, List[str]]:
+        try:
+            response = self.client.converse(
+                modelId=self.model_id,
+                system=[{"text": self.SYSTEM_PROMPT}],
+                messages=[{"role": "user", "content": [{"text": prompt[:4000]}]}],
+                inferenceConfig={"maxTokens": 2, "temperature": 0}
+            )
+            text = "".join(block.get("text", "") for block in response["output"]["message"]["content"])
+            digits = re.findall(r'[0-2]', text)
+            if digits:
+                return int(digits[0]), ["classifier"]
+        except Exception as e:
+            logger.warning(f"プロンプトの分類に失敗しました: {type(e).__name__}: {str(e)}")
+        return self.fallback.classify(prompt)
+
+
+def create_classifier(name: str, model_id: str = "us.amazon.nova-micro-v1:0") -> Any:
+    """設定名から分類の実装を生成"""
+    if name == "heuristic":
+        return HeuristicClassifier()
+    if name == "bedrock":
+        return BedrockClassifier(model_id)
+    raise ValueError(f"未対応の分類方式です: {name}")
+
+
+@dataclass
+class ModelStats:
+    """モデルごとの呼び出し結果の集計（レイテンシとエラー率は指数移動平均）"""
+
+    calls: int = 0
+    errors: int = 0
+    throttles: int = 0
+    latency_ms: Optional[float] = None
+    error_rate: float = 0.0
+    last_throttled: Optional[float] = None
+    errors_by_type: Dict[str, int] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "throttles": self.throttles,
+            "latency_ms": round(self.latency_ms, 1) if self.latency_ms is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "errors_by_type": dict(self.errors_by_type),
+        }
+
+
+class ModelRouter:
+    """ティアの選択、フォールバックチェーンの順序付け、モデルごとの統計"""
+
+    def __init__(
+        self,
+        tiers: Sequence[str],
+        classifier: Any = None,
+        enabled: bool = True,
+        cooldown_seconds: float = 30,
+        max_error_rate: float = 0.5,
+        min_calls: int = 5,
+        smoothing: float = 0.2
+    ):
+        self.tiers = list(tiers)
+        self.classifier = classifier or HeuristicClassifier()
+        self.enabled = enabled and bool(self.tiers)
+        self.cooldown_seconds = cooldown_seconds
+        self.max_error_rate = max_error_rate
+        self.min_calls = min_calls
+        self.smoothing = smoothing
+        self._stats: Dict[str, ModelStats] = {}
+        self._lock = threading.Lock()
+
+    def _penalty(self, model_id: str, remaining_ms: Optional[float], now: float) -> int:
+        """チェーンで後ろに回す度合い（0: 正常、1: 締め切りに間に合わなそう、2: 不調）"""
+        stats = self._stats.get(model_id)
+        if stats is None:
+            return 0
+        if stats.last_throttled is not None and now - stats.last_throttled < self.cooldown_seconds:
+            return 2
+        if stats.calls >= self.min_calls and stats.error_rate > self.max_error_rate:
+            return 2
+        if remaining_ms is not None and stats.latency_ms is not None and stats.latency_ms > remaining_ms:
+            return 1
+        return 0
+
+    def route(self, prompt: str, remaining_seconds: Optional[float] = None, now: Optional[float] = None) -> Route:
+        """プロンプトのティアを選び、試す順にモデルを並べる
+
+        選んだティアから上位へ、次に下位へ向かう順を基本とし、不調なモデルは後ろに回す。
+        """
+        tier, reasons = self.classifier.classify(prompt)
+        tier = min(max(tier, 0), len(self.tiers) - 1)
+        preferred = self.tiers[tier:] + self.tiers[:tier][::-1]
+        remaining_ms = remaining_seconds * 1000 if remaining_seconds is not None else None
+        now = time.time() if now is None else now
+        with self._lock:
+            penalties = {model_id: self._penalty(model_id, remaining_ms, now) for model_id in preferred}
+        chain = sorted(preferred, key=lambda model_id: penalties[model_id])
+        if chain[0] != preferred[0]:
+            reasons = reasons + [f"avoid:{preferred[0]}"]
+        return Route(tier=tier, reasons=reasons, chain=chain)
+
+    def record(self, model_id: str, latency_ms: float, error: Optional[str] = None, now: Optional[float] = None) -> None:
+        """呼び出しの結果を記録（errorはフォールバックの対象となった例外の名前、timeoutなど）"""
+        with self._lock:
+            stats = self._stats.setdefault(model_id, ModelStats())
+            stats.calls += 1
+            failed = 1.0 if error else 0.0
+            stats.error_rate += self.smoothing * (failed - stats.error_rate)
+            if error:
+                stats.errors += 1
+                stats.errors_by_type[error] = stats.errors_by_type.get(error, 0) + 1
+                if error in THROTTLING_ERRORS:
+                    stats.throttles += 1
+                    stats.last_throttled = time.time() if now is None else now
+            else:
+                # 失敗した呼び出しの所要時間はモデルの応答速度を表さないため、成功した呼び出しのみ集計する
+                stats.latency_ms = latency_ms if stats.latency_ms is None else (
+                    stats.latency_ms + self.smoothing * (latency_ms - stats.latency_ms)
+                )
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {model_id: stats.to_dict() for model_id, stats in self._stats.items()}
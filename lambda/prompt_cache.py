@@ -0,0 +1,38 @@
+"""
+Bedrockのプロンプトキャッシュ
+
+システムプロンプトとツール定義はリクエストごとに同じ内容を送るため、対応するモデルではキャッシュポイントを
+付けて入力トークンの処理を再利用する。キャッシュはプレフィックスがバイト単位で一致した場合のみヒットするため、
+ツールは名前順に並べてツール定義の順序を固定する。
+"""
+from typing import Any, Dict, List, Optional, Sequence
+
+from agent_pool import tool_name
+
+
+def _matches(model_id: str, patterns: Sequence[str]) -> bool:
+    return any(pattern in model_id for pattern in patterns)
+
+
+def cache_settings(
+    model_id: Any,
+    cache_models: Sequence[str],
+    tool_cache_models: Sequence[str]
+) -> Optional[Dict[str, str]]:
+    """BedrockModelに渡すキャッシュポイントの設定（cache_modelsに含まれないモデルはNone）
+
+    モデルはモデルIDに含まれる文字列で判定する。strandsのBedrockModelはcache_promptで
+    システムプロンプトの後、cache_toolsでツール定義の後にキャッシュポイントを追加する。
+    """
+    if not isinstance(model_id, str) or not _matches(model_id, cache_models):
+        return None
+    settings = {"cache_prompt": "default"}
+    if _matches(model_id, tool_cache_models):
+        settings["cache_tools"] = "default"
+    return settings
+
+
+def stable_tool_order(tools: Sequence[Any]) -> List[Any]:
+    """ツールを名前順に並べる（設定の組み合わせによらずツール定義の順序を固定する）"""
+    return sorted(tools, key=tool_name)
+
@@ -0,0 +1,334 @@
+"""
+同一プロンプトに対する応答のキャッシュ
+
+キーは (正規化したプロンプト, モデルID, システムプロンプト, 有効なツール, model_config) のハッシュ。
+ウォームコンテナごとのメモリ上のLRUと、任意の共有ストア（DynamoDB・S3・ローカルディレクトリ）の
+2段構成で、いずれもTTLを過ぎたエントリは使わない。時刻など呼び出しごとに結果が変わる
+ツールを使った応答は保存しない。
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+
+import json_backend
+from agent_pool import tool_name
+
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_prompt(prompt: str) -> str:
+    """前後の空白を除き、連続する空白を1つにまとめる"""
+    return _WHITESPACE.sub(' ', prompt).strip()
+
+
+def make_cache_key(
+    prompt: str,
+    model_config: Dict[str, Any],
+    system_prompt: str,
+    tools: Sequence[Any]
+) -> str:
+    """応答に影響する入力からキャッシュキー（SHA-256）を生成"""
+    material = json_backend.dumps(
+        {
+            "prompt": normalize_prompt(prompt),
+            "model": str(model_config.get("model", "")),
+            "system_prompt": system_prompt,
+            "tools": sorted(tool_name(t) for t in tools),
+            "model_config": model_config,
+        },
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def make_scope_key(model_config: Dict[str, Any], system_prompt: str, tools: Sequence[Any]) -> str:
+    """プロンプト以外の応答に影響する入力からキー（SHA-256）を生成（セマンティックキャッシュで使用）"""
+    material = json_backend.dumps(
+        {
+            "model": str(model_config.get("model", "")),
+            "system_prompt": system_prompt,
+            "tools": sorted(tool_name(t) for t in tools),
+            "model_config": model_config,
+        },
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def is_cacheable(response_data: Dict[str, Any], bypass_tools: Iterable[str]) -> bool:
+    """完了した応答で、結果が呼び出しごとに変わるツールを使っていないか"""
+    if response_data.get("status") != "completed":
+        return False
+    used_tools = {call.get("name") for call in response_data.get("tool_calls", [])}
+    return not (used_tools & set(bypass_tools))
+
+
+class MemoryTier:
+    """ウォームコンテナ内で保持するTTL付きのLRU"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: Dict[str, Any], ttl: int) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class LocalDirectoryTier:
+    """ローカルディレクトリをストアとする共有層（テストやローカル実行での代替）"""
+
+    name = "local"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                entry = json_backend.loads(f.read())
+        except FileNotFoundError:
+            return None
+        if entry["expires_at"] <= time.time():
+            return None
+        return entry["value"]
+
+    def put(self, key: str, value: Dict[str, Any], ttl: int) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        entry = {"expires_at": time.time() + ttl, "value": value}
+        # 書き込み途中のファイルを読まないよう置き換えで保存
+        temp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(json_backend.dumps(entry, compact=True))
+        os.replace(temp_path, self._path(key))
+
+
+class DynamoDBTier:
+    """DynamoDBテーブルをストアとする共有層
+
+    テーブルはパーティションキー `cache_key`（文字列）を持ち、`expires_at` をTTL属性に設定する。
+    DynamoDBのTTL削除は遅れることがあるため、読み込み時にも期限を確認する。
+    """
+
+    name = "dynamodb"
+
+    def __init__(self, table_name: str, client: Any = None):
+        self.table_name = table_name
+        self._client = client
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            import boto3
+            self._client = boto3.client("dynamodb")
+        return self._client
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        item = self.client.get_item(
+            TableName=self.table_name,
+            Key={"cache_key": {"S": key}},
+            ConsistentRead=False
+        ).get("Item")
+        if not item or int(item["expires_at"]["N"]) <= time.time():
+            return None
+        return json_backend.loads(item["value"]["S"])
+
+    def put(self, key: str, value: Dict[str, Any], ttl: int) -> None:
+        self.client.put_item(
+            TableName=self.table_name,
+            Item={
+                "cache_key": {"S": key},
+                "value": {"S": json_backend.dumps(value, compact=True)},
+                "expires_at": {"N": str(int(time.time() + ttl))},
+            }
+        )
+
+
+class S3Tier:
+    """S3バケットをストアとする共有層（期限切れオブジェクトの削除はライフサイクルルールで行う）"""
+
+    name = "s3"
+
+    def __init__(self, bucket: str, prefix: str = "response-cache/", client: Any = None):
+        self.bucket = bucket
+        self.prefix = prefix
+        self._client = client
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            import boto3
+            self._client = boto3.client("s3")
+        return self._client
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=f"{self.prefix}{key}.json")
+        except self.client.exceptions.NoSuchKey:
+            return None
+        entry = json_backend.loads(response["Body"].read())
+        if entry["expires_at"] <= time.time():
+            return None
+        return entry["value"]
+
+    def put(self, key: str, value: Dict[str, Any], ttl: int) -> None:
+        entry = {"expires_at": time.time() + ttl, "value": value}
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=f"{self.prefix}{key}.json",
+            Body=json_backend.dumps(entry, compact=True).encode("utf-8"),
+            ContentType="application/json"
+        )
+
+
+class ResponseCache:
+    """メモリ層と任意の共有層からなる応答キャッシュ
+
+    共有層の障害はキャッシュミスとして扱い、リクエストの処理は続行する。
+    """
+
+    def __init__(
+        self,
+        memory: Optional[MemoryTier] = None,
+        shared: Any = None,
+        ttl: int = 3600,
+        bypass_tools: Iterable[str] = (),
+        enabled: bool = True
+    ):
+        self.memory = memory if memory is not None else MemoryTier()
+        self.shared = shared
+        self.ttl = ttl
+        self.bypass_tools = set(bypass_tools)
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counts = {"hits": 0, "memory_hits": 0, "shared_hits": 0, "misses": 0, "stores": 0, "bypassed": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counts[name] += 1
+
+    def get(self, key: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """キャッシュされた応答と、ヒットした層の名前を返す（ミスの場合は (None, None)）"""
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("hits")
+            self._count("memory_hits")
+            return value, self.memory.name
+
+        if self.shared is not None:
+            try:
+                value = self.shared.get(key)
+            except Exception as e:
+                logger.warning(f"共有キャッシュの読み込みに失敗しました: {type(e).__name__}: {str(e)}")
+                value = None
+            if value is not None:
+                # 次回以降はメモリ層から返す
+                self.memory.put(key, value, self.ttl)
+                self._count("hits")
+                self._count("shared_hits")
+                return value, self.shared.name
+
+        self._count("misses")
+        return None, None
+
+    def is_cacheable(self, response_data: Dict[str, Any]) -> bool:
+        return is_cacheable(response_data, self.bypass_tools)
+
+    def put(self, key: str, response_data: Dict[str, Any]) -> bool:
+        """キャッシュ可能な応答を保存し、保存したかどうかを返す"""
+        if not self.is_cacheable(response_data):
+            self._count("bypassed")
+            return False
+
+        value = dict(response_data)
+        self.memory.put(key, value, self.ttl)
+        if self.shared is not None:
+            try:
+                self.shared.put(key, value, self.ttl)
+            except Exception as e:
+                logger.warning(f"共有キャッシュへの書き込みに失敗しました: {type(e).__name__}: {str(e)}")
+        self._count("stores")
+        return True
+
+    def clear(self) -> None:
+        """メモリ層と統計を初期化する（共有層はTTLで失効させる）"""
+        self.memory.clear()
+        with self._lock:
+            self._counts = {name: 0 for name in self._counts}
+
+    def stats(self) -> Dict[str, Any]:
+        """キャッシュの利用状況を返す"""
+        with self._lock:
+            counts = dict(self._counts)
+        lookups = counts["hits"] + counts["misses"]
+        return {
+            **counts,
+            "hit_rate": round(counts["hits"] / lookups, 3) if lookups else 0.0,
+            "size": len(self.memory),
+            "evictions": self.memory.evictions,
+        }
+
+
+def create_shared_tier(
+    backend: str,
+    table_name: str = "",
+    bucket: str = "",
+    prefix: str = "response-cache/",
+    local_dir: str = "/tmp/response-cache"
+) -> Any:
+    """設定名から共有層を生成（noneの場合はNone）"""
+    if backend == "none":
+        return None
+    if backend == "dynamodb":
+        if not table_name:
+            raise ValueError("RESPONSE_CACHE_TABLEを指定してください")
+        return DynamoDBTier(table_name)
+    if backend == "s3":
+        if not bucket:
+            raise ValueError("RESPONSE_CACHE_BUCKETを指定してください")
+        return S3Tier(bucket, prefix)
+    if backend == "local":
+        return LocalDirectoryTier(local_dir)
+    raise ValueError(f"未対応の共有キャッシュです: {backend}")
@@ -0,0 +1,3 @@
+#!/bin/bash
+# Lambda Web Adapter用の起動スクリプト（ストリーミング関数のハンドラー）
+exec python3 "${LAMBDA_TASK_ROOT:-$(dirname "$0")}/stream_server.py"
@@ -0,0 +1,512 @@
+"""
+言い換えられたプロンプトにも応答を再利用するセマンティックキャッシュ
+
+プロンプトを埋め込みベクトルに変換し、保存済みのベクトルとのコサイン類似度が
+しきい値以上で、モデル・システムプロンプト・ツール・model_configが同じエントリの応答を返す。
+ベクトルはfloat32の連続した配列として保持し、NumPyがあれば行列演算で検索する
+（なければ標準ライブラリのarrayで検索する）。インデックスはローカルファイルまたはS3に保存でき、
+読み込み時はメモリマップするため、コールドスタートで再構築や全体の読み込みを行わない。
+"""
+import hashlib
+import json
+import logging
+import math
+import mmap
+import operator
+import os
+import re
+import threading
+import time
+import uuid
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import json_backend
+from response_cache import is_cacheable, normalize_prompt
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT_VERSION = 1
+# 検索時にargmaxで確認する件数（これを超えて拒否された場合は残りを並べ替える）
+SEARCH_ARGMAX_PROBES = 8
+
+_WORD = re.compile(r'\w+')
+
+
+class HashingEmbedder:
+    """文字n-gramと単語の特徴ハッシングによる決定的な埋め込み（テスト・ローカル実行用）
+
+    分かち書きなしで日本語も扱えるよう、文字の2-gramと3-gramを特徴に使う。
+    """
+
+    name = "hashing"
+
+    def __init__(self, dimensions: int = 256):
+        self.dimensions = dimensions
+
+    def _features(self, text: str) -> List[str]:
+        text = normalize_prompt(text).lower()
+        features = [f"w:{word}" for word in _WORD.findall(text)]
+        for n in (2, 3):
+            features.extend(f"c{n}:{text[i:i + n]}" for i in range(len(text) - n + 1))
+        return features or [f"w:{text}"]
+
+    def embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimensions
+        for feature in self._features(text):
+            digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[digest % self.dimensions] += 1.0 if digest >> 63 else -1.0
+        return _normalize(vector)
+
+
+class BedrockEmbedder:
+    """Amazon Bedrockの埋め込みモデル（Titan Text Embeddings V2）"""
+
+    name = "bedrock"
+
+    def __init__(self, model_id: str = "amazon.titan-embed-text-v2:0", dimensions: int = 256, client: Any = None):
+        self.model_id = model_id
+        self.dimensions = dimensions
+        self._client = client
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            import boto3
+            self._client = boto3.client("bedrock-runtime")
+        return self._client
+
+    def embed(self, text: str) -> List[float]:
+        response = self.client.invoke_model(
+            modelId=self.model_id,
+            body=json.dumps({"inputText": normalize_prompt(text), "dimensions": self.dimensions, "normalize": True}),
+            contentType="application/json",
+            accept="application/json"
+        )
+        return _normalize(json.loads(response["body"].read())["embedding"])
+
+
+def create_embedder(name: str, dimensions: int = 256, model_id: str = "amazon.titan-embed-text-v2:0") -> Any:
+    """設定名から埋め込みモデルを生成"""
+    if name == "hashing":
+        return HashingEmbedder(dimensions)
+    if name == "bedrock":
+        return BedrockEmbedder(model_id, dimensions)
+    raise ValueError(f"未対応の埋め込みモデルです: {name}")
+
+
+def _normalize(vector: Sequence[float]) -> List[float]:
+    norm = math.sqrt(sum(v * v for v in vector))
+    return [v / norm for v in vector] if norm else list(vector)
+
+
+class VectorIndex:
+    """正規化済みベクトル（float32）とエントリの組を保持する総当たりの近傍探索インデックス
+
+    ベクトルは行優先の連続した配列で保持する。読み込んだインデックスはメモリマップされた
+    読み取り専用の配列を参照し、追加や削除を行う時点で初めてメモリ上にコピーする。
+    NumPyの場合は容量を倍々に確保した行列の `[start, start + 件数)` の行を使い、
+    追加・古い順の削除で行列全体をコピーしない。
+    """
+
+    def __init__(self, dimensions: int, vectors: Any = None, entries: Optional[List[Dict[str, Any]]] = None):
+        self.dimensions = dimensions
+        self.entries: List[Dict[str, Any]] = entries or []
+        if vectors is None:
+            vectors = numpy.empty((0, dimensions), dtype=numpy.float32) if numpy is not None else array("f")
+        self._vectors = vectors
+        self._start = 0
+        self._mapped = None
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _matrix(self) -> Any:
+        """有効な行だけの行列（NumPyの場合のみ、コピーしないビュー）"""
+        return self._vectors[self._start:self._start + len(self.entries)]
+
+    def _writable(self) -> None:
+        """メモリマップされた配列をメモリ上のコピーに置き換える"""
+        if self._mapped is None:
+            return
+        if numpy is not None:
+            self._vectors = numpy.array(self._matrix())
+            self._start = 0
+        else:
+            self._vectors = array("f", self._vectors)
+        # 参照がなくなった時点でマップが解放される
+        self._mapped = None
+
+    def _reserve(self) -> None:
+        """末尾に1行追加できるよう、先頭の空きを詰めるか容量を倍にする"""
+        count = len(self.entries)
+        if self._start + count < len(self._vectors):
+            return
+        capacity = len(self._vectors)
+        if self._start < max(count, 1):
+            capacity = max(16, capacity * 2)
+        grown = numpy.empty((capacity, self.dimensions), dtype=numpy.float32)
+        grown[:count] = self._matrix()
+        self._vectors = grown
+        self._start = 0
+
+    def add(self, vector: Sequence[float], entry: Dict[str, Any]) -> None:
+        if len(vector) != self.dimensions:
+            raise ValueError(f"ベクトルの次元数が一致しません: {len(vector)} != {self.dimensions}")
+        self._writable()
+        if numpy is not None:
+            self._reserve()
+            self._vectors[self._start + len(self.entries)] = numpy.asarray(vector, dtype=numpy.float32)
+        else:
+            self._vectors.extend(vector)
+        self.entries.append(entry)
+
+    def remove_oldest(self, count: int) -> None:
+        """古いエントリから削除"""
+        if count <= 0:
+            return
+        count = min(count, len(self.entries))
+        self._writable()
+        if numpy is not None:
+            self._start += count
+        else:
+            del self._vectors[:count * self.dimensions]
+        del self.entries[:count]
+
+    def vector(self, position: int) -> List[float]:
+        """position番目のベクトル"""
+        if numpy is not None:
+            return self._matrix()[position].tolist()
+        return list(self._vectors[position * self.dimensions:(position + 1) * self.dimensions])
+
+    def scores(self, query: Sequence[float]) -> List[float]:
+        """各エントリとのコサイン類似度（ベクトルは正規化済みのため内積）"""
+        if not self.entries:
+            return []
+        if numpy is not None:
+            return (self._matrix() @ numpy.asarray(query, dtype=numpy.float32)).tolist()
+        dims = self.dimensions
+        vectors = self._vectors
+        return [
+            sum(map(operator.mul, vectors[i * dims:(i + 1) * dims], query))
+            for i in range(len(self.entries))
+        ]
+
+    def search(self, query: Sequence[float], accept: Any = None) -> Tuple[float, Optional[int]]:
+        """acceptを満たすエントリのうち最も類似度が高いものの (類似度, 位置) を返す"""
+        if not self.entries:
+            return 0.0, None
+        if numpy is not None:
+            return self._search_matrix(query, accept)
+        scores = self.scores(query)
+        for position in sorted(range(len(scores)), key=scores.__getitem__, reverse=True):
+            if accept is None or accept(self.entries[position]):
+                return scores[position], position
+        return 0.0, None
+
+    def _search_matrix(self, query: Sequence[float], accept: Any) -> Tuple[float, Optional[int]]:
+        # 通常は最大値のエントリがそのまま使えるため、argmaxで数件だけ確認する
+        scores = self._matrix() @ numpy.asarray(query, dtype=numpy.float32)
+        for _ in range(min(SEARCH_ARGMAX_PROBES, len(scores))):
+            position = int(numpy.argmax(scores))
+            if accept is None or accept(self.entries[position]):
+                return float(scores[position]), position
+            scores[position] = -numpy.inf
+        # スコープ違いや期限切れが多い場合は、残りを類似度の降順に確認する
+        for position in numpy.argsort(-scores, kind="stable"):
+            if scores[position] == -numpy.inf:
+                break
+            if accept(self.entries[position]):
+                return float(scores[position]), int(position)
+        return 0.0, None
+
+    @classmethod
+    def merged(cls, first: "VectorIndex", second: "VectorIndex", max_entries: int) -> "VectorIndex":
+        """2つのインデックスを合わせ、idが重複するエントリを除いて有効期限順に新しいmax_entries件を残す"""
+        seen = set()
+        rows = []
+        for index in (first, second):
+            for position, entry in enumerate(index.entries):
+                entry_id = entry.get("id")
+                if entry_id is not None:
+                    if entry_id in seen:
+                        continue
+                    seen.add(entry_id)
+                rows.append((entry.get("expires_at", 0.0), index, position))
+        rows.sort(key=operator.itemgetter(0))
+        result = cls(first.dimensions)
+        for _, index, position in rows[max(0, len(rows) - max_entries):]:
+            result.add(index.vector(position), index.entries[position])
+        return result
+
+    def copy(self) -> "VectorIndex":
+        """ベクトルとエントリ一覧をコピーしたインデックス（エントリ自体は共有する）"""
+        if numpy is not None:
+            vectors = numpy.array(self._matrix())
+        else:
+            vectors = array("f", self._vectors)
+        return VectorIndex(self.dimensions, vectors, list(self.entries))
+
+    def save(self, path: str) -> None:
+        """`{path}.f32`（ベクトル）と `{path}.json`（メタデータ）に保存"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(path + ".f32" + suffix, "wb") as f:
+            if numpy is not None:
+                f.write(numpy.ascontiguousarray(self._matrix(), dtype="<f4").tobytes())
+            else:
+                f.write(bytes(memoryview(self._vectors).cast("B")))
+        with open(path + ".json" + suffix, "w", encoding="utf-8") as f:
+            f.write(json_backend.dumps({
+                "version": INDEX_FORMAT_VERSION,
+                "dimensions": self.dimensions,
+                "count": len(self.entries),
+                "entries": self.entries,
+            }, compact=True))
+        os.replace(path + ".f32" + suffix, path + ".f32")
+        os.replace(path + ".json" + suffix, path + ".json")
+
+    @classmethod
+    def load(cls, path: str) -> "VectorIndex":
+        """保存したインデックスをベクトルをメモリマップして読み込む"""
+        with open(path + ".json", encoding="utf-8") as f:
+            metadata = json_backend.loads(f.read())
+        if metadata.get("version") != INDEX_FORMAT_VERSION:
+            raise ValueError(f"未対応のインデックス形式です: {metadata.get('version')}")
+
+        dimensions, count = metadata["dimensions"], metadata["count"]
+        index = cls(dimensions, entries=metadata["entries"])
+        if count == 0:
+            return index
+
+        with open(path + ".f32", "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(mapped) != count * dimensions * 4:
+            mapped.close()
+            raise ValueError("ベクトルファイルのサイズがメタデータと一致しません")
+
+        if numpy is not None:
+            index._vectors = numpy.frombuffer(mapped, dtype="<f4").reshape(count, dimensions)
+        else:
+            index._vectors = memoryview(mapped).cast("f")
+        index._mapped = mapped
+        return index
+
+
+class LocalIndexStore:
+    """インデックスをローカルファイルに保存"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> Optional[VectorIndex]:
+        if not os.path.exists(self.path + ".json"):
+            return None
+        return VectorIndex.load(self.path)
+
+    def save(self, index: VectorIndex) -> None:
+        index.save(self.path)
+
+
+class S3IndexStore:
+    """インデックスをS3に保存（読み込み時は/tmpにダウンロードしてメモリマップ）"""
+
+    def __init__(self, bucket: str, key: str, local_path: str = "/tmp/semantic-index/index", client: Any = None):
+        self.bucket = bucket
+        self.key = key
+        self.local_path = local_path
+        self._client = client
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            import boto3
+            self._client = boto3.client("s3")
+        return self._client
+
+    def load(self) -> Optional[VectorIndex]:
+        os.makedirs(os.path.dirname(self.local_path), exist_ok=True)
+        try:
+            for suffix in (".json", ".f32"):
+                self.client.download_file(self.bucket, self.key + suffix, self.local_path + suffix)
+        except Exception as e:
+            logger.info(f"S3からインデックスを読み込めませんでした: {type(e).__name__}: {str(e)}")
+            return None
+        return VectorIndex.load(self.local_path)
+
+    def save(self, index: VectorIndex) -> None:
+        index.save(self.local_path)
+        # メタデータを後にアップロードし、読み込み側が古いベクトルと組み合わせないようにする
+        for suffix in (".f32", ".json"):
+            self.client.upload_file(self.local_path + suffix, self.bucket, self.key + suffix)
+
+
+def create_index_store(uri: str) -> Any:
+    """`s3://bucket/key` またはローカルパスから保存先を生成（空の場合はNone）"""
+    if not uri:
+        return None
+    if uri.startswith("s3://"):
+        bucket, _, key = uri[len("s3://"):].partition("/")
+        if not bucket or not key:
+            raise ValueError(f"S3のURIにはバケットとキーが必要です: {uri}")
+        return S3IndexStore(bucket, key)
+    return LocalIndexStore(uri)
+
+
+class SemanticCache:
+    """埋め込みの近傍探索で言い換えられたプロンプトの応答を返すキャッシュ"""
+
+    def __init__(
+        self,
+        embedder: Any,
+        index: Optional[VectorIndex] = None,
+        threshold: float = 0.92,
+        ttl: int = 3600,
+        max_entries: int = 10000,
+        bypass_tools: Sequence[str] = (),
+        store: Any = None,
+        save_every: int = 10,
+        enabled: bool = True
+    ):
+        self.embedder = embedder
+        self.index = index if index is not None else VectorIndex(embedder.dimensions)
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.bypass_tools = list(bypass_tools)
+        self.store = store
+        self.save_every = save_every
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: Optional[Future] = None
+        self._counts = {"hits": 0, "misses": 0, "stores": 0, "bypassed": 0}
+
+    @classmethod
+    def from_store(cls, embedder: Any, store: Any, **kwargs: Any) -> "SemanticCache":
+        """保存先からインデックスを読み込んで構築（読み込めない場合は空のインデックス）"""
+        index = None
+        if store is not None:
+            try:
+                index = store.load()
+            except Exception as e:
+                logger.warning(f"セマンティックキャッシュのインデックスを読み込めませんでした: {str(e)}")
+        if index is not None and index.dimensions != embedder.dimensions:
+            logger.warning("インデックスの次元数が埋め込みモデルと異なるため破棄します")
+            index = None
+        return cls(embedder, index=index, store=store, **kwargs)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counts[name] += 1
+
+    def embed(self, prompt: str) -> List[float]:
+        return self.embedder.embed(prompt)
+
+    def lookup(self, vector: Sequence[float], scope: str) -> Tuple[Optional[Dict[str, Any]], float]:
+        """同じスコープで類似度がしきい値以上の応答と類似度を返す（ミスの場合は (None, 最大類似度)）"""
+        now = time.time()
+
+        def accept(entry: Dict[str, Any]) -> bool:
+            return entry["scope"] == scope and entry["expires_at"] > now
+
+        with self._lock:
+            score, position = self.index.search(vector, accept)
+            value = self.index.entries[position]["value"] if position is not None else None
+
+        if value is not None and score >= self.threshold:
+            self._count("hits")
+            return value, score
+        self._count("misses")
+        return None, score
+
+    def add(self, vector: Sequence[float], scope: str, response_data: Dict[str, Any]) -> bool:
+        """キャッシュ可能な応答を追加し、追加したかどうかを返す"""
+        if not is_cacheable(response_data, self.bypass_tools):
+            self._count("bypassed")
+            return False
+
+        entry = {
+            "id": uuid.uuid4().hex,
+            "scope": scope,
+            "expires_at": time.time() + self.ttl,
+            "value": dict(response_data)
+        }
+        with self._lock:
+            self.index.add(vector, entry)
+            self.index.remove_oldest(len(self.index) - self.max_entries)
+            self._unsaved += 1
+            should_save = (
+                self.store is not None and self._unsaved >= self.save_every
+                and (self._pending is None or self._pending.done())
+            )
+            if should_save:
+                # 保存は応答の組み立てと並行してバックグラウンドのスレッドで行い、ハンドラーの終了前にflushで待つ
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="semantic-cache")
+                self._pending = self._executor.submit(self.persist)
+        self._count("stores")
+        return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """バックグラウンドの保存が終わるまで最大timeout秒待ち、終わったかどうかを返す
+
+        Lambdaはハンドラーが戻ると実行環境を凍結するため、保存中のまま戻るとアップロードが
+        次の呼び出しまで止まり、実行環境が破棄されると失われる。ハンドラーの終了前に呼び出す。
+        """
+        pending = self._pending
+        if pending is None or pending.done():
+            return True
+        try:
+            pending.result(timeout)
+        except FutureTimeoutError:
+            logger.warning(f"セマンティックキャッシュのインデックスの保存が{timeout}秒以内に終わりませんでした")
+            return False
+        return True
+
+    def persist(self) -> None:
+        """期限切れのエントリを除いてインデックスを保存先に書き出す
+
+        複数のコンテナが同じ保存先に書き込むため、保存前に保存先のインデックスを読み込み、
+        他のコンテナが追加したエントリとidで重複を除いて合わせてから書き出す
+        （読み込みから書き出しまでの間に別のコンテナが保存した分は失われることがある）。
+        """
+        if self.store is None:
+            return
+        with self._lock:
+            now = time.time()
+            expired = 0
+            # エントリは追加順のため、先頭から期限切れが続く範囲を削除する
+            while expired < len(self.index) and self.index.entries[expired]["expires_at"] <= now:
+                expired += 1
+            self.index.remove_oldest(expired)
+            snapshot = self.index.copy()
+            unsaved = self._unsaved
+
+        try:
+            stored = self.store.load()
+            if stored is not None and stored.dimensions == snapshot.dimensions:
+                stored.remove_oldest(sum(1 for entry in stored.entries if entry.get("expires_at", 0.0) <= now))
+                snapshot = VectorIndex.merged(stored, snapshot, self.max_entries)
+            self.store.save(snapshot)
+        except Exception as e:
+            logger.warning(f"セマンティックキャッシュのインデックスを保存できませんでした: {str(e)}")
+            return
+        with self._lock:
+            self._unsaved = max(0, self._unsaved - unsaved)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._counts)
+            size = len(self.index)
+        lookups = counts["hits"] + counts["misses"]
+        return {**counts, "hit_rate": round(counts["hits"] / lookups, 3) if lookups else 0.0, "size": size}
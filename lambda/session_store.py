@@ -0,0 +1,471 @@
+"""
+複数ターンの会話を保持するセッションストア
+
+リクエストの session_id ごとに会話履歴（Bedrock Converse形式のメッセージ）を保存し、次のリクエストで
+Agentに渡す。ストアはDynamoDB、ローカル実行・テスト用のメモリ・ローカルディレクトリから選択でき、
+ウォームコンテナ内のLRUを読み込みキャッシュとして使う。履歴はmsgpack（未インストール時はJSON）で
+シリアライズしてzlibで圧縮する。
+
+1ターンあたりの入力トークンを一定に保つため、履歴がメッセージ数・推定トークン数の上限を超えたら
+古いターンを要約に置き換える。要約は上限の半分まで縮めるときにまとめて行い、毎ターンは実行しない。
+"""
+import base64
+import copy
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import json_backend
+from response_cache import MemoryTier
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+logger = logging.getLogger(__name__)
+
+_SESSION_ID = re.compile(r'^[A-Za-z0-9_.:-]{1,128}$')
+
+# シリアライズ形式を示す先頭バイト（続くデータはzlibで圧縮）
+FORMAT_MSGPACK = b"\x01"
+FORMAT_JSON = b"\x02"
+
+# 推定トークン数の計算に使う1トークンあたりの文字数（日本語と英語が混在するため少なめに見積もる）
+CHARS_PER_TOKEN = 3
+
+SUMMARY_HEADER = "[これまでの会話の要約]"
+
+
+def validate_session_id(session_id: Any) -> Tuple[bool, Optional[str]]:
+    """session_idのバリデーション（英数字と _ . : - の128文字以内）"""
+    if not isinstance(session_id, str) or not _SESSION_ID.match(session_id):
+        return False, "session_idは英数字と _ . : - からなる128文字以内の文字列である必要があります"
+    return True, None
+
+
+@dataclass
+class SessionState:
+    """セッションの会話履歴（要約に置き換えていない直近のメッセージと要約）"""
+
+    messages: List[Dict[str, Any]] = field(default_factory=list)
+    summary: str = ""
+    turns: int = 0
+    summarized_messages: int = 0  # 要約に置き換えたメッセージの累計
+    version: int = 0  # 保存のたびに増やし、同時更新の検出に使う
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SessionState":
+        return cls(**{key: data[key] for key in cls.__dataclass_fields__ if key in data})
+
+
+def _encode_bytes(value: Any) -> Any:
+    if isinstance(value, (bytes, bytearray)):
+        return {"__bytes__": base64.b64encode(value).decode("ascii")}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _decode_bytes(value: Any) -> Any:
+    if isinstance(value, dict):
+        if set(value) == {"__bytes__"}:
+            return base64.b64decode(value["__bytes__"])
+        return {key: _decode_bytes(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode_bytes(item) for item in value]
+    return value
+
+
+def encode_state(state: SessionState, codec: str = "auto") -> bytes:
+    """セッションをバイト列にシリアライズ（msgpackがあれば使い、zlibで圧縮）"""
+    data = asdict(state)
+    if codec == "msgpack" or (codec == "auto" and msgpack is not None):
+        return FORMAT_MSGPACK + zlib.compress(msgpack.packb(data, use_bin_type=True))
+    # 画像などのバイト列はBase64の文字列にする
+    payload = json_backend.dumps(data, compact=True, default=_encode_bytes).encode("utf-8")
+    return FORMAT_JSON + zlib.compress(payload)
+
+
+def decode_state(data: bytes) -> SessionState:
+    """encode_stateの出力を読み込む（保存時と異なる形式の環境でも読めるよう先頭バイトで判定）"""
+    header, payload = data[:1], zlib.decompress(data[1:])
+    if header == FORMAT_MSGPACK:
+        if msgpack is None:
+            raise ValueError("msgpack形式のセッションを読み込むにはmsgpackが必要です")
+        return SessionState.from_dict(msgpack.unpackb(payload, raw=False))
+    if header == FORMAT_JSON:
+        return SessionState.from_dict(_decode_bytes(json_backend.loads(payload)))
+    raise ValueError(f"未対応のセッション形式です: {header!r}")
+
+
+def estimate_tokens(messages: List[Dict[str, Any]]) -> int:
+    """メッセージの推定トークン数（文字数からの概算）"""
+    if not messages:
+        return 0
+    return len(json_backend.dumps(messages, compact=True, default=str)) // CHARS_PER_TOKEN
+
+
+def _is_turn_start(message: Dict[str, Any]) -> bool:
+    """ユーザーの発話で始まるメッセージか（ツール結果のメッセージはターンの途中）"""
+    if message.get("role") != "user":
+        return False
+    return not any(isinstance(block, dict) and "toolResult" in block for block in message.get("content", []))
+
+
+def message_text(message: Dict[str, Any]) -> str:
+    """メッセージのテキストブロックを結合"""
+    return "\n".join(
+        block["text"] for block in message.get("content", []) if isinstance(block, dict) and block.get("text")
+    )
+
+
+class CompactionPolicy:
+    """履歴がメッセージ数・推定トークン数の上限を超えたら、古いターンを要約対象として切り出す"""
+
+    def __init__(self, max_messages: int = 20, max_tokens: int = 4000):
+        self.max_messages = max_messages
+        self.max_tokens = max_tokens
+
+    def split(self, messages: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """(要約するメッセージ, 残すメッセージ) を返す（上限内なら要約するメッセージは空）
+
+        ツールの呼び出しと結果の組を分けないよう、ユーザーの発話の直前で切る。上限を超えたら
+        上限の半分まで縮め、要約の実行を数ターンに1回にする。最新のターンは常に残す。
+        """
+        if len(messages) <= self.max_messages and estimate_tokens(messages) <= self.max_tokens:
+            return [], messages
+
+        starts = [index for index, message in enumerate(messages) if index > 0 and _is_turn_start(message)]
+        if not starts:
+            return [], messages
+        target_messages = max(1, self.max_messages // 2)
+        target_tokens = self.max_tokens // 2
+        for index in starts:
+            kept = messages[index:]
+            if len(kept) <= target_messages and estimate_tokens(kept) <= target_tokens:
+                return messages[:index], kept
+        return messages[:starts[-1]], messages[starts[-1]:]
+
+
+class TruncatingSummarizer:
+    """発話の先頭部分を並べる決定的な要約（テスト・ローカル実行用、Bedrockでの要約の失敗時にも使用）"""
+
+    name = "truncate"
+
+    def __init__(self, max_chars: int = 2000, chars_per_message: int = 200):
+        self.max_chars = max_chars
+        self.chars_per_message = chars_per_message
+
+    def summarize(self, previous_summary: str, messages: List[Dict[str, Any]]) -> str:
+        lines = [previous_summary] if previous_summary else []
+        for message in messages:
+            text = message_text(message)
+            if text:
+                speaker = "ユーザー" if message.get("role") == "user" else "アシスタント"
+                lines.append(f"{speaker}: {text[:self.chars_per_message]}")
+        # 上限を超えた場合は古い部分から削る
+        return "\n".join(lines)[-self.max_chars:]
+
+
+class BedrockSummarizer:
+    """Bedrockの小さなモデルで要約（Converse API）"""
+
+    name = "bedrock"
+
+    SYSTEM_PROMPT = (
+        "あなたは会話の要約を作成します。これまでの要約と新しい会話を統合し、"
+        "ユーザーの目的、決定事項、重要な事実や数値、未解決の事項を簡潔な箇条書きで出力してください。"
+    )
+
+    def __init__(self, model_id: str = "us.amazon.nova-micro-v1:0", max_tokens: int = 512, client: Any = None):
+        self.model_id = model_id
+        self.max_tokens = max_tokens
+        self._client = client
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            import boto3
+            self._client = boto3.client("bedrock-runtime")
+        return self._client
+
+    def summarize(self, previous_summary: str, messages: List[Dict[str, Any]]) -> str:
+        transcript = "\n".join(
+            f"{message.get('role')}: {message_text(message)}" for message in messages if message_text(message)
+        )
+        response = self.client.converse(
+            modelId=self.model_id,
+            system=[{"text": self.SYSTEM_PROMPT}],
+            messages=[{
+                "role": "user",
+                "content": [{"text": f"これまでの要約:\n{previous_summary or 'なし'}\n\n新しい会話:\n{transcript}"}]
+            }],
+            inferenceConfig={"maxTokens": self.max_tokens, "temperature": 0}
+        )
+        return message_text(response["output"]["message"]).strip()
+
+
+def create_summarizer(name: str, model_id: str = "us.amazon.nova-micro-v1:0") -> Any:
+    """設定名から要約の実装を生成"""
+    if name == "truncate":
+        return TruncatingSummarizer()
+    if name == "bedrock":
+        return BedrockSummarizer(model_id)
+    raise ValueError(f"未対応の要約方式です: {name}")
+
+
+class SessionConflictError(Exception):
+    """保存しようとしたセッションが、読み込んだ後に別のリクエストで更新されていた"""
+
+
+class MemorySessionStore:
+    """プロセス内に保持するストア（テスト・ローカル実行用）"""
+
+    name = "memory"
+
+    def __init__(self):
+        self._items: Dict[str, Tuple[bytes, int, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._items.get(session_id)
+        if item is None or item[2] <= time.time():
+            return None
+        return item[0]
+
+    def put(self, session_id: str, data: bytes, version: int, expected_version: int, ttl: int) -> None:
+        with self._lock:
+            item = self._items.get(session_id)
+            current = item[1] if item is not None and item[2] > time.time() else 0
+            if current != expected_version:
+                raise SessionConflictError(session_id)
+            self._items[session_id] = (data, version, time.time() + ttl)
+
+
+class LocalSessionStore:
+    """ローカルディレクトリにセッションごとのファイルを保存するストア（DynamoDBの代替）"""
+
+    name = "local"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def _path(self, session_id: str) -> str:
+        return os.path.join(self.directory, f"{session_id}.session")
+
+    def _read(self, session_id: str) -> Optional[Tuple[bytes, int]]:
+        try:
+            with open(self._path(session_id), "rb") as f:
+                header = f.readline()
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        version, expires_at = header.split()
+        if float(expires_at) <= time.time():
+            return None
+        return data, int(version)
+
+    def get(self, session_id: str) -> Optional[bytes]:
+        item = self._read(session_id)
+        return item[0] if item is not None else None
+
+    def put(self, session_id: str, data: bytes, version: int, expected_version: int, ttl: int) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            item = self._read(session_id)
+            if (item[1] if item is not None else 0) != expected_version:
+                raise SessionConflictError(session_id)
+            temp_path = f"{self._path(session_id)}.{os.getpid()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(f"{version} {time.time() + ttl:.3f}\n".encode("ascii"))
+                f.write(data)
+            os.replace(temp_path, self._path(session_id))
+
+
+class DynamoDBSessionStore:
+    """DynamoDBテーブルをストアとする
+
+    テーブルはパーティションキー `session_id`（文字列）を持ち、`expires_at` をTTL属性に設定する。
+    `version` の条件付き書き込みで、同じセッションへの同時更新を検出する。
+    """
+
+    name = "dynamodb"
+
+    def __init__(self, table_name: str, client: Any = None):
+        self.table_name = table_name
+        self._client = client
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            import boto3
+            self._client = boto3.client("dynamodb")
+        return self._client
+
+    def get(self, session_id: str) -> Optional[bytes]:
+        item = self.client.get_item(
+            TableName=self.table_name,
+            Key={"session_id": {"S": session_id}},
+            ConsistentRead=True
+        ).get("Item")
+        if not item or int(item["expires_at"]["N"]) <= time.time():
+            return None
+        return item["data"]["B"]
+
+    def put(self, session_id: str, data: bytes, version: int, expected_version: int, ttl: int) -> None:
+        if expected_version:
+            condition = {
+                "ConditionExpression": "version = :expected",
+                "ExpressionAttributeValues": {":expected": {"N": str(expected_version)}},
+            }
+        else:
+            # 新規作成（TTLで削除される前の期限切れの項目は上書きしてよい）
+            condition = {
+                "ConditionExpression": "attribute_not_exists(session_id) OR expires_at <= :now",
+                "ExpressionAttributeValues": {":now": {"N": str(int(time.time()))}},
+            }
+        try:
+            self.client.put_item(
+                TableName=self.table_name,
+                Item={
+                    "session_id": {"S": session_id},
+                    "data": {"B": data},
+                    "version": {"N": str(version)},
+                    "expires_at": {"N": str(int(time.time() + ttl))},
+                },
+                **condition
+            )
+        except Exception as e:
+            if getattr(e, "response", {}).get("Error", {}).get("Code") == "ConditionalCheckFailedException":
+                raise SessionConflictError(session_id) from e
+            raise
+
+
+def create_session_store(backend: str, table_name: str = "", local_dir: str = "/tmp/sessions") -> Optional[Any]:
+    """設定名からストアを生成（noneの場合はNone）"""
+    if backend == "none":
+        return None
+    if backend == "memory":
+        return MemorySessionStore()
+    if backend == "local":
+        return LocalSessionStore(local_dir)
+    if backend == "dynamodb":
+        if not table_name:
+            raise ValueError("SESSION_TABLEが設定されていません")
+        return DynamoDBSessionStore(table_name)
+    raise ValueError(f"未対応のセッションストアです: {backend}")
+
+
+class SessionManager:
+    """ストアとウォームコンテナ内の読み込みキャッシュを組み合わせてセッションを読み書きする
+
+    キャッシュは同じコンテナが最後に保存したセッションを返すため、別のコンテナで更新された
+    セッションは古い履歴で処理されることがある。その場合は保存時の条件付き書き込みで検出し、
+    最新の履歴に今回のターンを追加して保存し直す。
+    """
+
+    def __init__(
+        self,
+        store: Any,
+        policy: Optional[CompactionPolicy] = None,
+        summarizer: Any = None,
+        cache: Optional[MemoryTier] = None,
+        ttl: int = 86400,
+        codec: str = "auto"
+    ):
+        self.store = store
+        self.policy = policy or CompactionPolicy()
+        self.summarizer = summarizer or TruncatingSummarizer()
+        self.cache = cache if cache is not None else MemoryTier(128)
+        self.ttl = ttl
+        self.codec = codec
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.conflicts = 0
+        self.summaries = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.store is not None
+
+    def load(self, session_id: str, use_cache: bool = True) -> SessionState:
+        """セッションを読み込む（存在しなければ空のセッション）"""
+        if use_cache:
+            state = self.cache.get(session_id)
+            if state is not None:
+                self.cache_hits += 1
+                return state
+            self.cache_misses += 1
+        data = self.store.get(session_id)
+        state = decode_state(data) if data is not None else SessionState()
+        self.cache.put(session_id, state, self.ttl)
+        return state
+
+    def history(self, state: SessionState) -> List[Dict[str, Any]]:
+        """Agentに渡す履歴（要約は最初のユーザー発話の前にテキストブロックとして加える）"""
+        messages = copy.deepcopy(state.messages)
+        if state.summary and messages:
+            first = messages[0]
+            first["content"] = [{"text": f"{SUMMARY_HEADER}\n{state.summary}"}] + list(first.get("content", []))
+        return messages
+
+    def _compact(self, state: SessionState) -> SessionState:
+        dropped, kept = self.policy.split(state.messages)
+        if not dropped:
+            return state
+        try:
+            summary = self.summarizer.summarize(state.summary, dropped)
+        except Exception as e:
+            # 要約に失敗しても会話は続けられるよう、決定的な要約で代替する
+            logger.warning(f"会話の要約に失敗しました: {type(e).__name__}: {str(e)}")
+            summary = TruncatingSummarizer().summarize(state.summary, dropped)
+        self.summaries += 1
+        logger.info(f"{len(dropped)}件のメッセージを要約に置き換えました（残り{len(kept)}件）")
+        return SessionState(
+            messages=kept,
+            summary=summary,
+            turns=state.turns,
+            summarized_messages=state.summarized_messages + len(dropped),
+            version=state.version
+        )
+
+    def append(self, session_id: str, state: SessionState, new_messages: List[Dict[str, Any]]) -> SessionState:
+        """今回のターンのメッセージを追加し、必要なら要約してから保存する"""
+        for attempt in range(2):
+            updated = self._compact(SessionState(
+                messages=state.messages + list(new_messages),
+                summary=state.summary,
+                turns=state.turns + 1,
+                summarized_messages=state.summarized_messages,
+                version=state.version
+            ))
+            updated.version = state.version + 1
+            try:
+                self.store.put(session_id, encode_state(updated, self.codec), updated.version, state.version, self.ttl)
+            except SessionConflictError:
+                self.conflicts += 1
+                if attempt:
+                    raise
+                logger.warning(f"セッション {session_id} が同時に更新されたため、最新の履歴に追加し直します")
+                state = self.load(session_id, use_cache=False)
+                continue
+            self.cache.put(session_id, updated, self.ttl)
+            return updated
+        raise SessionConflictError(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "cache_hit_rate": round(self.cache_hits / lookups, 3) if lookups else 0.0,
+            "conflicts": self.conflicts,
+            "summaries": self.summaries,
+        }
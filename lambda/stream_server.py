@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+レスポンスストリーミング用HTTPサーバー
+
+Lambda Web Adapter（AWS_LWA_INVOKE_MODE=response_stream）の背後で動作し、
+モデルの差分出力とツールイベントをNDJSONまたはSSEのチャンクとして逐次返す。
+ローカルでもそのまま起動してcurl -Nなどで動作確認できる。
+"""
+import argparse
+import asyncio
+import logging
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict
+
+import json_backend
+import lambda_function
+from config import config
+from deadline import Deadline
+from streaming import CONTENT_TYPES, STREAM_FORMATS, encode_chunk, stream_agent
+from utils import get_model_info, validate_prompt
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8080
+
+
+class StreamingRequestHandler(BaseHTTPRequestHandler):
+    """POSTされたプロンプトをエージェントで処理し、チャンク転送で応答する"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        # Lambda Web Adapterのreadinessチェック用
+        if self.path.rstrip("/") == "/health":
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"success": False, "error": "Not Found"})
+
+    def do_POST(self) -> None:
+        deadline = request_deadline()
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json_backend.loads(self.rfile.read(length) or b"{}")
+        except json_backend.JSONDecodeError as e:
+            self._send_json(400, {
+                "success": False,
+                "error": "無効なJSON",
+                "message": f"リクエストボディの解析に失敗しました: {str(e)}"
+            })
+            return
+        if not isinstance(body, dict):
+            self._send_json(400, {
+                "success": False,
+                "error": "無効なリクエストボディ",
+                "message": "リクエストボディはJSONオブジェクトである必要があります"
+            })
+            return
+
+        prompt = body.get("prompt", "")
+        is_valid, error_msg = validate_prompt(prompt, lambda_function.MAX_PROMPT_LENGTH)
+        if not is_valid:
+            self._send_json(400, {
+                "success": False,
+                "error": error_msg,
+                "message": "プロンプトの検証に失敗しました"
+            })
+            return
+
+        fmt = body.get("stream_format") or self._format_from_accept()
+        if fmt not in STREAM_FORMATS:
+            self._send_json(400, {
+                "success": False,
+                "error": f"サポートされていないストリーム形式: {fmt}"
+            })
+            return
+
+        model_config = lambda_function.resolve_model_config(body)
+
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPES[fmt])
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        try:
+            with lambda_function.acquire_agent(model_config) as agent:
+                used_model = get_model_info(agent, model_config, lambda_function.DEFAULT_MODEL_ID)
+                asyncio.run(self._pump(agent, prompt, fmt, {"model_used": used_model}, deadline))
+                if deadline.expired:
+                    # 中断したイベントループの状態を次のリクエストへ持ち越さない
+                    lambda_function.agent_pool.discard(agent)
+        except Exception as e:
+            logger.error(f"Error: {type(e).__name__}: {str(e)}")
+            self._write_chunk(encode_chunk({"type": "error", "error": type(e).__name__}, fmt))
+        finally:
+            self._write_chunk(b"")
+
+    async def _pump(self, agent: Any, prompt: str, fmt: str, extra: Dict[str, Any], deadline: Deadline) -> None:
+        # 呼び出し中はstdoutへの出力を抑止し、イベントはストリームからのみ受け取る
+        callback_handler = getattr(agent, "callback_handler", None)
+        agent.callback_handler = _null_callback_handler
+        invocation_state = lambda_function.new_invocation_state(deadline)
+        try:
+            async for chunk in stream_agent(agent, prompt, fmt, extra, invocation_state, deadline):
+                self._write_chunk(chunk)
+        finally:
+            agent.callback_handler = callback_handler
+
+    def _format_from_accept(self) -> str:
+        accept = self.headers.get("Accept", "")
+        return "sse" if "text/event-stream" in accept else "ndjson"
+
+    def _write_chunk(self, data: bytes) -> None:
+        """HTTP/1.1のチャンク転送形式で書き込んで即座にフラッシュ"""
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+        data = json_backend.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.info("%s - %s", self.address_string(), format % args)
+
+
+def request_deadline() -> Deadline:
+    """関数のタイムアウトから安全マージンを引いたリクエストの締め切り
+
+    Lambda Web Adapter経由ではLambdaコンテキストの残り時間を参照できないため、
+    リクエスト受信時点から関数のタイムアウトまでを上限とする。
+    """
+    return Deadline(config.LAMBDA_TIMEOUT * 60 - config.DEADLINE_SAFETY_MARGIN_MS / 1000)
+
+
+def _null_callback_handler(**kwargs: Any) -> None:
+    return None
+
+
+def create_server(host: str = "0.0.0.0", port: int = DEFAULT_PORT) -> ThreadingHTTPServer:
+    """ストリーミングサーバーを生成（テストやローカルハーネスから利用）"""
+    return ThreadingHTTPServer((host, port), StreamingRequestHandler)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Strands Agentストリーミングサーバー")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("AWS_LWA_PORT", os.environ.get("PORT", DEFAULT_PORT))))
+    args = parser.parse_args()
+
+    server = create_server(args.host, args.port)
+    logger.info(f"ストリーミングサーバーを起動: {args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,195 @@
+"""
+エージェントイベントの変換・収集とレスポンスストリーミング用のチャンク生成
+"""
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import json_backend
+from config import config
+from deadline import Deadline, stop_event_loop
+from utils import sanitize_error_message
+
+
+logger = logging.getLogger(__name__)
+
+STREAM_FORMATS = ("ndjson", "sse")
+
+CONTENT_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+
+def translate_event(event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Strandsのストリームイベントをクライアント向けのペイロードに変換
+
+    クライアントに不要なイベント（ライフサイクル通知など）はNoneを返す。
+    """
+    if event.get("data"):
+        return {"type": "text", "data": event["data"]}
+
+    if event.get("reasoningText"):
+        return {"type": "reasoning", "data": event["reasoningText"]}
+
+    # ツール呼び出しの開始はcontentBlockStartで1回だけ通知される
+    raw_event = event.get("event")
+    if isinstance(raw_event, dict):
+        tool_use = raw_event.get("contentBlockStart", {}).get("start", {}).get("toolUse")
+        if tool_use:
+            return {
+                "type": "tool_use",
+                "tool_use_id": tool_use.get("toolUseId"),
+                "name": tool_use.get("name"),
+            }
+
+    # ツール結果はuserロールのメッセージとして追加される
+    message = event.get("message")
+    if isinstance(message, dict) and message.get("role") == "user":
+        results = [
+            block["toolResult"]
+            for block in message.get("content", [])
+            if isinstance(block, dict) and "toolResult" in block
+        ]
+        if results:
+            return {
+                "type": "tool_result",
+                "results": [
+                    {"tool_use_id": r.get("toolUseId"), "status": r.get("status")}
+                    for r in results
+                ],
+            }
+
+    if event.get("force_stop"):
+        return {"type": "error", "error": event.get("force_stop_reason", "")}
+
+    return None
+
+
+class EventCollector:
+    """callback_handlerとしてエージェントのイベントを構造化して収集する
+
+    テキスト差分は追記のみのリストに保持し、参照時に一度だけ結合する。
+    """
+
+    def __init__(self) -> None:
+        self._text_chunks: List[str] = []
+        self._reasoning_chunks: List[str] = []
+        self._tool_calls: Dict[str, Dict[str, Any]] = {}
+        self._text: Optional[str] = None
+
+    def __call__(self, **kwargs: Any) -> None:
+        payload = translate_event(kwargs)
+        if payload is None:
+            return
+
+        event_type = payload["type"]
+        if event_type == "text":
+            self._text_chunks.append(payload["data"])
+            self._text = None
+        elif event_type == "reasoning":
+            self._reasoning_chunks.append(payload["data"])
+        elif event_type == "tool_use":
+            self._tool_calls[payload["tool_use_id"]] = {
+                "tool_use_id": payload["tool_use_id"],
+                "name": payload["name"],
+                "status": None,
+            }
+        elif event_type == "tool_result":
+            for result in payload["results"]:
+                call = self._tool_calls.setdefault(
+                    result["tool_use_id"],
+                    {"tool_use_id": result["tool_use_id"], "name": None, "status": None}
+                )
+                call["status"] = result["status"]
+
+    @property
+    def text(self) -> str:
+        """全ターンのテキスト出力"""
+        if self._text is None:
+            self._text = "".join(self._text_chunks)
+        return self._text
+
+    @property
+    def reasoning(self) -> str:
+        """推論（thinking）テキスト"""
+        return "".join(self._reasoning_chunks)
+
+    @property
+    def tool_calls(self) -> List[Dict[str, Any]]:
+        """呼び出し順のツール呼び出しと結果ステータス"""
+        return list(self._tool_calls.values())
+
+
+def encode_chunk(payload: Dict[str, Any], fmt: str = "ndjson") -> bytes:
+    """ペイロードをNDJSONまたはSSE形式のバイト列に変換"""
+    data = json_backend.dumps(payload, compact=config.JSON_COMPACT_RESPONSES, default=str)
+    if fmt == "sse":
+        return f"event: {payload.get('type', 'message')}\ndata: {data}\n\n".encode("utf-8")
+    return f"{data}\n".encode("utf-8")
+
+
+async def stream_agent(
+    agent: Any,
+    prompt: str,
+    fmt: str = "ndjson",
+    extra: Optional[Dict[str, Any]] = None,
+    invocation_state: Optional[Dict[str, Any]] = None,
+    deadline: Optional[Deadline] = None
+) -> AsyncIterator[bytes]:
+    """エージェントの応答をイベント到着順にチャンクとして生成
+
+    最後に応答全文を含むdoneチャンク、失敗時はerrorチャンクを送出する。
+    締め切りを過ぎた場合はイベントループを停止し、それまでのテキストと "status": "timeout" をdoneチャンクで返す。
+    """
+    deadline = deadline or Deadline()
+    if invocation_state is not None:
+        events = agent.stream_async(prompt, invocation_state=invocation_state)
+    else:
+        events = agent.stream_async(prompt)
+    iterator = events.__aiter__()
+    result = None
+    text_chunks: List[str] = []
+    timed_out = False
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(iterator.__anext__(), deadline.remaining())
+            except StopAsyncIteration:
+                break
+            except asyncio.TimeoutError:
+                timed_out = True
+                break
+            if "result" in event:
+                result = event["result"]
+                continue
+            payload = translate_event(event)
+            if payload is not None:
+                if payload["type"] == "text":
+                    text_chunks.append(payload["data"])
+                yield encode_chunk(payload, fmt)
+    except Exception as e:
+        # ヘッダー送信後はステータスコードを変更できないためエラーもチャンクで返す
+        logger.error(f"ストリーミング中のエラー: {type(e).__name__}: {str(e)}")
+        yield encode_chunk({"type": "error", "error": sanitize_error_message(e)}, fmt)
+        return
+
+    if timed_out:
+        logger.warning("締め切りを過ぎたためストリーミングを中断し、部分的な応答を返します")
+        if invocation_state is not None:
+            stop_event_loop(invocation_state)
+        if hasattr(agent, "cancel"):
+            agent.cancel()
+        try:
+            await iterator.aclose()
+        except Exception:
+            pass
+        done = {"type": "done", "status": "timeout", "response": "".join(text_chunks)}
+    else:
+        done = {"type": "done", "status": "completed", "response": str(result) if result is not None else ""}
+        stop_reason = getattr(result, "stop_reason", None)
+        if isinstance(stop_reason, str):
+            done["stop_reason"] = stop_reason
+    if extra:
+        done.update(extra)
+    yield encode_chunk(done, fmt)
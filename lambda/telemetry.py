@@ -0,0 +1,260 @@
+"""
+リクエスト単位のパフォーマンス計測とCloudWatch Embedded Metric Format（EMF）での出力
+
+フェーズごとの所要時間（解析、検証、Agentの構築、モデル呼び出しのターンごと、ツール呼び出しごと、
+レスポンスのシリアライズ）、トークン使用量、コールドスタートかどうかを1つのRequestMetricsに集める。
+モデル・ツールの呼び出しはAgentのフックで計測し、invocation_stateでRequestMetricsを受け渡す。
+EMFはstdoutに1行のJSONとして出力するだけで、CloudWatch Logsがメトリクスに変換するため、
+PutMetricDataの同期呼び出しは不要。
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import json_backend
+
+
+# invocation_stateでRequestMetricsを受け渡すキー
+METRICS_KEY = "request_metrics"
+
+# AgentResultのトークン使用量（Bedrock Converseのusage）とレスポンスでのキー
+USAGE_FIELDS = {
+    "inputTokens": "input_tokens",
+    "outputTokens": "output_tokens",
+    "totalTokens": "total_tokens",
+    "cacheReadInputTokens": "cache_read_input_tokens",
+    "cacheWriteInputTokens": "cache_write_input_tokens",
+}
+
+# EMFの1メトリクスあたりの値の上限
+EMF_MAX_VALUES = 100
+
+# 実行環境で最初の呼び出しかどうか（SnapStartの復元後も最初の呼び出しをコールドスタートとする）
+_cold_start = True
+_cold_start_lock = threading.Lock()
+
+
+def take_cold_start() -> bool:
+    """この実行環境で最初の呼び出しならTrueを返し、以降はFalseを返す"""
+    global _cold_start
+    with _cold_start_lock:
+        cold, _cold_start = _cold_start, False
+        return cold
+
+
+def mark_cold_start() -> None:
+    """次の呼び出しをコールドスタートとして扱う（SnapStartの復元後）"""
+    global _cold_start
+    with _cold_start_lock:
+        _cold_start = True
+
+
+def _elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 3)
+
+
+def usage_from_result(result: Any) -> Dict[str, int]:
+    """AgentResultから今回の呼び出しのトークン使用量を取得（取得できなければ空）"""
+    metrics = getattr(result, "metrics", None)
+    invocation = getattr(metrics, "latest_agent_invocation", None)
+    usage = getattr(invocation, "usage", None) or getattr(metrics, "accumulated_usage", None)
+    if not isinstance(usage, dict):
+        return {}
+    return {
+        name: int(usage[field])
+        for field, name in USAGE_FIELDS.items()
+        if isinstance(usage.get(field), (int, float))
+    }
+
+
+def prompt_cache_hit_ratio(usage: Dict[str, int]) -> Optional[float]:
+    """入力トークンのうちプロンプトキャッシュから読み込んだ割合（キャッシュの項目がなければNone）
+
+    Bedrockのinput_tokensにはキャッシュから読み込んだ・書き込んだトークンは含まれない。
+    """
+    if "cache_read_input_tokens" not in usage and "cache_write_input_tokens" not in usage:
+        return None
+    read = usage.get("cache_read_input_tokens", 0)
+    total = usage.get("input_tokens", 0) + read + usage.get("cache_write_input_tokens", 0)
+    return round(read / total, 3) if total else 0.0
+
+
+class RequestMetrics:
+    """1リクエストの計測値（バッチでは全項目で共有するためスレッドセーフ）"""
+
+    def __init__(self, cold_start: bool = False):
+        self.cold_start = cold_start
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.model_calls: List[float] = []
+        self.tool_calls: List[Dict[str, Any]] = []
+        self.usage: Dict[str, int] = {}
+        self._starts: Dict[Tuple[str, Any], float] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """ブロックの所要時間をフェーズとして記録（同名のフェーズは加算）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, _elapsed_ms(start))
+
+    def add_phase(self, name: str, duration_ms: float) -> None:
+        with self._lock:
+            self.phases[name] = round(self.phases.get(name, 0.0) + duration_ms, 3)
+
+    def start(self, kind: str, key: Any) -> None:
+        with self._lock:
+            self._starts[(kind, key)] = time.perf_counter()
+
+    def _stop(self, kind: str, key: Any) -> Optional[float]:
+        with self._lock:
+            start = self._starts.pop((kind, key), None)
+        return None if start is None else _elapsed_ms(start)
+
+    def end_model_call(self, key: Any) -> None:
+        duration = self._stop("model", key)
+        if duration is not None:
+            with self._lock:
+                self.model_calls.append(duration)
+
+    def end_tool_call(self, key: Any, name: str, status: Optional[str], duration: Optional[float] = None) -> None:
+        """ツール呼び出しの終了を記録（strandsが計測した秒数があればそれを使う）"""
+        measured = self._stop("tool", key)
+        duration_ms = round(duration * 1000, 3) if duration is not None else measured
+        if duration_ms is None:
+            return
+        with self._lock:
+            self.tool_calls.append({"name": name, "duration_ms": duration_ms, "status": status})
+
+    def add_usage(self, usage: Dict[str, int]) -> None:
+        with self._lock:
+            for name, value in usage.items():
+                self.usage[name] = self.usage.get(name, 0) + value
+
+    def total_ms(self) -> float:
+        return _elapsed_ms(self.started)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """レスポンスのmetricsフィールド"""
+        with self._lock:
+            return {
+                "cold_start": self.cold_start,
+                "total_ms": self.total_ms(),
+                "phases_ms": dict(self.phases),
+                "model_calls_ms": list(self.model_calls),
+                "tool_calls": [dict(call) for call in self.tool_calls],
+                "usage": dict(self.usage),
+            }
+
+
+def measure(metrics: Optional[RequestMetrics], name: str) -> Any:
+    """metricsがあればフェーズとして計測するコンテキストマネージャー（なければ何もしない）"""
+    return metrics.phase(name) if metrics is not None else nullcontext()
+
+
+class TelemetryHook:
+    """モデル呼び出し（ターン）とツール呼び出しの所要時間を記録するフックプロバイダー"""
+
+    def register_hooks(self, registry: Any, **kwargs: Any) -> None:
+        from strands.hooks import AfterModelCallEvent, AfterToolCallEvent, BeforeModelCallEvent, BeforeToolCallEvent
+        registry.add_callback(BeforeModelCallEvent, self.before_model_call)
+        registry.add_callback(AfterModelCallEvent, self.after_model_call)
+        registry.add_callback(BeforeToolCallEvent, self.before_tool_call)
+        registry.add_callback(AfterToolCallEvent, self.after_tool_call)
+
+    @staticmethod
+    def _metrics(event: Any) -> Optional[RequestMetrics]:
+        return (getattr(event, "invocation_state", None) or {}).get(METRICS_KEY)
+
+    def before_model_call(self, event: Any) -> None:
+        metrics = self._metrics(event)
+        if metrics is not None:
+            # バッチでは複数のAgentが同じRequestMetricsに記録する
+            metrics.start("model", id(event.agent))
+
+    def after_model_call(self, event: Any) -> None:
+        metrics = self._metrics(event)
+        if metrics is not None:
+            metrics.end_model_call(id(event.agent))
+
+    def before_tool_call(self, event: Any) -> None:
+        metrics = self._metrics(event)
+        if metrics is not None:
+            metrics.start("tool", event.tool_use.get("toolUseId"))
+
+    def after_tool_call(self, event: Any) -> None:
+        metrics = self._metrics(event)
+        if metrics is None:
+            return
+        result = event.result if isinstance(event.result, dict) else {}
+        duration = getattr(event, "duration", None)
+        metrics.end_tool_call(
+            event.tool_use.get("toolUseId"),
+            event.tool_use.get("name"),
+            result.get("status"),
+            duration if isinstance(duration, (int, float)) else None
+        )
+
+
+def emf_document(
+    metrics: RequestMetrics,
+    namespace: str,
+    dimensions: Dict[str, str],
+    properties: Optional[Dict[str, Any]] = None,
+    timestamp_ms: Optional[int] = None
+) -> Dict[str, Any]:
+    """RequestMetricsをEMFのドキュメントに変換
+
+    ターンごと・ツールごとの所要時間は値の配列として出力し、CloudWatchでパーセンタイルを集計できるようにする。
+    """
+    snapshot = metrics.to_dict()
+    values: Dict[str, Tuple[Any, str]] = {
+        "Latency": (snapshot["total_ms"], "Milliseconds"),
+        "ColdStart": (1 if snapshot["cold_start"] else 0, "Count"),
+        "ModelCalls": (len(snapshot["model_calls_ms"]), "Count"),
+        "ToolCalls": (len(snapshot["tool_calls"]), "Count"),
+    }
+    for name, duration in snapshot["phases_ms"].items():
+        values[f"{''.join(part.capitalize() for part in name.split('_'))}Time"] = (duration, "Milliseconds")
+    if snapshot["model_calls_ms"]:
+        values["ModelLatency"] = (snapshot["model_calls_ms"][:EMF_MAX_VALUES], "Milliseconds")
+    if snapshot["tool_calls"]:
+        values["ToolLatency"] = ([call["duration_ms"] for call in snapshot["tool_calls"]][:EMF_MAX_VALUES], "Milliseconds")
+    for field, name in USAGE_FIELDS.items():
+        if name in snapshot["usage"]:
+            values[field[0].upper() + field[1:]] = (snapshot["usage"][name], "Count")
+    hit_ratio = prompt_cache_hit_ratio(snapshot["usage"])
+    if hit_ratio is not None:
+        values["PromptCacheHitRatio"] = (hit_ratio, "None")
+
+    dimension_names = list(dimensions)
+    document: Dict[str, Any] = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000) if timestamp_ms is None else timestamp_ms,
+            "CloudWatchMetrics": [{
+                "Namespace": namespace,
+                # 関数全体と、関数×各ディメンションの組み合わせで集計する
+                "Dimensions": [dimension_names[:1]] + [dimension_names[:1] + [name] for name in dimension_names[1:]],
+                "Metrics": [{"Name": name, "Unit": unit} for name, (_, unit) in values.items()],
+            }],
+        },
+        **(properties or {}),
+        **dimensions,
+    }
+    for name, (value, _) in values.items():
+        document[name] = value
+    return document
+
+
+def emit(document: Dict[str, Any]) -> None:
+    """EMFのドキュメントをstdoutへ1行で出力（CloudWatch Logsがメトリクスとして取り込む）"""
+    print(json_backend.dumps(document, compact=True, default=str), flush=True)
+
+
+def function_name() -> str:
+    return os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "local")
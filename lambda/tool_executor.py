@@ -0,0 +1,141 @@
+"""
+1ターン内の独立したツール呼び出しの並行実行
+
+モデルが1ターンで複数のツール呼び出しを返した場合に、同時実行数の上限を設けて並行に実行する。
+ツールごとにタイムアウトを設定でき、結果はモデルが呼び出した順序で返す。
+同期関数のツールはイベントループのスレッドプールで実行されるため、http_requestや
+use_awsのようなI/O待ちの長いツールほど効果が大きい。
+"""
+import asyncio
+import inspect
+import logging
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence
+
+
+logger = logging.getLogger(__name__)
+
+StreamFactory = Callable[[Dict[str, Any], List[Dict[str, Any]]], AsyncIterator[Any]]
+
+
+def timeout_result(tool_use: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+    """タイムアウトしたツール呼び出しのエラー結果"""
+    return {
+        "toolUseId": tool_use["toolUseId"],
+        "status": "error",
+        "content": [{"text": f"ツールの実行が{timeout:g}秒でタイムアウトしました"}],
+    }
+
+
+async def run_tool_calls(
+    tool_uses: Sequence[Dict[str, Any]],
+    stream_one: StreamFactory,
+    tool_results: List[Dict[str, Any]],
+    max_concurrency: int = 4,
+    timeout_for: Callable[[Dict[str, Any]], Optional[float]] = lambda tool_use: None
+) -> AsyncIterator[Any]:
+    """ツール呼び出しを並行に実行し、各ツールのイベントを発生順に生成する
+
+    stream_one(tool_use, results) はツールのイベントを生成し、結果をresultsに追加する。
+    全ての呼び出しが終わった時点で、結果をtool_useの順にtool_resultsへ追加する。
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    results: List[Optional[Dict[str, Any]]] = [None] * len(tool_uses)
+    done = object()
+
+    async def run(index: int, tool_use: Dict[str, Any]) -> None:
+        try:
+            async with semaphore:
+                timeout = timeout_for(tool_use)
+                sink: List[Dict[str, Any]] = []
+                try:
+                    async with asyncio.timeout(timeout):
+                        async for event in stream_one(tool_use, sink):
+                            await queue.put(event)
+                except TimeoutError:
+                    # 同期関数のツールはスレッドで実行され続けるが、結果は使わない
+                    logger.warning(f"ツール {tool_use.get('name')} が{timeout:g}秒でタイムアウトしました")
+                    sink = [timeout_result(tool_use, timeout)]
+                results[index] = sink[-1] if sink else None
+        finally:
+            await queue.put(done)
+
+    tasks = [asyncio.create_task(run(index, tool_use)) for index, tool_use in enumerate(tool_uses)]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            event = await queue.get()
+            if event is done:
+                remaining -= 1
+                continue
+            yield event
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    tool_results.extend(result for result in results if result is not None)
+
+
+def create_tool_executor(
+    max_concurrency: int,
+    default_timeout: float,
+    timeouts: Optional[Dict[str, float]] = None
+) -> Any:
+    """strandsのConcurrentToolExecutorを拡張した、同時実行数と順序を制御するExecutorを生成
+
+    締め切りがinvocation_stateにある場合、タイムアウトは締め切りまでの残り時間以内に収める。
+    拡張に使うstrandsの内部メソッドの引数がこの実装の想定と異なる場合は、標準のConcurrentToolExecutorを返す。
+    """
+    from strands.tools.executors import ConcurrentToolExecutor
+
+    try:
+        parameters = inspect.signature(ConcurrentToolExecutor._stream_with_trace).parameters
+    except (AttributeError, TypeError, ValueError):
+        parameters = {}
+    if not {"agent", "tool_use", "tool_results", "cycle_trace", "cycle_span", "invocation_state"} <= set(parameters):
+        logger.warning("このstrandsのバージョンでは同時実行数の上限を設定できないため、標準のExecutorを使用します")
+        return ConcurrentToolExecutor()
+    # 構造化出力のコンテキストはstrands 1.14以降のみ受け付ける
+    passes_structured_output = "structured_output_context" in parameters
+
+    timeouts = dict(timeouts or {})
+
+    def timeout_for(tool_use: Dict[str, Any], invocation_state: Dict[str, Any]) -> float:
+        timeout = float(timeouts.get(tool_use.get("name"), default_timeout))
+        deadline = invocation_state.get("deadline")
+        return deadline.clamp(timeout) if deadline is not None else timeout
+
+    class BoundedToolExecutor(ConcurrentToolExecutor):
+        """同時実行数の上限・ツールごとのタイムアウト・呼び出し順の結果を備えたExecutor"""
+
+        async def _execute(
+            self,
+            agent: Any,
+            tool_uses: List[Dict[str, Any]],
+            tool_results: List[Dict[str, Any]],
+            cycle_trace: Any,
+            cycle_span: Any,
+            invocation_state: Dict[str, Any],
+            *args: Any,
+            **kwargs: Any
+        ) -> AsyncIterator[Any]:
+            # strands 1.14以降は構造化出力のコンテキストを位置引数で渡す
+            extra = {}
+            if passes_structured_output:
+                extra["structured_output_context"] = args[0] if args else kwargs.get("structured_output_context")
+
+            def stream_one(tool_use: Dict[str, Any], sink: List[Dict[str, Any]]) -> AsyncIterator[Any]:
+                return self._stream_with_trace(
+                    agent, tool_use, sink, cycle_trace, cycle_span, invocation_state, **extra
+                )
+
+            async for event in run_tool_calls(
+                tool_uses,
+                stream_one,
+                tool_results,
+                max_concurrency=max_concurrency,
+                timeout_for=lambda tool_use: timeout_for(tool_use, invocation_state)
+            ):
+                yield event
+
+    return BoundedToolExecutor()
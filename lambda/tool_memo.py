@@ -0,0 +1,169 @@
+"""
+決定的なツールの実行結果のメモ化
+
+同じ入力に対して常に同じ結果を返すツール（ハッシュ生成、JSON整形、テキスト分析、計算機）の
+結果を、リクエストをまたいでウォームコンテナ内に保持する。キャッシュはエントリ数ではなく
+結果のバイト数で上限を設けたLRU。Agentのフックとして登録し、キャッシュにヒットした場合は
+ツールを実行せずに保存済みの結果を返す。
+"""
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+import json_backend
+
+
+logger = logging.getLogger(__name__)
+
+# 入力によって結果が外部の状態に依存するツールは、純粋な入力の場合のみメモ化する
+PURE_INPUT_CONDITIONS: Dict[str, Callable[[Dict[str, Any]], bool]] = {
+    # ファイルやS3オブジェクトの内容は変わりうる
+    "generate_hash": lambda tool_input: tool_input.get("source", "text") in ("text", "base64"),
+}
+
+# invocation_stateでリクエスト単位のヒット数・ミス数を受け渡すキー
+STATS_KEY = "tool_memo_stats"
+
+
+def make_memo_key(name: str, tool_input: Any) -> str:
+    """ツール名と正規化した入力からキーを生成"""
+    material = json_backend.dumps({"name": name, "input": tool_input}, sort_keys=True, default=str)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def new_request_stats() -> Dict[str, int]:
+    """リクエスト単位の集計用の辞書（invocation_stateに入れて渡す）"""
+    return {"hits": 0, "misses": 0}
+
+
+class ToolResultCache:
+    """結果のバイト数で上限を設けたLRU"""
+
+    def __init__(self, max_bytes: int = 8388608):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[int, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, result: Dict[str, Any]) -> bool:
+        """結果を保存（単体で上限を超える結果は保存しない）"""
+        size = len(key) + len(json_backend.dumps(result, compact=True, default=str).encode("utf-8"))
+        if size > self.max_bytes:
+            return False
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size_bytes -= previous[0]
+            self._entries[key] = (size, result)
+            self.size_bytes += size
+            while self.size_bytes > self.max_bytes:
+                _, (evicted_size, _) = self._entries.popitem(last=False)
+                self.size_bytes -= evicted_size
+                self.evictions += 1
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "size_bytes": self.size_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class _CachedResultTool:
+    """保存済みの結果を返すだけのツール（BeforeToolCallEventのselected_toolを置き換える）"""
+
+    def __init__(self, tool: Any, result: Dict[str, Any]):
+        self._tool = tool
+        self._result = result
+
+    def __getattr__(self, name: str) -> Any:
+        # tool_name・tool_specなどは元のツールのものを使う
+        return getattr(self._tool, name)
+
+    async def stream(self, tool_use: Dict[str, Any], invocation_state: Dict[str, Any], **kwargs: Any):
+        result = {**self._result, "toolUseId": tool_use["toolUseId"]}
+        try:
+            from strands.types._events import ToolResultEvent
+        except ImportError:
+            # 最後に生成した値がツールの結果として扱われるバージョン
+            yield result
+        else:
+            yield ToolResultEvent(result)
+
+
+class ToolMemoHook:
+    """メモ化の対象ツールの結果をキャッシュするフックプロバイダー"""
+
+    def __init__(self, cache: ToolResultCache, tools: Iterable[str]):
+        self.cache = cache
+        self.tools = set(tools)
+
+    def register_hooks(self, registry: Any, **kwargs: Any) -> None:
+        from strands.hooks import AfterToolCallEvent, BeforeToolCallEvent
+        registry.add_callback(BeforeToolCallEvent, self.before_tool_call)
+        registry.add_callback(AfterToolCallEvent, self.after_tool_call)
+
+    def _key(self, tool_use: Dict[str, Any]) -> Optional[str]:
+        name = tool_use.get("name")
+        if name not in self.tools:
+            return None
+        tool_input = tool_use.get("input") or {}
+        condition = PURE_INPUT_CONDITIONS.get(name)
+        if condition is not None and not condition(tool_input):
+            return None
+        return make_memo_key(name, tool_input)
+
+    def _count(self, event: Any, name: str) -> None:
+        stats = (event.invocation_state or {}).get(STATS_KEY)
+        if stats is not None:
+            stats[name] += 1
+
+    def before_tool_call(self, event: Any) -> None:
+        if event.selected_tool is None or getattr(event, "cancel_tool", False):
+            return
+        key = self._key(event.tool_use)
+        if key is None:
+            return
+
+        result = self.cache.get(key)
+        if result is None:
+            self._count(event, "misses")
+            return
+        self._count(event, "hits")
+        logger.info(f"ツールの結果をキャッシュから返します: {event.tool_use.get('name')}")
+        event.selected_tool = _CachedResultTool(event.selected_tool, result)
+
+    def after_tool_call(self, event: Any) -> None:
+        if isinstance(event.selected_tool, _CachedResultTool):
+            return
+        result = event.result
+        if not isinstance(result, dict) or result.get("status") != "success" or getattr(event, "exception", None):
+            return
+        key = self._key(event.tool_use)
+        if key is not None:
+            self.cache.put(key, {k: v for k, v in result.items() if k != "toolUseId"})
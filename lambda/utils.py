@@ -2,14 +2,18 @@
 ユーティリティ関数とヘルパー
 """
 import io
+import re
 import sys
 import logging
 import functools
 import time
-from typing import Any, Callable, Optional, Tuple
+from typing import Any, Callable, Dict, Optional, Pattern, Tuple
 from contextlib import contextmanager
 from datetime import datetime
 
+import json_backend
+from config import config
+
 
 logger = logging.getLogger(__name__)
 
@@ -86,27 +90,45 @@ def retry_on_exception(
     return decorator
 
 
-def sanitize_error_message(error: Exception, include_type: bool = True) -> str:
+@functools.lru_cache(maxsize=32)
+def compile_rules(patterns: Tuple[str, ...], flags: int = 0) -> Pattern:
+    """複数の正規表現を1つの選択パターンに結合してコンパイル（結果はキャッシュ）
+    
+    入力を1回走査するだけで全ルールを判定できる。
+    """
+    if not patterns:
+        # 何にもマッチしないパターン
+        return re.compile(r'(?!)')
+    return re.compile("|".join(f"(?:{pattern})" for pattern in patterns), flags)
+
+
+def _rules_matcher(rules: Dict[str, str], flags: int = 0) -> Pattern:
+    return compile_rules(tuple(rules.values()), flags)
+
+
+def sanitize_error_message(
+    error: Exception,
+    include_type: bool = True,
+    rules: Optional[Dict[str, str]] = None
+) -> str:
     """エラーメッセージをサニタイズして安全に返す"""
     error_msg = str(error)
     
     # センシティブな情報をマスク
-    sensitive_patterns = [
-        r'arn:aws:[^:]+:[^:]+:[^:]+:[^/\s]+',  # AWS ARN
-        r'AKIA[0-9A-Z]{16}',  # AWS Access Key
-        r'[0-9a-zA-Z/+=]{40}',  # AWS Secret Key
-    ]
-    
-    import re
-    for pattern in sensitive_patterns:
-        error_msg = re.sub(pattern, '***REDACTED***', error_msg)
+    if rules is None:
+        rules = config.REDACTION_RULES
+    error_msg = _rules_matcher(rules).sub('***REDACTED***', error_msg)
     
     if include_type:
         return f"{type(error).__name__}: {error_msg}"
     return error_msg
 
 
-def validate_prompt(prompt: str, max_length: int) -> Tuple[bool, Optional[str]]:
+def validate_prompt(
+    prompt: str,
+    max_length: int,
+    rules: Optional[Dict[str, str]] = None
+) -> Tuple[bool, Optional[str]]:
     """プロンプトのバリデーション"""
     if not prompt:
         return False, "プロンプトが提供されていません"
@@ -118,16 +140,10 @@ def validate_prompt(prompt: str, max_length: int) -> Tuple[bool, Optional[str]]:
         return False, f"プロンプトが長すぎます（最大{max_length}文字）"
     
     # 危険な文字のチェック
-    dangerous_patterns = [
-        r'<script[^>]*>.*?</script>',  # スクリプトタグ
-        r'javascript:',  # JavaScriptプロトコル
-        r'data:text/html',  # データURI
-    ]
-    
-    import re
-    for pattern in dangerous_patterns:
-        if re.search(pattern, prompt, re.IGNORECASE):
-            return False, "プロンプトに許可されていない内容が含まれています"
+    if rules is None:
+        rules = config.DANGEROUS_CONTENT_RULES
+    if _rules_matcher(rules, re.IGNORECASE).search(prompt):
+        return False, "プロンプトに許可されていない内容が含まれています"
     
     return True, None
 
@@ -203,7 +219,6 @@ def format_response(
     if error:
         body['error'] = error
     
-    import json
-    response['body'] = json.dumps(body, ensure_ascii=False)
+    response['body'] = json_backend.dumps(body, compact=config.JSON_COMPACT_RESPONSES)
     
     return response
\ No newline at end of file
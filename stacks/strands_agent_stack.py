@@ -1,16 +1,52 @@
 from aws_cdk import (
     Stack,
     Duration,
+    TimeZone,
     aws_lambda as lambda_,
     aws_iam as iam,
     aws_logs as logs,
+    aws_applicationautoscaling as appscaling,
+    aws_ecr_assets as ecr_assets,
     CfnOutput,
     RemovalPolicy
 )
 from constructs import Construct
+import json
 import os
 
 
+def _parse_schedules(value) -> list:
+    """スケジュール設定（JSON文字列またはリスト）を解析
+
+    例: [{"name": "BusinessHours", "cron": "0 9 ? * MON-FRI *", "min": 5, "max": 20, "time_zone": "Asia/Tokyo"}]
+    """
+    if not value:
+        return []
+    schedules = json.loads(value) if isinstance(value, str) else value
+    for schedule in schedules:
+        if "name" not in schedule or "cron" not in schedule:
+            raise ValueError(f"provisioned_concurrency_schedulesにはnameとcronが必要です: {schedule}")
+    return schedules
+
+
+def _check_layer_python_version(layer_dir: str, python_version: str) -> None:
+    """build_layer.pyが記録したLayerのPythonバージョンがランタイムと一致するか確認
+
+    ネイティブ拡張（pydantic_core、orjsonなど）はPythonバージョンごとにビルドされるため、
+    一致しないLayerはインポート時に失敗する。記録がない場合は確認しない。
+    """
+    path = os.path.join(layer_dir, "layer-metadata.json")
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as f:
+        built_version = json.load(f).get("python_version")
+    if built_version != python_version:
+        raise ValueError(
+            f"LayerはPython {built_version}向けにビルドされていますが、ランタイムはPython {python_version}です"
+            f"（python build_layer.py --python-version {python_version} で再ビルドしてください）"
+        )
+
+
 class StrandsAgentStack(Stack):
     def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
@@ -21,6 +57,32 @@ class StrandsAgentStack(Stack):
         reserved_concurrent = self.node.try_get_context("reserved_concurrent")
         function_name = self.node.try_get_context("lambda_function_name") or "strands-agent-sample1"
         default_model_id = self.node.try_get_context("default_model_id")
+        enable_streaming = str(self.node.try_get_context("enable_streaming") or "false").lower() == "true"
+        lwa_layer_version = self.node.try_get_context("lwa_layer_version") or 25
+        eager_init = str(self.node.try_get_context("eager_init") or "false").lower() == "true"
+        enable_snapstart = str(self.node.try_get_context("enable_snapstart") or "false").lower() == "true"
+        alias_name = self.node.try_get_context("alias_name") or "live"
+        provisioned_concurrency = int(self.node.try_get_context("provisioned_concurrency") or 0)
+        pc_max_capacity = int(self.node.try_get_context("provisioned_concurrency_max") or 0)
+        pc_utilization_target = float(self.node.try_get_context("provisioned_concurrency_utilization") or 0.7)
+        pc_schedules = _parse_schedules(self.node.try_get_context("provisioned_concurrency_schedules"))
+        packaging = self.node.try_get_context("packaging") or "zip"
+        
+        # コンテナイメージはLayerを使わず、依存関係とアプリケーションを1つのイメージに含める
+        if packaging not in ("zip", "container"):
+            raise ValueError(f"packagingはzipまたはcontainerを指定してください: {packaging}")
+        if packaging == "container" and (enable_snapstart or enable_streaming):
+            raise ValueError("packaging=containerはenable_snapstart・enable_streamingと併用できません")
+        if not provisioned_concurrency and (pc_max_capacity or pc_schedules):
+            raise ValueError(
+                "provisioned_concurrency_max・provisioned_concurrency_schedulesにはprovisioned_concurrencyの指定が必要です"
+            )
+        
+        # PythonのSnapStartはPython 3.12以降のランタイムが必要（Layerも3.12向けにビルドする）
+        python_version = "3.12" if enable_snapstart else "3.11"
+        runtime = lambda_.Runtime.PYTHON_3_12 if enable_snapstart else lambda_.Runtime.PYTHON_3_11
+        # initフェーズでstrands・ツール・Bedrockクライアントを初期化する
+        init_environment = {"EAGER_INIT": "true"} if eager_init else {}
         
         # Lambda実行ロールを作成
         lambda_role = iam.Role(
@@ -94,43 +156,90 @@ class StrandsAgentStack(Stack):
             }
         )
 
-        # 依存関係用のLambda Layerを作成
-        dependencies_layer = lambda_.LayerVersion(
-            self, "StrandsAgentDependencies",
-            code=lambda_.Code.from_asset("lambda_layer"),
-            compatible_runtimes=[lambda_.Runtime.PYTHON_3_11],
-            compatible_architectures=[lambda_.Architecture.ARM_64],
-            description="Strands Agent Lambda用の依存関係",
-            layer_version_name="strands-agent-deps"
-        )
-
-        # Lambda関数を作成
-        lambda_function = lambda_.Function(
-            self, "StrandsAgentFunction",
+        common_function_props = dict(
             function_name=function_name,  # 明示的に関数名を指定
-            runtime=lambda_.Runtime.PYTHON_3_11,
             architecture=lambda_.Architecture.ARM_64,
-            handler="lambda_function.lambda_handler",
-            code=lambda_.Code.from_asset("lambda", exclude=["__pycache__", "*.pyc", ".DS_Store"]),
             memory_size=memory_size,
             timeout=Duration.minutes(timeout_minutes),
-            layers=[dependencies_layer],
             role=lambda_role,
-            environment={
-                "PYTHONPATH": "/opt/python",
-                **({"DEFAULT_MODEL_ID": default_model_id} if default_model_id else {})
-            },
             log_retention=logs.RetentionDays.ONE_WEEK,
             description="Strands Agentサーバーレス関数"
         )
+        environment = {
+            **init_environment,
+            **({"DEFAULT_MODEL_ID": default_model_id} if default_model_id else {})
+        }
+
+        if packaging == "container":
+            # 依存関係とアプリケーションをプリコンパイル済みで含むARM64コンテナイメージ（container/Dockerfile）
+            lambda_function = lambda_.DockerImageFunction(
+                self, "StrandsAgentFunction",
+                code=lambda_.DockerImageCode.from_image_asset(
+                    ".",
+                    file="container/Dockerfile",
+                    platform=ecr_assets.Platform.LINUX_ARM64
+                ),
+                environment=environment,
+                **common_function_props
+            )
+        else:
+            _check_layer_python_version("lambda_layer", python_version)
+            # 依存関係用のLambda Layerを作成
+            dependencies_layer = lambda_.LayerVersion(
+                self, "StrandsAgentDependencies",
+                code=lambda_.Code.from_asset("lambda_layer"),
+                compatible_runtimes=[runtime],
+                compatible_architectures=[lambda_.Architecture.ARM_64],
+                description="Strands Agent Lambda用の依存関係",
+                layer_version_name="strands-agent-deps"
+            )
+
+            # Lambda関数を作成
+            lambda_function = lambda_.Function(
+                self, "StrandsAgentFunction",
+                runtime=runtime,
+                handler="lambda_function.lambda_handler",
+                code=lambda_.Code.from_asset("lambda", exclude=["__pycache__", "*.pyc", ".DS_Store"]),
+                layers=[dependencies_layer],
+                environment={"PYTHONPATH": "/opt/python", **environment},
+                snap_start=lambda_.SnapStartConf.ON_PUBLISHED_VERSIONS if enable_snapstart else None,
+                **common_function_props
+            )
 
         # 指定された場合、予約同時実行数を設定
         if reserved_concurrent:
             lambda_function.add_reserved_concurrent_executions(reserved_concurrent)
 
-        # Lambda Function URLを作成
+        # バージョンを発行し、エイリアス経由で呼び出す
+        # （SnapStartとプロビジョニングされた同時実行は発行済みバージョンにのみ適用される）
+        version = lambda_function.current_version
+        alias = lambda_.Alias(
+            self, "StrandsAgentLiveAlias",
+            alias_name=alias_name,
+            version=version,
+            provisioned_concurrent_executions=provisioned_concurrency or None
+        )
+
+        # プロビジョニングされた同時実行のオートスケーリング（使用率ベースとスケジュールベース）
+        if provisioned_concurrency and (pc_max_capacity or pc_schedules):
+            scalable_target = alias.add_auto_scaling(
+                min_capacity=provisioned_concurrency,
+                max_capacity=max(pc_max_capacity, provisioned_concurrency)
+            )
+            if pc_max_capacity:
+                scalable_target.scale_on_utilization(utilization_target=pc_utilization_target)
+            for schedule in pc_schedules:
+                scalable_target.scale_on_schedule(
+                    schedule["name"],
+                    schedule=appscaling.Schedule.expression(f"cron({schedule['cron']})"),
+                    min_capacity=schedule.get("min"),
+                    max_capacity=schedule.get("max"),
+                    time_zone=TimeZone.of(schedule["time_zone"]) if schedule.get("time_zone") else None
+                )
+        
+        # Lambda Function URLを作成（エイリアスに紐付け）
         # CORSの設定を含む
-        function_url = lambda_function.add_function_url(
+        function_url = alias.add_function_url(
             auth_type=lambda_.FunctionUrlAuthType.NONE,  # 認証なし（必要に応じてAWS_IAMに変更）
             cors={
                 "allowed_origins": ["*"],  # すべてのオリジンを許可
@@ -141,13 +250,71 @@ class StrandsAgentStack(Stack):
         )
 
         # Function URLに対する権限を付与（パブリックアクセス）
-        lambda_function.add_permission(
+        alias.add_permission(
             "AllowPublicAccess",
             principal=iam.ServicePrincipal("*"),
             action="lambda:InvokeFunctionUrl",
             function_url_auth_type=lambda_.FunctionUrlAuthType.NONE
         )
 
+        # ストリーミング用の関数とFunction URLを作成（オプション）
+        # PythonランタイムはハンドラーからのストリーミングをサポートしないためLambda Web Adapterを使用
+        if enable_streaming:
+            web_adapter_layer = lambda_.LayerVersion.from_layer_version_arn(
+                self, "LambdaWebAdapterLayer",
+                f"arn:aws:lambda:{self.region}:753240598075:layer:LambdaAdapterLayerArm64:{lwa_layer_version}"
+            )
+            
+            streaming_function = lambda_.Function(
+                self, "StrandsAgentStreamingFunction",
+                function_name=f"{function_name}-stream",
+                runtime=runtime,
+                architecture=lambda_.Architecture.ARM_64,
+                handler="run.sh",
+                code=lambda_.Code.from_asset("lambda", exclude=["__pycache__", "*.pyc", ".DS_Store"]),
+                memory_size=memory_size,
+                timeout=Duration.minutes(timeout_minutes),
+                layers=[dependencies_layer, web_adapter_layer],
+                role=lambda_role,
+                environment={
+                    "PYTHONPATH": "/opt/python",
+                    "AWS_LAMBDA_EXEC_WRAPPER": "/opt/bootstrap",
+                    "AWS_LWA_INVOKE_MODE": "response_stream",
+                    "AWS_LWA_PORT": "8080",
+                    "AWS_LWA_READINESS_CHECK_PATH": "/health",
+                    # Web Adapter経由ではLambdaコンテキストを参照できないため、締め切りは関数のタイムアウトから求める
+                    "LAMBDA_TIMEOUT": str(timeout_minutes),
+                    **init_environment,
+                    **({"DEFAULT_MODEL_ID": default_model_id} if default_model_id else {})
+                },
+                log_retention=logs.RetentionDays.ONE_WEEK,
+                description="Strands Agentストリーミング関数"
+            )
+            
+            streaming_url = streaming_function.add_function_url(
+                auth_type=lambda_.FunctionUrlAuthType.NONE,
+                invoke_mode=lambda_.InvokeMode.RESPONSE_STREAM,
+                cors={
+                    "allowed_origins": ["*"],
+                    "allowed_methods": [lambda_.HttpMethod.POST],
+                    "allowed_headers": ["Content-Type", "Authorization", "Accept"],
+                    "max_age": Duration.hours(1)
+                }
+            )
+            
+            streaming_function.add_permission(
+                "AllowPublicStreamingAccess",
+                principal=iam.ServicePrincipal("*"),
+                action="lambda:InvokeFunctionUrl",
+                function_url_auth_type=lambda_.FunctionUrlAuthType.NONE
+            )
+            
+            CfnOutput(
+                self, "StreamingFunctionUrl",
+                value=streaming_url.url,
+                description="ストリーミング用Lambda Function URL"
+            )
+
         # 出力
         CfnOutput(
             self, "FunctionUrl",
@@ -165,4 +332,22 @@ class StrandsAgentStack(Stack):
             self, "LambdaFunctionArn",
             value=lambda_function.function_arn,
             description="Lambda関数ARN"
+        )
+
+        CfnOutput(
+            self, "LambdaFunctionVersion",
+            value=version.version,
+            description="発行済みのLambda関数バージョン"
+        )
+
+        CfnOutput(
+            self, "LambdaAliasName",
+            value=alias.alias_name,
+            description="Function URLが呼び出すエイリアス名"
+        )
+
+        CfnOutput(
+            self, "LambdaAliasArn",
+            value=alias.function_arn,
+            description="Lambdaエイリアス（呼び出し対象）のARN"
         )
\ No newline at end of file
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+ストリーミング応答のローカルハーネス
+AWSを使わずにストリーミングサーバーを起動し、チャンクの到着を確認する
+
+使用例:
+    python tests/stream_harness.py "こんにちは"            # 偽エージェントで実行
+    python tests/stream_harness.py "こんにちは" --sse      # SSE形式
+    python tests/stream_harness.py "こんにちは" --real     # 実際のBedrockを使用
+"""
+import asyncio
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, List
+from unittest.mock import patch
+
+# Lambda関数のパスを追加
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+
+
+class FakeResult:
+    """AgentResultの代替"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.stop_reason = "end_turn"
+
+    def __str__(self) -> str:
+        return self.text
+
+
+class FakeStreamingAgent:
+    """stream_asyncでツール呼び出しとテキスト差分を返す偽エージェント"""
+
+    def __init__(self, text: str = "現在の時刻は10時です。", delay: float = 0.0, tool_name: str = "current_time"):
+        self.text = text
+        self.delay = delay
+        self.tool_name = tool_name
+        self.messages: List[Any] = []
+        self.callback_handler = None
+        self.model_id = "fake-model"
+        self.invocation_state: Any = None
+
+    async def stream_async(self, prompt: str, invocation_state: Any = None):
+        self.invocation_state = invocation_state
+        if self.tool_name:
+            yield {"event": {"contentBlockStart": {"start": {"toolUse": {"toolUseId": "tool-1", "name": self.tool_name}}}}}
+            yield {"message": {"role": "user", "content": [{"toolResult": {"toolUseId": "tool-1", "status": "success"}}]}}
+        for i in range(0, len(self.text), 4):
+            await asyncio.sleep(self.delay)
+            yield {"data": self.text[i:i + 4]}
+        yield {"result": FakeResult(self.text)}
+
+
+@contextmanager
+def running_server(agent: Any = None) -> Iterator[int]:
+    """ストリーミングサーバーを別スレッドで起動してポート番号を返す"""
+    import lambda_function
+    from stream_server import create_server
+
+    with patch.object(lambda_function, "Agent", side_effect=lambda **kwargs: agent) if agent else _nullcontext():
+        lambda_function.agent_pool.clear()
+        server = create_server("127.0.0.1", 0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            yield server.server_address[1]
+        finally:
+            server.shutdown()
+            server.server_close()
+            lambda_function.agent_pool.clear()
+
+
+@contextmanager
+def _nullcontext():
+    yield
+
+
+def post_stream(port: int, payload: dict, accept: str = "application/x-ndjson") -> Iterator[bytes]:
+    """プロンプトをPOSTし、受信したチャンクを到着順に返す"""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    conn.request(
+        "POST", "/",
+        body=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+        headers={"Content-Type": "application/json", "Accept": accept}
+    )
+    response = conn.getresponse()
+    try:
+        while True:
+            line = response.readline()
+            if not line:
+                break
+            yield line
+    finally:
+        conn.close()
+
+
+def main() -> None:
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    prompt = args[0] if args else "現在の日時を教えてください。"
+    accept = "text/event-stream" if "--sse" in sys.argv else "application/x-ndjson"
+    agent = None if "--real" in sys.argv else FakeStreamingAgent(delay=0.05)
+
+    with running_server(agent) as port:
+        start = time.perf_counter()
+        first_chunk_at = None
+        for line in post_stream(port, {"prompt": prompt}, accept):
+            if first_chunk_at is None and line.strip():
+                first_chunk_at = time.perf_counter() - start
+            print(f"[{time.perf_counter() - start:6.3f}s] {line.decode('utf-8').rstrip()}")
+
+    total = time.perf_counter() - start
+    print(f"\n最初のチャンクまで: {first_chunk_at or 0:.3f}s / 合計: {total:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Agentプールのテスト
+"""
+import sys
+import os
+from unittest.mock import Mock
+
+# Lambda関数のパスを追加
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+
+from agent_pool import AgentPool, make_pool_key
+
+
+class FakeAgentState:
+    """strandsのAgentStateの代替"""
+    
+    def __init__(self):
+        self._state = {}
+    
+    def set(self, key, value):
+        self._state[key] = value
+    
+    def get(self, key=None):
+        return dict(self._state) if key is None else self._state.get(key)
+
+
+class FakeConversationManager:
+    """strandsのSummarizingConversationManagerの代替"""
+    
+    def __init__(self):
+        self.removed_message_count = 0
+        self._summary_message = None
+    
+    def restore_from_session(self, state):
+        if state.get("__name__") != type(self).__name__:
+            raise ValueError("Invalid conversation manager state.")
+        self.removed_message_count = state["removed_message_count"]
+        self._summary_message = state.get("summary_message")
+        return None
+
+
+def _factory():
+    agent = Mock()
+    agent.messages = []
+    return agent
+
+
+class TestAgentPool:
+    """AgentPoolの単体テスト"""
+    
+    def test_reuses_agent_for_same_key(self):
+        pool = AgentPool(max_size=2)
+        key = make_pool_key({"model": "m"}, [])
+        
+        with pool.acquire(key, _factory) as first:
+            first.messages.append("turn")
+        with pool.acquire(key, _factory) as second:
+            pass
+        
+        assert first is second
+        assert second.messages == []
+        assert pool.stats()["hits"] == 1
+        assert pool.stats()["misses"] == 1
+    
+    def test_release_clears_agent_state_and_conversation_manager(self):
+        pool = AgentPool(max_size=2)
+        key = make_pool_key({"model": "m"}, [])
+        
+        def factory():
+            agent = _factory()
+            agent.state = FakeAgentState()
+            agent.conversation_manager = FakeConversationManager()
+            return agent
+        
+        with pool.acquire(key, factory) as first:
+            first.state.set("user_id", "caller-a")
+            first.conversation_manager.removed_message_count = 12
+            first.conversation_manager._summary_message = {"role": "user", "content": [{"text": "要約"}]}
+        with pool.acquire(key, factory) as second:
+            pass
+        
+        assert first is second
+        assert second.state.get() == {}
+        assert second.conversation_manager.removed_message_count == 0
+        assert second.conversation_manager._summary_message is None
+    
+    def test_concurrent_acquire_builds_separate_agents(self):
+        pool = AgentPool(max_size=2)
+        key = make_pool_key({"model": "m"}, [])
+        
+        with pool.acquire(key, _factory) as first:
+            with pool.acquire(key, _factory) as second:
+                assert first is not second
+        
+        assert pool.stats()["size"] == 2
+    
+    def test_evicts_least_recently_used_key(self):
+        pool = AgentPool(max_size=1)
+        key_a = make_pool_key({"model": "a"}, [])
+        key_b = make_pool_key({"model": "b"}, [])
+        
+        with pool.acquire(key_a, _factory) as agent_a:
+            pass
+        with pool.acquire(key_b, _factory):
+            pass
+        with pool.acquire(key_a, _factory) as agent_a2:
+            pass
+        
+        assert agent_a is not agent_a2
+        assert pool.stats()["evictions"] >= 1
+    
+    def test_disabled_pool_always_builds(self):
+        pool = AgentPool(max_size=0)
+        key = make_pool_key({"model": "m"}, [])
+        
+        with pool.acquire(key, _factory) as first:
+            pass
+        with pool.acquire(key, _factory) as second:
+            pass
+        
+        assert first is not second
+    
+    def test_key_is_order_independent(self):
+        tool_a = Mock(__name__="a")
+        tool_b = Mock(__name__="b")
+        
+        assert make_pool_key({"model": "m", "temperature": 0.1}, [tool_a, tool_b]) == \
+            make_pool_key({"temperature": 0.1, "model": "m"}, [tool_b, tool_a])
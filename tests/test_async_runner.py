@@ -0,0 +1,113 @@
+"""
+イベントループでAgentのstream_asyncを実行するAsyncRunnerのテスト
+"""
+import asyncio
+import sys
+import os
+import threading
+import time
+
+import pytest
+
+# Lambda関数のパスを追加
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+
+from async_runner import AsyncRunner, stream_agent_result
+from deadline import Deadline
+
+
+class FakeStreamingAgent:
+    """stream_asyncでイベントを返すAgent（delay秒ごとにイベントを1つ返す）"""
+
+    def __init__(self, delay=0.0, events=3, error=None):
+        self.delay = delay
+        self.events = events
+        self.error = error
+        self.cancelled = False
+        self.invocation_state = None
+
+    async def stream_async(self, prompt, invocation_state=None):
+        self.invocation_state = invocation_state
+        try:
+            for index in range(self.events):
+                await asyncio.sleep(self.delay)
+                yield {"data": f"{prompt}-{index}"}
+            if self.error:
+                raise self.error
+            yield {"result": f"done:{prompt}"}
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+@pytest.fixture
+def runner():
+    runner = AsyncRunner(max_tool_threads=4)
+    yield runner
+    runner.close()
+
+
+def test_returns_final_result(runner):
+    agent = FakeStreamingAgent()
+    completed, result = runner.run(lambda: stream_agent_result(agent, "p", {"k": 1}), Deadline(5))
+    assert (completed, result) == (True, "done:p")
+    assert agent.invocation_state == {"k": 1}
+    assert runner.stats() == {"running": 0, "completed": 1, "cancelled": 0}
+
+
+def test_loop_started_lazily(runner):
+    assert runner.started is False
+    runner.run(lambda: stream_agent_result(FakeStreamingAgent(), "p", {}), Deadline(5))
+    assert runner.started is True
+
+
+def test_deadline_cancels_task(runner):
+    agent = FakeStreamingAgent(delay=0.2, events=50)
+    started = time.monotonic()
+    completed, result = runner.run(lambda: stream_agent_result(agent, "p", {}), Deadline(0.1))
+    assert (completed, result) == (False, None)
+    assert time.monotonic() - started < 1
+    # 取り消しはループ上のタスクに伝わる
+    for _ in range(50):
+        if agent.cancelled:
+            break
+        time.sleep(0.01)
+    assert agent.cancelled is True
+    assert runner.stats()["cancelled"] == 1
+
+
+def test_exception_propagates(runner):
+    agent = FakeStreamingAgent(error=RuntimeError("model error"))
+    with pytest.raises(RuntimeError, match="model error"):
+        runner.run(lambda: stream_agent_result(agent, "p", {}), Deadline(5))
+
+
+def test_concurrent_calls_overlap_on_one_loop(runner):
+    """複数のスレッドからの呼び出しは同じループ上で待ち時間が重なる"""
+    results = []
+
+    def call(index):
+        agent = FakeStreamingAgent(delay=0.1, events=2)
+        results.append(runner.run(lambda: stream_agent_result(agent, index, {}), Deadline(5)))
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=call, args=(index,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert time.monotonic() - started < 1
+    assert sorted(result for _, result in results) == sorted(f"done:{index}" for index in range(8))
+
+
+def test_sync_tools_use_sized_executor(runner):
+    """同期関数のツールはmax_tool_threadsのスレッドで並行に実行する"""
+    async def run_tools():
+        return await asyncio.gather(*(asyncio.to_thread(lambda: (time.sleep(0.1), threading.current_thread().name)[1])
+                                      for _ in range(4)))
+
+    started = time.monotonic()
+    completed, names = runner.run(run_tools, Deadline(5))
+    assert completed is True
+    assert time.monotonic() - started < 0.35
+    assert all(name.startswith("async-tool") for name in names)
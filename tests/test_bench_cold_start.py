@@ -0,0 +1,58 @@
+"""
+コールドスタートベンチマークの集計・判定処理のテスト
+"""
+import sys
+import os
+
+# ベンチマークスクリプトのパスを追加
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+from bench_cold_start import (
+    ImportRecord, append_history, check_regression, load_baseline, parse_importtime, summarize
+)
+
+
+IMPORTTIME_OUTPUT = """import time: self [us] | cumulative | imported package
+import time:       156 |        156 |         importlib
+import time:      2079 |       2235 |   config
+import time:       300 |        300 |     botocore.utils
+import time:       700 |       1000 |   botocore
+import time:      5000 |       5000 |   strands.agent
+import time:      1000 |       6000 |   strands
+import time:       500 |      9735 | lambda_function
+Traceback (most recent call last):
+"""
+
+
+def test_parse_importtime():
+    records = parse_importtime(IMPORTTIME_OUTPUT)
+    assert len(records) == 7
+    assert records[0] == ImportRecord("importlib", 156, 156, 4)
+    assert records[-1] == ImportRecord("lambda_function", 500, 9735, 0)
+
+
+def test_summarize_modules_and_packages():
+    summary = summarize(parse_importtime(IMPORTTIME_OUTPUT), ["lambda_function", "config", "utils"])
+    assert summary["modules"] == {"config": 2.235, "lambda_function": 9.735}
+    assert summary["packages"]["strands"] == 6.0
+    assert summary["packages"]["botocore"] == 1.0
+
+
+def test_check_regression():
+    baseline = {"init_ms": 100.0, "modules": {"config": 10.0}}
+    assert check_regression({"init_ms": 110.0, "modules": {"config": 11.0}}, baseline, 200, 20) == []
+
+    failures = check_regression({"init_ms": 130.0, "modules": {"config": 15.0}}, baseline, 120, 20)
+    assert len(failures) == 3
+    assert check_regression({"init_ms": 130.0, "modules": {}}, None, None, 20) == []
+
+
+def test_history_round_trip(tmp_path):
+    path = str(tmp_path / "results" / "cold_start.jsonl")
+    assert load_baseline(path, "lambda_function") is None
+
+    append_history(path, {"module": "lambda_function", "init_ms": 100.0})
+    append_history(path, {"module": "utils", "init_ms": 5.0})
+    append_history(path, {"module": "lambda_function", "init_ms": 90.0})
+    assert load_baseline(path, "lambda_function")["init_ms"] == 90.0
+    assert load_baseline(path, "utils")["init_ms"] == 5.0
@@ -0,0 +1,177 @@
+"""
+Bedrockの代替サーバーとハンドラーのレイテンシベンチマークの集計処理のテスト
+"""
+import json
+import struct
+import sys
+import os
+import time
+import urllib.error
+import urllib.request
+import zlib
+
+import pytest
+
+# ベンチマークスクリプトのパスを追加
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+from bench_handler import make_event, percentile, run_level, sample_from_result, summarize_level
+from fake_bedrock import FakeBedrockConfig, FakeBedrockServer, encode_event, plan_reply
+
+
+TOOL_CONFIG = {"tools": [{"toolSpec": {"name": "current_time"}}, {"toolSpec": {"name": "calculator"}}]}
+
+
+def decode_events(data):
+    """AWSイベントストリームを (イベントの種類, ペイロード) の一覧にデコードし、CRCを検証する"""
+    events = []
+    while data:
+        total, headers_length = struct.unpack(">II", data[:8])
+        assert struct.unpack(">I", data[8:12])[0] == zlib.crc32(data[:8])
+        message = data[:total]
+        assert struct.unpack(">I", message[-4:])[0] == zlib.crc32(message[:-4])
+        headers, offset = {}, 12
+        while offset < 12 + headers_length:
+            name_length = message[offset]
+            name = message[offset + 1:offset + 1 + name_length].decode()
+            offset += 1 + name_length
+            assert message[offset] == 7
+            value_length = struct.unpack(">H", message[offset + 1:offset + 3])[0]
+            headers[name] = message[offset + 3:offset + 3 + value_length].decode()
+            offset += 3 + value_length
+        events.append((headers[":event-type"], json.loads(message[offset:-4])))
+        data = data[total:]
+    return events
+
+
+def post(server, path, payload):
+    request = urllib.request.Request(server.url + path, data=json.dumps(payload).encode(), method="POST",
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=5) as response:
+        return response.headers, response.read()
+
+
+class TestFakeBedrock:
+    """Converse / ConverseStream APIの代替サーバーのテスト"""
+
+    def test_encode_event_headers(self):
+        events = decode_events(encode_event("messageStart", {"role": "assistant"}) +
+                               encode_event("messageStop", {"stopReason": "end_turn"}))
+        assert events == [("messageStart", {"role": "assistant"}), ("messageStop", {"stopReason": "end_turn"})]
+
+    def test_plan_reply_tool_turns(self):
+        config = FakeBedrockConfig(tool_turns=1)
+        prompt = {"role": "user", "content": [{"text": "25 * 4"}]}
+        kind, tool_use = plan_reply({"messages": [prompt], "toolConfig": TOOL_CONFIG}, config)
+        assert kind == "tool_use"
+        assert (tool_use["name"], tool_use["input"]) == ("calculator", {"expression": "25 * 4"})
+
+        result = {"role": "user", "content": [{"toolResult": {"toolUseId": tool_use["toolUseId"], "content": []}}]}
+        messages = [prompt, {"role": "assistant", "content": [{"toolUse": tool_use}]}, result]
+        assert plan_reply({"messages": messages, "toolConfig": TOOL_CONFIG}, config)[0] == "text"
+        # ツールがないリクエストはテキストで応答する
+        assert plan_reply({"messages": [prompt]}, config)[0] == "text"
+
+    def test_converse(self):
+        config = FakeBedrockConfig(first_token_ms=0, tokens_per_second=0, output_tokens=3)
+        with FakeBedrockServer(config) as server:
+            _, body = post(server, "/model/us.amazon.nova-lite-v1%3A0/converse",
+                           {"messages": [{"role": "user", "content": [{"text": "hi"}]}]})
+            stats = server.stats()
+        response = json.loads(body)
+        assert response["output"]["message"]["content"] == [{"text": "token0 token1 token2"}]
+        assert response["stopReason"] == "end_turn"
+        assert response["usage"]["outputTokens"] == 3
+        assert stats["models"] == {"us.amazon.nova-lite-v1:0": 1}
+
+    def test_converse_stream_tool_use(self):
+        config = FakeBedrockConfig(first_token_ms=0, tokens_per_second=0, tool_turns=1, tool_name="current_time")
+        with FakeBedrockServer(config) as server:
+            headers, body = post(server, "/model/m/converse-stream", {
+                "messages": [{"role": "user", "content": [{"text": "今何時?"}]}], "toolConfig": TOOL_CONFIG
+            })
+            stats = server.stats()
+        assert headers["Content-Type"] == "application/vnd.amazon.eventstream"
+        events = decode_events(body)
+        assert [name for name, _ in events] == [
+            "messageStart", "contentBlockStart", "contentBlockDelta", "contentBlockStop", "messageStop", "metadata"
+        ]
+        assert events[1][1]["start"]["toolUse"]["name"] == "current_time"
+        assert json.loads(events[2][1]["delta"]["toolUse"]["input"]) == {"timezone": "Asia/Tokyo"}
+        assert events[4][1] == {"stopReason": "tool_use"}
+        assert (stats["streamed"], stats["tool_uses"]) == (1, 1)
+
+    def test_converse_stream_token_rate(self):
+        config = FakeBedrockConfig(first_token_ms=50, tokens_per_second=100, output_tokens=11)
+        with FakeBedrockServer(config) as server:
+            start = time.perf_counter()
+            _, body = post(server, "/model/m/converse-stream", {"messages": []})
+            elapsed = time.perf_counter() - start
+        deltas = [payload["delta"]["text"] for name, payload in decode_events(body) if name == "contentBlockDelta"]
+        assert len(deltas) == 11
+        assert "".join(deltas).split(" ")[-1] == "token10"
+        # 最初のトークンまで50ms、残りの10トークンに100ms
+        assert 0.15 <= elapsed < 1
+
+    def test_throttling(self):
+        with FakeBedrockServer(FakeBedrockConfig(throttle_rate=1.0)) as server:
+            with pytest.raises(urllib.error.HTTPError) as exc_info:
+                post(server, "/model/m/converse", {"messages": []})
+            stats = server.stats()
+        assert exc_info.value.code == 429
+        assert exc_info.value.headers["x-amzn-ErrorType"] == "ThrottlingException"
+        assert stats["throttled"] == 1
+
+
+class TestBenchHandler:
+    """レイテンシの集計のテスト"""
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        assert percentile(values, 50) == 50.5
+        assert percentile(values, 99) == pytest.approx(99.01)
+        assert percentile([5.0], 95) == 5.0
+        assert percentile([], 50) is None
+
+    def test_sample_from_result(self):
+        body = {"status": "completed", "metrics": {"model_calls_ms": [100.0, 50.0], "tool_calls": [{"name": "calculator"}]}}
+        sample = sample_from_result({"statusCode": 200, "body": json.dumps(body)}, 180.0)
+        assert sample == {"latency_ms": 180.0, "model_ms": 150.0, "overhead_ms": 30.0, "status": "completed",
+                          "tool_calls": 1}
+        assert sample_from_result({"statusCode": 500, "body": "{}"}, 10.0)["status"] == "error"
+
+    def test_summarize_excludes_errors(self):
+        samples = [
+            {"latency_ms": 100.0, "model_ms": 80.0, "overhead_ms": 20.0, "status": "completed"},
+            {"latency_ms": 300.0, "model_ms": 250.0, "overhead_ms": 50.0, "status": "timeout"},
+            {"latency_ms": 5.0, "model_ms": 0.0, "overhead_ms": 5.0, "status": "error"},
+        ]
+        summary = summarize_level(samples, 2.0, 4)
+        assert summary["statuses"] == {"completed": 1, "timeout": 1, "error": 1}
+        assert summary["throughput_rps"] == 1.0
+        assert summary["latency_ms"]["p50"] == 200.0
+        assert summary["overhead_ms"]["p99"] == pytest.approx(49.7)
+
+    def test_run_level_with_handler(self):
+        prompts = []
+
+        def handler(event, context):
+            assert context.get_remaining_time_in_millis() > 0
+            body = json.loads(event["body"])
+            prompts.append(body["prompt"])
+            assert body["metrics"] is True
+            time.sleep(0.02)
+            return {"statusCode": 200, "body": json.dumps({"status": "completed", "metrics": {"model_calls_ms": [15.0]}})}
+
+        summary = run_level(handler, concurrency=4, requests=8, prompts=["a", "b"])
+        assert summary["requests"] == 8
+        assert sorted(prompts) == ["a"] * 4 + ["b"] * 4
+        assert summary["model_ms"]["p50"] == 15.0
+        assert summary["overhead_ms"]["p50"] >= 5
+        # 4並列で8件（1件20ms）は逐次実行の160msより速い
+        assert summary["elapsed_s"] < 0.15
+
+    def test_make_event(self):
+        event = make_event("こんにちは", "us.amazon.nova-micro-v1:0")
+        assert event["requestContext"]["http"]["method"] == "POST"
+        assert json.loads(event["body"])["model_config"] == {"model": "us.amazon.nova-micro-v1:0"}
@@ -0,0 +1,91 @@
+"""
+Layerビルドの最適化処理（不要ファイルの削除、パッケージの削減、事前コンパイル）のテスト
+"""
+import importlib.util
+import json
+import sys
+import os
+
+# プロジェクトルートのパスを追加
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import build_layer
+
+
+def _write(path, content=""):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+def test_strip_unused_files_keeps_python_packages(tmp_path):
+    root = str(tmp_path)
+    _write(os.path.join(root, "pkg", "__init__.py"))
+    _write(os.path.join(root, "pkg", "__init__.pyi"))
+    _write(os.path.join(root, "pkg", "docs", "index.html"))
+    _write(os.path.join(root, "pkg", "locale", "ja", "messages.mo"))
+    _write(os.path.join(root, "botocore", "docs", "__init__.py"))
+    _write(os.path.join(root, "pkg-1.0.dist-info", "METADATA"))
+
+    assert build_layer.strip_unused_files(root) == 3
+    assert os.path.exists(os.path.join(root, "pkg", "__init__.py"))
+    assert not os.path.exists(os.path.join(root, "pkg", "docs"))
+    assert not os.path.exists(os.path.join(root, "pkg", "locale"))
+    assert os.path.exists(os.path.join(root, "botocore", "docs", "__init__.py"))
+
+
+def test_prune_unused_packages_removes_metadata(tmp_path):
+    root = str(tmp_path)
+    _write(os.path.join(root, "used", "__init__.py"))
+    _write(os.path.join(root, "unused", "__init__.py"))
+    _write(os.path.join(root, "single.py"))
+    _write(os.path.join(root, "bin", "tool"))
+    _write(os.path.join(root, "unused-1.0.dist-info", "RECORD"), "unused/__init__.py,sha256=x,1\n../../bin/tool,,\n")
+    _write(os.path.join(root, "used-1.0.dist-info", "RECORD"), "used/__init__.py,sha256=x,1\n")
+
+    removed = build_layer.prune_unused_packages(root, imported={"used"}, keep=set())
+
+    assert removed == ["bin", "single.py", "unused"]
+    assert sorted(os.listdir(root)) == ["used", "used-1.0.dist-info"]
+
+
+def test_prune_skipped_when_trace_fails(tmp_path, monkeypatch, capsys):
+    """クロスアーキテクチャのビルドなどでトレースに失敗しても、削除をスキップしてビルドを続ける"""
+    layer_dir = str(tmp_path / "layer")
+
+    def fake_install(command):
+        _write(os.path.join(layer_dir, "python", "strands_tools", "__init__.py"))
+
+    def fail_trace(python, python_dir):
+        raise RuntimeError("Exec format error")
+
+    monkeypatch.setattr(build_layer.subprocess, "check_call", fake_install)
+    monkeypatch.setattr(build_layer, "trace_imports", fail_trace)
+
+    build_layer.build_layer(layer_dir=layer_dir, python_version=f"{sys.version_info.major}.{sys.version_info.minor}",
+                            prune_unused=True)
+
+    assert "パッケージの削除をスキップします" in capsys.readouterr().out
+    assert os.path.exists(os.path.join(layer_dir, "python", "strands_tools", "__init__.py"))
+    # シンセサイズ時にランタイムと照合するため、ビルドしたPythonバージョンを記録する
+    with open(os.path.join(layer_dir, build_layer.LAYER_METADATA), encoding="utf-8") as f:
+        assert json.load(f)["python_version"] == f"{sys.version_info.major}.{sys.version_info.minor}"
+
+
+def test_tool_runtime_packages_are_kept():
+    keep = set(build_layer.DEFAULT_KEEP) | set(build_layer.TOOL_RUNTIME_KEEP)
+    # http_request・use_aws・calculatorが実行時にだけインポートするパッケージ
+    assert {"strands_tools", "requests", "markdownify", "bs4", "sympy", "mpmath", "jmespath"} <= keep
+
+
+def test_compile_bytecode_writes_unchecked_hash_pycs(tmp_path):
+    root = str(tmp_path)
+    _write(os.path.join(root, "pkg", "__init__.py"), "VALUE = 1\n")
+
+    build_layer.compile_bytecode(sys.executable, root, [0])
+
+    pyc = importlib.util.cache_from_source(os.path.join(root, "pkg", "__init__.py"))
+    with open(pyc, "rb") as f:
+        header = f.read(8)
+    # フラグ: bit0=ハッシュ形式, bit1=ソースを検証する（unchecked-hashでは0）
+    assert int.from_bytes(header[4:8], "little") == 0b01
@@ -0,0 +1,221 @@
+"""
+ウォームコンテナ間で共有する接続プールのテスト
+"""
+import socket
+import sys
+import os
+import types
+from unittest.mock import Mock, patch
+
+import pytest
+
+# Lambda関数のパスを追加
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+
+from connections import ConnectionManager, keepalive_socket_options, pool_counts
+
+
+class FakePoolManager:
+    """urllib3のPoolManagerと同じ属性を持つ接続プールの集合"""
+
+    def __init__(self, *counts):
+        self.pools = {f"host{i}": Mock(num_connections=c, num_requests=r) for i, (c, r) in enumerate(counts)}
+        self.connection_pool_kw = {}
+
+    def clear(self):
+        self.pools.clear()
+
+
+DEFAULT_ACCESS_KEY = "AKIADEFAULT"
+
+
+def _bedrock_client(region="us-east-1", counts=(), access_key=DEFAULT_ACCESS_KEY):
+    client = Mock()
+    client._request_signer._credentials = Mock(access_key=access_key)
+    client.meta.service_model.service_name = "bedrock-runtime"
+    client.meta.region_name = region
+    client.meta.endpoint_url = f"https://bedrock-runtime.{region}.amazonaws.com"
+    client._endpoint.http_session._manager = FakePoolManager(*counts)
+    client._endpoint.http_session.close.side_effect = client._endpoint.http_session._manager.clear
+    return client
+
+
+class FakeConfig:
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.__dict__.update(kwargs)
+
+    def merge(self, other):
+        return FakeConfig(**{**self.kwargs, **other.kwargs})
+
+
+@pytest.fixture
+def botocore_config():
+    module = types.ModuleType("botocore.config")
+    module.Config = FakeConfig
+    with patch.dict(sys.modules, {"botocore": types.ModuleType("botocore"), "botocore.config": module}):
+        yield
+
+
+@pytest.fixture
+def manager(botocore_config):
+    session = Mock()
+    session.client.side_effect = lambda service, region_name, endpoint_url, config: _bedrock_client(region_name)
+    session.get_credentials.return_value = Mock(access_key=DEFAULT_ACCESS_KEY)
+    return ConnectionManager(max_pool_connections=32, session_factory=lambda: session)
+
+
+class TestBedrockClient:
+    """共有のBedrockクライアントのテスト"""
+
+    def test_models_share_one_client_per_region(self, manager):
+        models = [Mock(client=_bedrock_client()), Mock(client=_bedrock_client()), Mock(client=_bedrock_client("eu-west-1"))]
+        for model in models:
+            model.client.meta.config = FakeConfig(user_agent_extra="strands-agents", read_timeout=120)
+
+        assert [manager.attach(model) for model in models] == [True, True, True]
+        assert models[0].client is models[1].client
+        assert models[0].client is not models[2].client
+        assert len(manager.clients()) == 2
+
+        # 既に共有クライアントを使っているモデルはそのまま
+        assert manager.attach(models[0]) is False
+
+        _, kwargs = manager._session.client.call_args_list[0]
+        assert kwargs["config"].kwargs == {
+            "user_agent_extra": "strands-agents",
+            "read_timeout": 120,
+            "max_pool_connections": 32,
+            "tcp_keepalive": True,
+        }
+
+    def test_different_client_config_is_not_shared(self, manager):
+        """タイムアウトやリトライが異なるモデルは別のクライアントを使う"""
+        models = [Mock(client=_bedrock_client()) for _ in range(3)]
+        models[0].client.meta.config = FakeConfig(read_timeout=120, retries={"max_attempts": 3})
+        models[1].client.meta.config = FakeConfig(read_timeout=30, retries={"max_attempts": 3})
+        models[2].client.meta.config = FakeConfig(read_timeout=120, retries={"max_attempts": 3})
+
+        for model in models:
+            manager.attach(model)
+        assert models[0].client is models[2].client
+        assert models[0].client is not models[1].client
+        assert len(manager.clients()) == 2
+
+    def test_client_from_other_session_keeps_its_credentials(self, manager):
+        """boto_sessionで別の認証情報を指定したモデルは既定の認証情報に切り替えない"""
+        model = Mock(client=_bedrock_client(access_key="AKIAOTHERPROFILE"))
+        client = model.client
+
+        assert manager.attach(model) is False
+        assert model.client is client
+        assert manager.clients() == []
+
+    def test_other_clients_are_left_alone(self, manager):
+        model = Mock()
+        model.client.meta.service_model.service_name = "s3"
+        client = model.client
+        assert manager.attach(model) is False
+        assert model.client is client
+        assert manager.attach(None) is False
+
+        disabled = ConnectionManager(enabled=False)
+        model = Mock(client=_bedrock_client())
+        assert disabled.attach(model) is False
+
+
+class TestReuseMetrics:
+    """接続の再利用数の集計のテスト"""
+
+    def test_pool_counts(self):
+        assert pool_counts(FakePoolManager((1, 5), (2, 2))) == (3, 7)
+        assert pool_counts(None) == (0, 0)
+
+    def test_stats_survive_reset(self):
+        manager = ConnectionManager()
+        client = _bedrock_client(counts=[(2, 10)])
+        manager._clients[("us-east-1", "", ())] = client
+
+        stats = manager.stats()
+        assert stats["bedrock"] == {"connections": 2, "requests": 10, "reused": 8, "reuse_rate": 0.8}
+        assert stats["http"]["requests"] == 0
+
+        assert manager.reset() == 1
+        client._endpoint.http_session._manager.pools["host0"] = Mock(num_connections=1, num_requests=3)
+        assert manager.stats()["bedrock"] == {"connections": 3, "requests": 13, "reused": 10, "reuse_rate": 0.769}
+
+
+class TestIdleHealthCheck:
+    """アイドル後の接続の張り直しのテスト"""
+
+    def test_resets_only_after_idle_period(self):
+        manager = ConnectionManager(idle_reset_seconds=300)
+        client = _bedrock_client(counts=[(1, 1)])
+        manager._clients[("us-east-1", "", ())] = client
+        close = client._endpoint.http_session.close
+
+        assert manager.check_idle(now=0) is False
+        manager.mark_used(now=10)
+        assert manager.check_idle(now=200) is False
+        manager.mark_used(now=210)
+        assert manager.check_idle(now=600) is True
+        close.assert_called_once()
+        assert manager.stats()["idle_resets"] == 1
+
+    def test_disabled_with_zero_threshold(self):
+        manager = ConnectionManager(idle_reset_seconds=0)
+        manager.check_idle(now=0)
+        assert manager.check_idle(now=10000) is False
+
+
+class TestHttpSessions:
+    """http_requestのセッションのテスト"""
+
+    def _module(self):
+        module = types.SimpleNamespace(SESSION_CACHE={})
+
+        def create_session(config):
+            adapter = Mock(poolmanager=FakePoolManager())
+            return Mock(config=config, adapters={"http://": adapter, "https://": adapter})
+
+        module.create_session = create_session
+        return module
+
+    def test_sessions_get_keepalive_and_pool_size(self):
+        module = self._module()
+        manager = ConnectionManager(http_pool_size=20)
+        assert manager.configure_http_sessions(module) is True
+
+        session = module.create_session({})
+        assert session.config == {"pool_size": 20}
+        poolmanager = session.adapters["https://"].poolmanager
+        assert poolmanager.connection_pool_kw["socket_options"] == keepalive_socket_options()
+        assert module.create_session({"pool_size": 5}).config == {"pool_size": 5}
+
+        # 2回目は包み直さない
+        assert manager.configure_http_sessions(module) is False
+
+    def test_counts_cached_sessions(self):
+        module = self._module()
+        manager = ConnectionManager()
+        manager.configure_http_sessions(module)
+        session = module.create_session({})
+        session.adapters["https://"].poolmanager.pools["api"] = Mock(num_connections=1, num_requests=4)
+        module.SESSION_CACHE["api.example.com"] = session
+
+        stats = manager.stats()
+        assert stats["http"]["reused"] == 3
+        assert stats["http_sessions"] == 1
+
+        assert manager.reset() == 1
+        session.close.assert_called_once()
+
+    def test_skips_non_module_tools(self):
+        assert ConnectionManager().configure_http_sessions(lambda url: None) is False
+
+
+def test_keepalive_socket_options():
+    options = keepalive_socket_options()
+    assert (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1) in options
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        assert (socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 60) in options
@@ -0,0 +1,186 @@
+"""
+カスタムツールのテスト
+"""
+import base64
+import hashlib
+import json
+import importlib
+import sys
+import os
+from unittest.mock import Mock
+
+import pytest
+
+# Lambda関数のパスを追加
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+
+sys.modules.setdefault('strands', Mock())
+
+from custom_tools import TextStats, analyze_text_chunks
+
+
+@pytest.fixture
+def tools(monkeypatch):
+    """@toolを素通しにしてカスタムツールを直接呼び出せるようにする"""
+    strands = Mock()
+    strands.tool = lambda func: func
+    monkeypatch.setitem(sys.modules, 'strands', strands)
+    import custom_tools
+    return importlib.reload(custom_tools)
+
+
+def reference_text_stats(text):
+    """以前の実装（文字種別ごとに走査）による統計情報"""
+    char_count = len(text)
+    word_count = len(text.split())
+    return {
+        "総文字数": char_count,
+        "単語数": word_count,
+        "行数": text.count('\n') + 1 if text else 0,
+        "文字種別": {
+            "大文字": sum(1 for c in text if c.isupper()),
+            "小文字": sum(1 for c in text if c.islower()),
+            "数字": sum(1 for c in text if c.isdigit()),
+            "空白文字": sum(1 for c in text if c.isspace()),
+            "ひらがな": sum(1 for c in text if '぀' <= c <= 'ゟ'),
+            "カタカナ": sum(1 for c in text if '゠' <= c <= 'ヿ'),
+            "漢字": sum(1 for c in text if '一' <= c <= '鿿'),
+        },
+        "平均単語長": round(char_count / word_count, 2) if word_count > 0 else 0
+    }
+
+
+SAMPLES = [
+    "",
+    "Hello World 123",
+    "こんにちは、世界！カタカナとひらがなと漢字。\nSecond LINE\t42",
+    "   leading and trailing   \n\n",
+    "ＡＢＣ　全角スペースと①②③",
+]
+
+
+class TestTextStats:
+    @pytest.mark.parametrize("text", SAMPLES)
+    def test_matches_reference_implementation(self, text):
+        assert TextStats().update(text).to_dict() == reference_text_stats(text)
+    
+    @pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64])
+    def test_chunked_matches_single_pass(self, chunk_size):
+        text = "".join(SAMPLES) * 3
+        chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+        assert analyze_text_chunks(chunks) == reference_text_stats(text)
+    
+    def test_word_split_across_chunks_counted_once(self):
+        assert analyze_text_chunks(["hel", "lo wor", "ld"])["単語数"] == 2
+
+
+class TestGenerateHash:
+    """generate_hashのテスト"""
+    
+    def test_text_matches_hashlib(self, tools):
+        result = tools.generate_hash("Hello World")
+        assert result == {
+            "algorithm": "sha256",
+            "hash": hashlib.sha256(b"Hello World").hexdigest(),
+            "original_length": 11
+        }
+    
+    def test_chunked_text_matches_one_shot(self, tools, monkeypatch):
+        monkeypatch.setattr(tools.config, "HASH_CHUNK_SIZE", 3)
+        text = "こんにちは世界、Hello!" * 10
+        assert tools.generate_hash(text, "md5")["hash"] == hashlib.md5(text.encode()).hexdigest()
+    
+    def test_multiple_algorithms_in_one_pass(self, tools, monkeypatch):
+        monkeypatch.setattr(tools.config, "HASH_CHUNK_SIZE", 4)
+        data = b"x" * 1000
+        result = tools.generate_hash(data.decode(), algorithms=["sha256", "md5", "sha512"])
+        assert result["hashes"] == {
+            "sha256": hashlib.sha256(data).hexdigest(),
+            "md5": hashlib.md5(data).hexdigest(),
+            "sha512": hashlib.sha512(data).hexdigest(),
+        }
+        assert result["original_length"] == 1000
+    
+    def test_base64_source(self, tools, monkeypatch):
+        monkeypatch.setattr(tools.config, "HASH_CHUNK_SIZE", 5)
+        data = bytes(range(256)) * 3
+        encoded = base64.b64encode(data).decode()
+        result = tools.generate_hash(encoded, source="base64")
+        assert result["hash"] == hashlib.sha256(data).hexdigest()
+        assert result["original_length"] == len(data)
+    
+    def test_file_source(self, tools, monkeypatch, tmp_path):
+        monkeypatch.setattr(tools.config, "HASH_FILE_ALLOWED_DIRS", [str(tmp_path)])
+        path = tmp_path / "data.bin"
+        path.write_bytes(b"file contents" * 100)
+        
+        single = tools.generate_hash(str(path), "sha1", source="file")
+        multi = tools.generate_hash(str(path), source="file", algorithms=["sha1", "sha256"])
+        
+        assert single["hash"] == hashlib.sha1(path.read_bytes()).hexdigest()
+        assert multi["hashes"]["sha1"] == single["hash"]
+        assert single["original_length"] == 1300
+    
+    def test_file_outside_allowed_dirs_is_rejected(self, tools, monkeypatch, tmp_path):
+        monkeypatch.setattr(tools.config, "HASH_FILE_ALLOWED_DIRS", [str(tmp_path / "allowed")])
+        path = tmp_path / "secret.txt"
+        path.write_text("secret")
+        assert "error" in tools.generate_hash(str(path), source="file")
+    
+    def test_s3_source_streams_body(self, tools, monkeypatch):
+        monkeypatch.setattr(tools.config, "HASH_S3_ALLOWED_PREFIXES", ["bucket/path/"])
+        body = Mock()
+        body.iter_chunks.return_value = iter([b"abc", b"def"])
+        boto3 = Mock()
+        boto3.client.return_value.get_object.return_value = {"Body": body}
+        monkeypatch.setitem(sys.modules, 'boto3', boto3)
+        
+        result = tools.generate_hash("s3://bucket/path/to/key", source="s3")
+        
+        boto3.client.return_value.get_object.assert_called_once_with(Bucket="bucket", Key="path/to/key")
+        assert result["hash"] == hashlib.sha256(b"abcdef").hexdigest()
+        body.close.assert_called_once()
+    
+    @pytest.mark.parametrize("allowed, uri", [
+        ([], "s3://bucket/path/to/key"),
+        (["bucket/path/"], "s3://bucket/other/key"),
+        (["bucket"], "s3://bucket-other/key"),
+        ([""], "s3://bucket/key"),
+    ])
+    def test_s3_outside_allowed_prefixes_is_rejected(self, tools, monkeypatch, allowed, uri):
+        monkeypatch.setattr(tools.config, "HASH_S3_ALLOWED_PREFIXES", allowed)
+        boto3 = Mock()
+        monkeypatch.setitem(sys.modules, 'boto3', boto3)
+        result = tools.generate_hash(uri, source="s3")
+        assert "許可されていないS3の場所" in result["error"]
+        boto3.client.assert_not_called()
+    
+    def test_unsupported_algorithm_and_source(self, tools):
+        assert "error" in tools.generate_hash("x", "sha3_256")
+        assert "error" in tools.generate_hash("x", source="ftp")
+
+
+class TestJsonFormatter:
+    def test_matches_stdlib_output(self, tools):
+        text = '{"b": [1, 2.5, 1e-05], "a": {"名前": "テスト"}}'
+        for indent in (2, 4):
+            expected = json.dumps(json.loads(text), indent=indent, ensure_ascii=False, sort_keys=True)
+            assert tools.json_formatter(text, indent=indent) == expected
+
+    def test_large_document_is_streamed_identically(self, tools, monkeypatch):
+        text = json.dumps({f"key{i}": {"values": list(range(5))} for i in range(200)})
+        monkeypatch.setattr(tools.config, "JSON_STREAMING_THRESHOLD", 100)
+        expected = json.dumps(json.loads(text), indent=2, ensure_ascii=False, sort_keys=True)
+        assert tools.json_formatter(text) == expected
+
+    def test_large_document_is_truncated_at_limit(self, tools, monkeypatch):
+        text = json.dumps([{"i": i} for i in range(1000)])
+        monkeypatch.setattr(tools.config, "JSON_STREAMING_THRESHOLD", 100)
+        monkeypatch.setattr(tools.config, "MAX_RESPONSE_SIZE", 500)
+        result = tools.json_formatter(text)
+        assert result.startswith('[\n  {\n    "i": 0\n  }')
+        assert "省略しました" in result
+        assert len(result) < 600
+
+    def test_invalid_json(self, tools):
+        assert tools.json_formatter('{"a": }').startswith("JSON解析エラー: Expecting value")
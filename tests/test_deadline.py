@@ -0,0 +1,156 @@
+"""
+締め切り管理のテスト
+"""
+import asyncio
+import sys
+import os
+import time
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+import pytest
+
+# Lambda関数のパスを追加
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+
+from deadline import (
+    Deadline, DeadlineHook, aws_client_timeouts, install_aws_client_timeouts, run_with_deadline
+)
+
+
+class TestDeadline:
+    def test_from_context_subtracts_margin(self, lambda_context):
+        deadline = Deadline.from_context(lambda_context, safety_margin_ms=100000)
+        assert 199 < deadline.remaining() <= 200
+    
+    def test_without_context_is_unbounded(self):
+        deadline = Deadline.from_context(None)
+        assert deadline.remaining() is None
+        assert not deadline.expired
+        assert deadline.clamp(30) == 30
+    
+    def test_clamp_and_expired(self):
+        assert Deadline(5).clamp(30) <= 5
+        assert Deadline(0).expired
+
+
+class TestDeadlineHook:
+    def _event(self, name, tool_input, deadline):
+        return Mock(
+            tool_use={"toolUseId": "t1", "name": name, "input": tool_input},
+            invocation_state={"deadline": deadline},
+            cancel_tool=False
+        )
+    
+    def test_http_request_timeout_is_clamped(self):
+        event = self._event("http_request", {"url": "https://example.com", "timeout": 60}, Deadline(2))
+        DeadlineHook(default_tool_timeout=30).before_tool_call(event)
+        assert event.tool_use["input"]["timeout"] <= 2
+    
+    def test_http_request_gets_default_timeout(self):
+        event = self._event("http_request", {"url": "https://example.com"}, None)
+        DeadlineHook(default_tool_timeout=30).before_tool_call(event)
+        assert event.tool_use["input"]["timeout"] == 30
+    
+    @pytest.mark.parametrize("timeout", ["30s", None, {"seconds": 5}, [], float("nan"), float("inf"), -5, 0, True])
+    def test_invalid_http_request_timeout_uses_default(self, timeout):
+        """モデルが不正なtimeoutを指定してもフックは例外を出さず既定値を使う"""
+        event = self._event("http_request", {"url": "https://example.com", "timeout": timeout}, None)
+        DeadlineHook(default_tool_timeout=30).before_tool_call(event)
+        assert event.tool_use["input"]["timeout"] == 30
+    
+    def test_numeric_string_timeout_is_accepted(self):
+        event = self._event("http_request", {"url": "https://example.com", "timeout": "10"}, Deadline(60))
+        DeadlineHook(default_tool_timeout=30).before_tool_call(event)
+        assert event.tool_use["input"]["timeout"] == 10
+    
+    def test_expired_deadline_cancels_tool(self):
+        event = self._event("use_aws", {"service_name": "s3"}, Deadline(0))
+        DeadlineHook().before_tool_call(event)
+        assert event.cancel_tool
+        # ツールの結果を受け取った後にイベントループを終了する
+        assert event.invocation_state["request_state"]["stop_event_loop"] is True
+    
+    def test_expired_deadline_cancels_model_call(self):
+        event = SimpleNamespace(invocation_state={"deadline": Deadline(0), "request_state": {}}, cancel=False)
+        DeadlineHook().before_model_call(event)
+        assert event.cancel
+        assert event.invocation_state["request_state"]["stop_event_loop"] is True
+    
+    def test_model_call_within_deadline_continues(self):
+        event = SimpleNamespace(invocation_state={"deadline": Deadline(5)}, cancel=False)
+        DeadlineHook().before_model_call(event)
+        assert event.cancel is False
+        assert "request_state" not in event.invocation_state
+    
+    def test_model_call_event_without_invocation_state(self):
+        """invocation_stateのないstrandsのイベントでは何もしない"""
+        event = SimpleNamespace()
+        DeadlineHook().before_model_call(event)
+        assert vars(event) == {}
+
+
+class TestRunWithDeadline:
+    def test_completes_within_deadline(self):
+        assert run_with_deadline(lambda: 42, Deadline(5)) == (True, 42)
+    
+    def test_times_out(self):
+        completed, result = run_with_deadline(lambda: time.sleep(1), Deadline(0.05))
+        assert completed is False
+    
+    def test_propagates_exceptions(self):
+        def fail():
+            raise ValueError("boom")
+        with pytest.raises(ValueError):
+            run_with_deadline(fail, Deadline(5))
+
+
+class TestAwsClientTimeouts:
+    """use_awsのクライアントのタイムアウトのテスト"""
+    
+    def test_timeouts_fit_remaining_time(self):
+        settings = aws_client_timeouts(Deadline(2), default_timeout=30)
+        assert 1 < settings["read_timeout"] <= 2
+        assert settings["connect_timeout"] <= settings["read_timeout"]
+        assert settings["retries"] == {"total_max_attempts": 1}
+        assert aws_client_timeouts(Deadline(None)) is None
+        assert aws_client_timeouts(None) is None
+    
+    def test_use_aws_client_uses_tool_deadline(self):
+        original = Mock(return_value="default-client")
+        module = SimpleNamespace(get_boto3_client=original)
+        assert install_aws_client_timeouts(module, default_timeout=30)
+        # 2回目は置き換えない
+        wrapped = module.get_boto3_client
+        assert install_aws_client_timeouts(module)
+        assert module.get_boto3_client is wrapped
+        
+        # 締め切りのない呼び出しは元の関数でクライアントを生成する
+        assert module.get_boto3_client("s3", "us-east-1") == "default-client"
+        
+        session = Mock()
+        boto3 = SimpleNamespace(Session=Mock(return_value=session))
+        botocore_config = SimpleNamespace(Config=lambda **kwargs: kwargs)
+        event = Mock(
+            tool_use={"toolUseId": "t1", "name": "use_aws", "input": {}},
+            invocation_state={"deadline": Deadline(3)},
+            cancel_tool=False
+        )
+        
+        async def call_tool():
+            # strandsと同様に、フックを実行したタスクからasyncio.to_threadでツールを実行する
+            DeadlineHook().before_tool_call(event)
+            return await asyncio.to_thread(module.get_boto3_client, "s3", "us-east-1", "dev")
+        
+        with patch.dict(sys.modules, {"boto3": boto3, "botocore": SimpleNamespace(), "botocore.config": botocore_config}):
+            asyncio.run(call_tool())
+        
+        boto3.Session.assert_called_once_with(profile_name="dev")
+        kwargs = session.client.call_args[1]
+        assert (kwargs["service_name"], kwargs["region_name"]) == ("s3", "us-east-1")
+        assert 2 < kwargs["config"]["read_timeout"] <= 3
+        assert kwargs["config"]["user_agent_extra"] == "strands-agents-use-aws"
+        original.assert_called_once()
+    
+    def test_missing_client_factory_is_reported(self):
+        assert install_aws_client_timeouts(SimpleNamespace()) is False
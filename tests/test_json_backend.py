@@ -0,0 +1,109 @@
+"""
+JSONバックエンドのテスト
+
+整形結果が標準ライブラリ（ensure_ascii=False）の出力とバイト単位で一致することを確認する
+"""
+import json
+import random
+import sys
+import os
+from datetime import datetime
+
+import pytest
+
+# Lambda関数のパスを追加
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+
+import json_backend
+from config import config
+
+
+DOCUMENTS = [
+    '{}',
+    '[]',
+    '"単独の文字列"',
+    '42',
+    'null',
+    '{"b": 1, "a": {"z": [], "y": {}}, "c": [true, false, null]}',
+    '{"日本語": "こんにちは", "emoji": "\U0001f600", "control": "\\u0001\\n\\t\\"\\\\", "sep": " "}',
+    '{"floats": [0.1, -0.0, 1.5, 1e-05, 5.2e-05, 0.0001, 1e16, 1e+22, 123456789.123, 5e-324]}',
+    '{"ints": [0, -1, 9223372036854775807, -9223372036854775809, 123456789012345678901234567890]}',
+    '{"special": [NaN, Infinity, -Infinity]}',
+    '{"dup": 1, "other": 2, "dup": 3}',
+    '[{"nested": [[1, 2], {"deep": [{"x": "y"}]}]}, "tail"]',
+]
+
+INDENTS = [2, 4, 0, 1, 3]
+
+
+def stdlib_pretty(text, indent, sort_keys):
+    return json.dumps(json.loads(text), indent=indent, ensure_ascii=False, sort_keys=sort_keys)
+
+
+@pytest.fixture(params=["auto", "json"])
+def backend(request, monkeypatch):
+    monkeypatch.setattr(config, "JSON_BACKEND", request.param)
+    return request.param
+
+
+class TestPretty:
+    @pytest.mark.parametrize("text", DOCUMENTS)
+    @pytest.mark.parametrize("indent", INDENTS)
+    @pytest.mark.parametrize("sort_keys", [True, False])
+    def test_matches_stdlib(self, backend, text, indent, sort_keys):
+        expected = stdlib_pretty(text, indent, sort_keys)
+        assert json_backend.pretty(text, indent=indent, sort_keys=sort_keys) == expected
+        assert "".join(json_backend.iter_pretty(text, indent=indent, sort_keys=sort_keys)) == expected
+
+    def test_random_floats_match_stdlib(self, backend):
+        rng = random.Random(0)
+        values = [rng.uniform(-1, 1) * 10 ** rng.randint(-8, 20) for _ in range(2000)]
+        text = json.dumps({"values": values})
+        assert json_backend.pretty(text, indent=2, sort_keys=True) == stdlib_pretty(text, 2, True)
+
+    def test_indent_none_matches_stdlib(self, backend):
+        text = DOCUMENTS[5]
+        assert json_backend.pretty(text, indent=None) == stdlib_pretty(text, None, False)
+
+    def test_iter_pretty_yields_top_level_items(self, backend):
+        text = json.dumps([{"i": i} for i in range(10)])
+        chunks = list(json_backend.iter_pretty(text, indent=2))
+        assert len(chunks) == 12  # 開き括弧 + 要素 + 閉じ括弧
+
+    def test_decode_error_matches_stdlib(self, backend):
+        with pytest.raises(json.JSONDecodeError) as excinfo:
+            json_backend.pretty('{"a": }')
+        with pytest.raises(json.JSONDecodeError) as expected:
+            json.loads('{"a": }')
+        assert str(excinfo.value) == str(expected.value)
+
+
+class TestDumps:
+    def test_default_matches_stdlib(self, backend):
+        body = {"success": True, "response": "応答", "tool_calls": [{"name": "calculator"}]}
+        assert json_backend.dumps(body) == json.dumps(body, ensure_ascii=False)
+
+    def test_compact_round_trips(self, backend):
+        body = {"success": True, "response": "応答", 1: [1.5, None]}
+        compact = json_backend.dumps(body, compact=True)
+        assert " " not in compact
+        assert json.loads(compact) == {"success": True, "response": "応答", "1": [1.5, None]}
+
+    def test_compact_default_handles_unserializable(self, backend):
+        payload = {"at": datetime(2024, 1, 2, 3, 4, 5), "big": 2 ** 70}
+        assert json.loads(json_backend.dumps(payload, compact=True, default=str)) == {
+            "at": "2024-01-02 03:04:05",
+            "big": 2 ** 70,
+        }
+
+    def test_loads_matches_stdlib(self, backend):
+        for text in DOCUMENTS:
+            loaded = json_backend.loads(text)
+            assert json.dumps(loaded) == json.dumps(json.loads(text))
+
+
+def test_backend_name(monkeypatch):
+    monkeypatch.setattr(config, "JSON_BACKEND", "json")
+    assert json_backend.backend_name() == "json"
+    monkeypatch.setattr(config, "JSON_BACKEND", "auto")
+    assert json_backend.backend_name() == ("orjson" if json_backend.orjson else "json")
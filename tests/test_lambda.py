@@ -6,6 +6,7 @@ Lambda関数の統合テスト
 import json
 import sys
 import os
+import threading
 import pytest
 from unittest.mock import Mock, patch
 
@@ -19,6 +20,8 @@ mock_bedrock_response.model = 'us.amazon.nova-pro-v1:0'
 # strandsモジュールをモック
 sys.modules['strands'] = Mock()
 sys.modules['strands.models'] = Mock()
+sys.modules['strands.agent'] = Mock()
+sys.modules['strands.agent.conversation_manager'] = Mock()
 sys.modules['strands_tools'] = Mock()
 
 # モックツールを作成
@@ -50,23 +53,33 @@ def mock_generate_hash(text, algorithm="sha256"):
         "original_length": len(text)
     }
 
+def mock_use_aws(service, action, **kwargs):
+    """Use AWSツールのモック"""
+    return {"service": service, "action": action}
+
 # モックを設定
+sys.modules['strands_tools'].use_aws = mock_use_aws
 sys.modules['strands_tools'].calculator = mock_calculator
 sys.modules['strands_tools'].current_time = mock_current_time
 sys.modules['strands_tools'].http_request = mock_http_request
 
+import lambda_function
 from lambda_function import lambda_handler
 
 
 class TestLambdaFunction:
     """モックを使用したLambda関数のテスト"""
     
+    def setup_method(self):
+        """テスト間でプール済みのAgentを共有しない"""
+        lambda_function.agent_pool.clear()
+    
     @patch('lambda_function.Agent')
     def test_basic_calculation(self, mock_agent):
         """基本的な計算テスト"""
         # エージェントのレスポンスをモック
         mock_agent_instance = Mock()
-        mock_agent_instance.__call__.return_value = "計算結果: 25 * 4 = 100"
+        mock_agent_instance.return_value = "計算結果: 25 * 4 = 100"
         mock_agent.return_value = mock_agent_instance
         
         event = {
@@ -86,7 +99,7 @@ class TestLambdaFunction:
     def test_current_time(self, mock_agent):
         """現在時刻取得テスト"""
         mock_agent_instance = Mock()
-        mock_agent_instance.__call__.return_value = "現在の時刻はUTCで2024-06-16T10:00:00Zです。"
+        mock_agent_instance.return_value = "現在の時刻はUTCで2024-06-16T10:00:00Zです。"
         mock_agent.return_value = mock_agent_instance
         
         event = {
@@ -134,7 +147,7 @@ class TestLambdaFunction:
     def test_model_config(self, mock_agent):
         """モデル設定のテスト"""
         mock_agent_instance = Mock()
-        mock_agent_instance.__call__.return_value = "テストレスポンス"
+        mock_agent_instance.return_value = "テストレスポンス"
         mock_agent_instance.model = mock_bedrock_response
         mock_agent.return_value = mock_agent_instance
         
@@ -156,6 +169,728 @@ class TestLambdaFunction:
         call_kwargs = mock_agent.call_args[1]
         assert call_kwargs["model"] == "us.anthropic.claude-3-5-sonnet-20241022-v2:0"
         assert call_kwargs["temperature"] == 0.5
+    
+    @patch('lambda_function.Agent')
+    def test_agent_reused_across_invocations(self, mock_agent):
+        """ウォーム呼び出しでAgentが再利用され、会話状態がリセットされること"""
+        mock_agent_instance = Mock()
+        mock_agent_instance.return_value = "応答"
+        mock_agent_instance.messages = []
+        mock_agent.return_value = mock_agent_instance
+        
+        def remember(prompt, **kwargs):
+            mock_agent_instance.messages.append(prompt)
+            return "応答"
+        mock_agent_instance.side_effect = remember
+        
+        event = {"body": json.dumps({"prompt": "こんにちは"})}
+        
+        assert lambda_handler(event, None)["statusCode"] == 200
+        assert lambda_handler(event, None)["statusCode"] == 200
+        
+        mock_agent.assert_called_once()
+        assert mock_agent_instance.messages == []
+    
+    @patch('lambda_function.Agent')
+    def test_agent_not_shared_between_model_configs(self, mock_agent):
+        """異なるmodel_configでは別のAgentが構築されること"""
+        mock_agent.return_value = Mock(return_value="応答")
+        
+        for temperature in (0.1, 0.9):
+            event = {
+                "body": json.dumps({
+                    "prompt": "テスト",
+                    "model_config": {"temperature": temperature}
+                })
+            }
+            assert lambda_handler(event, None)["statusCode"] == 200
+        
+        assert mock_agent.call_count == 2
+    
+    @patch('lambda_function.Agent')
+    def test_structured_events_in_response(self, mock_agent):
+        """コールバックで収集したテキストとツール呼び出しがレスポンスに含まれること"""
+        mock_agent_instance = Mock()
+        
+        def run(prompt, **kwargs):
+            handler = mock_agent_instance.callback_handler
+            handler(event={"contentBlockStart": {"start": {"toolUse": {"toolUseId": "t1", "name": "calculator"}}}})
+            handler(message={"role": "user", "content": [{"toolResult": {"toolUseId": "t1", "status": "success"}}]})
+            handler(data="25 * 4 = ")
+            handler(data="100")
+            return "100"
+        mock_agent_instance.side_effect = run
+        mock_agent.return_value = mock_agent_instance
+        
+        event = {"body": json.dumps({"prompt": "25 * 4 の計算をお願いします。"})}
+        body = json.loads(lambda_handler(event, None)["body"])
+        
+        assert body["response"] == "25 * 4 = 100"
+        assert body["tool_calls"] == [{"tool_use_id": "t1", "name": "calculator", "status": "success"}]
+        assert mock_agent.call_args[1]["callback_handler"] is None
+
+    
+    @patch('lambda_function.Agent')
+    def test_deadline_returns_partial_answer(self, mock_agent, lambda_context):
+        """締め切りを過ぎた場合に部分的な応答とtimeoutステータスを返し、Agentを破棄すること"""
+        release = threading.Event()
+        mock_agent_instance = Mock()
+        
+        def slow(prompt, **kwargs):
+            mock_agent_instance.callback_handler(data="途中までの回答")
+            release.wait(5)
+            return "完了"
+        mock_agent_instance.side_effect = slow
+        mock_agent.return_value = mock_agent_instance
+        lambda_context.get_remaining_time_in_millis.return_value = lambda_function.config.DEADLINE_SAFETY_MARGIN_MS + 100
+        
+        event = {"body": json.dumps({"prompt": "長い処理"})}
+        try:
+            result = lambda_handler(event, lambda_context)
+        finally:
+            release.set()
+        
+        body = json.loads(result["body"])
+        assert result["statusCode"] == 200
+        assert body["status"] == "timeout"
+        assert body["response"] == "途中までの回答"
+        mock_agent_instance.cancel.assert_called_once()
+        invocation_state = mock_agent_instance.call_args[1]["invocation_state"]
+        assert invocation_state["request_state"]["stop_event_loop"] is True
+        assert lambda_function.agent_pool.stats()["size"] == 0
+    
+    @patch('lambda_function.Agent')
+    def test_deadline_passed_to_agent(self, mock_agent, lambda_context):
+        """締め切りがinvocation_state経由でエージェントに渡されること"""
+        mock_agent_instance = Mock(return_value="ok")
+        mock_agent.return_value = mock_agent_instance
+        
+        body = json.loads(lambda_handler({"body": json.dumps({"prompt": "p"})}, lambda_context)["body"])
+        
+        assert body["status"] == "completed"
+        deadline = mock_agent_instance.call_args[1]["invocation_state"]["deadline"]
+        assert 0 < deadline.remaining() <= 300
+
+
+class TestPriming:
+    """initフェーズでの事前初期化のテスト"""
+    
+    def setup_method(self):
+        lambda_function.agent_pool.clear()
+    
+    @patch('lambda_function.Agent')
+    def test_prime_prepares_agent_for_first_request(self, mock_agent, lambda_context):
+        """事前初期化で構築したAgentが最初のリクエストで再利用されること"""
+        mock_agent.return_value = Mock(return_value="ok")
+        
+        timings = lambda_function.prime()
+        assert set(timings) == {"imports", "validation_rules", "agent"}
+        assert lambda_function.agent_pool.stats()["size"] == 1
+        
+        lambda_handler({"body": json.dumps({"prompt": "p"})}, lambda_context)
+        assert mock_agent.call_count == 1
+        assert lambda_function.agent_pool.stats()["hits"] >= 1
+    
+    @patch('lambda_function.Agent')
+    def test_restore_resets_client_connections(self, mock_agent):
+        """復元後にプール内のBedrockクライアントの接続が破棄されること"""
+        agent = Mock()
+        mock_agent.return_value = agent
+        lambda_function.prime()
+        
+        with patch('priming.random.seed') as seed:
+            lambda_function.restore()
+        
+        seed.assert_called_once_with()
+        agent.model.client._endpoint.http_session.close.assert_called_once()
+
+
+class TestBatchRequests:
+    """バッチリクエストのテスト"""
+    
+    def setup_method(self):
+        lambda_function.agent_pool.clear()
+    
+    @patch('lambda_function.Agent')
+    def test_batch_returns_per_item_results(self, mock_agent, lambda_context):
+        """各プロンプトの結果が入力順に返り、無効な項目は個別にエラーになること"""
+        mock_agent.side_effect = lambda **kwargs: Mock(side_effect=lambda prompt, **kwargs: f"回答: {prompt}")
+        
+        event = {"body": json.dumps({"prompts": ["1+1", "", "2+2"]})}
+        result = lambda_handler(event, lambda_context)
+        
+        assert result["statusCode"] == 200
+        body = json.loads(result["body"])
+        assert [item["index"] for item in body["results"]] == [0, 1, 2]
+        assert body["results"][0]["response"] == "回答: 1+1"
+        assert body["results"][1]["success"] is False
+        assert body["results"][2]["response"] == "回答: 2+2"
+        assert body["succeeded"] == 2
+        assert body["success"] is False
+    
+    @patch('lambda_function.Agent')
+    def test_batch_item_errors_are_isolated(self, mock_agent, lambda_context):
+        """1項目の失敗が他の項目に影響しないこと"""
+        def run(prompt, **kwargs):
+            if prompt == "fail":
+                raise RuntimeError("model error")
+            return "ok"
+        mock_agent.side_effect = lambda **kwargs: Mock(side_effect=run)
+        
+        event = {"body": json.dumps({"prompts": ["fail", "pass"]})}
+        body = json.loads(lambda_handler(event, lambda_context)["body"])
+        
+        assert body["results"][0]["success"] is False
+        assert "RuntimeError" in body["results"][0]["error"]
+        assert body["results"][1]["response"] == "ok"
+    
+    @patch('lambda_function.Agent')
+    def test_batch_times_out_before_deadline(self, mock_agent, lambda_context):
+        """残り時間が足りない場合は未完了の項目がタイムアウトになること"""
+        release = threading.Event()
+        mock_agent.side_effect = lambda **kwargs: Mock(side_effect=lambda prompt, **kwargs: release.wait(5) and "ok")
+        lambda_context.get_remaining_time_in_millis.return_value = 0
+        validate_prompt = lambda_function.validate_prompt
+        
+        def blocked_validate(prompt, max_length):
+            # ハンドラーが戻るまで項目の処理を止め、項目自身の締め切り処理より先にバッチの待機を終わらせる
+            release.wait(5)
+            return validate_prompt(prompt, max_length)
+        
+        event = {"body": json.dumps({"prompts": ["a", "b"]})}
+        try:
+            with patch('lambda_function.validate_prompt', blocked_validate):
+                body = json.loads(lambda_handler(event, lambda_context)["body"])
+        finally:
+            release.set()
+        
+        assert [item["error"] for item in body["results"]] == ["タイムアウト", "タイムアウト"]
+    
+    def test_batch_rejects_invalid_shape(self):
+        for prompts in ([], "not a list", ["p"] * 51):
+            result = lambda_handler({"body": json.dumps({"prompts": prompts})}, None)
+            assert result["statusCode"] == 400
+
+
+class TestResponseCache:
+    """応答キャッシュを有効にしたハンドラーのテスト"""
+    
+    def setup_method(self):
+        lambda_function.agent_pool.clear()
+    
+    @patch('lambda_function.Agent')
+    def test_identical_prompt_served_from_cache(self, mock_agent):
+        """同じプロンプトの2回目はAgentを呼ばずにキャッシュから返ること"""
+        mock_agent_instance = Mock(return_value="4です")
+        mock_agent.return_value = mock_agent_instance
+        cache = lambda_function.ResponseCache(bypass_tools=["current_time"])
+        
+        with patch('lambda_function.response_cache', cache):
+            first = json.loads(lambda_handler({"body": json.dumps({"prompt": "2+2は？"})}, None)["body"])
+            second = json.loads(lambda_handler({"body": json.dumps({"prompt": " 2+2は？ "})}, None)["body"])
+            bypassed = json.loads(lambda_handler(
+                {"body": json.dumps({"prompt": "2+2は？", "cache": False})}, None
+            )["body"])
+        
+        assert (first["cached"], second["cached"]) == (False, True)
+        assert second["response"] == "4です"
+        assert second["prompt"] == " 2+2は？ "
+        assert "cached" not in bypassed
+        assert mock_agent_instance.call_count == 2
+        assert cache.stats()["hits"] == 1
+    
+    @patch('lambda_function.Agent')
+    def test_time_dependent_tool_response_not_cached(self, mock_agent):
+        """current_timeを使った応答は保存されないこと"""
+        def run(prompt, **kwargs):
+            handler = mock_agent_instance.callback_handler
+            handler(event={"contentBlockStart": {"start": {"toolUse": {"toolUseId": "t1", "name": "current_time"}}}})
+            return "10時です"
+        mock_agent_instance = Mock(side_effect=run)
+        mock_agent.return_value = mock_agent_instance
+        cache = lambda_function.ResponseCache(bypass_tools=["current_time"])
+        
+        with patch('lambda_function.response_cache', cache):
+            for _ in range(2):
+                body = json.loads(lambda_handler({"body": json.dumps({"prompt": "今何時？"})}, None)["body"])
+                assert body["cached"] is False
+        
+        assert mock_agent_instance.call_count == 2
+        assert cache.stats()["bypassed"] == 2
+
+    @patch('lambda_function.Agent')
+    def test_paraphrased_prompt_served_from_semantic_cache(self, mock_agent):
+        """言い換えられたプロンプトはセマンティックキャッシュから類似度付きで返ること"""
+        from semantic_cache import HashingEmbedder, SemanticCache
+        
+        mock_agent_instance = Mock(return_value="パリです")
+        mock_agent.return_value = mock_agent_instance
+        cache = SemanticCache(HashingEmbedder(), threshold=0.8)
+        
+        with patch('lambda_function.semantic_cache', cache):
+            first = json.loads(lambda_handler(
+                {"body": json.dumps({"prompt": "What is the capital of France?"})}, None
+            )["body"])
+            second = json.loads(lambda_handler(
+                {"body": json.dumps({"prompt": "what is the capital of france"})}, None
+            )["body"])
+            other_model = json.loads(lambda_handler(
+                {"body": json.dumps({"prompt": "what is the capital of france", "model_config": {"temperature": 0.9}})},
+                None
+            )["body"])
+        
+        assert first["cached"] is False
+        assert second["cached"] is True
+        assert second["response"] == "パリです"
+        assert second["cache_similarity"] >= 0.8
+        assert other_model["cached"] is False
+        # 1回目とmodel_configが異なるリクエストのみAgentを呼び出す
+        assert mock_agent_instance.call_count == 2
+
+    @patch('lambda_function.Agent')
+    def test_semantic_index_saved_before_handler_returns(self, mock_agent, tmp_path):
+        """実行環境が凍結される前に、バックグラウンドのインデックスの保存を待つ"""
+        from semantic_cache import HashingEmbedder, LocalIndexStore, SemanticCache
+        
+        mock_agent.return_value = Mock(return_value="パリです")
+        store = LocalIndexStore(str(tmp_path / "index"))
+        cache = SemanticCache(HashingEmbedder(), threshold=0.8, store=store, save_every=1)
+        
+        with patch('lambda_function.semantic_cache', cache), patch.object(cache, 'flush', wraps=cache.flush) as flush:
+            lambda_handler({"body": json.dumps({"prompt": "What is the capital of France?"})}, None)
+        
+        flush.assert_called_once()
+        assert len(store.load()) == 1
+
+
+class TestToolMemoization:
+    """ツール結果のメモ化を有効にしたハンドラーのテスト"""
+    
+    def setup_method(self):
+        lambda_function.agent_pool.clear()
+    
+    @patch('lambda_function.Agent')
+    def test_memo_hook_registered_and_counters_returned(self, mock_agent):
+        """メモ化のフックがAgentに登録され、リクエスト単位の集計がレスポンスに含まれること"""
+        def run(prompt, invocation_state=None, **kwargs):
+            invocation_state["tool_memo_stats"]["hits"] += 2
+            return "応答"
+        mock_agent.return_value = Mock(side_effect=run)
+        
+        with patch.object(lambda_function.config, 'ENABLE_TOOL_MEMOIZATION', True):
+            body = json.loads(lambda_handler({"body": json.dumps({"prompt": "25 * 4"})}, None)["body"])
+        
+        hooks = mock_agent.call_args[1]["hooks"]
+        assert [type(hook).__name__ for hook in hooks] == ["DeadlineHook", "TelemetryHook", "ToolMemoHook"]
+        assert body["tool_memo"] == {"hits": 2, "misses": 0}
+
+
+class TestConcurrentTools:
+    """ツールの並行実行の設定のテスト"""
+    
+    def setup_method(self):
+        lambda_function.agent_pool.clear()
+    
+    @patch('lambda_function.create_tool_executor')
+    @patch('lambda_function.Agent')
+    def test_executor_passed_to_agent_when_enabled(self, mock_agent, mock_create_executor):
+        mock_agent.return_value = Mock(return_value="応答")
+        
+        with patch.object(lambda_function.config, 'ENABLE_CONCURRENT_TOOLS', True), \
+                patch.object(lambda_function.config, 'TOOL_TIMEOUTS', {"http_request": 10}):
+            assert lambda_handler({"body": json.dumps({"prompt": "並行"})}, None)["statusCode"] == 200
+        
+        mock_create_executor.assert_called_once_with(
+            max_concurrency=lambda_function.config.TOOL_MAX_CONCURRENCY,
+            default_timeout=lambda_function.DEFAULT_TIMEOUT,
+            timeouts={"http_request": 10}
+        )
+        assert mock_agent.call_args[1]["tool_executor"] is mock_create_executor.return_value
+    
+    @patch('lambda_function.Agent')
+    def test_strands_default_when_disabled(self, mock_agent):
+        mock_agent.return_value = Mock(return_value="応答")
+        assert lambda_handler({"body": json.dumps({"prompt": "逐次"})}, None)["statusCode"] == 200
+        assert "tool_executor" not in mock_agent.call_args[1]
+
+
+
+class TestConnectionPool:
+    """ウォームコンテナ間で共有する接続プールのテスト"""
+    
+    def setup_method(self):
+        lambda_function.agent_pool.clear()
+    
+    @patch('lambda_function.Agent')
+    def test_new_agents_use_shared_client_and_idle_check_runs(self, mock_agent):
+        agent = Mock(return_value="応答")
+        mock_agent.return_value = agent
+        manager = lambda_function.connection_manager
+        
+        with patch.object(manager, 'attach') as attach, \
+                patch.object(manager, 'check_idle') as check_idle, \
+                patch.object(manager, 'mark_used') as mark_used:
+            assert lambda_handler({"body": json.dumps({"prompt": "接続"})}, None)["statusCode"] == 200
+            # プールから借りたAgentは構築し直さない
+            assert lambda_handler({"body": json.dumps({"prompt": "接続"})}, None)["statusCode"] == 200
+        
+        attach.assert_called_once_with(agent.model)
+        assert check_idle.call_count == 2
+        assert mark_used.call_count == 2
+
+
+class TestRequestMetrics:
+    """リクエスト単位の計測のテスト"""
+    
+    def setup_method(self):
+        lambda_function.agent_pool.clear()
+    
+    @patch('lambda_function.Agent')
+    def test_metrics_field_only_when_requested(self, mock_agent):
+        result = Mock()
+        result.__str__ = Mock(return_value="応答")
+        result.metrics.latest_agent_invocation.usage = {"inputTokens": 12, "outputTokens": 3, "totalTokens": 15}
+        mock_agent.return_value = Mock(return_value=result)
+        
+        plain = json.loads(lambda_handler({"body": json.dumps({"prompt": "計測なし"})}, None)["body"])
+        assert "metrics" not in plain
+        
+        lambda_function.agent_pool.clear()
+        body = json.loads(lambda_handler({"body": json.dumps({"prompt": "計測", "metrics": True})}, None)["body"])
+        metrics = body["metrics"]
+        assert {"parse", "validate", "agent_build", "agent_invoke"} <= set(metrics["phases_ms"])
+        assert metrics["usage"] == {"input_tokens": 12, "output_tokens": 3, "total_tokens": 15}
+        assert metrics["cold_start"] is False
+        assert mock_agent.call_args[1]["hooks"][1].__class__.__name__ == "TelemetryHook"
+    
+    @patch('lambda_function.Agent')
+    def test_emf_emitted_when_enabled(self, mock_agent, lambda_context, capsys):
+        mock_agent.return_value = Mock(return_value="応答")
+        lambda_context.aws_request_id = "req-1"
+        
+        with patch.object(lambda_function.config, 'ENABLE_EMF_METRICS', True):
+            lambda_handler({"body": json.dumps({"prompt": "EMF"})}, lambda_context)
+        
+        lines = [line for line in capsys.readouterr().out.splitlines() if line.startswith('{"_aws"')]
+        assert len(lines) == 1
+        document = json.loads(lines[0])
+        assert document["_aws"]["CloudWatchMetrics"][0]["Namespace"] == lambda_function.config.METRICS_NAMESPACE
+        assert document["RequestId"] == "req-1"
+        assert "SerializeTime" in document
+    
+    @patch('lambda_function.Agent')
+    def test_batch_metrics_are_aggregated(self, mock_agent):
+        mock_agent.return_value = Mock(return_value="応答")
+        body = json.loads(lambda_handler(
+            {"body": json.dumps({"prompts": ["a", "b"], "metrics": True})}, None
+        )["body"])
+        assert body["succeeded"] == 2
+        assert {"validate", "agent_invoke"} <= set(body["metrics"]["phases_ms"])
+
+
+class TestSessions:
+    """複数ターンの会話（session_id）のテスト"""
+    
+    def setup_method(self):
+        lambda_function.agent_pool.clear()
+    
+    def _manager(self):
+        from session_store import CompactionPolicy, MemorySessionStore, SessionManager, TruncatingSummarizer
+        return SessionManager(MemorySessionStore(), CompactionPolicy(max_messages=4), TruncatingSummarizer())
+    
+    @patch('lambda_function.Agent')
+    def test_history_carried_between_turns(self, mock_agent):
+        seen = []
+        
+        def run(prompt, **kwargs):
+            seen.append([message["content"][-1]["text"] for message in agent.messages])
+            agent.messages.append({"role": "user", "content": [{"text": prompt}]})
+            agent.messages.append({"role": "assistant", "content": [{"text": f"{prompt}への応答"}]})
+            return f"{prompt}への応答"
+        agent = Mock(side_effect=run, messages=[])
+        mock_agent.return_value = agent
+        manager = self._manager()
+        
+        with patch('lambda_function.session_manager', manager):
+            bodies = [
+                json.loads(lambda_handler({"body": json.dumps({"prompt": p, "session_id": "s-1"})}, None)["body"])
+                for p in ("一", "二", "三")
+            ]
+        
+        assert seen == [[], ["一", "一への応答"], ["一", "一への応答", "二", "二への応答"]]
+        # 4件を超えた時点で古いターンを要約に置き換え、要約は最初のメッセージに含める
+        assert bodies[2]["session_id"] == "s-1"
+        assert bodies[2]["session"] == {"turns": 3, "messages": 2, "summarized_messages": 4}
+        assert manager.history(manager.load("s-1"))[0]["content"][0]["text"].startswith("[これまでの会話の要約]")
+        # プールに戻したAgentに履歴は残らない
+        assert agent.messages == []
+    
+    @patch('lambda_function.Agent')
+    def test_sliding_window_does_not_trim_session_history(self, mock_agent):
+        """Agentの会話管理が履歴を削っても、セッションのターンは欠けずに保存される"""
+        class TrimmingManager:
+            """strandsのSlidingWindowConversationManagerのように古いメッセージを削る"""
+            def apply_management(self, agent):
+                del agent.messages[:2]
+        
+        trimming = TrimmingManager()
+        
+        def run(prompt, **kwargs):
+            agent.messages.append({"role": "user", "content": [{"text": prompt}]})
+            agent.messages.append({"role": "assistant", "content": [{"text": f"{prompt}への応答"}]})
+            agent.conversation_manager.apply_management(agent)
+            return f"{prompt}への応答"
+        agent = Mock(side_effect=run, messages=[], conversation_manager=trimming)
+        mock_agent.return_value = agent
+        manager = self._manager()
+        
+        with patch('lambda_function.session_manager', manager), \
+                patch('lambda_function.NullConversationManager') as null_manager:
+            null_manager.return_value.apply_management = lambda agent: None
+            for p in ("一", "二"):
+                lambda_handler({"body": json.dumps({"prompt": p, "session_id": "s-5"})}, None)
+        
+        texts = [message["content"][0]["text"] for message in manager.history(manager.load("s-5"))]
+        assert texts == ["一", "一への応答", "二", "二への応答"]
+        # 返却時に元の会話管理に戻す
+        assert agent.conversation_manager is trimming
+    
+    @patch('lambda_function.Agent')
+    def test_rewritten_history_is_not_persisted(self, mock_agent):
+        """実行中に履歴の先頭が書き換えられた場合はターンを保存しない"""
+        def run(prompt, **kwargs):
+            agent.messages[:] = agent.messages[1:]
+            agent.messages.append({"role": "user", "content": [{"text": prompt}]})
+            agent.messages.append({"role": "assistant", "content": [{"text": "応答"}]})
+            return "応答"
+        agent = Mock(side_effect=run, messages=[])
+        mock_agent.return_value = agent
+        manager = self._manager()
+        
+        with patch('lambda_function.session_manager', manager):
+            lambda_handler({"body": json.dumps({"prompt": "一", "session_id": "s-6"})}, None)
+            body = json.loads(lambda_handler({"body": json.dumps({"prompt": "二", "session_id": "s-6"})}, None)["body"])
+        
+        assert body["status"] == "completed"
+        assert body["session"]["turns"] == 1
+        assert len(manager.history(manager.load("s-6"))) == 2
+    
+    @patch('lambda_function.Agent')
+    def test_timeout_is_not_persisted(self, mock_agent):
+        mock_agent.return_value = Mock(return_value="応答", messages=[])
+        manager = self._manager()
+        with patch('lambda_function.session_manager', manager), \
+                patch('lambda_function.run_with_deadline', return_value=(False, None)):
+            body = json.loads(lambda_handler({"body": json.dumps({"prompt": "遅い", "session_id": "s-2"})}, None)["body"])
+        assert body["status"] == "timeout"
+        assert body["session"]["turns"] == 0
+        assert manager.store.get("s-2") is None
+    
+    def test_invalid_requests_rejected(self):
+        with patch('lambda_function.session_manager', self._manager()):
+            for payload in (
+                {"prompt": "p", "session_id": "../etc/passwd"},
+                {"prompt": "p", "session_id": 1},
+                {"prompts": ["a"], "session_id": "s-1"},
+            ):
+                assert lambda_handler({"body": json.dumps(payload)}, None)["statusCode"] == 400
+        # ストアが無効な場合
+        result = lambda_handler({"body": json.dumps({"prompt": "p", "session_id": "s-1"})}, None)
+        assert result["statusCode"] == 400
+    
+    @patch('lambda_function.Agent')
+    def test_conflict_returns_409(self, mock_agent):
+        from session_store import SessionConflictError
+        mock_agent.return_value = Mock(return_value="応答", messages=[])
+        manager = self._manager()
+        with patch('lambda_function.session_manager', manager), \
+                patch.object(manager.store, 'put', side_effect=SessionConflictError("s-3")):
+            result = lambda_handler({"body": json.dumps({"prompt": "競合", "session_id": "s-3"})}, None)
+        assert result["statusCode"] == 409
+        assert manager.stats()["conflicts"] == 2
+
+class TestPromptCache:
+    """プロンプトキャッシュのテスト"""
+    
+    def setup_method(self):
+        lambda_function.agent_pool.clear()
+    
+    @patch.object(lambda_function.config, 'ENABLE_PROMPT_CACHE', True)
+    @patch('lambda_function.BedrockModel')
+    @patch('lambda_function.Agent')
+    def test_supported_model_gets_cache_points(self, mock_agent, mock_model):
+        result = Mock()
+        result.__str__ = Mock(return_value="応答")
+        result.metrics.latest_agent_invocation.usage = {
+            "inputTokens": 20, "outputTokens": 5, "totalTokens": 1525,
+            "cacheReadInputTokens": 1500, "cacheWriteInputTokens": 0
+        }
+        mock_agent.return_value = Mock(return_value=result)
+        
+        body = json.loads(lambda_handler({"body": json.dumps({
+            "prompt": "キャッシュ",
+            "metrics": True,
+            "model_config": {"model": "us.anthropic.claude-3-7-sonnet-20250219-v1:0"}
+        })}, None)["body"])
+        
+        mock_model.assert_called_once_with(
+            model_id="us.anthropic.claude-3-7-sonnet-20250219-v1:0", cache_prompt="default", cache_tools="default"
+        )
+        assert mock_agent.call_args[1]["model"] is mock_model.return_value
+        assert body["metrics"]["usage"]["cache_read_input_tokens"] == 1500
+        assert body["metrics"]["usage"]["cache_write_input_tokens"] == 0
+    
+    @patch('lambda_function.BedrockModel')
+    @patch('lambda_function.Agent')
+    def test_disabled_or_unsupported_model_uses_model_id(self, mock_agent, mock_model):
+        mock_agent.return_value = Mock(return_value="応答")
+        
+        with patch.object(lambda_function.config, 'ENABLE_PROMPT_CACHE', True):
+            lambda_handler({"body": json.dumps({
+                "prompt": "キャッシュなし",
+                "model_config": {"model": "us.anthropic.claude-3-haiku-20240307-v1:0"}
+            })}, None)
+        # 既定では無効
+        lambda_handler({"body": json.dumps({"prompt": "キャッシュなし"})}, None)
+        
+        mock_model.assert_not_called()
+        assert mock_agent.call_args[1]["model"] == lambda_function.DEFAULT_MODEL_ID
+    
+    def test_tool_order_is_stable(self):
+        names = [lambda_function.tool_name(tool) for tool in lambda_function._build_tools()]
+        assert names == sorted(names)
+
+class TestModelRouter:
+    """モデルのルーティングとフォールバックのテスト"""
+    
+    def setup_method(self):
+        lambda_function.agent_pool.clear()
+    
+    def _router(self):
+        from model_router import ModelRouter
+        return ModelRouter(["us.amazon.nova-micro-v1:0", "us.amazon.nova-lite-v1:0", "us.amazon.nova-pro-v1:0"])
+    
+    @patch('lambda_function.Agent')
+    def test_prompt_routed_to_tier(self, mock_agent):
+        mock_agent.return_value = Mock(return_value="応答")
+        router = self._router()
+        
+        with patch('lambda_function.model_router', router), \
+                patch.object(lambda_function.config, 'ENABLE_PROMPT_CACHE', False):
+            body = json.loads(lambda_handler({"body": json.dumps({"prompt": "25 * 4 を計算して"})}, None)["body"])
+            # モデルを指定したリクエストはルーティングしない
+            pinned = json.loads(lambda_handler({"body": json.dumps({
+                "prompt": "こんにちは", "model_config": {"model": "us.amazon.nova-pro-v1:0"}
+            })}, None)["body"])
+        
+        assert mock_agent.call_args_list[0][1]["model"] == "us.amazon.nova-lite-v1:0"
+        assert body["routing"] == {"tier": 1, "reasons": ["tools"], "attempts": ["us.amazon.nova-lite-v1:0"], "fallback": False}
+        assert "routing" not in pinned
+        assert router.stats()["us.amazon.nova-lite-v1:0"]["calls"] == 1
+    
+    @patch('lambda_function.Agent')
+    def test_throttled_model_falls_back(self, mock_agent):
+        class ModelThrottledException(Exception):
+            pass
+        
+        def build(model, **kwargs):
+            if model == "us.amazon.nova-micro-v1:0":
+                return Mock(side_effect=ModelThrottledException("rate exceeded"))
+            return Mock(return_value=f"{model}の応答")
+        mock_agent.side_effect = build
+        router = self._router()
+        
+        with patch('lambda_function.model_router', router), \
+                patch.object(lambda_function.config, 'ENABLE_PROMPT_CACHE', False):
+            body = json.loads(lambda_handler({"body": json.dumps({"prompt": "こんにちは"})}, None)["body"])
+        
+        assert body["response"] == "us.amazon.nova-lite-v1:0の応答"
+        assert body["routing"]["attempts"] == ["us.amazon.nova-micro-v1:0", "us.amazon.nova-lite-v1:0"]
+        assert body["routing"]["fallback"] is True
+        assert router.stats()["us.amazon.nova-micro-v1:0"]["throttles"] == 1
+        # スロットリングされたモデルは次のリクエストでチェーンの後ろに回る
+        assert router.route("こんにちは").chain[0] == "us.amazon.nova-lite-v1:0"
+    
+    @patch('lambda_function.Agent')
+    def test_other_errors_are_not_retried(self, mock_agent):
+        mock_agent.return_value = Mock(side_effect=ValueError("bad request"))
+        with patch('lambda_function.model_router', self._router()):
+            result = lambda_handler({"body": json.dumps({"prompt": "こんにちは"})}, None)
+        assert result["statusCode"] == 500
+        assert mock_agent.call_count == 1
+
+class StreamingAgent:
+    """stream_asyncでイベントをcallback_handlerに渡すAgentのモック"""
+    
+    def __init__(self, chunks, delay=0.0):
+        self.chunks = chunks
+        self.delay = delay
+        self.callback_handler = None
+        self.messages = []
+        self.cancelled = False
+        self.invocation_state = None
+    
+    def __call__(self, prompt, **kwargs):
+        raise AssertionError("同期の呼び出しは使わない")
+    
+    async def stream_async(self, prompt, invocation_state=None):
+        import asyncio
+        self.invocation_state = invocation_state
+        try:
+            for chunk in self.chunks:
+                await asyncio.sleep(self.delay)
+                self.callback_handler(data=chunk)
+                yield {"data": chunk}
+            yield {"result": "".join(self.chunks)}
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+class TestAsyncHandler:
+    """イベントループでstream_asyncを実行する非同期の呼び出しのテスト"""
+    
+    def setup_method(self):
+        lambda_function.agent_pool.clear()
+    
+    @patch('lambda_function.Agent')
+    def test_stream_async_used(self, mock_agent, lambda_context):
+        agent = StreamingAgent(["25 * 4 ", "= 100"])
+        mock_agent.return_value = agent
+        
+        with patch.object(lambda_function.config, 'ENABLE_ASYNC_HANDLER', True):
+            body = json.loads(lambda_handler({"body": json.dumps({"prompt": "25 * 4"})}, lambda_context)["body"])
+        
+        assert body["status"] == "completed"
+        assert body["response"] == "25 * 4 = 100"
+        assert 0 < agent.invocation_state["deadline"].remaining() <= 300
+    
+    @patch('lambda_function.Agent')
+    def test_deadline_cancels_stream(self, mock_agent, lambda_context):
+        agent = StreamingAgent(["途中まで"] + ["の回答"] * 100, delay=0.05)
+        mock_agent.return_value = agent
+        lambda_context.get_remaining_time_in_millis.return_value = lambda_function.config.DEADLINE_SAFETY_MARGIN_MS + 100
+        
+        with patch.object(lambda_function.config, 'ENABLE_ASYNC_HANDLER', True):
+            body = json.loads(lambda_handler({"body": json.dumps({"prompt": "長い処理"})}, lambda_context)["body"])
+        
+        assert body["status"] == "timeout"
+        assert body["response"].startswith("途中まで")
+        assert lambda_function.agent_pool.stats()["size"] == 0
+        assert lambda_function.async_runner.stats()["cancelled"] >= 1
+    
+    @patch('lambda_function.Agent')
+    def test_batch_items_overlap(self, mock_agent, lambda_context):
+        import time
+        mock_agent.side_effect = lambda **kwargs: StreamingAgent(["a", "b"], delay=0.1)
+        event = {"body": json.dumps({"prompts": [f"質問{index}" for index in range(4)]})}
+        
+        started = time.monotonic()
+        with patch.object(lambda_function.config, 'ENABLE_ASYNC_HANDLER', True):
+            body = json.loads(lambda_handler(event, lambda_context)["body"])
+        
+        assert [item["response"] for item in body["results"]] == ["ab"] * 4
+        assert time.monotonic() - started < 0.8
 
 
 def test_lambda_handler_real():
@@ -0,0 +1,124 @@
+"""
+コストとレイテンシを考慮したモデルのルーティングのテスト
+"""
+import sys
+import os
+from unittest.mock import Mock
+
+import pytest
+
+# Lambda関数のパスを追加
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+
+from model_router import BedrockClassifier, HeuristicClassifier, ModelRouter, create_classifier, error_name
+
+TIERS = ["micro", "lite", "pro"]
+
+
+class TestHeuristicClassifier:
+    """長さとキーワードによる分類のテスト"""
+
+    @pytest.mark.parametrize("prompt, tier", [
+        ("こんにちは", 0),
+        ("25 * 4 を計算してください", 1),
+        ("現在の日時を教えてください", 1),
+        ("https://example.com の内容を取得して", 1),
+        ("あ" * 300, 1),
+        ("2つの設計案を比較してください", 2),
+        ("Explain why the sky is blue", 2),
+        ("a" * 2500, 2),
+    ])
+    def test_tiers(self, prompt, tier):
+        assert HeuristicClassifier().classify(prompt)[0] == tier
+
+    def test_reasons(self):
+        assert HeuristicClassifier().classify("hello") == (0, ["simple"])
+        assert HeuristicClassifier().classify("calculate 2+2 and explain why")[1] == ["tools", "complex"]
+
+
+class TestBedrockClassifier:
+    """小さなモデルによる分類のテスト"""
+
+    def test_uses_model_answer(self):
+        client = Mock()
+        client.converse.return_value = {"output": {"message": {"content": [{"text": "2"}]}}}
+        assert BedrockClassifier(client=client).classify("こんにちは") == (2, ["classifier"])
+        assert client.converse.call_args[1]["inferenceConfig"]["maxTokens"] == 2
+
+    def test_falls_back_to_heuristic(self):
+        client = Mock()
+        client.converse.side_effect = RuntimeError("throttled")
+        assert BedrockClassifier(client=client).classify("こんにちは") == (0, ["simple"])
+
+    def test_create_classifier(self):
+        assert isinstance(create_classifier("heuristic"), HeuristicClassifier)
+        with pytest.raises(ValueError):
+            create_classifier("random")
+
+
+class TestRouting:
+    """フォールバックチェーンの順序付けのテスト"""
+
+    def _router(self, tier):
+        return ModelRouter(TIERS, classifier=Mock(classify=Mock(return_value=(tier, ["test"]))), min_calls=2)
+
+    def test_chain_escalates_then_descends(self):
+        assert self._router(0).route("p").chain == ["micro", "lite", "pro"]
+        assert self._router(1).route("p").chain == ["lite", "pro", "micro"]
+        assert self._router(5).route("p").chain == ["pro", "lite", "micro"]
+
+    def test_throttled_model_moved_back_until_cooldown(self):
+        router = self._router(1)
+        router.record("lite", 100, "ModelThrottledException", now=1000)
+        route = router.route("p", now=1010)
+        assert route.chain == ["pro", "micro", "lite"]
+        assert route.reasons == ["test", "avoid:lite"]
+        assert router.route("p", now=1031).chain == ["lite", "pro", "micro"]
+
+    def test_error_rate_and_latency_bias(self):
+        router = self._router(0)
+        for _ in range(4):
+            router.record("micro", 100, "ServiceUnavailableException")
+        assert router.route("p").chain[-1] == "micro"
+
+        router = self._router(0)
+        router.record("micro", 9000)
+        router.record("lite", 500)
+        # 締め切りまでの残り時間より遅いモデルは後ろに回す
+        assert router.route("p", remaining_seconds=5).chain == ["lite", "pro", "micro"]
+        assert router.route("p", remaining_seconds=60).chain == ["micro", "lite", "pro"]
+
+    def test_stats(self):
+        router = ModelRouter(TIERS, smoothing=0.5)
+        router.record("lite", 100)
+        router.record("lite", 300)
+        router.record("lite", 5000, "ThrottlingException")
+        assert router.stats()["lite"] == {
+            "calls": 3,
+            "errors": 1,
+            "throttles": 1,
+            "latency_ms": 200.0,
+            "error_rate": 0.5,
+            "errors_by_type": {"ThrottlingException": 1},
+        }
+
+    def test_disabled_without_tiers(self):
+        assert ModelRouter([]).enabled is False
+
+
+def test_error_name_follows_cause():
+    class ModelThrottledException(Exception):
+        pass
+
+    try:
+        try:
+            raise ModelThrottledException("rate exceeded")
+        except ModelThrottledException as e:
+            raise RuntimeError("event loop failed") from e
+    except RuntimeError as e:
+        assert error_name(e) == "ModelThrottledException"
+
+    client_error = Exception("busy")
+    client_error.response = {"Error": {"Code": "ServiceUnavailableException"}}
+    assert error_name(client_error) == "ServiceUnavailableException"
+    assert error_name(ValueError("bad input")) is None
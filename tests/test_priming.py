@@ -0,0 +1,53 @@
+"""
+事前初期化とSnapStartフックのテスト
+"""
+import sys
+import os
+from unittest.mock import Mock
+
+# Lambda関数のパスを追加
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+
+import priming
+
+
+def test_run_steps_continues_after_failure():
+    calls = []
+
+    def failing():
+        raise RuntimeError("boom")
+
+    timings = priming.run_steps([
+        ("first", failing),
+        ("second", lambda: calls.append("second")),
+    ])
+    assert list(timings) == ["first", "second"]
+    assert calls == ["second"]
+
+
+def test_reset_connections_skips_objects_without_session():
+    client = Mock()
+    assert priming.reset_connections([client, None, object()]) == 1
+    client._endpoint.http_session.close.assert_called_once()
+
+
+def test_is_snapstart(monkeypatch):
+    monkeypatch.setenv("AWS_LAMBDA_INITIALIZATION_TYPE", "snap-start")
+    assert priming.is_snapstart() is True
+    monkeypatch.setenv("AWS_LAMBDA_INITIALIZATION_TYPE", "on-demand")
+    assert priming.is_snapstart() is False
+
+
+def test_register_snapstart_hooks(monkeypatch):
+    runtime = Mock()
+    monkeypatch.setitem(sys.modules, "snapshot_restore_py", runtime)
+    before, after = Mock(), Mock()
+
+    assert priming.register_snapstart_hooks(before, after) is True
+    runtime.register_before_snapshot.assert_called_once_with(before)
+    runtime.register_after_restore.assert_called_once_with(after)
+
+
+def test_register_snapstart_hooks_outside_lambda(monkeypatch):
+    monkeypatch.setitem(sys.modules, "snapshot_restore_py", None)
+    assert priming.register_snapstart_hooks(Mock(), Mock()) is False
@@ -0,0 +1,45 @@
+"""
+Bedrockのプロンプトキャッシュの設定のテスト
+"""
+import sys
+import os
+from unittest.mock import Mock
+
+# Lambda関数のパスを追加
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+
+from config import Config
+from prompt_cache import cache_settings, stable_tool_order
+
+
+class TestCacheSettings:
+    """モデルごとのキャッシュポイントの設定のテスト"""
+
+    def setup_method(self):
+        config = Config()
+        self.models = (config.PROMPT_CACHE_MODELS, config.PROMPT_CACHE_TOOL_MODELS)
+
+    def test_claude_caches_system_prompt_and_tools(self):
+        assert cache_settings("us.anthropic.claude-3-7-sonnet-20250219-v1:0", *self.models) == {
+            "cache_prompt": "default",
+            "cache_tools": "default",
+        }
+
+    def test_nova_caches_system_prompt_only(self):
+        assert cache_settings("us.amazon.nova-pro-v1:0", *self.models) == {"cache_prompt": "default"}
+
+    def test_unsupported_models(self):
+        assert cache_settings("us.anthropic.claude-3-haiku-20240307-v1:0", *self.models) is None
+        assert cache_settings(Mock(), *self.models) is None
+        assert cache_settings(None, *self.models) is None
+
+
+def test_stable_tool_order():
+    def tool(name):
+        return Mock(tool_name=name)
+
+    tools = [tool("http_request"), tool("calculator"), tool("use_aws"), tool("current_time")]
+    ordered = stable_tool_order(tools)
+    assert [t.tool_name for t in ordered] == ["calculator", "current_time", "http_request", "use_aws"]
+    # 入力の順序によらず同じ順序になる
+    assert stable_tool_order(list(reversed(tools))) == ordered
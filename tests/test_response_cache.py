@@ -0,0 +1,131 @@
+"""
+応答キャッシュのテスト
+"""
+import sys
+import os
+from unittest.mock import Mock, patch
+
+import pytest
+
+# Lambda関数のパスを追加
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+
+from response_cache import (
+    LocalDirectoryTier, MemoryTier, ResponseCache, create_shared_tier, make_cache_key, normalize_prompt
+)
+
+
+def calculator():
+    pass
+
+
+def current_time():
+    pass
+
+
+COMPLETED = {"response": "4", "prompt": "2+2", "status": "completed"}
+
+
+class TestCacheKey:
+    """キャッシュキー生成のテスト"""
+
+    def test_normalized_prompt_shares_key(self):
+        assert normalize_prompt("  2 +\n 2 ") == "2 + 2"
+        assert make_cache_key(" 2 + 2", {"model": "m"}, "sys", [calculator]) == \
+            make_cache_key("2 +  2\n", {"model": "m"}, "sys", [calculator])
+
+    def test_inputs_affecting_response_change_key(self):
+        base = make_cache_key("2+2", {"model": "m"}, "sys", [calculator])
+        assert make_cache_key("2+2", {"model": "other"}, "sys", [calculator]) != base
+        assert make_cache_key("2+2", {"model": "m", "temperature": 0.1}, "sys", [calculator]) != base
+        assert make_cache_key("2+2", {"model": "m"}, "other", [calculator]) != base
+        assert make_cache_key("2+2", {"model": "m"}, "sys", [calculator, current_time]) != base
+
+    def test_tool_order_does_not_change_key(self):
+        assert make_cache_key("x", {}, "sys", [calculator, current_time]) == \
+            make_cache_key("x", {}, "sys", [current_time, calculator])
+
+
+class TestMemoryTier:
+    """メモリ層のテスト"""
+
+    def test_lru_eviction(self):
+        tier = MemoryTier(max_entries=2)
+        tier.put("a", {"v": 1}, 60)
+        tier.put("b", {"v": 2}, 60)
+        tier.get("a")
+        tier.put("c", {"v": 3}, 60)
+
+        assert tier.get("b") is None
+        assert tier.get("a") == {"v": 1}
+        assert tier.evictions == 1
+
+    def test_expired_entry_is_miss(self):
+        tier = MemoryTier()
+        with patch("response_cache.time.time", return_value=1000.0):
+            tier.put("a", {"v": 1}, 60)
+        with patch("response_cache.time.time", return_value=1061.0):
+            assert tier.get("a") is None
+        assert len(tier) == 0
+
+
+class TestResponseCache:
+    """2層キャッシュのテスト"""
+
+    def test_shared_hit_populates_memory(self, tmp_path):
+        shared = LocalDirectoryTier(str(tmp_path))
+        ResponseCache(shared=shared).put("k", COMPLETED)
+
+        # 別のコンテナ（空のメモリ層）から共有層の応答を参照する
+        cache = ResponseCache(shared=shared)
+        assert cache.get("k") == (COMPLETED, "local")
+        assert cache.get("k") == (COMPLETED, "memory")
+        stats = cache.stats()
+        assert (stats["hits"], stats["shared_hits"], stats["memory_hits"], stats["misses"]) == (2, 1, 1, 0)
+
+    def test_shared_expiry(self, tmp_path):
+        shared = LocalDirectoryTier(str(tmp_path))
+        with patch("response_cache.time.time", return_value=1000.0):
+            shared.put("k", COMPLETED, 60)
+        with patch("response_cache.time.time", return_value=1061.0):
+            assert shared.get("k") is None
+
+    def test_time_dependent_tools_are_not_stored(self):
+        cache = ResponseCache(bypass_tools=["current_time"])
+        data = {**COMPLETED, "tool_calls": [{"name": "current_time", "status": "success"}]}
+
+        assert cache.put("k", data) is False
+        assert cache.put("k", {**COMPLETED, "status": "timeout"}) is False
+        assert cache.get("k") == (None, None)
+        assert cache.stats()["bypassed"] == 2
+
+    def test_shared_failure_is_miss(self):
+        shared = Mock()
+        shared.get.side_effect = RuntimeError("throttled")
+        shared.put.side_effect = RuntimeError("throttled")
+        cache = ResponseCache(shared=shared)
+
+        assert cache.get("k") == (None, None)
+        assert cache.put("k", COMPLETED) is True
+        assert cache.get("k") == (COMPLETED, "memory")
+
+    def test_dynamodb_tier_round_trip(self):
+        items = {}
+        client = Mock()
+        client.put_item.side_effect = lambda TableName, Item: items.update({Item["cache_key"]["S"]: Item})
+        client.get_item.side_effect = lambda TableName, Key, **kwargs: (
+            {"Item": items[Key["cache_key"]["S"]]} if Key["cache_key"]["S"] in items else {}
+        )
+
+        tier = create_shared_tier("dynamodb", table_name="cache")
+        tier._client = client
+        tier.put("k", COMPLETED, 60)
+        assert tier.get("k") == COMPLETED
+        assert tier.get("missing") is None
+
+    def test_create_shared_tier_requires_store(self):
+        assert create_shared_tier("none") is None
+        with pytest.raises(ValueError):
+            create_shared_tier("dynamodb")
+        with pytest.raises(ValueError):
+            create_shared_tier("redis")
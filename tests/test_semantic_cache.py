@@ -0,0 +1,238 @@
+"""
+セマンティックキャッシュのテスト
+"""
+import sys
+import os
+import threading
+from unittest.mock import patch
+
+import pytest
+
+# Lambda関数のパスを追加
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+
+import semantic_cache
+from semantic_cache import (
+    HashingEmbedder, LocalIndexStore, S3IndexStore, SemanticCache, VectorIndex, _normalize, create_index_store
+)
+
+
+COMPLETED = {"response": "パリです", "prompt": "フランスの首都は？", "status": "completed"}
+
+
+def dot(a, b):
+    return sum(x * y for x, y in zip(a, b))
+
+
+@pytest.fixture(params=["array", "numpy"])
+def vector_backend(request):
+    """NumPyがある場合は両方の実装で確認する"""
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+        yield
+    else:
+        with patch.object(semantic_cache, "numpy", None):
+            yield
+
+
+class TestHashingEmbedder:
+    """ローカル用の埋め込みのテスト"""
+
+    def test_deterministic_and_normalized(self):
+        embedder = HashingEmbedder(dimensions=64)
+        vector = embedder.embed("What is the capital of France?")
+        assert vector == HashingEmbedder(dimensions=64).embed("What is the capital of France?")
+        assert len(vector) == 64
+        assert dot(vector, vector) == pytest.approx(1.0)
+
+    def test_paraphrase_is_closer_than_unrelated(self):
+        embedder = HashingEmbedder()
+        base = embedder.embed("東京の天気を教えてください")
+        assert dot(base, embedder.embed("東京の天気を教えて")) > dot(base, embedder.embed("2+2を計算して")) + 0.5
+
+
+class TestVectorIndex:
+    """ベクトルインデックスのテスト"""
+
+    def test_search_returns_best_accepted_entry(self, vector_backend):
+        index = VectorIndex(2)
+        index.add([1.0, 0.0], {"name": "x"})
+        index.add([0.0, 1.0], {"name": "y"})
+
+        score, position = index.search([0.6, 0.8])
+        assert (round(score, 3), position) == (0.8, 1)
+        score, position = index.search([0.6, 0.8], lambda entry: entry["name"] == "x")
+        assert (round(score, 3), position) == (0.6, 0)
+        assert index.search([0.6, 0.8], lambda entry: False) == (0.0, None)
+
+    def test_remove_oldest(self, vector_backend):
+        index = VectorIndex(2)
+        for i in range(3):
+            index.add([float(i), 1.0], {"i": i})
+        index.remove_oldest(2)
+        assert [entry["i"] for entry in index.entries] == [2]
+        assert index.scores([1.0, 0.0]) == [2.0]
+
+    def test_search_skips_many_rejected_entries(self, vector_backend):
+        """argmaxで確認する件数を超えて拒否された場合も類似度の降順で探す"""
+        index = VectorIndex(2)
+        for i in range(20):
+            index.add(_normalize([1.0, i / 10]), {"i": i})
+        score, position = index.search([1.0, 0.0], lambda entry: entry["i"] >= 15)
+        assert position == 15
+        assert score == pytest.approx(_normalize([1.0, 1.5])[0], abs=1e-6)
+        assert index.search([1.0, 0.0], lambda entry: entry["i"] > 100) == (0.0, None)
+
+    def test_add_and_remove_keep_order_across_growth(self, vector_backend):
+        index = VectorIndex(2)
+        for i in range(40):
+            index.add([float(i), 1.0], {"i": i})
+            index.remove_oldest(len(index) - 10)
+        assert [entry["i"] for entry in index.entries] == list(range(30, 40))
+        assert index.scores([1.0, 0.0]) == [float(i) for i in range(30, 40)]
+        assert index.vector(0) == [30.0, 1.0]
+
+    def test_capacity_grows_geometrically(self):
+        numpy = pytest.importorskip("numpy")
+        index = VectorIndex(2)
+        capacities = set()
+        for i in range(100):
+            index.add([float(i), 0.0], {})
+            capacities.add(len(index._vectors))
+        assert capacities == {16, 32, 64, 128}
+        assert isinstance(index._vectors, numpy.ndarray)
+
+    def test_dimension_mismatch(self, vector_backend):
+        with pytest.raises(ValueError):
+            VectorIndex(2).add([1.0], {})
+
+    def test_save_and_memory_mapped_load(self, tmp_path, vector_backend):
+        path = str(tmp_path / "index")
+        index = VectorIndex(2)
+        index.add([1.0, 0.0], {"name": "x"})
+        index.add([0.0, 1.0], {"name": "y"})
+        index.save(path)
+
+        loaded = VectorIndex.load(path)
+        assert loaded._mapped is not None
+        assert loaded.search([0.0, 1.0])[1] == 1
+
+        # 追加時にメモリ上へコピーし、保存済みのファイルは変更しない
+        loaded.add([0.6, 0.8], {"name": "z"})
+        assert loaded._mapped is None
+        assert len(loaded) == 3
+        assert len(VectorIndex.load(path)) == 2
+        assert os.path.getsize(path + ".f32") == 2 * 2 * 4
+
+    def test_load_empty_and_corrupt(self, tmp_path):
+        path = str(tmp_path / "index")
+        VectorIndex(4).save(path)
+        assert len(VectorIndex.load(path)) == 0
+
+        index = VectorIndex(2)
+        index.add([1.0, 0.0], {})
+        index.save(path)
+        with open(path + ".f32", "ab") as f:
+            f.write(b"\0")
+        with pytest.raises(ValueError):
+            VectorIndex.load(path)
+
+
+class TestSemanticCache:
+    """セマンティックキャッシュのテスト"""
+
+    def _cache(self, **kwargs):
+        return SemanticCache(HashingEmbedder(), threshold=0.6, **kwargs)
+
+    def test_paraphrase_hit_within_scope(self, vector_backend):
+        cache = self._cache()
+        cache.add(cache.embed("What is the capital of France?"), "scope", COMPLETED)
+
+        value, similarity = cache.lookup(cache.embed("what is the capital of france"), "scope")
+        assert value == COMPLETED
+        assert similarity > 0.9
+        assert cache.lookup(cache.embed("what is the capital of france"), "other-scope")[0] is None
+        assert cache.lookup(cache.embed("How do I reset my password?"), "scope")[0] is None
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 2
+
+    def test_expired_and_uncacheable_entries(self):
+        cache = self._cache(ttl=60, bypass_tools=["current_time"])
+        vector = cache.embed("今何時？")
+        assert cache.add(vector, "scope", {**COMPLETED, "tool_calls": [{"name": "current_time"}]}) is False
+
+        with patch("semantic_cache.time.time", return_value=1000.0):
+            cache.add(vector, "scope", COMPLETED)
+        with patch("semantic_cache.time.time", return_value=1061.0):
+            assert cache.lookup(vector, "scope")[0] is None
+
+    def test_max_entries(self):
+        cache = self._cache(max_entries=2)
+        for prompt in ("one", "two", "three"):
+            cache.add(cache.embed(prompt), "scope", {**COMPLETED, "prompt": prompt})
+        assert [entry["value"]["prompt"] for entry in cache.index.entries] == ["two", "three"]
+
+    def test_persists_and_reloads(self, tmp_path):
+        store = LocalIndexStore(str(tmp_path / "index"))
+        cache = self._cache(store=store, save_every=2)
+        cache.add(cache.embed("What is the capital of France?"), "scope", COMPLETED)
+        assert store.load() is None
+        cache.add(cache.embed("How do I reset my password?"), "scope", COMPLETED)
+        cache.flush(timeout=5)
+
+        # コールドスタートした別のコンテナが保存済みのインデックスを使う
+        restored = SemanticCache.from_store(HashingEmbedder(), store, threshold=0.6)
+        assert len(restored.index) == 2
+        assert restored.lookup(restored.embed("what is the capital of france"), "scope")[0] == COMPLETED
+
+        # 次元数が異なる場合は使わない
+        assert len(SemanticCache.from_store(HashingEmbedder(dimensions=8), store).index) == 0
+
+    def test_persist_merges_entries_from_other_containers(self, tmp_path, vector_backend):
+        """同じ保存先に書き込む別のコンテナのエントリを上書きで失わない"""
+        store = LocalIndexStore(str(tmp_path / "index"))
+        first = self._cache(store=store, save_every=1)
+        second = self._cache(store=store, save_every=1)
+        first.add(first.embed("What is the capital of France?"), "scope", COMPLETED)
+        first.flush(timeout=5)
+        second.add(second.embed("How do I reset my password?"), "scope", {**COMPLETED, "prompt": "reset"})
+        second.flush(timeout=5)
+
+        restored = SemanticCache.from_store(HashingEmbedder(), store, threshold=0.6)
+        assert len(restored.index) == 2
+        assert restored.lookup(restored.embed("what is the capital of france"), "scope")[0] == COMPLETED
+
+        # 同じエントリを再び保存しても重複しない
+        second.persist()
+        assert len(store.load()) == 2
+
+    def test_persist_runs_in_background(self, tmp_path):
+        started, release = threading.Event(), threading.Event()
+
+        class SlowStore(LocalIndexStore):
+            def save(self, index):
+                started.set()
+                release.wait(5)
+                super().save(index)
+
+        store = SlowStore(str(tmp_path / "index"))
+        cache = self._cache(store=store, save_every=1)
+        cache.add(cache.embed("What is the capital of France?"), "scope", COMPLETED)
+        assert started.wait(5)
+        # 保存中でも追加・検索はブロックされない
+        cache.add(cache.embed("How do I reset my password?"), "scope", COMPLETED)
+        assert cache.lookup(cache.embed("what is the capital of france"), "scope")[0] == COMPLETED
+        # 待つ時間には上限がある
+        assert cache.flush(timeout=0.01) is False
+        release.set()
+        assert cache.flush(timeout=5) is True
+        assert len(store.load()) == 1
+
+    def test_create_index_store(self):
+        assert create_index_store("") is None
+        assert isinstance(create_index_store("/tmp/index"), LocalIndexStore)
+        store = create_index_store("s3://bucket/cache/index")
+        assert isinstance(store, S3IndexStore)
+        assert (store.bucket, store.key) == ("bucket", "cache/index")
+        with pytest.raises(ValueError):
+            create_index_store("s3://bucket")
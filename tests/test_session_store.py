@@ -0,0 +1,193 @@
+"""
+複数ターンの会話を保持するセッションストアのテスト
+"""
+import json
+import sys
+import os
+import types
+from unittest.mock import Mock, patch
+
+import pytest
+
+# Lambda関数のパスを追加
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+
+import session_store
+from session_store import (
+    CompactionPolicy, DynamoDBSessionStore, LocalSessionStore, MemorySessionStore, SessionConflictError,
+    SessionManager, SessionState, TruncatingSummarizer, create_session_store, decode_state, encode_state,
+    validate_session_id
+)
+
+
+def _turn(index, tool=False):
+    """ユーザーの発話とアシスタントの応答（toolの場合はツールの呼び出しと結果を挟む）"""
+    messages = [{"role": "user", "content": [{"text": f"質問{index}"}]}]
+    if tool:
+        messages += [
+            {"role": "assistant", "content": [{"toolUse": {"toolUseId": f"t{index}", "name": "calculator", "input": {}}}]},
+            {"role": "user", "content": [{"toolResult": {"toolUseId": f"t{index}", "content": [{"text": "4"}]}}]},
+        ]
+    messages.append({"role": "assistant", "content": [{"text": f"回答{index}"}]})
+    return messages
+
+
+def test_validate_session_id():
+    assert validate_session_id("user-1:chat_2.a") == (True, None)
+    for session_id in ("", "a/b", "x" * 129, None, 1):
+        assert validate_session_id(session_id)[0] is False
+
+
+class TestSerialization:
+    """セッションのシリアライズのテスト"""
+
+    def test_json_fallback_round_trip_with_bytes(self):
+        state = SessionState(messages=[{"role": "user", "content": [{"image": {"source": {"bytes": b"\x89PNG"}}}]}],
+                             summary="要約", turns=3, version=2)
+        data = encode_state(state, codec="json")
+        assert data[:1] == session_store.FORMAT_JSON
+        assert decode_state(data) == state
+
+    def test_compressed(self):
+        state = SessionState(messages=_turn(0) * 50)
+        assert len(encode_state(state, codec="json")) < len(str(state.messages).encode("utf-8")) // 5
+
+    def test_msgpack_used_when_available(self):
+        fake = types.SimpleNamespace(
+            packb=lambda data, use_bin_type: json.dumps(data).encode(),
+            unpackb=lambda payload, raw: json.loads(payload)
+        )
+        state = SessionState(messages=_turn(1), turns=1)
+        with patch.object(session_store, "msgpack", fake):
+            data = encode_state(state)
+            assert data[:1] == session_store.FORMAT_MSGPACK
+            assert decode_state(data) == state
+        with patch.object(session_store, "msgpack", None):
+            with pytest.raises(ValueError):
+                decode_state(data)
+
+
+class TestCompactionPolicy:
+    """履歴の要約対象の切り出しのテスト"""
+
+    def test_within_limits_keeps_everything(self):
+        messages = _turn(0) + _turn(1)
+        assert CompactionPolicy(max_messages=4).split(messages) == ([], messages)
+
+    def test_trims_to_half_at_turn_boundary(self):
+        messages = [message for index in range(6) for message in _turn(index)]
+        dropped, kept = CompactionPolicy(max_messages=10).split(messages)
+        assert len(kept) == 4
+        assert kept[0]["content"][0]["text"] == "質問4"
+        assert dropped + kept == messages
+
+    def test_never_splits_tool_use_from_result(self):
+        messages = _turn(0) + _turn(1, tool=True) + _turn(2, tool=True)
+        dropped, kept = CompactionPolicy(max_messages=8).split(messages)
+        assert kept == _turn(2, tool=True)
+        assert dropped == _turn(0) + _turn(1, tool=True)
+
+    def test_token_budget(self):
+        long_turn = [{"role": "user", "content": [{"text": "あ" * 3000}]}, {"role": "assistant", "content": [{"text": "了解"}]}]
+        messages = long_turn + _turn(1)
+        dropped, kept = CompactionPolicy(max_messages=100, max_tokens=500).split(messages)
+        assert dropped == long_turn
+        assert kept == _turn(1)
+
+    def test_latest_turn_always_kept(self):
+        messages = _turn(0) + [{"role": "user", "content": [{"text": "い" * 6000}]}]
+        dropped, kept = CompactionPolicy(max_messages=100, max_tokens=100).split(messages)
+        assert (dropped, kept) == (_turn(0), messages[2:])
+
+
+def test_truncating_summarizer():
+    summary = TruncatingSummarizer(chars_per_message=3).summarize("前回", _turn(0, tool=True))
+    assert summary == "前回\nユーザー: 質問0\nアシスタント: 回答0"
+
+
+class TestStores:
+    """ストアの条件付き書き込みのテスト"""
+
+    @pytest.mark.parametrize("backend", ["memory", "local"])
+    def test_versioned_put(self, backend, tmp_path):
+        store = create_session_store(backend, local_dir=str(tmp_path))
+        assert store.get("s") is None
+        store.put("s", b"v1", 1, 0, 60)
+        assert store.get("s") == b"v1"
+        with pytest.raises(SessionConflictError):
+            store.put("s", b"stale", 1, 0, 60)
+        store.put("s", b"v2", 2, 1, 60)
+        assert store.get("s") == b"v2"
+
+    def test_expired_session_is_empty(self, tmp_path):
+        store = LocalSessionStore(str(tmp_path))
+        store.put("s", b"v1", 1, 0, -1)
+        assert store.get("s") is None
+        store.put("s", b"v1", 1, 0, 60)
+
+    def test_dynamodb_conflict(self):
+        client = Mock()
+        error = Exception("conditional")
+        error.response = {"Error": {"Code": "ConditionalCheckFailedException"}}
+        client.put_item.side_effect = error
+        store = DynamoDBSessionStore("sessions", client=client)
+        with pytest.raises(SessionConflictError):
+            store.put("s", b"v", 3, 2, 60)
+        kwargs = client.put_item.call_args[1]
+        assert kwargs["ConditionExpression"] == "version = :expected"
+        assert kwargs["ExpressionAttributeValues"] == {":expected": {"N": "2"}}
+        assert kwargs["Item"]["data"] == {"B": b"v"}
+
+    def test_dynamodb_get(self):
+        client = Mock()
+        client.get_item.return_value = {"Item": {"data": {"B": b"v"}, "expires_at": {"N": "9999999999"}}}
+        assert DynamoDBSessionStore("sessions", client=client).get("s") == b"v"
+
+    def test_create_session_store(self, tmp_path):
+        assert create_session_store("none") is None
+        assert isinstance(create_session_store("local", local_dir=str(tmp_path)), LocalSessionStore)
+        with pytest.raises(ValueError):
+            create_session_store("dynamodb")
+
+
+class TestSessionManager:
+    """読み込みキャッシュと履歴の更新のテスト"""
+
+    def test_read_through_cache(self):
+        manager = SessionManager(MemorySessionStore())
+        state = manager.append("s", manager.load("s"), _turn(0))
+        assert manager.load("s") is state
+        assert manager.stats()["cache_hits"] == 1
+        assert (state.turns, state.version) == (1, 1)
+
+    def test_conflict_rebases_on_latest_history(self):
+        store = MemorySessionStore()
+        other = SessionManager(store)
+        manager = SessionManager(store)
+        stale = manager.load("s")
+        other.append("s", other.load("s"), _turn(0))
+
+        state = manager.append("s", stale, _turn(1))
+        assert state.messages == _turn(0) + _turn(1)
+        assert (state.turns, state.version) == (2, 2)
+        assert manager.stats()["conflicts"] == 1
+
+    def test_summary_prepended_to_history(self):
+        manager = SessionManager(MemorySessionStore(), CompactionPolicy(max_messages=4))
+        state = manager.load("s")
+        for index in range(3):
+            state = manager.append("s", state, _turn(index))
+        assert state.summarized_messages == 4
+        history = manager.history(state)
+        assert history[0]["content"][0]["text"].startswith(session_store.SUMMARY_HEADER)
+        assert history[0]["content"][1:] == state.messages[0]["content"]
+        # 保存した履歴は変更しない
+        assert state.messages[0] == _turn(2)[0]
+
+    def test_summarizer_failure_falls_back_to_truncation(self):
+        summarizer = Mock()
+        summarizer.summarize.side_effect = RuntimeError("throttled")
+        manager = SessionManager(MemorySessionStore(), CompactionPolicy(max_messages=2), summarizer)
+        state = manager.append("s", manager.load("s"), _turn(0) + _turn(1))
+        assert "質問0" in state.summary
+        assert state.messages == _turn(1)
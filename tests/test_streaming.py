@@ -0,0 +1,172 @@
+"""
+レスポンスストリーミングのテスト
+"""
+import asyncio
+import json
+import sys
+import os
+from unittest.mock import Mock
+
+import pytest
+
+# Lambda関数のパスを追加
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+for module_name in ('strands', 'strands.models', 'strands.agent', 'strands.agent.conversation_manager', 'strands_tools'):
+    sys.modules.setdefault(module_name, Mock())
+
+from deadline import Deadline
+from streaming import EventCollector, encode_chunk, stream_agent, translate_event
+from stream_harness import FakeStreamingAgent, post_stream, running_server
+
+
+async def _collect(agen):
+    return [chunk async for chunk in agen]
+
+
+class TestTranslateEvent:
+    """ストリームイベント変換のテスト"""
+    
+    def test_text_delta(self):
+        assert translate_event({"data": "abc"}) == {"type": "text", "data": "abc"}
+    
+    def test_tool_use_start(self):
+        event = {"event": {"contentBlockStart": {"start": {"toolUse": {"toolUseId": "t1", "name": "calculator"}}}}}
+        assert translate_event(event) == {"type": "tool_use", "tool_use_id": "t1", "name": "calculator"}
+    
+    def test_tool_result_message(self):
+        event = {"message": {"role": "user", "content": [{"toolResult": {"toolUseId": "t1", "status": "error"}}]}}
+        assert translate_event(event) == {
+            "type": "tool_result",
+            "results": [{"tool_use_id": "t1", "status": "error"}]
+        }
+    
+    def test_lifecycle_events_are_dropped(self):
+        assert translate_event({"init_event_loop": True}) is None
+        assert translate_event({"message": {"role": "assistant", "content": [{"text": "x"}]}}) is None
+
+
+class TestEncodeChunk:
+    def test_ndjson(self):
+        assert encode_chunk({"type": "text", "data": "あ"}) == '{"type": "text", "data": "あ"}\n'.encode("utf-8")
+    
+    def test_sse(self):
+        chunk = encode_chunk({"type": "done"}, "sse").decode("utf-8")
+        assert chunk.startswith("event: done\ndata: ")
+        assert chunk.endswith("\n\n")
+
+
+class TestStreamAgent:
+    def test_chunks_in_order_with_done(self):
+        agent = FakeStreamingAgent(text="12345678")
+        chunks = [json.loads(c) for c in asyncio.run(_collect(stream_agent(agent, "p", extra={"model_used": "m"})))]
+        
+        assert [c["type"] for c in chunks] == ["tool_use", "tool_result", "text", "text", "done"]
+        assert "".join(c["data"] for c in chunks if c["type"] == "text") == "12345678"
+        assert chunks[-1]["response"] == "12345678"
+        assert chunks[-1]["model_used"] == "m"
+    
+    def test_error_becomes_error_chunk(self):
+        agent = Mock()
+        
+        async def failing(prompt):
+            yield {"data": "途中"}
+            raise RuntimeError("boom")
+        agent.stream_async = failing
+        
+        chunks = [json.loads(c) for c in asyncio.run(_collect(stream_agent(agent, "p")))]
+        assert chunks[0] == {"type": "text", "data": "途中"}
+        assert chunks[-1]["type"] == "error"
+    
+    def test_invocation_state_is_passed_to_agent(self):
+        agent = FakeStreamingAgent(text="1234")
+        invocation_state = {"deadline": Deadline()}
+        
+        chunks = [json.loads(c) for c in asyncio.run(_collect(stream_agent(agent, "p", invocation_state=invocation_state)))]
+        
+        assert agent.invocation_state is invocation_state
+        assert chunks[-1]["status"] == "completed"
+    
+    def test_deadline_stops_stream_with_partial_response(self):
+        agent = FakeStreamingAgent(text="12345678", delay=0.5, tool_name="")
+        agent.cancel = Mock()
+        deadline = Deadline(0.7)
+        invocation_state = {"deadline": deadline}
+        
+        chunks = [json.loads(c) for c in asyncio.run(_collect(
+            stream_agent(agent, "p", extra={"model_used": "m"}, invocation_state=invocation_state, deadline=deadline)
+        ))]
+        
+        assert chunks[-1]["type"] == "done"
+        assert chunks[-1]["status"] == "timeout"
+        assert chunks[-1]["response"] == "1234"
+        assert chunks[-1]["model_used"] == "m"
+        assert invocation_state["request_state"]["stop_event_loop"] is True
+        agent.cancel.assert_called_once()
+
+
+class TestStreamServer:
+    """ローカルハーネスを使ったエンドツーエンドのテスト"""
+    
+    def test_ndjson_stream(self):
+        with running_server(FakeStreamingAgent()) as port:
+            lines = [json.loads(line) for line in post_stream(port, {"prompt": "今何時？"}) if line.strip()]
+        
+        assert lines[0]["type"] == "tool_use"
+        assert lines[-1]["type"] == "done"
+        assert lines[-1]["response"] == "現在の時刻は10時です。"
+    
+    def test_sse_stream(self):
+        with running_server(FakeStreamingAgent()) as port:
+            body = b"".join(post_stream(port, {"prompt": "今何時？"}, accept="text/event-stream")).decode("utf-8")
+        
+        assert "event: tool_use" in body
+        assert "event: done" in body
+    
+    def test_server_passes_request_deadline(self):
+        agent = FakeStreamingAgent()
+        with running_server(agent) as port:
+            lines = [json.loads(line) for line in post_stream(port, {"prompt": "今何時？"}) if line.strip()]
+        
+        assert lines[-1]["status"] == "completed"
+        assert isinstance(agent.invocation_state["deadline"], Deadline)
+        assert agent.invocation_state["deadline"].remaining() > 0
+    
+    def test_invalid_prompt_returns_400(self):
+        with running_server(FakeStreamingAgent()) as port:
+            body = b"".join(post_stream(port, {"prompt": ""}))
+        
+        assert json.loads(body)["success"] is False
+
+    @pytest.mark.parametrize("payload", [[], "今何時？", 1])
+    def test_non_object_body_returns_400(self, payload):
+        with running_server(FakeStreamingAgent()) as port:
+            body = json.loads(b"".join(post_stream(port, payload)))
+        
+        assert body["success"] is False
+        assert body["error"] == "無効なリクエストボディ"
+
+
+class TestEventCollector:
+    """callback_handlerによるイベント収集のテスト"""
+    
+    def test_collects_structured_events(self):
+        collector = EventCollector()
+        collector(event={"contentBlockStart": {"start": {"toolUse": {"toolUseId": "t1", "name": "calculator"}}}})
+        collector(message={"role": "user", "content": [{"toolResult": {"toolUseId": "t1", "status": "success"}}]})
+        collector(reasoningText="考え中")
+        for delta in ("25 * 4 ", "= ", "100"):
+            collector(data=delta)
+        collector(init_event_loop=True)
+        
+        assert collector.text == "25 * 4 = 100"
+        assert collector.reasoning == "考え中"
+        assert collector.tool_calls == [{"tool_use_id": "t1", "name": "calculator", "status": "success"}]
+    
+    def test_text_rejoined_after_new_delta(self):
+        collector = EventCollector()
+        collector(data="a")
+        assert collector.text == "a"
+        collector(data="b")
+        assert collector.text == "ab"
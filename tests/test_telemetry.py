@@ -0,0 +1,138 @@
+"""
+リクエスト単位の計測とEMF出力のテスト
+"""
+import json
+import sys
+import os
+from unittest.mock import Mock, patch
+
+# Lambda関数のパスを追加
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+
+import telemetry
+from telemetry import (
+    METRICS_KEY, RequestMetrics, TelemetryHook, emf_document, emit, mark_cold_start, take_cold_start,
+    usage_from_result
+)
+
+
+def _event(metrics, tool_use_id="t1", name="calculator", result=None, duration=None, agent=None):
+    return Mock(
+        agent=agent,
+        invocation_state={METRICS_KEY: metrics},
+        tool_use={"toolUseId": tool_use_id, "name": name, "input": {}},
+        result=result,
+        duration=duration
+    )
+
+
+class TestRequestMetrics:
+    """計測値の集計のテスト"""
+
+    def test_phases_accumulate(self):
+        metrics = RequestMetrics()
+        with patch("telemetry.time.perf_counter", side_effect=[1.0, 1.25]):
+            with metrics.phase("validate"):
+                pass
+        metrics.add_phase("validate", 0.5)
+        assert metrics.phases == {"validate": 250.5}
+
+    def test_to_dict(self):
+        metrics = RequestMetrics(cold_start=True)
+        metrics.add_usage({"input_tokens": 10, "output_tokens": 5})
+        metrics.add_usage({"input_tokens": 3})
+        snapshot = metrics.to_dict()
+        assert snapshot["cold_start"] is True
+        assert snapshot["usage"] == {"input_tokens": 13, "output_tokens": 5}
+        assert set(snapshot) == {"cold_start", "total_ms", "phases_ms", "model_calls_ms", "tool_calls", "usage"}
+
+
+class TestTelemetryHook:
+    """モデル・ツール呼び出しの計測フックのテスト"""
+
+    def test_records_each_turn_and_tool_call(self):
+        metrics = RequestMetrics()
+        hook = TelemetryHook()
+        agent = object()
+
+        with patch("telemetry.time.perf_counter", side_effect=[10.0, 10.4, 11.0, 11.1]):
+            hook.before_model_call(_event(metrics, agent=agent))
+            hook.after_model_call(_event(metrics, agent=agent))
+            hook.before_model_call(_event(metrics, agent=agent))
+            hook.after_model_call(_event(metrics, agent=agent))
+        assert metrics.model_calls == [400.0, 100.0]
+
+        hook.before_tool_call(_event(metrics, "t1"))
+        hook.before_tool_call(_event(metrics, "t2", "http_request"))
+        # strandsが計測した所要時間を優先する
+        hook.after_tool_call(_event(metrics, "t2", "http_request", {"status": "error"}, duration=0.25))
+        hook.after_tool_call(_event(metrics, "t1", result={"status": "success"}))
+        assert metrics.tool_calls[0] == {"name": "http_request", "duration_ms": 250.0, "status": "error"}
+        assert metrics.tool_calls[1]["name"] == "calculator"
+        assert metrics.tool_calls[1]["status"] == "success"
+
+    def test_ignores_invocations_without_metrics(self):
+        hook = TelemetryHook()
+        event = Mock(invocation_state={})
+        hook.before_model_call(event)
+        hook.after_tool_call(event)
+
+
+def test_usage_from_result():
+    result = Mock()
+    result.metrics.latest_agent_invocation.usage = {"inputTokens": 120, "outputTokens": 30, "totalTokens": 150}
+    assert usage_from_result(result) == {"input_tokens": 120, "output_tokens": 30, "total_tokens": 150}
+
+    result.metrics.latest_agent_invocation = None
+    result.metrics.accumulated_usage = {"inputTokens": 1, "cacheReadInputTokens": 2}
+    assert usage_from_result(result) == {"input_tokens": 1, "cache_read_input_tokens": 2}
+
+    assert usage_from_result("応答") == {}
+
+
+def test_cold_start_is_reported_once():
+    with patch.object(telemetry, "_cold_start", True):
+        assert take_cold_start() is True
+        assert take_cold_start() is False
+        mark_cold_start()
+        assert take_cold_start() is True
+
+
+class TestEmf:
+    """Embedded Metric Formatのテスト"""
+
+    def test_document_structure(self):
+        metrics = RequestMetrics(cold_start=True)
+        metrics.add_phase("agent_build", 12.5)
+        metrics.model_calls.extend([400.0, 100.0])
+        metrics.tool_calls.append({"name": "calculator", "duration_ms": 3.0, "status": "success"})
+        metrics.add_usage({"input_tokens": 10, "output_tokens": 5})
+
+        document = emf_document(
+            metrics, "StrandsAgent", {"FunctionName": "fn", "ModelId": "m"}, {"RequestId": "r1"}, timestamp_ms=1
+        )
+        directive = document["_aws"]["CloudWatchMetrics"][0]
+        assert document["_aws"]["Timestamp"] == 1
+        assert directive["Namespace"] == "StrandsAgent"
+        assert directive["Dimensions"] == [["FunctionName"], ["FunctionName", "ModelId"]]
+        names = {metric["Name"] for metric in directive["Metrics"]}
+        assert {"Latency", "ColdStart", "AgentBuildTime", "ModelLatency", "ToolLatency", "InputTokens"} <= names
+        # 定義した全てのメトリクスの値がある
+        assert all(name in document for name in names)
+        assert document["ModelLatency"] == [400.0, 100.0]
+        assert document["ColdStart"] == 1
+        assert (document["FunctionName"], document["ModelId"], document["RequestId"]) == ("fn", "m", "r1")
+
+    def test_prompt_cache_tokens(self):
+        metrics = RequestMetrics()
+        metrics.add_usage({"input_tokens": 100, "cache_read_input_tokens": 900, "cache_write_input_tokens": 0})
+        document = emf_document(metrics, "StrandsAgent", {"FunctionName": "fn"})
+        assert document["CacheReadInputTokens"] == 900
+        assert document["PromptCacheHitRatio"] == 0.9
+        assert "PromptCacheHitRatio" not in emf_document(RequestMetrics(), "StrandsAgent", {"FunctionName": "fn"})
+
+    def test_emit_writes_single_line(self, capsys):
+        emit(emf_document(RequestMetrics(), "StrandsAgent", {"FunctionName": "fn"}))
+        lines = capsys.readouterr().out.splitlines()
+        assert len(lines) == 1
+        assert json.loads(lines[0])["FunctionName"] == "fn"
@@ -0,0 +1,140 @@
+"""
+ツールの並行実行のテスト
+"""
+import asyncio
+import sys
+import os
+import time
+
+import pytest
+
+# Lambda関数のパスを追加
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+
+from tool_executor import run_tool_calls
+
+
+def _tool_use(name, delay, tool_use_id=None):
+    return {"toolUseId": tool_use_id or name, "name": name, "input": {"delay": delay}}
+
+
+def _make_stream(active, peak):
+    """同期関数のツールと同じくスレッドで実行し、同時実行数を記録するストリーム"""
+    async def stream_one(tool_use, sink):
+        active.append(tool_use["name"])
+        peak.append(len(active))
+        yield {"started": tool_use["name"]}
+        await asyncio.to_thread(time.sleep, tool_use["input"]["delay"])
+        active.remove(tool_use["name"])
+        result = {"toolUseId": tool_use["toolUseId"], "status": "success", "content": [{"text": tool_use["name"]}]}
+        sink.append(result)
+        yield {"result": result}
+    return stream_one
+
+
+def _run(tool_uses, **kwargs):
+    active, peak, results = [], [], []
+
+    async def collect():
+        return [event async for event in run_tool_calls(tool_uses, _make_stream(active, peak), results, **kwargs)]
+
+    start = time.perf_counter()
+    events = asyncio.run(collect())
+    return events, results, max(peak), time.perf_counter() - start
+
+
+def test_runs_in_parallel_and_preserves_order():
+    tool_uses = [_tool_use("http_request", 0.2), _tool_use("current_time", 0.05), _tool_use("calculator", 0.01)]
+    events, results, peak, elapsed = _run(tool_uses, max_concurrency=4)
+
+    assert [r["toolUseId"] for r in results] == ["http_request", "current_time", "calculator"]
+    assert peak == 3
+    assert elapsed < 0.2 + 0.15
+    # イベントは完了順に流れる
+    finished = [e["result"]["toolUseId"] for e in events if "result" in e]
+    assert finished == ["calculator", "current_time", "http_request"]
+
+
+def test_concurrency_is_bounded():
+    tool_uses = [_tool_use(f"tool{i}", 0.02) for i in range(6)]
+    _, results, peak, _ = _run(tool_uses, max_concurrency=2)
+    assert peak == 2
+    assert [r["toolUseId"] for r in results] == [f"tool{i}" for i in range(6)]
+
+
+def test_per_tool_timeout_returns_error_result():
+    tool_uses = [_tool_use("http_request", 0.5), _tool_use("calculator", 0.01)]
+    timeouts = {"http_request": 0.05}
+    _, results, _, elapsed = _run(tool_uses, timeout_for=lambda tool_use: timeouts.get(tool_use["name"]))
+
+    assert results[0]["status"] == "error"
+    assert "タイムアウト" in results[0]["content"][0]["text"]
+    assert results[1]["status"] == "success"
+
+
+def _fake_executors_module(with_structured_output):
+    """strands 1.13（構造化出力の引数なし）と1.14以降の_stream_with_traceを模したモジュール"""
+    import types
+
+    calls = []
+
+    async def record(tool_use, tool_results, args):
+        calls.append(args)
+        tool_results.append({"toolUseId": tool_use["toolUseId"], "status": "success", "content": []})
+        yield tool_use["name"]
+
+    if with_structured_output:
+        class ConcurrentToolExecutor:
+            @staticmethod
+            def _stream_with_trace(agent, tool_use, tool_results, cycle_trace, cycle_span, invocation_state,
+                                   structured_output_context=None, **kwargs):
+                return record(tool_use, tool_results, (cycle_trace, cycle_span, invocation_state, structured_output_context))
+    else:
+        class ConcurrentToolExecutor:
+            @staticmethod
+            def _stream_with_trace(agent, tool_use, tool_results, cycle_trace, cycle_span, invocation_state, **kwargs):
+                assert not kwargs
+                return record(tool_use, tool_results, (cycle_trace, cycle_span, invocation_state))
+
+    module = types.ModuleType("strands.tools.executors")
+    module.ConcurrentToolExecutor = ConcurrentToolExecutor
+    return module, calls
+
+
+@pytest.mark.parametrize("with_structured_output, args, expected", [
+    (True, ("structured",), ("trace", "span", {}, "structured")),
+    (False, (), ("trace", "span", {})),
+])
+def test_executor_matches_strands_signature(with_structured_output, args, expected):
+    """strandsのイベントループと同じく位置引数で呼び出し、バージョンに合わせて構造化出力の引数を渡す"""
+    from unittest.mock import patch
+    from tool_executor import create_tool_executor
+
+    module, calls = _fake_executors_module(with_structured_output)
+    with patch.dict(sys.modules, {"strands.tools.executors": module}):
+        executor = create_tool_executor(max_concurrency=2, default_timeout=1.0)
+
+    results = []
+
+    async def collect():
+        stream = executor._execute(None, [_tool_use("calculator", 0)], results, "trace", "span", {}, *args)
+        return [event async for event in stream]
+
+    assert asyncio.run(collect()) == ["calculator"]
+    assert calls == [expected]
+    assert results[0]["status"] == "success"
+
+
+def test_unknown_strands_signature_falls_back_to_stock_executor():
+    import types
+    from unittest.mock import patch
+    from tool_executor import create_tool_executor
+
+    class ConcurrentToolExecutor:
+        pass
+
+    module = types.ModuleType("strands.tools.executors")
+    module.ConcurrentToolExecutor = ConcurrentToolExecutor
+    with patch.dict(sys.modules, {"strands.tools.executors": module}):
+        executor = create_tool_executor(max_concurrency=2, default_timeout=1.0)
+    assert type(executor) is ConcurrentToolExecutor
@@ -0,0 +1,122 @@
+"""
+ツール結果のメモ化のテスト
+"""
+import asyncio
+import sys
+import os
+from unittest.mock import Mock, patch
+
+# Lambda関数のパスを追加
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+
+from tool_memo import STATS_KEY, ToolMemoHook, ToolResultCache, make_memo_key, new_request_stats
+
+
+RESULT = {"status": "success", "content": [{"text": "100"}]}
+
+
+def _event(name, tool_input, tool_use_id="t1", stats=None, result=None):
+    return Mock(
+        tool_use={"toolUseId": tool_use_id, "name": name, "input": tool_input},
+        invocation_state={STATS_KEY: stats if stats is not None else new_request_stats()},
+        selected_tool=Mock(tool_name=name),
+        cancel_tool=False,
+        result=result,
+        exception=None
+    )
+
+
+def _run_stream(tool, tool_use):
+    async def collect():
+        return [event async for event in tool.stream(tool_use, {})]
+    with patch.dict(sys.modules, {"strands.types._events": None}):
+        return asyncio.run(collect())
+
+
+class TestToolResultCache:
+    """バイト数で上限を設けたLRUのテスト"""
+
+    def test_evicts_least_recently_used_by_bytes(self):
+        key_a, key_b, key_c = (make_memo_key("calculator", {"expression": e}) for e in "abc")
+        entry_size = len(key_a) + len('{"status":"success","content":[{"text":"100"}]}')
+        cache = ToolResultCache(max_bytes=entry_size * 2)
+
+        cache.put(key_a, RESULT)
+        cache.put(key_b, RESULT)
+        cache.get(key_a)
+        cache.put(key_c, RESULT)
+
+        assert cache.get(key_b) is None
+        assert cache.get(key_a) == RESULT
+        stats = cache.stats()
+        assert stats["entries"] == 2
+        assert stats["size_bytes"] == entry_size * 2
+        assert stats["evictions"] == 1
+
+    def test_oversized_result_is_not_stored(self):
+        cache = ToolResultCache(max_bytes=100)
+        assert cache.put("k", {"status": "success", "content": [{"text": "x" * 100}]}) is False
+        assert cache.stats()["entries"] == 0
+
+    def test_key_ignores_input_order(self):
+        assert make_memo_key("generate_hash", {"text": "a", "algorithm": "md5"}) == \
+            make_memo_key("generate_hash", {"algorithm": "md5", "text": "a"})
+
+
+class TestToolMemoHook:
+    """メモ化フックのテスト"""
+
+    def test_second_call_served_from_cache(self):
+        hook = ToolMemoHook(ToolResultCache(), ["calculator"])
+        stats = new_request_stats()
+
+        first = _event("calculator", {"expression": "25 * 4"}, stats=stats, result={**RESULT, "toolUseId": "t1"})
+        hook.before_tool_call(first)
+        original_tool = first.selected_tool
+        hook.after_tool_call(first)
+
+        second = _event("calculator", {"expression": "25 * 4"}, tool_use_id="t2", stats=stats)
+        hook.before_tool_call(second)
+
+        assert second.selected_tool is not original_tool
+        assert second.selected_tool.tool_name == "calculator"
+        assert _run_stream(second.selected_tool, second.tool_use) == [{**RESULT, "toolUseId": "t2"}]
+        assert stats == {"hits": 1, "misses": 1}
+
+        # キャッシュから返した結果は保存し直さない
+        second.result = {**RESULT, "toolUseId": "t2"}
+        hook.after_tool_call(second)
+        assert hook.cache.stats()["entries"] == 1
+
+    def test_only_opted_in_tools_and_pure_inputs(self):
+        hook = ToolMemoHook(ToolResultCache(), ["generate_hash"])
+        cases = [
+            ("current_time", {}),
+            ("generate_hash", {"text": "/tmp/data.bin", "source": "file"}),
+            ("generate_hash", {"text": "s3://bucket/key", "source": "s3"}),
+        ]
+        for name, tool_input in cases:
+            event = _event(name, tool_input, result=RESULT)
+            hook.before_tool_call(event)
+            hook.after_tool_call(event)
+            assert event.invocation_state[STATS_KEY] == {"hits": 0, "misses": 0}
+        assert hook.cache.stats()["entries"] == 0
+
+        event = _event("generate_hash", {"text": "abc"}, result=RESULT)
+        hook.after_tool_call(event)
+        assert hook.cache.stats()["entries"] == 1
+
+    def test_failed_results_are_not_stored(self):
+        hook = ToolMemoHook(ToolResultCache(), ["calculator"])
+        hook.after_tool_call(_event("calculator", {"expression": "1/0"}, result={"status": "error", "content": []}))
+        assert hook.cache.stats()["entries"] == 0
+
+    def test_cancelled_call_is_left_alone(self):
+        hook = ToolMemoHook(ToolResultCache(), ["calculator"])
+        hook.cache.put(make_memo_key("calculator", {"expression": "1+1"}), RESULT)
+        event = _event("calculator", {"expression": "1+1"})
+        event.cancel_tool = "締め切りを過ぎたためツール呼び出しを中止しました"
+        tool = event.selected_tool
+
+        hook.before_tool_call(event)
+        assert event.selected_tool is tool